@@ -21,12 +21,16 @@ limitations under the License.
 
 import os
 import socket
+import sys
 import urllib2
 import json
 from resource_management.libraries.script.script import Script
 from resource_management.libraries.functions.format import format
 from resource_management.core.logger import Logger
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+
 RESULT_CODE_OK = 'OK'
 RESULT_CODE_WARNING = 'WARNING'
 RESULT_CODE_CRITICAL = 'CRITICAL'
@@ -40,8 +44,9 @@ def get_tokens():
     """
     返回用于解析配置的tokens
     """
-    return (METAD_HOSTS_KEY, METAD_PORT_KEY, METAD_HTTP_PORT_KEY)
+    return (METAD_HOSTS_KEY, METAD_PORT_KEY, METAD_HTTP_PORT_KEY) + nebula_alerts.CLUSTER_TOKENS
 
+@nebula_alerts.cluster_alert('nebula_cluster_health')
 def execute(configurations={}, parameters=[], host_name=None):
     """
     检查Nebula集群健康状态
@@ -126,6 +131,7 @@ def is_metad_healthy(host, port, http_port):
     # 通过HTTP接口检查状态
     try:
         url = 'http://{0}:{1}/status'.format(host, http_port)
+        nebula_alerts.count('sockets')
         response = urllib2.urlopen(url, timeout=5)
         if response.getcode() == 200:
             return True
@@ -140,9 +146,12 @@ def is_metad_leader(host, http_port):
     """
     try:
         url = 'http://{0}:{1}/leader'.format(host, http_port)
+        nebula_alerts.count('sockets')
         response = urllib2.urlopen(url, timeout=5)
         if response.getcode() == 200:
-            data = json.loads(response.read())
+            body = response.read()
+            nebula_alerts.count('bytes_read', len(body))
+            data = json.loads(body)
             return data.get('is_leader', False)
     except Exception:
         pass
@@ -154,6 +163,7 @@ def is_port_accessible(host, port, timeout=3):
     检查端口是否可访问
     """
     try:
+        nebula_alerts.count('sockets')
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(timeout)
         result = sock.connect_ex((host, port))
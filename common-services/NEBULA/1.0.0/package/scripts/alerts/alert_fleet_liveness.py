@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import json
+import os
+import sys
+import time
+from array import array
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+from nebula_ngql import ConsoleSession, show_fleet
+
+RESULT_CODE_OK = 'OK'
+RESULT_CODE_WARNING = 'WARNING'
+RESULT_CODE_CRITICAL = 'CRITICAL'
+RESULT_CODE_UNKNOWN = 'UNKNOWN'
+
+GRAPHD_HOSTS_KEY = '{{clusterHostInfo/nebula_graphd_hosts}}'
+STORAGED_HOSTS_KEY = '{{clusterHostInfo/nebula_storaged_hosts}}'
+GRAPHD_PORT_KEY = '{{nebula-graphd-site/port}}'
+INSTALL_DIR_KEY = '{{nebula-env/nebula_install_dir}}'
+PID_DIR_KEY = '{{nebula-env/nebula_pid_dir}}'
+CONSOLE_USER_KEY = '{{nebula-env/nebula_console_user}}'
+CONSOLE_PASSWORD_KEY = '{{nebula-env/nebula_console_password}}'
+
+CRITICAL_SECONDS_PARAM = 'offline.critical.seconds'
+CRITICAL_PERCENT_PARAM = 'offline.critical.percent'
+
+DEFAULT_CRITICAL_SECONDS = 300
+DEFAULT_CRITICAL_PERCENT = 50.0
+
+STATE_FILE = 'nebula-fleet-liveness.json'
+
+
+def get_tokens():
+    """
+    返回用于解析配置的tokens
+    """
+    return (GRAPHD_HOSTS_KEY, STORAGED_HOSTS_KEY, GRAPHD_PORT_KEY, INSTALL_DIR_KEY, PID_DIR_KEY,
+            CONSOLE_USER_KEY, CONSOLE_PASSWORD_KEY) + nebula_alerts.HOST_TOKENS
+
+
+@nebula_alerts.host_alert('nebula_fleet_liveness')
+def execute(configurations={}, parameters={}, host_name=None):
+    """
+    通过一次SHOW HOSTS GRAPH/STORAGE检查所有graphd和storaged的存活状态
+
+    告警定义在metad组件上，每台metad主机先查询SHOW META LEADER，只有本机是metad
+    leader时才列出主机，因此每个周期整个集群只执行一次SHOW HOSTS；离线计时保存在
+    leader主机上，只在leader切换时重新开始。
+    返回包含告警结果的元组 (result_code, [result_label])
+    """
+    if configurations is None:
+        return (RESULT_CODE_UNKNOWN, ['There were no configurations supplied to the script.'])
+
+    graphd_hosts = configurations.get(GRAPHD_HOSTS_KEY)
+    if not graphd_hosts:
+        return (RESULT_CODE_UNKNOWN, ['No Graphd hosts are configured.'])
+    if GRAPHD_PORT_KEY not in configurations:
+        return (RESULT_CODE_UNKNOWN, ['The Graphd port could not be determined.'])
+
+    parameters = parameters or {}
+    critical_seconds = float(parameters.get(CRITICAL_SECONDS_PARAM, DEFAULT_CRITICAL_SECONDS))
+    critical_percent = float(parameters.get(CRITICAL_PERCENT_PARAM, DEFAULT_CRITICAL_PERCENT))
+
+    console_bin = configurations.get(INSTALL_DIR_KEY, '/usr/local/nebula') + '/bin/nebula-console'
+    session = ConsoleSession(console_bin, graphd_hosts[0], configurations[GRAPHD_PORT_KEY],
+                             configurations.get(CONSOLE_USER_KEY, 'root'),
+                             configurations.get(CONSOLE_PASSWORD_KEY, 'nebula'), timeout=20)
+    skipped = nebula_alerts.metad_leader_only(session, host_name)
+    if skipped is not None:
+        return skipped
+
+    try:
+        fleet = show_fleet(session)
+    except Exception as e:
+        return (RESULT_CODE_UNKNOWN, ['Unable to list hosts from metad: {0}'.format(e)])
+
+    state_path = os.path.join(configurations.get(PID_DIR_KEY, '/var/run/nebula'), STATE_FILE)
+    last_online = load_state(state_path)
+    expected = {'graphd': graphd_hosts, 'storaged': configurations.get(STORAGED_HOSTS_KEY) or []}
+    result = evaluate(fleet, expected, last_online, time.time(), critical_seconds, critical_percent)
+    try:
+        save_state(state_path, last_online)
+    except (IOError, OSError):
+        pass
+    return result
+
+
+def staleness(addresses, online, last_online, now):
+    """
+    一次遍历计算每台主机距最后一次被metad标记为ONLINE的秒数
+
+    Args:
+        addresses: "role host:port"列表
+        online: 与addresses对应的0/1数组
+        last_online: "role host:port" -> 时间戳，就地更新；首次看到OFFLINE的主机从本次开始计时
+
+    Returns:
+        array: 与addresses对应的秒数，ONLINE的主机为0
+    """
+    ages = array('d')
+    for address, up in zip(addresses, online):
+        if up:
+            last_online[address] = now
+            ages.append(0.0)
+        else:
+            ages.append(now - last_online.setdefault(address, now))
+    return ages
+
+
+def evaluate(fleet, expected, last_online, now, critical_seconds, critical_percent):
+    """
+    根据metad返回的主机状态给出告警结果
+
+    有主机OFFLINE或未在metad登记时为WARNING；OFFLINE超过critical_seconds，或某个角色
+    OFFLINE的比例达到critical_percent时为CRITICAL。
+    """
+    addresses = []
+    online = array('b')
+    registered = {'graphd': set(), 'storaged': set()}
+    for role in ('graphd', 'storaged'):
+        for host in fleet.get(role, []):
+            addresses.append('{0} {1}:{2}'.format(role, host['host'], host['port']))
+            online.append(1 if host['status'] == 'ONLINE' else 0)
+            registered[role].add(host['host'])
+    ages = staleness(addresses, online, last_online, now)
+    # 已从metad移除的主机不再保留计时
+    current = set(addresses)
+    for address in list(last_online):
+        if address not in current:
+            del last_online[address]
+
+    offline = sorted(((address, ages[i]) for i, address in enumerate(addresses) if not online[i]),
+                     key=lambda item: -item[1])
+    missing = ['{0} {1}'.format(role, host) for role in ('graphd', 'storaged')
+               for host in sorted(expected.get(role, [])) if host not in registered[role]]
+
+    counts = dict((role, len(fleet.get(role, []))) for role in ('graphd', 'storaged'))
+    summary = '{0} graphd and {1} storaged hosts registered in metad'.format(counts['graphd'], counts['storaged'])
+    if not offline and not missing:
+        return (RESULT_CODE_OK, [summary + ', all ONLINE.'])
+
+    result_code = RESULT_CODE_WARNING
+    if offline and offline[0][1] >= critical_seconds:
+        result_code = RESULT_CODE_CRITICAL
+    for role in ('graphd', 'storaged'):
+        down = sum(1 for address, _ in offline if address.startswith(role + ' '))
+        if counts[role] and down * 100.0 / counts[role] >= critical_percent:
+            result_code = RESULT_CODE_CRITICAL
+
+    details = []
+    if offline:
+        details.append('Offline: ' + '; '.join('{0} for {1:.0f}s'.format(address, age) for address, age in offline))
+    if missing:
+        details.append('Not registered: ' + ', '.join(missing))
+    return (result_code, [summary + '. ' + '. '.join(details)])
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_state(path, last_online):
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(last_online, f, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+if __name__ == '__main__':
+    print(execute())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import math
+import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+from nebula_ngql import ConsoleSession, show_hosts
+from nebula_stats import fetch_stats
+
+RESULT_CODE_OK = 'OK'
+RESULT_CODE_WARNING = 'WARNING'
+RESULT_CODE_CRITICAL = 'CRITICAL'
+RESULT_CODE_UNKNOWN = 'UNKNOWN'
+
+GRAPHD_HOSTS_KEY = '{{clusterHostInfo/nebula_graphd_hosts}}'
+GRAPHD_PORT_KEY = '{{nebula-graphd-site/port}}'
+STORAGED_HTTP_PORT_KEY = '{{nebula-storaged-site/ws_http_port}}'
+INSTALL_DIR_KEY = '{{nebula-env/nebula_install_dir}}'
+CONSOLE_USER_KEY = '{{nebula-env/nebula_console_user}}'
+CONSOLE_PASSWORD_KEY = '{{nebula-env/nebula_console_password}}'
+
+WARNING_PERCENT_PARAM = 'leader.skew.warning.percent'
+CRITICAL_PERCENT_PARAM = 'leader.skew.critical.percent'
+REQUEST_RATE_METRICS_PARAM = 'request.rate.metrics'
+
+DEFAULT_WARNING_PERCENT = 30.0
+DEFAULT_CRITICAL_PERCENT = 60.0
+DEFAULT_REQUEST_RATE_METRICS = 'num_get_neighbors.rate.60,num_get_prop.rate.60,num_add_edges.rate.60,num_add_vertices.rate.60'
+
+
+def get_tokens():
+    """
+    返回用于解析配置的tokens
+    """
+    return (GRAPHD_HOSTS_KEY, GRAPHD_PORT_KEY, STORAGED_HTTP_PORT_KEY, INSTALL_DIR_KEY,
+            CONSOLE_USER_KEY, CONSOLE_PASSWORD_KEY) + nebula_alerts.HOST_TOKENS
+
+
+@nebula_alerts.host_alert('nebula_storaged_leader_skew')
+def execute(configurations={}, parameters={}, host_name=None):
+    """
+    检查storaged之间的leader数和请求速率是否偏斜
+
+    告警定义在metad组件上，只有当前metad leader执行SHOW HOSTS并读取各storaged的/stats，
+    每个周期整个集群只探测一次。
+    返回包含告警结果的元组 (result_code, [result_label])
+    """
+    if configurations is None:
+        return (RESULT_CODE_UNKNOWN, ['There were no configurations supplied to the script.'])
+
+    graphd_hosts = configurations.get(GRAPHD_HOSTS_KEY)
+    if not graphd_hosts:
+        return (RESULT_CODE_UNKNOWN, ['No Graphd hosts are configured.'])
+    if GRAPHD_PORT_KEY not in configurations or STORAGED_HTTP_PORT_KEY not in configurations:
+        return (RESULT_CODE_UNKNOWN, ['The Graphd port or Storaged HTTP port could not be determined.'])
+
+    parameters = parameters or {}
+    warning_percent = float(parameters.get(WARNING_PERCENT_PARAM, DEFAULT_WARNING_PERCENT))
+    critical_percent = float(parameters.get(CRITICAL_PERCENT_PARAM, DEFAULT_CRITICAL_PERCENT))
+    rate_metrics = [name.strip() for name in
+                    parameters.get(REQUEST_RATE_METRICS_PARAM, DEFAULT_REQUEST_RATE_METRICS).split(',')
+                    if name.strip()]
+
+    console_bin = configurations.get(INSTALL_DIR_KEY, '/usr/local/nebula') + '/bin/nebula-console'
+    session = ConsoleSession(console_bin, graphd_hosts[0], configurations[GRAPHD_PORT_KEY],
+                             configurations.get(CONSOLE_USER_KEY, 'root'),
+                             configurations.get(CONSOLE_PASSWORD_KEY, 'nebula'), timeout=20)
+    skipped = nebula_alerts.metad_leader_only(session, host_name)
+    if skipped is not None:
+        return skipped
+    try:
+        hosts = [host for host in show_hosts(session) if host['status'] == 'ONLINE']
+    except Exception as e:
+        return (RESULT_CODE_UNKNOWN, ['Unable to list storaged hosts from metad: {0}'.format(e)])
+    if len(hosts) < 2:
+        return (RESULT_CODE_OK, ['{0} online storaged host(s), leader skew does not apply.'.format(len(hosts))])
+
+    leaders = dict((host['host'], host['leader_count']) for host in hosts)
+    rates = collect_request_rates(list(leaders), int(configurations[STORAGED_HTTP_PORT_KEY]), rate_metrics)
+    return evaluate(leaders, rates, warning_percent, critical_percent)
+
+
+def evaluate(leaders, rates, warning_percent, critical_percent):
+    """
+    根据每台主机的leader数和请求速率给出告警结果
+
+    leader数超过均值critical_percent为CRITICAL；leader数或请求速率超过均值
+    warning_percent为WARNING。
+    """
+    leader_cv = coefficient_of_variation(list(leaders.values()))
+    hot_leaders = hosts_above_mean(leaders, warning_percent)
+    hot_rates = hosts_above_mean(rates, warning_percent) if len(rates) > 1 else []
+
+    summary = 'Leader CV {0:.2f} across {1} storaged hosts'.format(leader_cv, len(leaders))
+    if rates:
+        summary += ', request rate CV {0:.2f}'.format(coefficient_of_variation(list(rates.values())))
+
+    if not hot_leaders and not hot_rates:
+        return (RESULT_CODE_OK, [summary + '. No host is more than {0:.0f}% above the mean.'.format(warning_percent)])
+
+    details = ['{0} leaders {1} (+{2:.0f}%)'.format(host, leaders[host], percent) for host, percent in hot_leaders]
+    details += ['{0} requests {1:.0f}/s (+{2:.0f}%)'.format(host, rates[host], percent) for host, percent in hot_rates]
+    result_code = RESULT_CODE_WARNING
+    if any(percent > critical_percent for _, percent in hot_leaders):
+        result_code = RESULT_CODE_CRITICAL
+    return (result_code, [summary + '. Hot hosts: ' + '; '.join(details)])
+
+
+def coefficient_of_variation(values):
+    """
+    一次遍历求和与平方和计算变异系数（总体标准差/均值）
+    """
+    count = len(values)
+    if count == 0:
+        return 0.0
+    total = 0.0
+    squares = 0.0
+    for value in values:
+        total += value
+        squares += value * value
+    mean = total / count
+    if mean == 0:
+        return 0.0
+    return math.sqrt(max(squares / count - mean * mean, 0.0)) / mean
+
+
+def hosts_above_mean(values, percent):
+    """
+    Returns:
+        list: 高于均值percent%以上的(host, 高出百分比)，按高出比例降序
+    """
+    if not values:
+        return []
+    mean = float(sum(values.values())) / len(values)
+    if mean == 0:
+        return []
+    hot = [(host, (value - mean) * 100.0 / mean) for host, value in values.items()]
+    return sorted([item for item in hot if item[1] > percent], key=lambda item: -item[1])
+
+
+def collect_request_rates(hosts, http_port, metrics, timeout=5, max_workers=32):
+    """
+    用有限的并发读取各storaged的/stats，把metrics中的速率求和
+
+    无法访问的主机不出现在结果中。
+    """
+    rates = {}
+    pending = list(hosts)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                host = pending.pop()
+            try:
+                stats = fetch_stats(host, http_port, timeout=timeout)
+            except Exception:
+                continue
+            with lock:
+                rates[host] = sum(stats.get(metric, 0.0) for metric in metrics)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max_workers, len(hosts)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return rates
+
+
+if __name__ == '__main__':
+    print(execute())
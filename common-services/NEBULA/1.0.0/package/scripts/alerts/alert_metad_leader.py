@@ -19,12 +19,17 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
+import sys
 import urllib2
 import json
 from resource_management.libraries.script.script import Script
 from resource_management.libraries.functions.format import format
 from resource_management.core.logger import Logger
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+
 RESULT_CODE_OK = 'OK'
 RESULT_CODE_WARNING = 'WARNING'
 RESULT_CODE_CRITICAL = 'CRITICAL'
@@ -37,8 +42,9 @@ def get_tokens():
     """
     返回用于解析配置的tokens
     """
-    return (METAD_HOSTS_KEY, METAD_HTTP_PORT_KEY)
+    return (METAD_HOSTS_KEY, METAD_HTTP_PORT_KEY) + nebula_alerts.CLUSTER_TOKENS
 
+@nebula_alerts.cluster_alert('nebula_metad_leader_status')
 def execute(configurations={}, parameters=[], host_name=None):
     """
     检查Metad集群中是否有Leader
@@ -115,10 +121,12 @@ def is_metad_leader(host, http_port):
         
         for endpoint in endpoints:
             url = 'http://{0}:{1}{2}'.format(host, http_port, endpoint)
+            nebula_alerts.count('sockets')
             response = urllib2.urlopen(url, timeout=5)
             
             if response.getcode() == 200:
                 data = response.read()
+                nebula_alerts.count('bytes_read', len(data))
                 
                 # 尝试解析JSON响应
                 try:
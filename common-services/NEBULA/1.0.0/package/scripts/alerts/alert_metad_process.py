@@ -21,10 +21,14 @@ limitations under the License.
 
 import os
 import socket
+import sys
 from resource_management.libraries.script.script import Script
 from resource_management.libraries.functions.format import format
 from resource_management.core.logger import Logger
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+
 RESULT_CODE_OK = 'OK'
 RESULT_CODE_CRITICAL = 'CRITICAL'
 RESULT_CODE_UNKNOWN = 'UNKNOWN'
@@ -36,8 +40,9 @@ def get_tokens():
     """
     返回用于解析配置的tokens
     """
-    return (METAD_PID_FILE_KEY, METAD_PORT_KEY)
+    return (METAD_PID_FILE_KEY, METAD_PORT_KEY) + nebula_alerts.HOST_TOKENS
 
+@nebula_alerts.host_alert('nebula_metad_process')
 def execute(configurations={}, parameters=[], host_name=None):
     """
     返回包含告警结果的元组 (result_code, [result_label])
@@ -104,6 +109,7 @@ def is_port_accessible(port, host='localhost', timeout=3):
     检查端口是否可访问
     """
     try:
+        nebula_alerts.count('sockets')
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(timeout)
         result = sock.connect_ex((host, port))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+import nebula_os_profile
+
+RESULT_CODE_OK = 'OK'
+RESULT_CODE_WARNING = 'WARNING'
+RESULT_CODE_UNKNOWN = 'UNKNOWN'
+
+OS_PROFILE_ENABLED_KEY = '{{nebula-env/os_profile_enabled}}'
+PID_DIR_KEY = '{{nebula-env/nebula_pid_dir}}'
+STORAGED_DATA_PATH_KEY = '{{nebula-storaged-site/data_path}}'
+BLOCK_DEVICES_KEY = '{{nebula-env/os_block_devices}}'
+
+# build_profile的参数 -> nebula-env中的属性及默认值，与params.py一致
+PROFILE_KEYS = (
+    ('nofile', '{{nebula-env/os_nofile_limit}}', 1048576),
+    ('nproc', '{{nebula-env/os_nproc_limit}}', 65536),
+    ('swappiness', '{{nebula-env/os_vm_swappiness}}', 1),
+    ('dirty_ratio', '{{nebula-env/os_vm_dirty_ratio}}', 10),
+    ('dirty_background_ratio', '{{nebula-env/os_vm_dirty_background_ratio}}', 5),
+    ('somaxconn', '{{nebula-env/os_net_core_somaxconn}}', 4096),
+    ('transparent_hugepage', '{{nebula-env/os_transparent_hugepage}}', 'never'),
+    ('read_ahead_kb', '{{nebula-env/os_block_read_ahead_kb}}', 128),
+    ('scheduler', '{{nebula-env/os_block_scheduler}}', '')
+)
+
+COMPONENT_PARAM = 'component'
+
+
+def get_tokens():
+    """
+    返回用于解析配置的tokens
+    """
+    return (OS_PROFILE_ENABLED_KEY, PID_DIR_KEY, STORAGED_DATA_PATH_KEY, BLOCK_DEVICES_KEY) + \
+        tuple(key for _, key, _ in PROFILE_KEYS) + nebula_alerts.HOST_TOKENS
+
+
+def profile_from(configurations):
+    """
+    由告警的configurations组成与nebula_utils.os_profile相同的OS配置
+    """
+    values = {}
+    for name, key, default in PROFILE_KEYS:
+        value = configurations.get(key)
+        if value is None or str(value).strip() == '':
+            value = default
+        values[name] = str(value).strip() if isinstance(default, str) else int(value)
+    return nebula_os_profile.build_profile(**values)
+
+
+@nebula_alerts.host_alert('nebula_os_profile_drift')
+def execute(configurations={}, parameters={}, host_name=None):
+    """
+    比较本机内核取值和运行中守护进程的ulimit与nebula-env中的OS性能配置
+
+    告警定义在graphd和storaged组件上，由component参数区分；storaged还检查数据盘的
+    read_ahead_kb和调度器。
+    返回包含告警结果的元组 (result_code, [result_label])
+    """
+    if configurations is None:
+        return (RESULT_CODE_UNKNOWN, ['There were no configurations supplied to the script.'])
+    if str(configurations.get(OS_PROFILE_ENABLED_KEY, 'false')).lower() != 'true':
+        return (RESULT_CODE_OK, ['OS profile management is disabled'])
+
+    component = (parameters or {}).get(COMPONENT_PARAM, 'storaged')
+    devices = []
+    if component == 'storaged':
+        devices = [device.strip() for device in (configurations.get(BLOCK_DEVICES_KEY) or '').split(',')
+                   if device.strip()]
+        if not devices:
+            devices = nebula_os_profile.data_devices(configurations.get(STORAGED_DATA_PATH_KEY) or '')
+
+    pids = []
+    pid_file = os.path.join(configurations.get(PID_DIR_KEY) or '/var/run/nebula',
+                            'nebula-{0}.pid'.format(component))
+    try:
+        with open(pid_file) as f:
+            pids.append(int(f.read().strip()))
+    except (IOError, OSError, ValueError):
+        pass
+
+    drift = nebula_os_profile.drift(profile_from(configurations), devices, pids)
+    if not drift:
+        return (RESULT_CODE_OK, ['OS profile matches nebula-env'])
+    return (RESULT_CODE_WARNING, ['OS profile drift: ' + '; '.join(
+        '{0} is {1}, expected {2}'.format(setting, 'unavailable' if actual is None else actual, expected)
+        for setting, expected, actual in drift)])
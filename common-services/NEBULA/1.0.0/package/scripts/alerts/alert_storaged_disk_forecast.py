@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import array
+import hashlib
+import os
+import struct
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+from nebula_tsdb import SeriesFile, history_path
+
+RESULT_CODE_OK = 'OK'
+RESULT_CODE_WARNING = 'WARNING'
+RESULT_CODE_CRITICAL = 'CRITICAL'
+RESULT_CODE_UNKNOWN = 'UNKNOWN'
+
+STORAGED_DATA_PATH_KEY = '{{nebula-storaged-site/data_path}}'
+
+WARNING_DAYS_PARAM = 'time.to.full.warning.days'
+CRITICAL_DAYS_PARAM = 'time.to.full.critical.days'
+SAMPLE_INTERVAL_PARAM = 'sample.interval.secs'
+HISTORY_DIR_PARAM = 'history.dir'
+
+DEFAULT_WARNING_DAYS = 14.0
+DEFAULT_CRITICAL_DAYS = 3.0
+DEFAULT_SAMPLE_INTERVAL = 3600
+DEFAULT_HISTORY_DIR = '/var/lib/ambari-agent/tmp'
+
+# 每个数据路径保留的样本数，按小时采样约两周
+HISTORY_CAPACITY = 336
+# 按小时采样时每个512字节的块约容纳60个样本，8个块覆盖HISTORY_CAPACITY还有余量，文件约4KB
+HISTORY_CHUNK_BYTES = 512
+HISTORY_CHUNKS = 8
+# 计算下包络时每组的样本数，压缩期间临时膨胀的空间不参与趋势拟合
+ENVELOPE_WINDOW = 6
+MIN_TREND_POINTS = 3
+
+# 旧版环形缓冲文件的头：样本数、写入位置
+_LEGACY_HEADER = struct.Struct('<II')
+
+
+def get_tokens():
+    """
+    返回用于解析配置的tokens
+    """
+    return (STORAGED_DATA_PATH_KEY,) + nebula_alerts.HOST_TOKENS
+
+
+@nebula_alerts.host_alert('nebula_storaged_disk_forecast')
+def execute(configurations={}, parameters={}, host_name=None):
+    """
+    记录每个storaged数据路径的磁盘用量并预测写满时间
+    返回包含告警结果的元组 (result_code, [result_label])
+    """
+    if configurations is None:
+        return (RESULT_CODE_UNKNOWN, ['There were no configurations supplied to the script.'])
+    if STORAGED_DATA_PATH_KEY not in configurations:
+        return (RESULT_CODE_UNKNOWN, ['The Nebula Storaged data path could not be determined.'])
+
+    parameters = parameters or {}
+    warning_days = float(parameters.get(WARNING_DAYS_PARAM, DEFAULT_WARNING_DAYS))
+    critical_days = float(parameters.get(CRITICAL_DAYS_PARAM, DEFAULT_CRITICAL_DAYS))
+    sample_interval = float(parameters.get(SAMPLE_INTERVAL_PARAM, DEFAULT_SAMPLE_INTERVAL))
+    history_dir = parameters.get(HISTORY_DIR_PARAM, DEFAULT_HISTORY_DIR)
+
+    if not os.path.isdir(history_dir):
+        try:
+            os.makedirs(history_dir)
+        except OSError as e:
+            return (RESULT_CODE_UNKNOWN, ['Unable to create history directory {0}: {1}'.format(history_dir, e)])
+
+    now = time.time()
+    worst_code = RESULT_CODE_OK
+    labels = []
+    for data_path in [path.strip() for path in configurations[STORAGED_DATA_PATH_KEY].split(',') if path.strip()]:
+        try:
+            stat = os.statvfs(data_path)
+        except OSError as e:
+            return (RESULT_CODE_UNKNOWN, ['Unable to stat storaged data path {0}: {1}'.format(data_path, e)])
+        capacity = float(stat.f_blocks * stat.f_frsize)
+        free = float(stat.f_bavail * stat.f_frsize)
+        used = capacity - float(stat.f_bfree * stat.f_frsize)
+
+        history = DiskHistory(history_file(history_dir, data_path))
+        try:
+            if history.last_timestamp() is None:
+                history.import_legacy(legacy_history_file(history_dir, data_path))
+            history.record(now, used, sample_interval)
+            samples = history.samples()
+        finally:
+            history.save()
+
+        days = days_to_full(samples, free)
+        code = classify(days, warning_days, critical_days)
+        worst_code = _worse(worst_code, code)
+        if days is None:
+            labels.append('{0}: {1:.1f}% used, not enough history or no growth'.format(
+                data_path, used * 100.0 / capacity if capacity else 0))
+        else:
+            labels.append('{0}: {1:.1f}% used, full in {2:.1f} days'.format(
+                data_path, used * 100.0 / capacity if capacity else 0, days))
+
+    return (worst_code, ['; '.join(labels)])
+
+
+def history_file(history_dir, data_path):
+    """
+    Returns:
+        str: data_path对应的SeriesFile历史文件路径
+    """
+    return history_path(history_dir, 'storaged-disk-' + _path_digest(data_path))
+
+
+def legacy_history_file(history_dir, data_path):
+    """
+    Returns:
+        str: 旧版环形缓冲历史文件路径，仅用于升级时导入
+    """
+    return os.path.join(history_dir, 'nebula-storaged-disk-{0}.bin'.format(_path_digest(data_path)))
+
+
+def _path_digest(data_path):
+    return hashlib.md5(data_path.encode('utf-8')).hexdigest()[:12]
+
+
+class DiskHistory(object):
+    """
+    (时间戳, 已用字节)历史，存放在nebula_tsdb的Gorilla编码块文件中
+
+    时间戳用delta-of-delta、用量用XOR编码，按小时采样时每个样本约8字节，
+    文件大小固定为HISTORY_CHUNK_BYTES * HISTORY_CHUNKS加16字节文件头。
+    """
+
+    def __init__(self, path, capacity=HISTORY_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.series = SeriesFile(path, chunk_bytes=HISTORY_CHUNK_BYTES, max_chunks=HISTORY_CHUNKS)
+
+    def save(self):
+        """
+        把映射区写回磁盘并关闭文件，之后不能再记录样本
+        """
+        self.series.close()
+
+    def last_timestamp(self):
+        return self.series.last_timestamp()
+
+    def record(self, timestamp, used, min_interval=0):
+        """
+        追加样本，距上一个样本不足min_interval秒或时钟回拨时跳过
+
+        编码后的样本不能原地改写，因此同一采样间隔内保留最早的样本，
+        使采样间隔保持稳定，delta-of-delta编码只需1位。
+
+        Returns:
+            bool: 是否写入了样本
+        """
+        last = self.last_timestamp()
+        if last is not None and timestamp - last < max(min_interval, 0):
+            return False
+        self.series.append(timestamp, used)
+        return True
+
+    def samples(self):
+        """
+        Returns:
+            list: 按时间排序的最近capacity个(timestamp, used)
+        """
+        return list(self.series.scan())[-self.capacity:]
+
+    def import_legacy(self, legacy_path):
+        """
+        导入旧版环形缓冲文件中的样本并删除旧文件，避免升级后丢失趋势
+
+        Args:
+            legacy_path: 旧版历史文件路径，不存在时什么也不做
+        Returns:
+            int: 导入的样本数
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        imported = 0
+        for timestamp, used in _read_legacy(legacy_path):
+            imported += self.record(timestamp, used)
+        os.remove(legacy_path)
+        return imported
+
+
+def _read_legacy(path):
+    """
+    读取旧版文件：8字节头加HISTORY_CAPACITY对double
+
+    Returns:
+        list: 按时间排序的(timestamp, used)，文件损坏时为空
+    """
+    try:
+        with open(path, 'rb') as f:
+            count, head = _LEGACY_HEADER.unpack(f.read(_LEGACY_HEADER.size))
+            values = array.array('d')
+            values.fromfile(f, HISTORY_CAPACITY * 2)
+    except (IOError, EOFError, struct.error):
+        return []
+    count, head = min(count, HISTORY_CAPACITY), head % HISTORY_CAPACITY
+    start = (head - count) % HISTORY_CAPACITY
+    return [(values[((start + i) % HISTORY_CAPACITY) * 2],
+             values[((start + i) % HISTORY_CAPACITY) * 2 + 1]) for i in range(count)]
+
+
+def lower_envelope(samples, window=ENVELOPE_WINDOW):
+    """
+    每window个样本取用量最小的一个
+
+    压缩在删除旧SST之前先写新文件，期间用量会短暂上冲；取下包络可以过滤这些尖峰。
+    """
+    return [min(samples[i:i + window], key=lambda sample: sample[1])
+            for i in range(0, len(samples), window)]
+
+
+def linear_trend(points):
+    """
+    最小二乘拟合used = a + b * t
+
+    Returns:
+        float: 斜率（字节/秒），点数不足时为None
+    """
+    n = len(points)
+    if n < 2:
+        return None
+    t0 = points[0][0]
+    sum_t = sum_u = sum_tt = sum_tu = 0.0
+    for t, u in points:
+        t -= t0
+        sum_t += t
+        sum_u += u
+        sum_tt += t * t
+        sum_tu += t * u
+    denominator = n * sum_tt - sum_t * sum_t
+    if denominator == 0:
+        return None
+    return (n * sum_tu - sum_t * sum_u) / denominator
+
+
+def days_to_full(samples, free_bytes):
+    """
+    基于下包络的增长趋势估算剩余可用空间写满的天数
+
+    Returns:
+        float: 天数，历史不足或用量没有增长时为None
+    """
+    points = lower_envelope(samples)
+    if len(points) < MIN_TREND_POINTS:
+        return None
+    slope = linear_trend(points)
+    if slope is None or slope <= 0:
+        return None
+    return free_bytes / slope / 86400.0
+
+
+def classify(days, warning_days, critical_days):
+    if days is None:
+        return RESULT_CODE_OK
+    if days < critical_days:
+        return RESULT_CODE_CRITICAL
+    if days < warning_days:
+        return RESULT_CODE_WARNING
+    return RESULT_CODE_OK
+
+
+def _worse(first, second):
+    order = [RESULT_CODE_OK, RESULT_CODE_WARNING, RESULT_CODE_CRITICAL]
+    return first if order.index(first) >= order.index(second) else second
+
+
+if __name__ == '__main__':
+    print(execute())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import socket
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import nebula_alerts
+from nebula_rocksdb import RocksDbCollector, evaluate, rocksdb_limits, signals
+from nebula_ngql import ConsoleSession
+from nebula_topology import SpaceList
+
+RESULT_CODE_OK = 'OK'
+RESULT_CODE_WARNING = 'WARNING'
+RESULT_CODE_CRITICAL = 'CRITICAL'
+RESULT_CODE_UNKNOWN = 'UNKNOWN'
+
+STORAGED_DATA_PATH_KEY = '{{nebula-storaged-site/data_path}}'
+STORAGED_HTTP_PORT_KEY = '{{nebula-storaged-site/ws_http_port}}'
+CF_OPTIONS_KEY = '{{nebula-storaged-site/rocksdb_column_family_options}}'
+PID_DIR_KEY = '{{nebula-env/nebula_pid_dir}}'
+GRAPHD_HOSTS_KEY = '{{clusterHostInfo/nebula_graphd_hosts}}'
+GRAPHD_PORT_KEY = '{{nebula-graphd-site/port}}'
+INSTALL_DIR_KEY = '{{nebula-env/nebula_install_dir}}'
+CONSOLE_USER_KEY = '{{nebula-env/nebula_console_user}}'
+CONSOLE_PASSWORD_KEY = '{{nebula-env/nebula_console_password}}'
+
+WARNING_PERCENT_PARAM = 'stall.warning.percent'
+HORIZON_PARAM = 'stall.horizon.secs'
+CHECKPOINT_DIR_PARAM = 'checkpoint.dir'
+
+DEFAULT_WARNING_PERCENT = 70.0
+DEFAULT_HORIZON = 900
+DEFAULT_CHECKPOINT_DIR = '/var/lib/ambari-agent/tmp'
+
+
+def get_tokens():
+    """
+    返回用于解析配置的tokens
+    """
+    return (STORAGED_DATA_PATH_KEY, STORAGED_HTTP_PORT_KEY, CF_OPTIONS_KEY, PID_DIR_KEY, GRAPHD_HOSTS_KEY,
+            GRAPHD_PORT_KEY, INSTALL_DIR_KEY, CONSOLE_USER_KEY, CONSOLE_PASSWORD_KEY) + nebula_alerts.HOST_TOKENS
+
+
+@nebula_alerts.host_alert('nebula_storaged_write_stall')
+def execute(configurations={}, parameters={}, host_name=None):
+    """
+    根据RocksDB的L0文件数、待压缩字节数、memtable数和stall统计提前预警写停顿
+    返回包含告警结果的元组 (result_code, [result_label])
+    """
+    if configurations is None:
+        return (RESULT_CODE_UNKNOWN, ['There were no configurations supplied to the script.'])
+    if STORAGED_DATA_PATH_KEY not in configurations:
+        return (RESULT_CODE_UNKNOWN, ['The Nebula Storaged data path could not be determined.'])
+
+    parameters = parameters or {}
+    warning_fraction = float(parameters.get(WARNING_PERCENT_PARAM, DEFAULT_WARNING_PERCENT)) / 100.0
+    horizon = float(parameters.get(HORIZON_PARAM, DEFAULT_HORIZON))
+    checkpoint_dir = parameters.get(CHECKPOINT_DIR_PARAM, DEFAULT_CHECKPOINT_DIR)
+    try:
+        if not os.path.isdir(checkpoint_dir):
+            os.makedirs(checkpoint_dir)
+    except OSError as e:
+        return (RESULT_CODE_UNKNOWN, ['Unable to create the checkpoint directory {0}: {1}'.format(checkpoint_dir, e)])
+
+    # space名从metad读取，metad不可达时退回storaged命令维护的拓扑缓存，都没有时只分析LOG
+    session = None
+    graphd_hosts = configurations.get(GRAPHD_HOSTS_KEY)
+    if graphd_hosts and GRAPHD_PORT_KEY in configurations:
+        console_bin = configurations.get(INSTALL_DIR_KEY, '/usr/local/nebula') + '/bin/nebula-console'
+        session = ConsoleSession(console_bin, graphd_hosts[0], configurations[GRAPHD_PORT_KEY],
+                                 configurations.get(CONSOLE_USER_KEY, 'root'),
+                                 configurations.get(CONSOLE_PASSWORD_KEY, 'nebula'), timeout=20)
+    spaces = SpaceList(session, os.path.join(configurations.get(PID_DIR_KEY, '/var/run/nebula'),
+                                             'nebula-topology.bin'))
+    data_paths = [path.strip() for path in configurations[STORAGED_DATA_PATH_KEY].split(',') if path.strip()]
+    collector = RocksDbCollector(os.path.join(checkpoint_dir, 'nebula-storaged-rocksdb.json'), data_paths,
+                                 host_name or socket.getfqdn(), configurations.get(STORAGED_HTTP_PORT_KEY),
+                                 spaces)
+    snapshot = collector.collect()
+    items = signals(snapshot)
+    if not items:
+        return (RESULT_CODE_UNKNOWN, ['No RocksDB statistics found under {0} yet.'.format(', '.join(data_paths))])
+
+    code, problems = evaluate(items, collector.previous, snapshot['time'],
+                              rocksdb_limits(configurations.get(CF_OPTIONS_KEY)), warning_fraction, horizon)
+    try:
+        collector.save()
+    except (IOError, OSError):
+        pass
+    summary = '{0} RocksDB engines, {1} spaces with live properties'.format(
+        len(snapshot['engines']), len(snapshot['properties']))
+    if not problems:
+        return (RESULT_CODE_OK, [summary + ', all signals below {0:.0f}% of the slowdown triggers.'.format(
+            warning_fraction * 100)])
+    return (code, [summary + '. ' + '; '.join(problems)])
+
+
+if __name__ == '__main__':
+    print(execute())
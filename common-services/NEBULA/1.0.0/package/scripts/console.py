@@ -20,11 +20,18 @@ limitations under the License.
 """
 
 import sys
+import os
+import json
+import time
 from resource_management import *
 from resource_management.libraries.script.script import Script
 from resource_management.core.resources.system import Execute, File, Directory
 
 from nebula_utils import setup_nebula_config
+from nebula_ngql import session_factory, driver_session_factory
+from nebula_benchmark import WorkloadGenerator, run_benchmark, schema_statements
+from nebula_bulk_load import RowFormatter, BulkLoader, Checkpoint, RejectFile, read_rows, iter_batches
+from nebula_trace import traced
 import params
 
 class ConsoleClient(Script):
@@ -51,6 +58,7 @@ class ConsoleClient(Script):
         Execute(format('usermod -a -G {nebula_group} {nebula_user}'),
                 ignore_failures=True)
 
+    @traced('console.configure')
     def configure(self, env):
         """
         配置Console组件
@@ -71,6 +79,7 @@ class ConsoleClient(Script):
                   create_parents=True,
                   recursive_ownership=True)
 
+    @traced('console.start')
     def start(self, env, upgrade_type=None):
         """
         启动Console组件 - Console是客户端工具，无需启动服务
@@ -83,6 +92,7 @@ class ConsoleClient(Script):
         # 先配置
         self.configure(env)
 
+    @traced('console.stop')
     def stop(self, env, upgrade_type=None):
         """
         停止Console组件 - Console是客户端工具，无需停止服务
@@ -105,6 +115,146 @@ class ConsoleClient(Script):
         else:
             raise Exception("Nebula Console binary not found at " + params.nebula_console_bin)
 
+    def run_benchmark(self, env):
+        """
+        执行合成负载压测，结果写入benchmark_result_dir下的JSON文件
+        """
+        import params
+        env.set_params(params)
+
+        if not os.path.exists(params.nebula_console_bin):
+            raise Exception("Nebula Console binary not found at " + params.nebula_console_bin)
+
+        print("Running Nebula benchmark against graphd hosts: %s" % ', '.join(params.graphd_hosts))
+
+        admin = session_factory(params.nebula_console_bin, params.graphd_hosts, params.graphd_port,
+                                params.nebula_console_user, params.nebula_console_password)(0)
+        statements = schema_statements(params.benchmark_space)
+        admin.execute(statements[0])
+        # 新建的space需要等待两个心跳周期才能使用
+        time.sleep(2 * int(params.storaged_heartbeat_interval_secs))
+        admin.execute(statements[1])
+        time.sleep(2 * int(params.storaged_heartbeat_interval_secs))
+
+        # 每条语句启动一次nebula-console并重新登录时，测得的主要是进程启动和认证开销，
+        # 因此优先使用nebula3-python的长连接会话池，退回nebula-console时结果只能作参考
+        factory = driver_session_factory(params.graphd_hosts, params.graphd_port,
+                                         params.nebula_console_user, params.nebula_console_password,
+                                         space=params.benchmark_space, size=params.benchmark_concurrency)
+        session_type = 'driver'
+        if factory is None:
+            print("WARNING: nebula3-python is not installed; falling back to one nebula-console process per "
+                  "statement. Latency and throughput will mostly measure process start-up and login, and the "
+                  "password is exposed in the process list.")
+            factory = session_factory(params.nebula_console_bin, params.graphd_hosts, params.graphd_port,
+                                      params.nebula_console_user, params.nebula_console_password,
+                                      space=params.benchmark_space)
+            session_type = 'console'
+        generator = WorkloadGenerator(params.benchmark_vertex_count, params.benchmark_edges_per_vertex,
+                                      params.benchmark_batch_size, params.benchmark_hops,
+                                      params.benchmark_seed)
+
+        def report_phase(result):
+            latency = result['latency']
+            print("Phase %s: %d ops, %d errors, %.2f ops/s, p50=%dus p99=%dus max=%dus" % (
+                result['phase'], result['operations'], result['errors'], result['throughput_ops'],
+                latency['p50_us'], latency['p99_us'], latency['max_us']))
+
+        try:
+            report = run_benchmark(generator, factory, params.benchmark_phases,
+                                   params.benchmark_concurrency, params.benchmark_rate_limit,
+                                   params.benchmark_warmup_secs, params.benchmark_duration_secs,
+                                   progress=report_phase)
+        finally:
+            if hasattr(factory, 'pool'):
+                factory.pool.close()
+        report['session_type'] = session_type
+        report['space'] = params.benchmark_space
+        report['graphd_hosts'] = params.graphd_hosts
+        report['graphd_num_worker_threads'] = params.graphd_num_worker_threads
+
+        Directory(params.benchmark_result_dir,
+                  owner=params.nebula_user,
+                  group=params.nebula_group,
+                  mode=0o755,
+                  create_parents=True)
+        result_file = os.path.join(params.benchmark_result_dir,
+                                   'benchmark-%s.json' % time.strftime('%Y%m%d-%H%M%S'))
+        File(result_file,
+             content=json.dumps(report, indent=2, sort_keys=True),
+             owner=params.nebula_user,
+             group=params.nebula_group,
+             mode=0o644)
+        print("Benchmark results written to %s" % result_file)
+
+    def bulk_load(self, env):
+        """
+        按bulk_load_jobs流式导入CSV/TSV文件，支持从checkpoint断点续传
+        """
+        import params
+        env.set_params(params)
+
+        if not params.bulk_load_space:
+            raise Exception("bulk_load_space must be set before running BULK_LOAD")
+        jobs = json.loads(params.bulk_load_jobs or '[]')
+        if not jobs:
+            print("No bulk load jobs are configured in bulk_load_jobs.")
+            return
+
+        Directory(params.bulk_load_checkpoint_dir,
+                  owner=params.nebula_user,
+                  group=params.nebula_group,
+                  mode=0o755,
+                  create_parents=True)
+
+        # 优先使用nebula3-python的长连接会话池；退回nebula-console时每个批次都要
+        # 启动进程并重新登录，密码也会出现在进程参数中，只适合小规模导入
+        factory = driver_session_factory(params.graphd_hosts, params.graphd_port,
+                                         params.nebula_console_user, params.nebula_console_password,
+                                         space=params.bulk_load_space, size=params.bulk_load_concurrency)
+        if factory is None:
+            print("WARNING: nebula3-python is not installed; falling back to one nebula-console process "
+                  "per batch, which limits throughput and exposes the password in the process list.")
+            factory = session_factory(params.nebula_console_bin, params.graphd_hosts, params.graphd_port,
+                                      params.nebula_console_user, params.nebula_console_password,
+                                      space=params.bulk_load_space)
+        loader = BulkLoader(factory, params.bulk_load_concurrency, params.bulk_load_max_retries)
+
+        try:
+            for job in jobs:
+                path = job['path']
+                formatter = RowFormatter(job['type'], job['name'], job['columns'],
+                                         job.get('vid_type', 'string'))
+                job_name = '%s-%s' % (job['name'], os.path.basename(path))
+                checkpoint = Checkpoint(os.path.join(params.bulk_load_checkpoint_dir, job_name + '.json'),
+                                        os.path.abspath(path))
+                rejects = RejectFile(os.path.join(params.bulk_load_checkpoint_dir, job_name + '.rejects'),
+                                     job.get('delimiter', ','))
+                file_size = os.path.getsize(path)
+                if checkpoint.offset >= file_size:
+                    print("Skipping %s: already loaded up to byte %d" % (path, checkpoint.offset))
+                    continue
+
+                print("Loading %s into %s %s from byte %d of %d" % (
+                    path, job['type'], job['name'], checkpoint.offset, file_size))
+                started = time.time()
+                rows = read_rows(path, job.get('delimiter', ','), checkpoint.offset, job.get('header', False))
+                stats = loader.load(formatter, iter_batches(rows, formatter, params.bulk_load_batch_bytes,
+                                                             loader.reject),
+                                    checkpoint, rejects)
+                elapsed = max(time.time() - started, 0.001)
+                print("Loaded %d rows in %d statements (%.0f rows/s), %d retries, %d splits, %d rejected; "
+                      "checkpoint at byte %d" % (stats['rows'], stats['statements'], stats['rows'] / elapsed,
+                                                 stats['retries'], stats['splits'], stats['rejected'],
+                                                 checkpoint.offset))
+                for error in stats['errors']:
+                    print("Rejected row: %s" % error)
+                if stats['rejected']:
+                    print("Rejected records were appended to %s" % rejects.path)
+        finally:
+            if hasattr(factory, 'pool'):
+                factory.pool.close()
+
     def get_log_folder(self):
         """
         获取日志目录
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import sys
+import json
+from resource_management import *
+from resource_management.libraries.script.script import Script
+from resource_management.core.resources.system import Execute, File, Directory
+from resource_management.libraries.functions.check_process_status import check_process_status
+
+from nebula_utils import setup_nebula_config
+from nebula_trace import traced
+import params
+
+class ExporterServer(Script):
+    """
+    Nebula Prometheus Exporter控制类
+    """
+
+    def install(self, env):
+        """
+        安装Exporter组件 - 只依赖随mpack分发的脚本
+        """
+        print("Installing Nebula Prometheus Exporter...")
+
+    @traced('exporter.configure')
+    def configure(self, env):
+        """
+        配置Exporter组件，只抓取本机部署的守护进程
+        """
+        import params
+        env.set_params(params)
+
+        print("Configuring Nebula Prometheus Exporter...")
+
+        setup_nebula_config()
+
+        targets = []
+        if params.hostname in params.graphd_hosts:
+            targets.append({'component': 'graphd', 'host': params.hostname, 'port': params.graphd_ws_http_port})
+        if params.hostname in params.metad_hosts:
+            targets.append({'component': 'metad', 'host': params.hostname, 'port': params.metad_ws_http_port})
+        if params.hostname in params.storaged_hosts:
+            targets.append({'component': 'storaged', 'host': params.hostname, 'port': params.storaged_ws_http_port})
+
+        exporter_config = {
+            'port': params.exporter_port,
+            'interval': params.exporter_scrape_interval_secs,
+            'targets': targets
+        }
+        if params.ams_sink_enabled and params.metrics_collector_hosts:
+            exporter_config['ams'] = {
+                'collector_hosts': params.metrics_collector_hosts,
+                'port': params.metrics_collector_port,
+                'hostname': params.hostname,
+                'flush_interval': params.ams_sink_flush_interval_secs,
+                'max_points': params.ams_sink_max_points,
+                'batch_size': params.ams_sink_batch_size,
+                'compress': params.ams_sink_compress
+            }
+        if params.cgroup_enabled:
+            exporter_config['cgroup'] = {
+                'root': params.cgroup_root,
+                'slice': params.cgroup_slice,
+                'components': [target['component'] for target in targets]
+            }
+        if params.hostname in params.storaged_hosts:
+            exporter_config['rocksdb'] = {
+                'data_paths': [path.strip() for path in params.storaged_data_path.split(',') if path.strip()],
+                'checkpoint_file': os.path.join(params.nebula_pid_dir, 'nebula-exporter-rocksdb.json'),
+                'host': params.hostname,
+                'http_port': params.storaged_ws_http_port,
+                'topology_cache_file': params.topology_cache_file
+            }
+            # space名定期从metad读取，拓扑缓存只作为metad不可达时的后备
+            if params.graphd_hosts:
+                exporter_config['rocksdb'].update({
+                    'console_bin': params.nebula_console_bin,
+                    'graphd_host': params.graphd_hosts[0],
+                    'graphd_port': params.graphd_port,
+                    'user': params.nebula_console_user,
+                    'password': params.nebula_console_password
+                })
+        # 只由排序后第一台Exporter主机汇总nebula.cluster.*，避免重复采集
+        if params.exporter_hosts and sorted(params.exporter_hosts)[0] == params.hostname and params.graphd_hosts:
+            exporter_config['cluster'] = {
+                'console_bin': params.nebula_console_bin,
+                'graphd_host': params.graphd_hosts[0],
+                'graphd_port': params.graphd_port,
+                'user': params.nebula_console_user,
+                'password': params.nebula_console_password,
+                'interval': params.cluster_metrics_interval_secs
+            }
+        metrics_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'metrics.json')
+        if os.path.exists(metrics_file):
+            exporter_config['metrics_file'] = os.path.abspath(metrics_file)
+
+        File(params.exporter_config_file,
+             content=json.dumps(exporter_config, indent=2, sort_keys=True),
+             owner=params.nebula_user,
+             group=params.nebula_group,
+             mode=0o600)
+
+    @traced('exporter.start')
+    def start(self, env, upgrade_type=None):
+        """
+        启动Exporter
+        """
+        import params
+        env.set_params(params)
+
+        print("Starting Nebula Prometheus Exporter...")
+
+        self.configure(env)
+
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nebula_exporter.py')
+        Execute(format("nohup {python} {script} {exporter_config_file} >> {nebula_log_dir}/nebula-exporter.log 2>&1 & echo $! > {exporter_pid_file}",
+                       python=sys.executable, script=script),
+                user=params.nebula_user,
+                not_if=format("test -f {exporter_pid_file} && ps -p `cat {exporter_pid_file}` > /dev/null 2>&1"))
+
+    @traced('exporter.stop')
+    def stop(self, env, upgrade_type=None):
+        """
+        停止Exporter
+        """
+        import params
+        env.set_params(params)
+
+        print("Stopping Nebula Prometheus Exporter...")
+
+        Execute(format("kill `cat {exporter_pid_file}` && rm -f {exporter_pid_file}"),
+                user=params.nebula_user,
+                only_if=format("test -f {exporter_pid_file}"),
+                ignore_failures=True)
+
+    def status(self, env):
+        """
+        检查Exporter状态
+        """
+        import status_params
+        env.set_params(status_params)
+
+        check_process_status(status_params.exporter_pid_file)
+
+    def get_log_folder(self):
+        """
+        获取日志目录
+        """
+        import params
+        return params.nebula_log_dir
+
+    def get_user(self):
+        """
+        获取运行用户
+        """
+        import params
+        return params.nebula_user
+
+    def get_pid_files(self):
+        """
+        获取PID文件列表
+        """
+        import params
+        return [params.exporter_pid_file]
+
+if __name__ == "__main__":
+    ExporterServer().execute()
@@ -20,6 +20,7 @@ limitations under the License.
 """
 
 import sys
+import time
 from resource_management import *
 from resource_management.libraries.script.script import Script
 from resource_management.libraries.functions import conf_select
@@ -28,7 +29,10 @@ from resource_management.core.resources.system import Execute, File, Directory
 from resource_management.core.source import InlineTemplate
 from resource_management.libraries.functions.check_process_status import check_process_status
 
-from nebula_utils import nebula_service, setup_nebula_config, generate_graphd_config
+from nebula_endpoints import ACTIVE, active_endpoints
+from nebula_utils import nebula_service, setup_nebula_config, generate_graphd_config, setup_os_profile, \
+    update_graphd_endpoints
+from nebula_trace import traced
 import params
 
 class GraphdServer(Script):
@@ -55,6 +59,7 @@ class GraphdServer(Script):
         Execute(format('usermod -a -G {nebula_group} {nebula_user}'),
                 ignore_failures=True)
 
+    @traced('graphd.configure')
     def configure(self, env):
         """
         配置Graphd组件
@@ -69,6 +74,12 @@ class GraphdServer(Script):
         
         # 生成Graphd特定配置
         generate_graphd_config()
+
+        # 应用主机OS性能配置
+        setup_os_profile()
+
+        # 拓扑变化后重新生成endpoint清单和负载均衡配置片段
+        update_graphd_endpoints()
         
         # 确保数据和日志目录权限正确
         Directory([params.nebula_data_dir, params.nebula_log_dir, params.nebula_pid_dir],
@@ -78,6 +89,7 @@ class GraphdServer(Script):
                   create_parents=True,
                   recursive_ownership=True)
 
+    @traced('graphd.start')
     def start(self, env, upgrade_type=None):
         """
         启动Graphd服务
@@ -93,6 +105,10 @@ class GraphdServer(Script):
         # 启动服务
         nebula_service('start', 'graphd')
 
+        # 重新加入面向客户端的endpoint清单
+        update_graphd_endpoints(ACTIVE)
+
+    @traced('graphd.stop')
     def stop(self, env, upgrade_type=None):
         """
         停止Graphd服务
@@ -101,10 +117,41 @@ class GraphdServer(Script):
         env.set_params(params)
         
         print("Stopping Nebula Graphd...")
+
+        # 先排空会话，避免执行中的查询失败
+        if params.graphd_drain_enabled:
+            self._drain_sessions()
         
         # 停止服务
         nebula_service('stop', 'graphd')
 
+    @traced('graphd.drain_sessions')
+    def _drain_sessions(self):
+        """
+        把本机移出endpoint清单，等待会话和查询降到阈值以下或超时
+
+        清单更新失败（文件损坏、权限不足等）只打印警告，不阻止停止。
+        """
+        import params
+        from nebula_endpoints import DRAINING, SessionDrain, format_drain
+        from nebula_stats import fetch_stats
+
+        # 清单默认在本机，只有读取同一文件的客户端或负载均衡（同机LB或共享存储）才能看到draining
+        try:
+            manifest = update_graphd_endpoints(DRAINING)
+            print("Marked %s:%s as draining in %s, %d graphd endpoints remain active" % (
+                params.hostname, params.graphd_port, params.graphd_endpoints_file, len(active_endpoints(manifest))))
+        except Exception as e:
+            print("Warning: cannot mark %s:%s as draining in %s, waiting for sessions anyway: %s" % (
+                params.hostname, params.graphd_port, params.graphd_endpoints_file, e))
+
+        drain = SessionDrain(lambda: fetch_stats(params.hostname, params.graphd_ws_http_port),
+                             max_sessions=params.graphd_drain_max_sessions,
+                             max_queries=params.graphd_drain_max_queries,
+                             timeout=params.graphd_drain_timeout_secs)
+        for line in format_drain(drain.drain()):
+            print(line)
+
     def status(self, env):
         """
         检查Graphd服务状态
@@ -123,6 +170,31 @@ class GraphdServer(Script):
         self.stop(env)
         self.start(env)
 
+    def analyze_slow_queries(self, env):
+        """
+        增量分析graphd日志，按总耗时输出最慢的查询形状
+        """
+        import params
+        env.set_params(params)
+
+        from nebula_slow_query import SlowQueryAnalyzer, format_top
+
+        Directory(params.slow_query_dir,
+                  owner=params.nebula_user,
+                  group=params.nebula_group,
+                  mode=0o755,
+                  create_parents=True)
+
+        patterns = [params.slow_query_log_pattern] if params.slow_query_log_pattern else None
+        analyzer = SlowQueryAnalyzer(params.slow_query_checkpoint_file, patterns)
+        started = time.time()
+        processed = analyzer.scan_dir(params.nebula_log_dir, params.slow_query_log_glob)
+        analyzer.save()
+        print("Scanned %d new bytes of graphd logs in %.1fs, %d query shapes tracked" % (
+            processed, time.time() - started, len(analyzer.queries)))
+        for line in format_top(analyzer.top(params.slow_query_top_n)):
+            print(line)
+
     def get_log_folder(self):
         """
         获取日志目录
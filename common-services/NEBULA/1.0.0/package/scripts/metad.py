@@ -29,6 +29,9 @@ from resource_management.core.source import InlineTemplate
 from resource_management.libraries.functions.check_process_status import check_process_status
 
 from nebula_utils import nebula_service, setup_nebula_config, generate_metad_config
+from nebula_ngql import session_factory
+from nebula_balance import BalanceOrchestrator, failed_spaces, format_report
+from nebula_trace import traced
 import params
 
 class MetadServer(Script):
@@ -55,6 +58,7 @@ class MetadServer(Script):
         Execute(format('usermod -a -G {nebula_group} {nebula_user}'),
                 ignore_failures=True)
 
+    @traced('metad.configure')
     def configure(self, env):
         """
         配置Metad组件
@@ -86,6 +90,7 @@ class MetadServer(Script):
                   create_parents=True,
                   recursive_ownership=True)
 
+    @traced('metad.start')
     def start(self, env, upgrade_type=None):
         """
         启动Metad服务
@@ -101,6 +106,7 @@ class MetadServer(Script):
         # 启动服务
         nebula_service('start', 'metad')
 
+    @traced('metad.stop')
     def stop(self, env, upgrade_type=None):
         """
         停止Metad服务
@@ -131,6 +137,43 @@ class MetadServer(Script):
         self.stop(env)
         self.start(env)
 
+    def balance_leader(self, env):
+        """
+        均衡各space的分片leader
+        """
+        self._balance(env, 'LEADER')
+
+    def balance_data(self, env):
+        """
+        均衡各space的分片副本
+        """
+        self._balance(env, 'DATA')
+
+    def _balance(self, env, kind):
+        import params
+        env.set_params(params)
+
+        session = session_factory(params.nebula_console_bin, params.graphd_hosts or [params.hostname],
+                                  params.graphd_port, params.nebula_console_user,
+                                  params.nebula_console_password)(0)
+        orchestrator = BalanceOrchestrator(session,
+                                           skew_threshold=params.balance_skew_threshold,
+                                           max_poll_interval=params.balance_max_poll_interval_secs,
+                                           stall_timeout=params.balance_stall_timeout_secs,
+                                           timeout=params.balance_timeout_secs)
+
+        print("Balancing %s for %s..." % (kind.lower(), ', '.join(params.balance_spaces) or 'all spaces'))
+        # 无论成功与否都输出已处理space的before/after报告，任一space失败时命令失败
+        report = {}
+        try:
+            orchestrator.balance(kind, params.balance_spaces, report=report)
+        finally:
+            for line in format_report(report):
+                print(line)
+        failed = failed_spaces(report)
+        if failed:
+            raise Fail("Balance %s failed for %s" % (kind.lower(), ', '.join(failed)))
+
     def get_log_folder(self):
         """
         获取日志目录
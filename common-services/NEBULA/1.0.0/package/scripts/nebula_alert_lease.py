@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import time
+
+# SERVICE范围的告警在所有装有NEBULA组件的agent上执行，候选主机取三类组件主机的并集
+HOST_KEYS = ('{{clusterHostInfo/nebula_graphd_hosts}}', '{{clusterHostInfo/nebula_metad_hosts}}',
+             '{{clusterHostInfo/nebula_storaged_hosts}}')
+LEASE_ENABLED_KEY = '{{nebula-env/alert_lease_enabled}}'
+LEASE_DIR_KEY = '{{nebula-env/alert_lease_dir}}'
+ALERT_TOKENS = HOST_KEYS + (LEASE_ENABLED_KEY, LEASE_DIR_KEY)
+
+# 每个(告警, 主机)上次执行的时间；告警模块随agent进程常驻，两次执行的间隔即告警周期
+_last_run = {}
+
+
+def rank_hosts(name, hosts):
+    """
+    按(告警名, 主机)的哈希对候选主机排序（rendezvous hashing）
+
+    所有agent算出相同的顺序；不同告警落在不同主机上，主机增减只影响与其相关的排序。
+    执行者在主机列表不变时保持固定，发布间隔因此与告警周期一致。
+
+    Returns:
+        list: 去重后的主机，第一个为执行者，其余依次为后备
+    """
+    def score(host):
+        return hashlib.md5('{0}|{1}'.format(name, host).encode('utf-8')).hexdigest()
+
+    return sorted(set(hosts), key=lambda host: (score(host), host))
+
+
+def result_path(lease_dir, name):
+    return os.path.join(lease_dir, name + '.json')
+
+
+def read_result(lease_dir, name):
+    """
+    Returns:
+        dict: 最近发布的结果{host, time, state, labels}，不存在或不完整时为None
+    """
+    try:
+        with open(result_path(lease_dir, name)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def publish_result(lease_dir, name, host, now, result):
+    """
+    原子替换共享目录中的结果文件，多台主机同时接管时以最后一次写入为准
+    """
+    if not os.path.isdir(lease_dir):
+        os.makedirs(lease_dir)
+    record = {'host': host, 'time': now, 'state': result[0], 'labels': list(result[1])}
+    tmp_path = '{0}.{1}.{2}.tmp'.format(result_path(lease_dir, name), host, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f, sort_keys=True)
+    os.chmod(tmp_path, 0o644)
+    os.rename(tmp_path, result_path(lease_dir, name))
+    return record
+
+
+def should_probe(rank, published, host, age, interval):
+    """
+    决定本机是否需要亲自探测
+
+    排第一的主机每次都探测。没有已发布的结果、结果由本机发布（目录不共享时
+    本机只能看到自己的结果），或者还不知道告警周期时也探测。第r位的后备主机
+    只在已发布结果的年龄超过(r + 0.5)个周期时接管，即前面r台主机都没有按时发布。
+    不在候选列表中的主机排在所有候选之后。
+    """
+    if rank == 0 or published is None or published.get('host') == host or not interval:
+        return True
+    return age > (rank + 0.5) * interval
+
+
+def cluster_scoped(name):
+    """
+    集群范围告警execute的装饰器：每个周期只有一台agent探测，其余读取它发布的结果
+
+    只有alert_lease_enabled为true且alert_lease_dir指向所有主机共享的目录时生效，
+    否则每台agent各自探测。告警周期取本机相邻两次执行的间隔，不需要单独配置。
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(configurations={}, parameters={}, host_name=None, clock=time.time):
+            lease_dir = (configurations or {}).get(LEASE_DIR_KEY)
+            if not configurations or not lease_dir or \
+                    str(configurations.get(LEASE_ENABLED_KEY, 'false')).lower() != 'true':
+                return func(configurations, parameters, host_name)
+            hosts = []
+            for key in HOST_KEYS:
+                hosts.extend(configurations.get(key) or [])
+            host_name = host_name or _local_host()
+
+            now = clock()
+            previous = _last_run.get((name, host_name))
+            _last_run[(name, host_name)] = now
+            interval = now - previous if previous is not None and now > previous else None
+            ranked = rank_hosts(name, hosts)
+            rank = ranked.index(host_name) if host_name in ranked else len(ranked)
+            published = read_result(lease_dir, name)
+            age = now - published['time'] if published else None
+
+            if not should_probe(rank, published, host_name, age, interval):
+                return _reuse(published)
+
+            result = func(configurations, parameters, host_name)
+            try:
+                publish_result(lease_dir, name, host_name, now, result)
+            except (IOError, OSError):
+                pass
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _reuse(published):
+    labels = list(published['labels'])
+    if labels:
+        labels[0] = '{0} (probed by {1})'.format(labels[0], published['host'])
+    return (published['state'], labels)
+
+
+def _local_host():
+    import socket
+    return socket.getfqdn()
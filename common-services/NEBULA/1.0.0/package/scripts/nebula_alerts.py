@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+
+import socket
+
+import nebula_alert_lease
+import nebula_trace
+from nebula_ngql import show_meta_leader
+
+# 告警脚本的公共入口。Ambari按文件路径加载告警脚本，不会把所在目录加入sys.path，
+# 因此每个告警只把package/scripts加入sys.path后导入本模块，tokens和装饰器都从这里取得。
+
+# 单主机告警和集群范围告警各自需要追加的tokens
+HOST_TOKENS = nebula_trace.ALERT_TOKENS
+CLUSTER_TOKENS = nebula_trace.ALERT_TOKENS + nebula_alert_lease.ALERT_TOKENS
+
+# 告警内部的计数直接记到当前trace区间
+count = nebula_trace.count
+
+
+def host_alert(name):
+    """
+    在每台主机上执行的告警：只记录trace
+    """
+    return nebula_trace.traced_alert(name)
+
+
+def cluster_alert(name):
+    """
+    集群范围告警：记录trace，并通过nebula_alert_lease每个周期只由一台主机探测
+    """
+
+    def decorator(func):
+        return nebula_trace.traced_alert(name)(nebula_alert_lease.cluster_scoped(name)(func))
+
+    return decorator
+
+
+def metad_leader_only(session, host_name=None):
+    """
+    挂在metad组件上的集群范围告警只由当前metad leader探测，其他metad主机直接返回OK
+
+    不依赖告警租约，每个周期整个集群只探测一次；需要保存在本机的状态只在leader切换时重新开始。
+
+    Returns:
+        tuple: 本机不是leader或无法确定leader时应返回的告警结果，本机是leader时为None
+    """
+    try:
+        leader = show_meta_leader(session)
+    except Exception as e:
+        return ('UNKNOWN', ['Unable to find the metad leader: {0}'.format(e)])
+    if leader is None:
+        return ('UNKNOWN', ['metad did not report a leader.'])
+    if leader[0] != (host_name or socket.getfqdn()):
+        return ('OK', ['Checked on the metad leader {0}.'.format(leader[0])])
+    return None
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+
+from nebula_ngql import NgqlError, quote_name, show_hosts
+
+FINAL_TASK_STATES = ('FINISHED', 'SUCCEEDED', 'FAILED', 'STOPPED', 'INVALID')
+
+
+class BalanceError(Exception):
+    """
+    均衡作业失败、停滞或超时
+    """
+    pass
+
+
+def space_distribution(hosts, key='leaders'):
+    """
+    按space汇总在线主机的leader（或分片）分布
+
+    Returns:
+        dict: space -> {"host:port": count}，没有leader的在线主机计为0
+    """
+    online = ['{0}:{1}'.format(host['host'], host['port']) for host in hosts if host['status'] == 'ONLINE']
+    distribution = {}
+    for host in hosts:
+        if host['status'] != 'ONLINE':
+            continue
+        address = '{0}:{1}'.format(host['host'], host['port'])
+        for space, count in host[key].items():
+            distribution.setdefault(space, dict((name, 0) for name in online))[address] = count
+    return distribution
+
+
+def skew(counts):
+    """
+    leader偏斜度：(最大值 - 最小值) / 平均值，主机数不足2或没有leader时为0
+    """
+    values = list(counts.values())
+    if len(values) < 2 or sum(values) == 0:
+        return 0.0
+    mean = float(sum(values)) / len(values)
+    return (max(values) - min(values)) / mean
+
+
+class BalanceOrchestrator(object):
+    """
+    提交SUBMIT JOB BALANCE LEADER/DATA并跟踪进度
+
+    轮询间隔从poll_interval开始按倍数退避，不超过max_poll_interval。已完成任务数
+    在stall_timeout内没有变化，或总耗时超过timeout时执行STOP JOB并抛出BalanceError。
+    """
+
+    def __init__(self, session, skew_threshold=0.2, poll_interval=2, max_poll_interval=30,
+                 stall_timeout=600, timeout=7200, clock=time.time, sleep=time.sleep):
+        self.session = session
+        self.skew_threshold = float(skew_threshold)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.stall_timeout = stall_timeout
+        self.timeout = timeout
+        self._clock = clock
+        self._sleep = sleep
+
+    def snapshot(self, key='leaders'):
+        return space_distribution(show_hosts(self.session), key)
+
+    def balance(self, kind, spaces=None, force=False, report=None):
+        """
+        对偏斜超过阈值的space执行均衡
+
+        某个space的作业失败、停滞或超时时记录错误并继续处理其余space。
+
+        Args:
+            kind: 'LEADER'或'DATA'
+            spaces: 限定的space列表，为空表示全部
+            force: 忽略偏斜阈值，对所有选中的space执行
+            report: 调用方传入的dict，中途抛出异常时其中保留已完成部分
+
+        Returns:
+            dict: 每个space的before/after分布、偏斜度、作业结果和error
+        """
+        kind = kind.upper()
+        if kind not in ('LEADER', 'DATA'):
+            raise ValueError('Unknown balance kind: ' + kind)
+        if report is None:
+            report = {}
+
+        # leader均衡看leader分布，数据均衡看分片分布
+        key = 'leaders' if kind == 'LEADER' else 'partitions'
+        before = self.snapshot(key)
+        try:
+            for space in sorted(before):
+                if spaces and space not in spaces:
+                    continue
+                entry = {'before': before[space], 'skew_before': round(skew(before[space]), 3)}
+                report[space] = entry
+                if not force and entry['skew_before'] <= self.skew_threshold:
+                    entry['job'] = 'skipped'
+                    continue
+                try:
+                    entry['job'] = self._run_job(space, kind)
+                except (BalanceError, NgqlError) as e:
+                    entry['job'] = 'failed'
+                    entry['error'] = str(e)
+        finally:
+            try:
+                after = self.snapshot(key)
+            except NgqlError as e:
+                print('Failed to read the distribution after balancing: {0}'.format(e))
+                after = {}
+            for space, entry in report.items():
+                entry['after'] = after.get(space, {})
+                entry['skew_after'] = round(skew(entry['after']), 3)
+        return report
+
+    def _run_job(self, space, kind):
+        rows = self.session.execute('USE {0}; SUBMIT JOB BALANCE {1}'.format(quote_name(space), kind))
+        if not rows or rows[0].get('New Job Id') is None:
+            raise BalanceError('SUBMIT JOB BALANCE {0} returned no job id for space {1}'.format(kind, space))
+        job_id = int(rows[0]['New Job Id'])
+
+        started = self._clock()
+        last_progress = None
+        progress_at = started
+        interval = self.poll_interval
+        while True:
+            status, done, total = self._job_progress(space, job_id)
+            now = self._clock()
+            if status == 'FINISHED':
+                return {'job_id': job_id, 'status': status, 'tasks': total,
+                        'elapsed_secs': round(now - started, 1)}
+            if status in ('FAILED', 'STOPPED'):
+                raise BalanceError('Balance {0} job {1} on space {2} ended with status {3} ({4}/{5} tasks done)'.format(
+                    kind, job_id, space, status, done, total))
+
+            if done != last_progress:
+                last_progress = done
+                progress_at = now
+            elif now - progress_at >= self.stall_timeout:
+                self._stop(space, job_id)
+                raise BalanceError('Balance {0} job {1} on space {2} stalled at {3}/{4} tasks for {5}s, stopped'.format(
+                    kind, job_id, space, done, total, int(now - progress_at)))
+            if now - started >= self.timeout:
+                self._stop(space, job_id)
+                raise BalanceError('Balance {0} job {1} on space {2} timed out after {3}s, stopped'.format(
+                    kind, job_id, space, int(now - started)))
+
+            print('Balance {0} on {1}: job {2} {3}, {4}/{5} tasks done'.format(
+                kind, space, job_id, status, done, total))
+            self._sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def _job_progress(self, space, job_id):
+        """
+        Returns:
+            tuple: (作业状态, 已结束任务数, 任务总数)
+        """
+        rows = self.session.execute('USE {0}; SHOW JOB {1}'.format(quote_name(space), job_id))
+        if not rows:
+            return '', 0, 0
+        status = rows[0].get('Status', '').upper()
+        # 3.x在任务行之后追加一行"Total:N | Succeeded:N | Failed:N ..."汇总
+        tasks = [row for row in rows[1:]
+                 if row.get('Status') and not any(str(value).startswith('Total:') for value in row.values())]
+        done = len([task for task in tasks if task['Status'].upper() in FINAL_TASK_STATES])
+        return status, done, len(tasks)
+
+    def _stop(self, space, job_id):
+        try:
+            self.session.execute('USE {0}; STOP JOB {1}'.format(quote_name(space), job_id))
+        except NgqlError as e:
+            print('Failed to stop balance job {0} on space {1}: {2}'.format(job_id, space, e))
+
+
+def format_report(report):
+    """
+    把balance返回的报告渲染成命令输出中的文本行
+    """
+    lines = []
+    for space in sorted(report):
+        entry = report[space]
+        job = entry['job']
+        summary = job if isinstance(job, str) else 'job {0} {1} in {2}s'.format(
+            job['job_id'], job['status'], job['elapsed_secs'])
+        lines.append('{0}: skew {1} -> {2} ({3})'.format(
+            space, entry['skew_before'], entry.get('skew_after', '?'), summary))
+        if entry.get('error'):
+            lines.append('  error: {0}'.format(entry['error']))
+        for host in sorted(entry['before']):
+            lines.append('  {0}: {1} -> {2}'.format(
+                host, entry['before'][host], entry.get('after', {}).get(host, 0)))
+    return lines
+
+
+def failed_spaces(report):
+    """
+    Returns:
+        list: 均衡作业失败的space
+    """
+    return sorted(space for space, entry in report.items() if entry.get('error'))
+
+
+class LeaderDrain(object):
+    """
+    停止storaged前把本机的leader迁走，避免分片等待raft选举超时
+
+    对本机担任leader的每个space执行statement，然后轮询SHOW HOSTS直到本机leader数为0或超过timeout。
+    statement必须用{host}（可选{port}）占位符指向本机：不排除本机的BALANCE LEADER只会在整个集群
+    重新均衡leader，每次滚动重启都造成无谓的leader切换，因此不含{host}时跳过迁移。
+    占位符按字面替换，语句中的其他花括号原样保留。任何失败都只记录在报告中，不阻止后续的停止。
+    """
+
+    def __init__(self, session, host, port, statement='', timeout=60,
+                 poll_interval=2, clock=time.time, sleep=time.sleep):
+        self.session = session
+        self.host = host
+        self.port = int(port)
+        self.statement = statement
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._sleep = sleep
+
+    def _self_and_peers(self):
+        hosts = show_hosts(self.session)
+        me = None
+        peers = []
+        for item in hosts:
+            if item['host'] == self.host and item['port'] == self.port:
+                me = item
+            elif item['status'] == 'ONLINE':
+                peers.append(item)
+        return me, peers
+
+    def drain(self):
+        """
+        Returns:
+            dict: initial、remaining、seconds、timeline（[(秒, leader数)]）、
+                  skipped（跳过原因）和errors
+        """
+        started = self._clock()
+        report = {'initial': None, 'remaining': None, 'seconds': 0, 'timeline': [], 'skipped': None,
+                  'errors': []}
+        if '{host}' not in self.statement:
+            report['skipped'] = 'leader_drain_statement must move leaders off this host via {host}'
+            return report
+        try:
+            me, peers = self._self_and_peers()
+        except NgqlError as e:
+            report['skipped'] = 'SHOW HOSTS failed: {0}'.format(e)
+            return report
+        if me is None:
+            report['skipped'] = '{0}:{1} is not registered in metad'.format(self.host, self.port)
+            return report
+        report['initial'] = report['remaining'] = me['leader_count']
+        report['timeline'].append((0.0, me['leader_count']))
+        if me['leader_count'] == 0:
+            return report
+        if not peers:
+            report['skipped'] = 'no other ONLINE storaged to take over leaders'
+            return report
+
+        statement = self.statement.replace('{host}', self.host).replace('{port}', str(self.port))
+        for space in sorted(space for space, count in me['leaders'].items() if count > 0):
+            try:
+                self.session.execute('USE {0}; {1}'.format(quote_name(space), statement))
+            except NgqlError as e:
+                report['errors'].append('{0}: {1}'.format(space, e))
+        while True:
+            elapsed = self._clock() - started
+            if elapsed >= self.timeout:
+                break
+            self._sleep(min(self.poll_interval, max(0, self.timeout - elapsed)))
+            try:
+                me, _ = self._self_and_peers()
+            except NgqlError as e:
+                report['errors'].append('SHOW HOSTS: {0}'.format(e))
+                continue
+            if me is None:
+                break
+            report['remaining'] = me['leader_count']
+            report['timeline'].append((round(self._clock() - started, 1), me['leader_count']))
+            if me['leader_count'] == 0:
+                break
+        report['seconds'] = round(self._clock() - started, 1)
+        return report
+
+
+def format_drain(report):
+    """
+    把drain返回的报告渲染成停止命令输出中的文本行
+    """
+    if report['skipped']:
+        return ['Leader drain skipped: {0}'.format(report['skipped'])]
+    lines = ['Leader drain: {0} -> {1} leaders in {2}s'.format(
+        report['initial'], report['remaining'], report['seconds'])]
+    lines.extend('  +{0}s: {1} leaders'.format(seconds, count) for seconds, count in report['timeline'][1:])
+    lines.extend('  error: {0}'.format(error) for error in report['errors'])
+    if report['remaining']:
+        lines.append('Warning: {0} leaders still on this host, their partitions will wait for an election'.format(
+            report['remaining']))
+    return lines
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+import threading
+import time
+
+from nebula_ngql import NgqlError
+
+BENCH_TAG = 'bench_vertex'
+BENCH_EDGE = 'bench_edge'
+
+DEFAULT_PHASES = ('insert_vertex', 'insert_edge', 'go', 'match')
+WRITE_PHASES = ('insert_vertex', 'insert_edge')
+
+# 延迟直方图桶上界（微秒），按2的幂递增，覆盖1us到约67s
+HISTOGRAM_BOUNDS = [1 << i for i in range(27)]
+
+
+def schema_statements(space, partition_num=10, replica_factor=1):
+    """
+    返回压测所需的space/tag/edge建模语句
+
+    CREATE SPACE之后需要等待两个心跳周期再执行其余语句。
+    """
+    return [
+        'CREATE SPACE IF NOT EXISTS {0}(partition_num={1}, replica_factor={2}, '
+        'vid_type=INT64)'.format(space, partition_num, replica_factor),
+        'USE {0}; CREATE TAG IF NOT EXISTS {1}(name string, value int); '
+        'CREATE EDGE IF NOT EXISTS {2}(weight double)'.format(space, BENCH_TAG, BENCH_EDGE),
+    ]
+
+
+class RateLimiter(object):
+    """
+    线程安全的令牌桶限速器
+
+    rate不大于0时不限速。
+    """
+
+    def __init__(self, rate, burst=None, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(1.0, self.rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class LatencyHistogram(object):
+    """
+    以2的幂为桶边界的延迟直方图，单位为微秒
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.total = 0
+        self.sum_us = 0
+        self.max_us = 0
+
+    def record(self, latency_us):
+        latency_us = int(latency_us)
+        index = 0
+        while index < len(HISTOGRAM_BOUNDS) and latency_us > HISTOGRAM_BOUNDS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += 1
+        self.sum_us += latency_us
+        if latency_us > self.max_us:
+            self.max_us = latency_us
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, pct):
+        """
+        返回pct分位所在桶的上界（微秒）
+        """
+        if self.total == 0:
+            return 0
+        target = self.total * pct / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                if index < len(HISTOGRAM_BOUNDS):
+                    return min(HISTOGRAM_BOUNDS[index], self.max_us)
+                return self.max_us
+        return self.max_us
+
+    def to_dict(self):
+        buckets = []
+        for index, count in enumerate(self.counts):
+            if count:
+                bound = HISTOGRAM_BOUNDS[index] if index < len(HISTOGRAM_BOUNDS) else None
+                buckets.append({'le_us': bound, 'count': count})
+        return {
+            'count': self.total,
+            'mean_us': self.sum_us / self.total if self.total else 0,
+            'p50_us': self.percentile(50),
+            'p95_us': self.percentile(95),
+            'p99_us': self.percentile(99),
+            'max_us': self.max_us,
+            'buckets': buckets
+        }
+
+
+class WorkloadGenerator(object):
+    """
+    生成合成的点/边写入和k跳读取语句
+
+    所有语句只依赖操作序号和seed，相同配置多次运行产生相同的负载。
+    """
+
+    def __init__(self, vertex_count=100000, edges_per_vertex=5, batch_size=100,
+                 hops=2, seed=42):
+        self.vertex_count = int(vertex_count)
+        self.edges_per_vertex = int(edges_per_vertex)
+        self.batch_size = int(batch_size)
+        self.hops = int(hops)
+        self.seed = int(seed)
+
+    def operation_count(self, phase):
+        """
+        写入阶段的总操作数，读取阶段返回None（按时长运行）
+        """
+        if phase == 'insert_vertex':
+            total = self.vertex_count
+        elif phase == 'insert_edge':
+            total = self.vertex_count * self.edges_per_vertex
+        else:
+            return None
+        return (total + self.batch_size - 1) // self.batch_size
+
+    def statement(self, phase, index):
+        if phase == 'insert_vertex':
+            return self.insert_vertex(index)
+        if phase == 'insert_edge':
+            return self.insert_edge(index)
+        if phase == 'go':
+            return self.go(index)
+        if phase == 'match':
+            return self.match(index)
+        raise ValueError('Unknown benchmark phase: ' + phase)
+
+    def insert_vertex(self, index):
+        start = index * self.batch_size
+        stop = min(start + self.batch_size, self.vertex_count)
+        values = ['{0}:("v{0}", {1})'.format(vid, vid % 1000) for vid in range(start, stop)]
+        return 'INSERT VERTEX {0}(name, value) VALUES {1}'.format(BENCH_TAG, ', '.join(values))
+
+    def insert_edge(self, index):
+        rng = random.Random(self.seed * 1000003 + index)
+        total = self.vertex_count * self.edges_per_vertex
+        start = index * self.batch_size
+        stop = min(start + self.batch_size, total)
+        values = []
+        for edge in range(start, stop):
+            src = edge // self.edges_per_vertex
+            dst = rng.randrange(self.vertex_count)
+            values.append('{0}->{1}:({2:.3f})'.format(src, dst, rng.random()))
+        return 'INSERT EDGE {0}(weight) VALUES {1}'.format(BENCH_EDGE, ', '.join(values))
+
+    def _read_vid(self, index):
+        return random.Random(self.seed * 7919 + index).randrange(self.vertex_count)
+
+    def go(self, index):
+        return 'GO {0} STEPS FROM {1} OVER {2} YIELD dst(edge) AS dst'.format(
+            self.hops, self._read_vid(index), BENCH_EDGE)
+
+    def match(self, index):
+        return ('MATCH (v:{0})-[e:{1}*{2}]->(u) WHERE id(v) == {3} '
+                'RETURN count(u) AS reached').format(
+            BENCH_TAG, BENCH_EDGE, self.hops, self._read_vid(index))
+
+
+class _OperationCounter(object):
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            if self.limit is not None and self._next >= self.limit:
+                return None
+            index = self._next
+            self._next += 1
+            return index
+
+
+def run_phase(phase, generator, session_factory, concurrency=4, rate=0,
+              warmup_secs=0, duration_secs=60, clock=time.time):
+    """
+    以固定并发执行一个压测阶段
+
+    写入阶段执行完generator给出的全部批次；读取阶段先预热warmup_secs，
+    预热期间的请求不计入直方图，然后再运行duration_secs。
+
+    Args:
+        phase: 阶段名称，见DEFAULT_PHASES
+        generator: WorkloadGenerator
+        session_factory: factory(worker_index) -> 带execute(statement)方法的会话
+        concurrency: 并发会话数
+        rate: 全局每秒请求上限，0表示不限速
+        warmup_secs: 读取阶段的预热秒数
+        duration_secs: 读取阶段的计量秒数
+
+    Returns:
+        dict: 阶段吞吐量、错误数和延迟直方图
+    """
+    limiter = RateLimiter(rate)
+    counter = _OperationCounter(generator.operation_count(phase))
+    timed = phase not in WRITE_PHASES
+    started = clock()
+    measure_from = started + (warmup_secs if timed else 0)
+    deadline = measure_from + duration_secs if timed else None
+
+    histograms = [LatencyHistogram() for _ in range(concurrency)]
+    errors = [0] * concurrency
+    last_errors = [None] * concurrency
+
+    def worker(slot):
+        try:
+            session = session_factory(slot)
+        except Exception as e:
+            errors[slot] += 1
+            last_errors[slot] = 'session: {0}'.format(e)
+            return
+        try:
+            while True:
+                now = clock()
+                if deadline is not None and now >= deadline:
+                    return
+                index = counter.take()
+                if index is None:
+                    return
+                limiter.acquire()
+                begin = clock()
+                try:
+                    session.execute(generator.statement(phase, index))
+                except Exception as e:
+                    # 除NgqlError外，nebula-console启动失败（OSError）和驱动的超时、
+                    # 连接异常也计为错误，不能让工作线程静默退出
+                    if begin >= measure_from:
+                        errors[slot] += 1
+                        last_errors[slot] = str(e) if isinstance(e, NgqlError) else '{0}: {1}'.format(
+                            type(e).__name__, e)
+                    continue
+                if begin >= measure_from:
+                    histograms[slot].record((clock() - begin) * 1000000)
+        finally:
+            if hasattr(session, 'close'):
+                session.close()
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    finished = clock()
+    histogram = LatencyHistogram()
+    for part in histograms:
+        histogram.merge(part)
+
+    elapsed = max(finished - measure_from, 1e-9)
+    result = {
+        'phase': phase,
+        'concurrency': concurrency,
+        'rate_limit': rate,
+        'warmup_secs': warmup_secs if timed else 0,
+        'elapsed_secs': round(elapsed, 3),
+        'operations': histogram.total,
+        'errors': sum(errors),
+        'throughput_ops': round(histogram.total / elapsed, 2),
+        'latency': histogram.to_dict()
+    }
+    if phase in WRITE_PHASES:
+        result['rows_per_sec'] = round(histogram.total * generator.batch_size / elapsed, 2)
+    sample_errors = [error for error in last_errors if error]
+    if sample_errors:
+        result['last_error'] = sample_errors[-1]
+    return result
+
+
+def run_benchmark(generator, session_factory, phases=DEFAULT_PHASES, concurrency=4,
+                  rate=0, warmup_secs=10, duration_secs=60, progress=None):
+    """
+    依次运行各阶段并汇总结果
+
+    Args:
+        progress: 可选回调，每个阶段完成后以阶段结果调用
+
+    Returns:
+        dict: 可直接写入JSON结果文件的压测报告
+    """
+    report = {
+        'started_at': int(time.time()),
+        'workload': {
+            'vertex_count': generator.vertex_count,
+            'edges_per_vertex': generator.edges_per_vertex,
+            'batch_size': generator.batch_size,
+            'hops': generator.hops,
+            'seed': generator.seed
+        },
+        'phases': []
+    }
+    for phase in phases:
+        result = run_phase(phase, generator, session_factory, concurrency, rate,
+                           warmup_secs, duration_secs)
+        report['phases'].append(result)
+        if progress is not None:
+            progress(result)
+    report['finished_at'] = int(time.time())
+    return report
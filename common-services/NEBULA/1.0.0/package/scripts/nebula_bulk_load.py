@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from nebula_ngql import NgqlError, is_retryable
+
+# 特殊列名：点ID、边的起点/终点/rank，以及忽略的列
+VID_COLUMN = ':vid'
+SRC_COLUMN = ':src'
+DST_COLUMN = ':dst'
+RANK_COLUMN = ':rank'
+SKIP_COLUMN = ':skip'
+
+STRING_TYPES = ('string', 'fixed_string')
+INT_TYPES = ('int', 'int64', 'int32', 'int16', 'int8')
+FLOAT_TYPES = ('float', 'double')
+TIME_TYPES = ('date', 'time', 'datetime', 'timestamp')
+
+
+def _escape(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class RowFormatter(object):
+    """
+    把一行CSV字段转换成INSERT VERTEX/EDGE的VALUES子句
+
+    columns中每一项要么是特殊列名，要么是"属性名:类型"。
+    """
+
+    def __init__(self, kind, name, columns, vid_type='string'):
+        if kind not in ('vertex', 'edge'):
+            raise ValueError('Bulk load type must be vertex or edge, got: ' + str(kind))
+        self.kind = kind
+        self.name = name
+        self.quote_vid = vid_type.lower() not in ('int', 'int64')
+        self.columns = []
+        self.props = []
+        for column in columns:
+            if column.startswith(':'):
+                self.columns.append((column, None))
+                continue
+            prop, _, prop_type = column.partition(':')
+            self.columns.append((prop, (prop_type or 'string').lower()))
+            self.props.append(prop)
+
+        specials = [column for column, _ in self.columns if column.startswith(':')]
+        required = [VID_COLUMN] if kind == 'vertex' else [SRC_COLUMN, DST_COLUMN]
+        for column in required:
+            if column not in specials:
+                raise ValueError('Bulk load columns for {0} {1} must include {2}'.format(
+                    kind, name, column))
+
+    def header(self):
+        keyword = 'VERTEX' if self.kind == 'vertex' else 'EDGE'
+        return 'INSERT {0} {1}({2}) VALUES '.format(keyword, self.name, ', '.join(self.props))
+
+    def _vid(self, value):
+        return _escape(value) if self.quote_vid else value.strip()
+
+    def format(self, fields):
+        """
+        Raises:
+            ValueError: 字段数与columns不一致，或数值/布尔字段无法转换
+        """
+        if len(fields) != len(self.columns):
+            raise ValueError('expected {0} fields, got {1}'.format(len(self.columns), len(fields)))
+
+        keys = {}
+        values = []
+        for (column, prop_type), field in zip(self.columns, fields):
+            if prop_type is None:
+                keys[column] = field
+            elif prop_type in STRING_TYPES:
+                values.append(_escape(field))
+            elif field == '':
+                values.append('NULL')
+            elif prop_type in TIME_TYPES:
+                values.append('{0}({1})'.format(prop_type, _escape(field)))
+            elif prop_type in INT_TYPES:
+                values.append(str(int(field.strip())))
+            elif prop_type in FLOAT_TYPES:
+                float(field.strip())
+                values.append(field.strip())
+            elif prop_type == 'bool':
+                if field.strip().lower() not in ('true', 'false'):
+                    raise ValueError('invalid bool value for {0}: {1}'.format(column, field))
+                values.append(field.strip().lower())
+            else:
+                values.append(field.strip())
+
+        if self.kind == 'vertex':
+            key = self._vid(keys[VID_COLUMN])
+        else:
+            key = '{0}->{1}'.format(self._vid(keys[SRC_COLUMN]), self._vid(keys[DST_COLUMN]))
+            if RANK_COLUMN in keys and keys[RANK_COLUMN] != '':
+                key += '@' + keys[RANK_COLUMN].strip()
+        return '{0}:({1})'.format(key, ', '.join(values))
+
+
+def _tracked_lines(f, position):
+    """
+    逐行读取文件，同时在position[0]中累计已读取的字节偏移
+
+    csv.reader只在需要时向迭代器要下一行，因此每返回一条记录时position
+    正好是该记录结束处的偏移，引号内含换行的字段也不会被拆开。
+    """
+    for line in iter(f.readline, b''):
+        position[0] += len(line)
+        yield line if str is bytes else line.decode('utf-8')
+
+
+def read_rows(path, delimiter=',', start_offset=0, header=False):
+    """
+    从字节偏移start_offset开始流式读取CSV/TSV文件
+
+    用csv模块解析，支持引号内的换行，不会把整个文件读入内存。
+
+    Yields:
+        tuple: (该记录结束处的字节偏移, 字段列表)
+    """
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        position = [start_offset]
+        reader = csv.reader(_tracked_lines(f, position), delimiter=str(delimiter))
+        if header and start_offset == 0:
+            next(reader, None)
+        for fields in reader:
+            if not fields:
+                continue
+            if str is bytes:
+                fields = [field.decode('utf-8') for field in fields]
+            yield position[0], fields
+
+
+class RejectFile(object):
+    """
+    以CSV格式追加写入被拒绝的原始记录，修正后可作为新的导入任务重新导入
+    """
+
+    def __init__(self, path, delimiter=','):
+        self.path = path
+        self.delimiter = str(delimiter)
+        self._lock = threading.Lock()
+
+    def write(self, fields):
+        if str is not bytes:
+            buf = io.StringIO()
+        else:
+            buf = io.BytesIO()
+            fields = [field.encode('utf-8') for field in fields]
+        csv.writer(buf, delimiter=self.delimiter, lineterminator='\n').writerow(fields)
+        data = buf.getvalue()
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+
+class Batch(object):
+
+    def __init__(self, seq, rows, end_offset):
+        self.seq = seq
+        # [(VALUES子句, 原始字段)]
+        self.rows = rows
+        self.end_offset = end_offset
+
+
+def iter_batches(rows, formatter, max_bytes=65536, rejected=None):
+    """
+    把格式化后的行按语句字节数打包
+
+    Args:
+        rejected: 格式化失败时调用的rejected(fields, error)，例如BulkLoader.reject；
+                  为None时格式错误直接抛出
+
+    Yields:
+        Batch: seq从0递增，end_offset为批内最后一行（含其后被拒绝的行）的结束偏移
+    """
+    budget = max_bytes - len(formatter.header())
+    seq = 0
+    batch = []
+    size = 0
+    consumed = None
+    for end_offset, fields in rows:
+        try:
+            value = formatter.format(fields)
+        except ValueError as e:
+            if rejected is None:
+                raise
+            rejected(fields, e)
+            consumed = end_offset
+            continue
+        if batch and size + len(value) + 2 > budget:
+            yield Batch(seq, batch, consumed)
+            seq += 1
+            batch = []
+            size = 0
+        batch.append((value, fields))
+        size += len(value) + 2
+        consumed = end_offset
+    if batch:
+        yield Batch(seq, batch, consumed)
+
+
+class Checkpoint(object):
+    """
+    记录已连续完成的字节偏移
+
+    批次可能乱序完成，只有当前面的批次都完成后偏移才会前移，
+    因此从checkpoint恢复时不会漏掉数据，最多重复写入少量已完成的批次。
+    """
+
+    def __init__(self, path, source, save_interval=5.0):
+        self.path = path
+        self.source = source
+        self.save_interval = save_interval
+        self.offset = 0
+        self._next_seq = 0
+        self._done = {}
+        self._last_save = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('source') == source:
+                self.offset = int(state.get('offset', 0))
+
+    def complete(self, seq, end_offset):
+        with self._lock:
+            self._done[seq] = end_offset
+            while self._next_seq in self._done:
+                self.offset = self._done.pop(self._next_seq)
+                self._next_seq += 1
+            if time.time() - self._last_save >= self.save_interval:
+                self._save()
+
+    def flush(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        self._last_save = time.time()
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': self.source, 'offset': self.offset}, f)
+        os.rename(tmp_path, self.path)
+
+
+class BulkLoader(object):
+    """
+    用一组并发会话写入批次
+
+    有界队列提供背压：写入跟不上时读取线程会阻塞，内存占用与文件大小无关。
+    瞬时错误（leader切换、RPC超时、会话失效）按退避重试整批max_retries次，仍失败则中止导入，
+    从checkpoint续传；语法、schema等确定性错误对半拆分定位到单行后记为拒绝，
+    原始记录写入rejects，checkpoint前移后也不会丢失。
+    """
+
+    # 生产者等待队列空位时检查停止标志的间隔
+    PUT_TIMEOUT = 0.5
+
+    def __init__(self, session_factory, concurrency=4, max_retries=3, retry_backoff=1.0,
+                 sleep=time.sleep):
+        self.session_factory = session_factory
+        self.concurrency = int(concurrency)
+        self.max_retries = int(max_retries)
+        self.retry_backoff = retry_backoff
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._rejects = None
+        self.stats = {'rows': 0, 'statements': 0, 'retries': 0, 'splits': 0, 'rejected': 0, 'errors': []}
+
+    def load(self, formatter, batches, checkpoint=None, rejects=None):
+        """
+        Args:
+            rejects: RejectFile，为None时被拒绝的记录只计数
+
+        Returns:
+            dict: rows, statements, retries, splits, rejected, errors（最多保留10条）
+
+        Raises:
+            Exception: 会话创建失败或批次在重试后仍失败时抛出第一个错误，已完成的部分记录在checkpoint中
+        """
+        self.stats = {'rows': 0, 'statements': 0, 'retries': 0, 'splits': 0, 'rejected': 0, 'errors': []}
+        self._rejects = rejects
+        pending = queue.Queue(maxsize=self.concurrency * 2)
+        failures = []
+        stop = threading.Event()
+
+        def fail(error):
+            failures.append(error)
+            stop.set()
+
+        def worker(slot):
+            try:
+                session = self.session_factory(slot)
+            except Exception as e:
+                fail(e)
+                return
+            try:
+                while True:
+                    batch = pending.get()
+                    if batch is None or stop.is_set():
+                        return
+                    try:
+                        self._execute(session, formatter, batch.rows)
+                        if checkpoint is not None:
+                            checkpoint.complete(batch.seq, batch.end_offset)
+                    except Exception as e:
+                        fail(e)
+            finally:
+                if hasattr(session, 'close'):
+                    session.close()
+
+        threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for batch in batches:
+                # 所有工作线程都可能已退出，带超时等待空位，失败后不再阻塞
+                while not stop.is_set():
+                    try:
+                        pending.put(batch, timeout=self.PUT_TIMEOUT)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    break
+        finally:
+            if stop.is_set():
+                # 丢弃尚未执行的批次，checkpoint停在最后连续完成的位置
+                while True:
+                    try:
+                        pending.get_nowait()
+                    except queue.Empty:
+                        break
+            # 先统计存活的线程再放入结束标记，边放边判断会被先退出的线程抢走标记
+            alive = [thread for thread in threads if thread.is_alive()]
+            for _ in alive:
+                pending.put(None)
+            for thread in threads:
+                thread.join()
+            if checkpoint is not None:
+                checkpoint.flush()
+
+        if failures:
+            raise failures[0]
+        return self.stats
+
+    def _execute(self, session, formatter, rows):
+        statement = formatter.header() + ', '.join(value for value, _ in rows)
+        attempt = 0
+        while True:
+            try:
+                session.execute(statement)
+                break
+            except NgqlError as e:
+                if is_retryable(e):
+                    if attempt >= self.max_retries:
+                        raise
+                    self._count('retries', 1)
+                    self._sleep(self.retry_backoff * (2 ** attempt))
+                    attempt += 1
+                    continue
+                if len(rows) == 1:
+                    self.reject(rows[0][1], e, rows[0][0])
+                    return
+                self._count('splits', 1)
+                middle = len(rows) // 2
+                self._execute(session, formatter, rows[:middle])
+                self._execute(session, formatter, rows[middle:])
+                return
+        self._count('statements', 1)
+        self._count('rows', len(rows))
+
+    def reject(self, fields, error, value=None):
+        """
+        记录一条被拒绝的原始记录，也作为iter_batches的rejected回调处理格式错误
+        """
+        if self._rejects is not None:
+            self._rejects.write(fields)
+        with self._lock:
+            self.stats['rejected'] += 1
+            if len(self.stats['errors']) < 10:
+                self.stats['errors'].append('{0}: {1}'.format((value or ','.join(fields))[:200], error))
+
+    def _count(self, key, value):
+        with self._lock:
+            self.stats[key] += value
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import errno
+import os
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+SLICE = 'nebula.slice'
+CONTROLLERS = ('cpu', 'memory', 'io')
+PRESSURE_RESOURCES = ('cpu', 'io', 'memory')
+
+
+def available(root=CGROUP_ROOT):
+    """
+    是否为cgroup v2统一层级
+    """
+    return os.path.isfile(os.path.join(root, 'cgroup.controllers'))
+
+
+def build_limits(cpu_weight=100, memory_high_mb=0, memory_max_mb=0, io_weight=100):
+    """
+    把nebula-env中的设置转换为cgroup接口文件的取值
+
+    Args:
+        cpu_weight: cpu.weight，1-10000
+        memory_high_mb: memory.high，0表示不限制
+        memory_max_mb: memory.max，0表示不限制
+        io_weight: io.weight的默认权重，1-10000
+
+    Returns:
+        list: [(接口文件, 取值)]
+    """
+    for name, weight in (('cpu weight', cpu_weight), ('io weight', io_weight)):
+        if not 1 <= int(weight) <= 10000:
+            raise ValueError('cgroup {0} must be between 1 and 10000, got {1}'.format(name, weight))
+    if memory_high_mb and memory_max_mb and int(memory_high_mb) > int(memory_max_mb):
+        raise ValueError('memory.high ({0} MB) must not exceed memory.max ({1} MB)'.format(
+            memory_high_mb, memory_max_mb))
+
+    def memory(mb):
+        return str(int(mb) * 1024 * 1024) if int(mb) > 0 else 'max'
+
+    return [
+        ('cpu.weight', str(int(cpu_weight))),
+        ('memory.high', memory(memory_high_mb)),
+        ('memory.max', memory(memory_max_mb)),
+        ('io.weight', 'default {0}'.format(int(io_weight)))
+    ]
+
+
+def parse_pressure(text):
+    """
+    解析cpu.pressure等PSI文件
+
+    "some avg10=0.12 avg60=0.05 avg300=0.01 total=123456"解析为
+    {'some.avg10': 0.12, ..., 'some.total': 123456}
+    """
+    values = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        for field in fields[1:]:
+            key, sep, value = field.partition('=')
+            if sep:
+                values['{0}.{1}'.format(fields[0], key)] = int(value) if key == 'total' else float(value)
+    return values
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def _write(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+class CgroupSlice(object):
+    """
+    组件在nebula.slice下的cgroup，例如/sys/fs/cgroup/nebula.slice/storaged
+
+    守护进程放在叶子节点中，nebula.slice本身不放进程，满足cgroup v2
+    "内部节点无进程"的约束。
+    """
+
+    def __init__(self, component, root=CGROUP_ROOT, slice_name=SLICE):
+        self.component = component
+        self.root = root
+        self.parent = os.path.join(root, slice_name)
+        self.path = os.path.join(self.parent, component)
+
+    def exists(self):
+        return os.path.isdir(self.path)
+
+    def ensure(self, limits):
+        """
+        创建cgroup、开启控制器并写入限制，取值未变的文件不重写
+
+        Returns:
+            dict: changed（写入的文件）和skipped（控制器不可用而跳过的文件）
+        """
+        for directory in (self.root, self.parent):
+            if directory != self.root and not os.path.isdir(directory):
+                os.mkdir(directory)
+            self._enable_controllers(directory)
+        if not os.path.isdir(self.path):
+            os.mkdir(self.path)
+
+        result = {'changed': [], 'skipped': []}
+        for name, value in limits:
+            path = os.path.join(self.path, name)
+            if not os.path.exists(path):
+                result['skipped'].append(name)
+                continue
+            if _read(path) != value:
+                _write(path, value)
+                result['changed'].append(name)
+        return result
+
+    def _enable_controllers(self, directory):
+        available_controllers = _read(os.path.join(directory, 'cgroup.controllers')).split()
+        subtree_file = os.path.join(directory, 'cgroup.subtree_control')
+        enabled = _read(subtree_file).split() if os.path.exists(subtree_file) else []
+        missing = [name for name in CONTROLLERS if name in available_controllers and name not in enabled]
+        if missing:
+            _write(subtree_file, ' '.join('+' + name for name in missing))
+
+    def attach(self, pid):
+        """
+        把进程（含全部线程）移入本cgroup
+
+        Returns:
+            bool: 进程已不存在时返回False
+        """
+        try:
+            _write(os.path.join(self.path, 'cgroup.procs'), str(pid))
+        except (IOError, OSError) as e:
+            if e.errno == errno.ESRCH:
+                return False
+            raise
+        return True
+
+    def pids(self):
+        try:
+            return [int(line) for line in _read(os.path.join(self.path, 'cgroup.procs')).split()]
+        except (IOError, OSError):
+            return []
+
+    def stats(self):
+        """
+        读取PSI和内存用量
+
+        Returns:
+            dict: 如{'cpu.pressure.some.avg10': 0.5, 'memory.current': 1048576}，cgroup不存在时为None
+        """
+        if not self.exists():
+            return None
+        stats = {}
+        for resource in PRESSURE_RESOURCES:
+            try:
+                pressure = parse_pressure(_read(os.path.join(self.path, resource + '.pressure')))
+            except (IOError, OSError):
+                continue
+            for key, value in pressure.items():
+                stats['{0}.pressure.{1}'.format(resource, key)] = value
+        try:
+            stats['memory.current'] = int(_read(os.path.join(self.path, 'memory.current')))
+        except (IOError, OSError, ValueError):
+            pass
+        return stats
+
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import threading
+import time
+
+from nebula_ngql import NgqlError, quote_name, show_hosts, show_spaces
+
+FINAL_JOB_STATES = ('FINISHED', 'FAILED', 'STOPPED')
+
+
+class ClusterAggregator(object):
+    """
+    增量维护nebula.cluster.*汇总值
+
+    保存每台主机的健康状态和每个space的点边数，样本到达时只按新旧值之差
+    调整总数，不需要重新遍历所有主机或space。
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._spaces = {}
+        self._lock = threading.Lock()
+        self.healthy_hosts = 0
+        self.total_vertices = 0
+        self.total_edges = 0
+
+    def update_host(self, host, healthy):
+        healthy = bool(healthy)
+        with self._lock:
+            previous = self._hosts.get(host)
+            self._hosts[host] = healthy
+            self.healthy_hosts += int(healthy) - int(bool(previous))
+
+    def remove_host(self, host):
+        with self._lock:
+            if self._hosts.pop(host, False):
+                self.healthy_hosts -= 1
+
+    def update_space(self, space, vertices, edges):
+        with self._lock:
+            old_vertices, old_edges = self._spaces.get(space, (0, 0))
+            self._spaces[space] = (vertices, edges)
+            self.total_vertices += vertices - old_vertices
+            self.total_edges += edges - old_edges
+
+    def remove_space(self, space):
+        with self._lock:
+            vertices, edges = self._spaces.pop(space, (0, 0))
+            self.total_vertices -= vertices
+            self.total_edges -= edges
+
+    def hosts(self):
+        with self._lock:
+            return list(self._hosts)
+
+    def spaces(self):
+        with self._lock:
+            return list(self._spaces)
+
+    def totals(self):
+        """
+        Returns:
+            dict: total_vertices、total_edges、healthy_hosts、total_hosts
+        """
+        with self._lock:
+            return {
+                'total_vertices': float(self.total_vertices),
+                'total_edges': float(self.total_edges),
+                'healthy_hosts': float(self.healthy_hosts),
+                'total_hosts': float(len(self._hosts))
+            }
+
+
+class ClusterStatsCollector(object):
+    """
+    从metad读取主机状态和各space的统计结果，喂给ClusterAggregator
+
+    SHOW STATS只读取metad中上一次STATS作业的结果，开销很小；只有space的
+    schema（tag/edge类型集合）或分片副本分布相对上次发生变化，或者该space
+    从未执行过STATS作业时，才提交新的SUBMIT JOB STATS。
+
+    space列表和各space的摘要缓存在两次采集之间：SHOW HOSTS中的分片分布变化
+    （增删space或迁移副本）或超过refresh_secs时才重新执行SHOW SPACES并重算摘要，
+    其余周期每个space只执行一次SHOW STATS，进行中的作业号也一并缓存。
+    session应复用同一个会话，安装了nebula3-python时使用长连接的DriverSession；
+    采集失败后调用reconnect（如果提供）换一个新会话，过期的长连接不会让采集一直失败。
+    """
+
+    def __init__(self, session, aggregator=None, interval=300, refresh_secs=3600, clock=time.time,
+                 reconnect=None):
+        self.session = session
+        self.reconnect = reconnect
+        self.aggregator = aggregator or ClusterAggregator()
+        self.interval = interval
+        self.refresh_secs = refresh_secs
+        self._clock = clock
+        self.spaces = []
+        self.fingerprints = {}
+        self.pending_jobs = {}
+        self.submitted = 0
+        self.refreshes = 0
+        self.collected_at = 0
+        self._layout = None
+        self._refreshed_at = None
+        self._stop = threading.Event()
+
+    def collect(self):
+        seen = set()
+        layout = []
+        for host in show_hosts(self.session):
+            address = '{0}:{1}'.format(host['host'], host['port'])
+            seen.add(address)
+            layout.append((address, sorted(host['partitions'].items())))
+            self.aggregator.update_host(address, host['status'] == 'ONLINE')
+        for address in self.aggregator.hosts():
+            if address not in seen:
+                self.aggregator.remove_host(address)
+
+        # leader切换和主机状态变化不改变分片分布，不会触发重新列举
+        layout.sort()
+        now = self._clock()
+        refresh = layout != self._layout or self._refreshed_at is None or \
+            now - self._refreshed_at >= self.refresh_secs
+        if refresh:
+            self.spaces = sorted(show_spaces(self.session))
+            self._layout = layout
+            self._refreshed_at = now
+            self.refreshes += 1
+        for space in self.spaces:
+            try:
+                self._collect_space(space, refresh)
+            except NgqlError as e:
+                print('Failed to collect stats for space {0}: {1}'.format(space, e))
+        for space in set(self.aggregator.spaces()) | set(self.fingerprints):
+            if space not in self.spaces:
+                self.aggregator.remove_space(space)
+                self.fingerprints.pop(space, None)
+                self.pending_jobs.pop(space, None)
+        self.collected_at = time.time()
+        return self.aggregator.totals()
+
+    def _collect_space(self, space, refresh=True):
+        changed = False
+        if refresh or space not in self.fingerprints:
+            fingerprint = self.space_fingerprint(space)
+            changed = space in self.fingerprints and self.fingerprints[space] != fingerprint
+            self.fingerprints[space] = fingerprint
+
+        try:
+            counts = self.space_counts(space)
+        except NgqlError:
+            # 从未执行过STATS作业的space，SHOW STATS会直接报错
+            counts = None
+        if counts is not None:
+            self.aggregator.update_space(space, counts[0], counts[1])
+
+        if (changed or counts is None) and not self._job_running(space):
+            rows = self.session.execute('USE {0}; SUBMIT JOB STATS'.format(quote_name(space)))
+            if rows and rows[0].get('New Job Id') is not None:
+                self.pending_jobs[space] = int(rows[0]['New Job Id'])
+                self.submitted += 1
+
+    def _job_running(self, space):
+        job_id = self.pending_jobs.get(space)
+        if job_id is None:
+            return False
+        rows = self.session.execute('USE {0}; SHOW JOB {1}'.format(quote_name(space), job_id))
+        if rows and rows[0].get('Status', '').upper() in FINAL_JOB_STATES:
+            del self.pending_jobs[space]
+            return False
+        return True
+
+    def space_fingerprint(self, space):
+        """
+        tag/edge类型集合加上每个分片的副本列表的摘要
+
+        leader切换不改变副本列表，不会触发新的统计作业。
+        """
+        digest = hashlib.md5()
+        for statement, column in (('SHOW TAGS', 'Name'), ('SHOW EDGES', 'Name')):
+            names = sorted(row.get(column, '') for row in
+                           self.session.execute('USE {0}; {1}'.format(quote_name(space), statement)))
+            digest.update((statement + ':' + ','.join(names) + ';').encode('utf-8'))
+        parts = sorted((row.get('Partition ID', ''), ','.join(sorted(p.strip() for p in row.get('Peers', '').split(','))))
+                       for row in self.session.execute('USE {0}; SHOW PARTS'.format(quote_name(space))))
+        for part_id, peers in parts:
+            digest.update('{0}={1};'.format(part_id, peers).encode('utf-8'))
+        return digest.hexdigest()
+
+    def space_counts(self, space):
+        """
+        Returns:
+            tuple: (点数, 边数)
+        """
+        vertices = edges = 0
+        for row in self.session.execute('USE {0}; SHOW STATS'.format(quote_name(space))):
+            if row.get('Type', '').lower() != 'space':
+                continue
+            name = row.get('Name', '').lower()
+            if name == 'vertices':
+                vertices = int(row.get('Count', 0))
+            elif name == 'edges':
+                edges = int(row.get('Count', 0))
+        return vertices, edges
+
+    def totals(self):
+        """
+        Returns:
+            dict: 汇总值，尚未成功采集过时为None
+        """
+        if not self.collected_at:
+            return None
+        return self.aggregator.totals()
+
+    def run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.collect()
+            except Exception as e:
+                print('Failed to collect cluster metrics: {0}'.format(e))
+                self._reconnect()
+            self._stop.wait(max(0, self.interval - (time.time() - started)))
+
+    def _reconnect(self):
+        if self.reconnect is None:
+            return
+        try:
+            session = self.reconnect()
+        except Exception as e:
+            print('Failed to reopen the cluster metrics session: {0}'.format(e))
+            return
+        if hasattr(self.session, 'close'):
+            try:
+                self.session.close()
+            except Exception:
+                pass
+        self.session = session
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import json
+import sys
+import time
+
+from nebula_ngql import ConsoleSession, NgqlError, quote_name, show_spaces
+from nebula_stats import fetch_stats
+
+FINAL_JOB_STATES = ('FINISHED', 'FAILED', 'STOPPED')
+# 仍在进行中的作业状态；其他状态（包括以后版本新增的终态）都按已结束处理，不会空等到超时
+ACTIVE_JOB_STATES = ('QUEUE', 'RUNNING')
+PENDING_METRIC = 'rocksdb_compaction_pending'
+
+
+def job_finished(status):
+    """
+    Returns:
+        bool: SHOW JOB返回的状态是否表示作业已结束
+    """
+    return status in FINAL_JOB_STATES or status not in ACTIVE_JOB_STATES
+
+
+def parse_window(window):
+    """
+    解析"HH:MM-HH:MM"格式的时间窗口
+
+    Returns:
+        tuple: (开始分钟数, 结束分钟数)，结束早于开始表示跨越午夜
+    """
+    try:
+        start, end = window.split('-')
+        return _minutes(start), _minutes(end)
+    except ValueError:
+        raise ValueError('Compaction window must look like HH:MM-HH:MM, got: ' + str(window))
+
+
+def _minutes(value):
+    hour, minute = value.strip().split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(value)
+    return hour * 60 + minute
+
+
+def in_window(window, now):
+    """
+    判断datetime now是否落在时间窗口内
+    """
+    start, end = parse_window(window)
+    current = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+class CompactionScheduler(object):
+    """
+    在低峰时间窗口内按space提交SUBMIT JOB COMPACT
+
+    同时运行的作业数受max_concurrent_jobs限制。每个轮询周期读取所有storaged的/stats，
+    任一主机的读延迟超过其基线的degrade_ratio倍（且不低于latency_floor_us）时用STOP JOB
+    暂停全部作业，延迟恢复后再RECOVER JOB。每个作业结束后追加一行JSON到history_file。
+    一轮调度最长运行max_runtime_secs，超时后停止仍在运行的作业，即使force忽略了时间窗口。
+    """
+
+    def __init__(self, session, storaged_endpoints, window, spaces=None, max_concurrent_jobs=1,
+                 latency_metric='get_neighbors_latency_us.p99.60', degrade_ratio=2.0,
+                 latency_floor_us=10000, poll_interval=30, history_file=None, max_runtime_secs=14400,
+                 fetch=fetch_stats, now=datetime.datetime.now, sleep=time.sleep, clock=time.time):
+        self.session = session
+        self.storaged_endpoints = storaged_endpoints
+        self.window = window
+        self.spaces = spaces or []
+        self.max_concurrent_jobs = max(1, int(max_concurrent_jobs))
+        self.latency_metric = latency_metric
+        self.degrade_ratio = float(degrade_ratio)
+        self.latency_floor_us = float(latency_floor_us)
+        self.poll_interval = poll_interval
+        self.history_file = history_file
+        self.max_runtime_secs = max_runtime_secs
+        self._fetch = fetch
+        self._now = now
+        self._sleep = sleep
+        self._clock = clock
+        parse_window(window)
+
+    def run(self, force=False):
+        """
+        执行一轮调度，窗口外且未指定force时直接返回
+
+        Returns:
+            list: 本轮每个作业的历史记录
+        """
+        if not force and not in_window(self.window, self._now()):
+            return []
+
+        queued = list(self.spaces) or self._list_spaces()
+        baseline = self._sample()
+        thresholds = dict((host, max(stats.get(self.latency_metric, 0) * self.degrade_ratio,
+                                     self.latency_floor_us))
+                          for host, stats in baseline.items())
+        active = []
+        history = []
+        paused_since = None
+        deadline = self._clock() + self.max_runtime_secs if self.max_runtime_secs else None
+
+        while queued or active:
+            stop_status = None
+            if not force and not in_window(self.window, self._now()):
+                stop_status = 'WINDOW_CLOSED'
+            elif deadline is not None and self._clock() >= deadline:
+                stop_status = 'DEADLINE_EXCEEDED'
+            if stop_status:
+                for record in active:
+                    if paused_since is None:
+                        self._job(record, 'STOP')
+                    else:
+                        record['paused_secs'] += round(self._clock() - paused_since, 1)
+                    self._finish(record, stop_status, baseline, history)
+                break
+
+            samples = self._sample()
+            degraded = sorted(host for host, stats in samples.items()
+                              if stats.get(self.latency_metric, 0) > thresholds.get(host, self.latency_floor_us))
+            for record in active:
+                for host, stats in samples.items():
+                    latency = stats.get(self.latency_metric, 0)
+                    record['peak_p99_us'][host] = max(record['peak_p99_us'].get(host, 0), latency)
+
+            if degraded and paused_since is None:
+                paused_since = self._clock()
+                for record in active:
+                    self._job(record, 'STOP')
+                    record['pauses'].append({'at': int(paused_since), 'hosts': degraded})
+            elif not degraded and paused_since is not None:
+                paused_secs = self._clock() - paused_since
+                paused_since = None
+                for record in active:
+                    record['paused_secs'] += round(paused_secs, 1)
+                    self._job(record, 'RECOVER')
+
+            if paused_since is None:
+                while queued and len(active) < self.max_concurrent_jobs:
+                    active.append(self._submit(queued.pop(0)))
+
+                for record in list(active):
+                    status = self._status(record)
+                    if job_finished(status):
+                        active.remove(record)
+                        self._finish(record, status, baseline, history)
+
+            if queued or active:
+                self._sleep(self.poll_interval)
+
+        return history
+
+    def _list_spaces(self):
+        return show_spaces(self.session)
+
+    def _sample(self):
+        samples = {}
+        for host, port in self.storaged_endpoints:
+            try:
+                samples[host] = self._fetch(host, port)
+            except Exception:
+                # 暂时无法访问的主机不参与延迟判断
+                continue
+        return samples
+
+    def _submit(self, space):
+        rows = self.session.execute('USE {0}; SUBMIT JOB COMPACT'.format(quote_name(space)))
+        job_id = rows[0].get('New Job Id') if rows else None
+        if job_id is None:
+            raise NgqlError('SUBMIT JOB COMPACT returned no job id for space ' + space)
+        return {
+            'space': space,
+            'job_id': int(job_id),
+            'started_at': int(time.time()),
+            'pauses': [],
+            'paused_secs': 0,
+            'peak_p99_us': {}
+        }
+
+    def _status(self, record):
+        rows = self.session.execute('USE {0}; SHOW JOB {1}'.format(quote_name(record['space']), record['job_id']))
+        return rows[0].get('Status', '').upper() if rows else ''
+
+    def _job(self, record, action):
+        try:
+            self.session.execute('USE {0}; {1} JOB {2}'.format(quote_name(record['space']), action,
+                                                                       record['job_id']))
+        except NgqlError as e:
+            record.setdefault('errors', []).append('{0} JOB failed: {1}'.format(action, e))
+
+    def _finish(self, record, status, baseline, history):
+        after = self._sample()
+        record['status'] = status
+        record['finished_at'] = int(time.time())
+        record['duration_secs'] = record['finished_at'] - record['started_at']
+        record['baseline_p99_us'] = dict((host, stats.get(self.latency_metric, 0))
+                                         for host, stats in baseline.items())
+        record['compaction_pending_before'] = sum(stats.get(PENDING_METRIC, 0) for stats in baseline.values())
+        record['compaction_pending_after'] = sum(stats.get(PENDING_METRIC, 0) for stats in after.values())
+        history.append(record)
+        if self.history_file:
+            with open(self.history_file, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def scheduler_from_config(config):
+    """
+    根据configure阶段生成的JSON配置构造调度器
+    """
+    session = ConsoleSession(config['console_bin'], config['graphd_host'], config['graphd_port'],
+                             config['user'], config['password'])
+    endpoints = [(host, config['storaged_http_port']) for host in config['storaged_hosts']]
+    return CompactionScheduler(session, endpoints, config['window'],
+                               spaces=config.get('spaces'),
+                               max_concurrent_jobs=config.get('max_concurrent_jobs', 1),
+                               latency_metric=config.get('latency_metric', 'get_neighbors_latency_us.p99.60'),
+                               degrade_ratio=config.get('degrade_ratio', 2.0),
+                               latency_floor_us=config.get('latency_floor_us', 10000),
+                               poll_interval=config.get('poll_interval', 30),
+                               history_file=config.get('history_file'),
+                               max_runtime_secs=config.get('max_runtime_secs', 14400))
+
+
+def lock_history(history_file):
+    """
+    对history_file加排他锁，cron和COMPACT命令共用，避免两轮调度同时提交作业
+
+    Returns:
+        file: 持有锁的文件对象，关闭即释放；已被其他进程持有时返回None
+    """
+    import fcntl
+    lock = open(history_file + '.lock', 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lock.close()
+        return None
+    return lock
+
+
+def main(argv):
+    if len(argv) < 2:
+        print('Usage: nebula_compaction.py <config.json> [--force]')
+        return 2
+    with open(argv[1]) as f:
+        config = json.load(f)
+
+    lock = lock_history(config['history_file'])
+    if lock is None:
+        print('Another compaction run is in progress, exiting.')
+        return 0
+
+    try:
+        for record in scheduler_from_config(config).run(force='--force' in argv):
+            print('Space {0} job {1}: {2} in {3}s, paused {4}s'.format(
+                record['space'], record['job_id'], record['status'],
+                record['duration_secs'], record['paused_secs']))
+    finally:
+        lock.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import fcntl
+import json
+import os
+import time
+
+ACTIVE = 'active'
+DRAINING = 'draining'
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+def load_manifest(path):
+    """
+    读取面向客户端的graphd endpoint清单
+
+    Returns:
+        dict: {'graphd': [{host, port, http_port, state, capacity, weight}]}，文件不存在时为空清单
+    """
+    if not os.path.exists(path):
+        return {'graphd': []}
+    with open(path) as f:
+        manifest = json.load(f)
+    manifest.setdefault('graphd', [])
+    return manifest
+
+
+def update_manifest(path, update):
+    """
+    在文件锁内读取、修改并原子替换清单，多台主机共享同一路径时也不会互相覆盖
+
+    Args:
+        update: 接收清单dict并就地修改的函数
+
+    Returns:
+        dict: 修改后的清单
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = load_manifest(path)
+            update(manifest)
+            manifest['graphd'].sort(key=lambda item: (item['host'], item['port']))
+            tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return manifest
+
+
+def host_capacity(cores, num_worker_threads=0):
+    """
+    graphd的处理能力：worker线程数，但不超过可用核数；num_worker_threads为0时graphd按核数启动
+    """
+    cores = max(1, int(cores))
+    workers = int(num_worker_threads or 0)
+    return max(1, min(cores, workers) if workers > 0 else cores)
+
+
+def parse_host_cores(text):
+    """
+    解析service advisor写入的"host1:16,host2:8"格式的各主机核数
+
+    Returns:
+        dict: 主机 -> 核数，无法解析的项忽略
+    """
+    cores = {}
+    for item in (text or '').split(','):
+        host, sep, count = item.strip().rpartition(':')
+        if not sep or not host:
+            continue
+        try:
+            cores[host] = int(count)
+        except ValueError:
+            continue
+    return cores
+
+
+def sync_manifest(path, hosts, port, http_port, local_host=None, capacity=None, state=None, host_cores=None,
+                  num_worker_threads=0):
+    """
+    按clusterHostInfo中的graphd主机同步清单并重新计算权重
+
+    已移除的主机从清单删除，新主机以active加入；local_host的capacity和state
+    只由该主机自己更新。尚未上报capacity的主机按host_cores（Ambari记录的核数）
+    和num_worker_threads计算，两者都没有时按已知capacity的平均值计权。
+
+    Returns:
+        dict: 同步后的清单
+    """
+
+    def update(manifest):
+        existing = dict((item['host'], item) for item in manifest['graphd'])
+        entries = []
+        for host in hosts:
+            entry = existing.get(host) or {'host': host, 'state': ACTIVE, 'capacity': None}
+            entry['port'] = int(port)
+            entry['http_port'] = int(http_port)
+            if host == local_host:
+                if capacity is not None:
+                    entry['capacity'] = int(capacity)
+                if state is not None:
+                    entry['state'] = state
+            entries.append(entry)
+        estimated = {}
+        for entry in entries:
+            if entry.get('capacity'):
+                estimated[entry['host']] = entry['capacity']
+            elif (host_cores or {}).get(entry['host']):
+                estimated[entry['host']] = host_capacity(host_cores[entry['host']], num_worker_threads)
+        known = list(estimated.values())
+        default = int(round(float(sum(known)) / len(known))) if known else 1
+        for entry in entries:
+            entry['weight'] = min(256, estimated.get(entry['host']) or default)
+        manifest['graphd'] = entries
+
+    return update_manifest(path, update)
+
+
+def render_haproxy(manifest, bind_port, name='nebula_graphd'):
+    """
+    生成HAProxy配置片段：TCP转发到graphd，按权重leastconn，并用ws_http_port的/status做健康检查
+
+    draining的主机权重为0，保留已有连接但不再接收新连接。
+    """
+    lines = [
+        'frontend {0}'.format(name),
+        '    mode tcp',
+        '    bind *:{0}'.format(bind_port),
+        '    default_backend {0}'.format(name),
+        '',
+        'backend {0}'.format(name),
+        '    mode tcp',
+        '    balance leastconn',
+        '    option httpchk GET /status',
+        '    http-check expect status 200',
+    ]
+    for item in manifest['graphd']:
+        weight = item.get('weight', 1) if item.get('state', ACTIVE) == ACTIVE else 0
+        lines.append('    server {0} {0}:{1} weight {2} check port {3} inter 2s fall 3 rise 2'.format(
+            item['host'], item['port'], weight, item.get('http_port', item['port'])))
+    return '\n'.join(lines) + '\n'
+
+
+def render_envoy(manifest, name='nebula_graphd'):
+    """
+    生成Envoy cluster配置（JSON），draining的主机标记为DRAINING
+    """
+    endpoints = []
+    for item in manifest['graphd']:
+        endpoint = {
+            'endpoint': {
+                'address': {'socket_address': {'address': item['host'], 'port_value': item['port']}},
+                'health_check_config': {'port_value': item.get('http_port', item['port'])}
+            },
+            'load_balancing_weight': max(1, min(128, item.get('weight', 1)))
+        }
+        if item.get('state', ACTIVE) != ACTIVE:
+            endpoint['health_status'] = 'DRAINING'
+        endpoints.append(endpoint)
+    cluster = {
+        'name': name,
+        # 清单中是主机名，STATIC只接受IP地址
+        'type': 'STRICT_DNS',
+        'connect_timeout': '2s',
+        'lb_policy': 'LEAST_REQUEST',
+        'load_assignment': {'cluster_name': name, 'endpoints': [{'lb_endpoints': endpoints}]},
+        'health_checks': [{
+            'timeout': '1s',
+            'interval': '2s',
+            'unhealthy_threshold': 3,
+            'healthy_threshold': 2,
+            'http_health_check': {'path': '/status'}
+        }]
+    }
+    return json.dumps({'clusters': [cluster]}, indent=2, sort_keys=True) + '\n'
+
+
+def active_endpoints(manifest):
+    """
+    Returns:
+        list: 可以接收新连接的"host:port"
+    """
+    return ['{0}:{1}'.format(item['host'], item['port']) for item in manifest['graphd']
+            if item.get('state', ACTIVE) == ACTIVE]
+
+
+def stat_value(stats, name):
+    """
+    取/stats中的计数，兼容带".sum.5"之类统计后缀的写法
+
+    Returns:
+        float: 找不到时为None
+    """
+    if name in stats:
+        return stats[name]
+    prefix = name + '.'
+    for key in sorted(stats):
+        if key.startswith(prefix):
+            return stats[key]
+    return None
+
+
+class SessionDrain(object):
+    """
+    等待graphd上的活跃会话和执行中的查询降到阈值以下
+
+    两者都不超过阈值，或超过timeout，或/stats不可达时结束。
+    """
+
+    def __init__(self, fetch, max_sessions=0, max_queries=0, timeout=60, poll_interval=2,
+                 clock=_clock, sleep=time.sleep):
+        self._fetch = fetch
+        self.max_sessions = max_sessions
+        self.max_queries = max_queries
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._sleep = sleep
+
+    def drain(self):
+        """
+        Returns:
+            dict: reason（drained/deadline/unreachable）、seconds和
+                  timeline（[(秒, 会话数, 查询数)]）
+        """
+        started = self._clock()
+        report = {'reason': None, 'seconds': 0, 'timeline': []}
+        while True:
+            elapsed = self._clock() - started
+            try:
+                stats = self._fetch()
+            except (IOError, OSError, ValueError):
+                report['reason'] = 'unreachable'
+                break
+            sessions = stat_value(stats, 'num_active_sessions') or 0
+            queries = stat_value(stats, 'num_active_queries') or 0
+            report['timeline'].append((round(elapsed, 1), int(sessions), int(queries)))
+            if sessions <= self.max_sessions and queries <= self.max_queries:
+                report['reason'] = 'drained'
+                break
+            if elapsed >= self.timeout:
+                report['reason'] = 'deadline'
+                break
+            self._sleep(min(self.poll_interval, self.timeout - elapsed))
+        report['seconds'] = round(self._clock() - started, 1)
+        return report
+
+
+def format_drain(report):
+    """
+    把drain返回的报告渲染成停止命令输出中的文本行
+    """
+    lines = ['Session drain {0} after {1}s'.format(report['reason'], report['seconds'])]
+    lines.extend('  +{0}s: {1} sessions, {2} queries'.format(*point) for point in report['timeline'])
+    return lines
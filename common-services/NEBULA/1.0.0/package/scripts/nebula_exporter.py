@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import io
+import json
+import math
+import re
+import sys
+import threading
+import time
+import traceback
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from nebula_cgroup import CgroupSlice
+from nebula_cluster_metrics import ClusterStatsCollector
+from nebula_metrics_sink import AmsSink
+from nebula_ngql import ConsoleSession, driver_session_factory
+from nebula_rocksdb import RocksDbCollector
+from nebula_stats import STAT_SUFFIX, fetch_stats, named_metrics
+from nebula_topology import SpaceList
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_INVALID_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def metric_name(component, stat):
+    """
+    把/stats中的统计项转换成nebula_*指标名和标签
+
+    例如storaged的"get_latency_us.p99.60"对应
+    nebula_storaged_get_latency_us{stat="p99",window="60"}。
+
+    Returns:
+        tuple: (指标名, 标签dict)
+    """
+    labels = {}
+    match = STAT_SUFFIX.match(stat)
+    if match:
+        stat = match.group(1)
+        labels = {'stat': match.group(2), 'window': match.group(3)}
+    return 'nebula_{0}_{1}'.format(component, _INVALID_CHARS.sub('_', stat)), labels
+
+
+def known_metrics(metrics_file):
+    """
+    读取metrics.json中各组件声明的nebula.*指标，用于生成HELP行
+    """
+    with open(metrics_file) as f:
+        definitions = json.load(f)
+    names = set()
+    for component in definitions.values():
+        for section in component.get('Component', []) + component.get('HostComponent', []):
+            for metric in section.get('metrics', {}).get('default', {}).values():
+                names.add(metric['metric'].replace('.', '_'))
+    return names
+
+
+def render(samples, known=None, scraped=None):
+    """
+    渲染Prometheus文本格式
+
+    窗口统计项带stat/window标签输出；metrics.json中的指标（见named_metrics）以
+    nebula_<component>_<name>无标签输出。
+
+    Args:
+        samples: {component: stats dict}，抓取失败的组件值为None
+        known: metrics.json中声明的指标名集合
+        scraped: 直接抓取/stats的组件，只为它们输出nebula_up；为None时为samples中的全部组件
+
+    Returns:
+        str: 按指标名分组的exposition文本
+    """
+    families = {}
+    for component in sorted(samples):
+        stats = samples[component]
+        if scraped is None or component in scraped:
+            families.setdefault('nebula_up', []).append(({'component': component}, 0 if stats is None else 1))
+        for stat, value in sorted((stats or {}).items()):
+            name, labels = metric_name(component, stat)
+            if labels:
+                families.setdefault(name, []).append((labels, value))
+        for stat, value in sorted(named_metrics(component, stats or {}).items()):
+            families.setdefault(metric_name(component, stat)[0], []).append(({}, value))
+
+    lines = []
+    for name in sorted(families):
+        if name == 'nebula_up':
+            lines.append('# HELP nebula_up Whether the last scrape of the daemon stats endpoint succeeded.')
+        elif known and name in known:
+            lines.append('# HELP {0} {1}'.format(name, name.replace('_', '.', 2)))
+        lines.append('# TYPE {0} gauge'.format(name))
+        for labels, value in families[name]:
+            if labels:
+                label_text = ','.join('{0}="{1}"'.format(key, labels[key]) for key in sorted(labels))
+                lines.append('{0}{{{1}}} {2}'.format(name, label_text, _format_value(value)))
+            else:
+                lines.append('{0} {1}'.format(name, _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    # Prometheus文本格式中非有限值写作NaN、+Inf、-Inf，int()无法转换它们
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsCache(object):
+    """
+    按固定间隔抓取本机守护进程并缓存渲染结果
+
+    /metrics请求只读取缓存，多个Prometheus副本并发抓取也不会增加对守护进程的请求。
+    配置了sink时，每次抓取成功的结果同时交给sink缓冲推送；配置了cluster时，
+    其最近一次汇总结果作为cluster组件一并输出；cgroups中每个已创建的cgroup的PSI
+    和内存用量作为<component>_cgroup组件输出；配置了rocksdb时，其rocksdb_*统计项
+    并入storaged组件。
+    """
+
+    def __init__(self, targets, interval=15, known=None, fetch=fetch_stats, sink=None, cluster=None,
+                 cgroups=None, rocksdb=None):
+        self.targets = targets
+        self.interval = interval
+        self.known = known
+        self._fetch = fetch
+        self.sink = sink
+        self.cluster = cluster
+        self.cgroups = cgroups or []
+        self.rocksdb = rocksdb
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.text = ''
+        self.gzipped = b''
+        self.scraped_at = 0
+
+    def refresh(self):
+        samples = {}
+        for component, host, port in self.targets:
+            try:
+                samples[component] = self._fetch(host, port)
+            except Exception:
+                samples[component] = None
+        if self.cluster is not None and self.cluster.totals() is not None:
+            samples['cluster'] = self.cluster.totals()
+        # 附加数据源失败时只缺少对应的指标，不影响守护进程/stats的输出
+        if self.rocksdb is not None and samples.get('storaged') is not None:
+            try:
+                samples['storaged'].update(self.rocksdb.stats())
+            except Exception as e:
+                print('Failed to collect RocksDB stats: {0}'.format(e))
+        for cgroup in self.cgroups:
+            try:
+                stats = cgroup.stats()
+            except Exception as e:
+                print('Failed to read cgroup stats of {0}: {1}'.format(cgroup.component, e))
+                continue
+            if stats is not None:
+                samples[cgroup.component + '_cgroup'] = stats
+        if self.sink is not None:
+            now = time.time()
+            for component, stats in samples.items():
+                if stats is not None:
+                    try:
+                        self.sink.add(component, stats, now)
+                    except Exception as e:
+                        print('Failed to buffer {0} metrics for AMS: {1}'.format(component, e))
+        self._publish(render(samples, self.known, [component for component, _, _ in self.targets]))
+
+    def _publish(self, text):
+        data = text.encode('utf-8')
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as f:
+            f.write(data)
+        with self._lock:
+            self.text = data
+            self.gzipped = buf.getvalue()
+            self.scraped_at = time.time()
+
+    def body(self, accept_gzip):
+        with self._lock:
+            return (self.gzipped, 'gzip') if accept_gzip else (self.text, None)
+
+    def run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception:
+                # 单次抓取失败不能结束抓取线程；缓存改为全部nebula_up 0，不再返回旧数据
+                print('Metrics refresh failed:')
+                traceback.print_exc()
+                self._publish(render(dict((component, None) for component, _, _ in self.targets)))
+            self._stop.wait(max(0, self.interval - (time.time() - started)))
+
+    def stop(self):
+        self._stop.set()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_server(cache, port, address=''):
+    """
+    创建只提供/metrics的HTTP服务
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            accept_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+            body, encoding = cache.body(accept_gzip)
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _ThreadingHTTPServer((address, int(port)), Handler)
+
+
+def main(argv):
+    if len(argv) < 2:
+        print('Usage: nebula_exporter.py <config.json>')
+        return 2
+    with open(argv[1]) as f:
+        config = json.load(f)
+
+    known = None
+    if config.get('metrics_file'):
+        try:
+            known = known_metrics(config['metrics_file'])
+        except (IOError, ValueError):
+            known = None
+    targets = [(target['component'], target['host'], target['port']) for target in config['targets']]
+    sink = None
+    if config.get('ams'):
+        ams = config['ams']
+        sink = AmsSink(ams['collector_hosts'], ams['port'], ams['hostname'],
+                       max_points=ams.get('max_points', 100000), batch_size=ams.get('batch_size', 500),
+                       flush_interval=ams.get('flush_interval', 60), compress=ams.get('compress', True))
+        flusher = threading.Thread(target=sink.run)
+        flusher.daemon = True
+        flusher.start()
+    cluster = None
+    if config.get('cluster'):
+        settings = config['cluster']
+        # 优先复用nebula3-python的长连接会话，每个周期的语句不再各自启动nebula-console并登录
+        session = reconnect = None
+        try:
+            factory = driver_session_factory([settings['graphd_host']], settings['graphd_port'],
+                                             settings.get('user', 'root'), settings.get('password', 'nebula'),
+                                             size=1)
+            if factory is not None:
+                session = factory(0)
+                reconnect = lambda: factory(0)
+        except Exception as e:
+            print('WARNING: unable to open a driver session for cluster metrics: {0}'.format(e))
+        if session is None:
+            print('WARNING: cluster metrics fall back to one nebula-console process per statement.')
+            session = ConsoleSession(settings['console_bin'], settings['graphd_host'], settings['graphd_port'],
+                                     settings.get('user', 'root'), settings.get('password', 'nebula'), timeout=60)
+        cluster = ClusterStatsCollector(session, interval=settings.get('interval', 300), reconnect=reconnect)
+        collector = threading.Thread(target=cluster.run)
+        collector.daemon = True
+        collector.start()
+    cgroups = []
+    if config.get('cgroup'):
+        settings = config['cgroup']
+        cgroups = [CgroupSlice(component, settings['root'], settings['slice'])
+                   for component in settings['components']]
+    rocksdb = None
+    if config.get('rocksdb'):
+        settings = config['rocksdb']
+        session = None
+        if settings.get('graphd_host'):
+            session = ConsoleSession(settings['console_bin'], settings['graphd_host'], settings['graphd_port'],
+                                     settings.get('user', 'root'), settings.get('password', 'nebula'), timeout=20)
+        rocksdb = RocksDbCollector(settings['checkpoint_file'], settings['data_paths'], settings['host'],
+                                   settings['http_port'], SpaceList(session, settings['topology_cache_file']))
+    cache = MetricsCache(targets, config.get('interval', 15), known, sink=sink, cluster=cluster,
+                         cgroups=cgroups, rocksdb=rocksdb)
+    cache.refresh()
+
+    scraper = threading.Thread(target=cache.run)
+    scraper.daemon = True
+    scraper.start()
+    make_server(cache, config['port']).serve_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+# glog文件名：<程序名>.<主机>.<用户>.log.<级别>.<日期>-<时间>.<pid>
+_GLOG_FILE = re.compile(r'^nebula-(graphd|metad|storaged)\..+\.log\.(INFO|WARNING|ERROR|FATAL)\.\d{8}-\d{6}\.\d+(\.gz)?$')
+
+# cron和Exporter以追加方式写入的日志，由本脚本按大小切分为<名称>.log.<日期>-<时间>
+TOOL_LOGS = ('nebula-log-retention', 'nebula-compaction', 'nebula-exporter')
+_TOOL_FILE = re.compile(r'^(nebula-(?:log-retention|compaction|exporter))\.log\.\d{8}-\d{6}(\.gz)?$')
+
+
+def list_logs(log_dir):
+    """
+    列出日志目录中各组件已切分的glog文件，以及TOOL_LOGS切分出的文件
+
+    Returns:
+        dict: 组件或工具名 -> [{path, severity, size, mtime, compressed}]，按mtime升序；
+              工具日志的severity为None
+    """
+    logs = {}
+    for name in os.listdir(log_dir):
+        path = os.path.join(log_dir, name)
+        match = _GLOG_FILE.match(name)
+        if match:
+            component, severity, compressed = match.groups()
+        else:
+            match = _TOOL_FILE.match(name)
+            if not match:
+                continue
+            component, compressed = match.groups()
+            severity = None
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        logs.setdefault(component, []).append({
+            'path': path,
+            'severity': severity,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'compressed': bool(compressed)
+        })
+    for files in logs.values():
+        files.sort(key=lambda item: (item['mtime'], item['path']))
+    return logs
+
+
+def active_files(log_dir, logs):
+    """
+    正在写入的文件：glog符号链接（nebula-graphd.INFO等）的目标，以及每个组件
+    每个级别最新的未压缩文件。工具日志切分出的文件都已不再写入。
+    """
+    active = set()
+    for name in os.listdir(log_dir):
+        path = os.path.join(log_dir, name)
+        if os.path.islink(path):
+            active.add(os.path.realpath(path))
+    for files in logs.values():
+        newest = {}
+        for item in files:
+            if not item['compressed'] and item['severity']:
+                newest[item['severity']] = item['path']
+        active.update(os.path.realpath(path) for path in newest.values())
+    return active
+
+
+def gzip_file(path, block_size=1024 * 1024):
+    """
+    流式压缩为path.gz并删除原文件，保留原文件的mtime
+    """
+    target = path + '.gz'
+    tmp_path = target + '.tmp'
+    stat = os.stat(path)
+    with open(path, 'rb') as source:
+        with gzip.open(tmp_path, 'wb', 6) as dest:
+            shutil.copyfileobj(source, dest, block_size)
+    os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+    os.rename(tmp_path, target)
+    os.remove(path)
+    return os.path.getsize(target)
+
+
+def rotate_tool_logs(log_dir, rotate_bytes, clock=time.time):
+    """
+    把超过rotate_bytes的工具日志复制为<名称>.log.<日期>-<时间>后截断
+
+    写入方都以追加方式打开文件，截断后从文件头继续写；复制和截断之间写入的
+    少量内容会丢失。
+
+    Returns:
+        list: 新切分出的文件
+    """
+    rotated = []
+    for tool in TOOL_LOGS:
+        path = os.path.join(log_dir, tool + '.log')
+        try:
+            if os.path.islink(path) or os.path.getsize(path) < rotate_bytes:
+                continue
+        except OSError:
+            continue
+        target = '{0}.{1}'.format(path, time.strftime('%Y%m%d-%H%M%S', time.localtime(clock())))
+        if os.path.exists(target) or os.path.exists(target + '.gz'):
+            continue
+        shutil.copy2(path, target)
+        with open(path, 'r+') as f:
+            f.truncate(0)
+        rotated.append(target)
+    return rotated
+
+
+class LogRetention(object):
+    """
+    压缩已轮转的glog文件，并按时间和每个组件的总大小上限清理
+
+    TOOL_LOGS超过tool_rotate_bytes（默认tool_max_bytes的1/4）时先切分，切分出的文件与glog一样压缩，
+    并按时间和每个工具tool_max_bytes的上限清理。当前写入的文件不会被压缩或删除；
+    压缩由最多workers个线程并行执行。
+    """
+
+    def __init__(self, log_dir, max_bytes=None, max_age_days=7, workers=2, compress=gzip_file,
+                 clock=time.time, tool_max_bytes=256 * 1024 * 1024, tool_rotate_bytes=None):
+        self.log_dir = log_dir
+        self.max_bytes = dict(max_bytes or {})
+        for tool in TOOL_LOGS:
+            self.max_bytes.setdefault(tool, tool_max_bytes)
+        if tool_rotate_bytes is None and tool_max_bytes:
+            tool_rotate_bytes = max(1024 * 1024, tool_max_bytes // 4)
+        self.tool_rotate_bytes = tool_rotate_bytes
+        self.max_age_days = max_age_days
+        self.workers = max(1, int(workers))
+        self._compress = compress
+        self._clock = clock
+
+    def run(self):
+        """
+        Returns:
+            dict: compressed、deleted、freed_bytes和errors
+        """
+        summary = {'compressed': 0, 'deleted': 0, 'freed_bytes': 0, 'errors': []}
+        if self.tool_rotate_bytes:
+            try:
+                rotate_tool_logs(self.log_dir, self.tool_rotate_bytes, self._clock)
+            except (IOError, OSError) as e:
+                summary['errors'].append('rotate: {0}'.format(e))
+        cutoff = self._clock() - self.max_age_days * 86400
+        logs = list_logs(self.log_dir)
+        active = active_files(self.log_dir, logs)
+        # 已过期的文件马上会被删除，不再压缩
+        pending = [item for files in logs.values() for item in files
+                   if not item['compressed'] and os.path.realpath(item['path']) not in active
+                   and not (self.max_age_days and item['mtime'] < cutoff)]
+        self._compress_all(pending, summary)
+
+        logs = list_logs(self.log_dir)
+        active = active_files(self.log_dir, logs)
+        for component, files in logs.items():
+            removable = [item for item in files if os.path.realpath(item['path']) not in active]
+            total = sum(item['size'] for item in files)
+            cap = self.max_bytes.get(component)
+            # files已按mtime升序，先删最旧的
+            for item in removable:
+                expired = self.max_age_days and item['mtime'] < cutoff
+                over_cap = cap is not None and total > cap
+                if not expired and not over_cap:
+                    continue
+                try:
+                    os.remove(item['path'])
+                except OSError as e:
+                    summary['errors'].append('{0}: {1}'.format(item['path'], e))
+                    continue
+                total -= item['size']
+                summary['deleted'] += 1
+                summary['freed_bytes'] += item['size']
+        return summary
+
+    def _compress_all(self, pending, summary):
+        lock = threading.Lock()
+        pending = list(pending)
+
+        def worker():
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    item = pending.pop(0)
+                try:
+                    compressed_size = self._compress(item['path'])
+                except (IOError, OSError) as e:
+                    with lock:
+                        summary['errors'].append('{0}: {1}'.format(item['path'], e))
+                    continue
+                with lock:
+                    summary['compressed'] += 1
+                    summary['freed_bytes'] += max(0, item['size'] - compressed_size)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.workers, len(pending)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def lower_priority():
+    """
+    把当前进程降为最低CPU优先级和idle IO调度类，避免与RocksDB争抢磁盘
+    """
+    try:
+        os.nice(19)
+    except OSError:
+        pass
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call(['ionice', '-c', '3', '-p', str(os.getpid())], stdout=devnull, stderr=devnull)
+    except OSError:
+        pass
+
+
+def main(argv):
+    if len(argv) < 2:
+        print('Usage: nebula_log_retention.py <config.json>')
+        return 2
+    with open(argv[1]) as f:
+        config = json.load(f)
+
+    import fcntl
+    lock = open(os.path.join(config['log_dir'], '.nebula-log-retention.lock'), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        print('Another log retention run is in progress, exiting.')
+        return 0
+
+    lower_priority()
+    max_bytes = dict((component, int(mb) * 1024 * 1024) for component, mb in config.get('max_mb', {}).items())
+    summary = LogRetention(config['log_dir'], max_bytes, config.get('max_age_days', 7),
+                           config.get('workers', 2),
+                           tool_max_bytes=int(config.get('tool_max_mb', 256)) * 1024 * 1024).run()
+    print('{0} compressed {1} files, deleted {2} files, freed {3} bytes'.format(
+        time.strftime('%Y-%m-%d %H:%M:%S'), summary['compressed'], summary['deleted'], summary['freed_bytes']))
+    for error in summary['errors']:
+        print('Failed: ' + error)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
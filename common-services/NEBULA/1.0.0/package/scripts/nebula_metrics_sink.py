@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import collections
+import gzip
+import io
+import json
+import threading
+import time
+
+try:
+    from urllib2 import Request, urlopen
+except ImportError:
+    from urllib.request import Request, urlopen
+
+from nebula_stats import named_metrics
+
+TIMELINE_PATH = '/ws/v1/timeline/metrics'
+
+
+def app_id(component):
+    """
+    AMS按组件的timelineAppid查询指标，见metainfo.xml
+
+    cluster汇总值归入metad，<component>_cgroup归入对应组件。
+    """
+    if component == 'cluster':
+        return 'nebula_metad'
+    return 'nebula_' + component.split('_')[0]
+
+
+class AmsSink(object):
+    """
+    缓冲NEBULA主机指标并批量推送到Ambari Metrics Collector
+
+    指标按named_metrics换成metrics.json中的nebula.<component>.<name>，并以组件的
+    appId推送。缓冲区最多保存max_points个数据点，Collector不可用时新数据会挤掉
+    最旧的数据，内存占用不随故障时长增长。每次flush按batch_size个指标序列拆分成多个POST，
+    compress为真时以gzip压缩请求体。
+    """
+
+    def __init__(self, collector_hosts, port, hostname, max_points=100000,
+                 batch_size=500, flush_interval=60, compress=True, timeout=10, post=None,
+                 clock=time.time):
+        self.collector_hosts = list(collector_hosts)
+        self.port = port
+        self.hostname = hostname
+        self.max_points = int(max_points)
+        self.batch_size = int(batch_size)
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.timeout = timeout
+        self._post = post or self._http_post
+        self._clock = clock
+        self._buffer = collections.deque(maxlen=self.max_points)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._collector_index = 0
+        self.dropped = 0
+        self.sent = 0
+
+    def add(self, component, stats, timestamp=None):
+        """
+        记录一个组件一次抓取得到的全部统计项
+        """
+        ts = int((timestamp if timestamp is not None else self._clock()) * 1000)
+        appid = app_id(component)
+        named = named_metrics(component, stats)
+        with self._lock:
+            self.dropped += max(0, len(self._buffer) + len(named) - self.max_points)
+            for name, value in named.items():
+                self._buffer.append(((appid, 'nebula.{0}.{1}'.format(component, name)), ts, value))
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """
+        把缓冲区数据分批推送，失败的数据放回缓冲区头部
+
+        Returns:
+            bool: 所有批次都推送成功
+        """
+        with self._lock:
+            points = list(self._buffer)
+            self._buffer.clear()
+        if not points:
+            return True
+
+        series = collections.OrderedDict()
+        for name, ts, value in points:
+            series.setdefault(name, []).append((ts, value))
+        names = list(series)
+
+        for start in range(0, len(names), self.batch_size):
+            batch = names[start:start + self.batch_size]
+            try:
+                self._send(self._payload(batch, series))
+            except Exception:
+                failed = [(name, ts, value) for name in names[start:] for ts, value in series[name]]
+                self._requeue(failed)
+                return False
+            self.sent += sum(len(series[name]) for name in batch)
+        return True
+
+    def _requeue(self, failed):
+        with self._lock:
+            merged = failed + list(self._buffer)
+            self.dropped += max(0, len(merged) - self.max_points)
+            self._buffer = collections.deque(merged, maxlen=self.max_points)
+
+    def _payload(self, names, series):
+        metrics = []
+        for key in names:
+            appid, name = key
+            values = series[key]
+            metrics.append({
+                'metricname': name,
+                'appid': appid,
+                'hostname': self.hostname,
+                'instanceid': '',
+                'starttime': values[0][0],
+                'metrics': dict((str(ts), value) for ts, value in values)
+            })
+        return {'metrics': metrics}
+
+    def _send(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.compress:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+
+        # 依次尝试各Collector，成功后下次从同一台开始
+        last_error = None
+        for attempt in range(len(self.collector_hosts)):
+            index = (self._collector_index + attempt) % len(self.collector_hosts)
+            url = 'http://{0}:{1}{2}'.format(self.collector_hosts[index], self.port, TIMELINE_PATH)
+            try:
+                self._post(url, body, headers, self.timeout)
+            except Exception as e:
+                last_error = e
+                continue
+            self._collector_index = index
+            return
+        raise last_error or IOError('No metrics collector hosts are configured.')
+
+    @staticmethod
+    def _http_post(url, body, headers, timeout):
+        response = urlopen(Request(url, data=body, headers=headers), timeout=timeout)
+        try:
+            if response.getcode() >= 300:
+                raise IOError('Metrics collector returned HTTP {0}'.format(response.getcode()))
+        finally:
+            response.close()
+
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+import subprocess
+import threading
+
+import nebula_trace
+
+# 可选的nebula3-python驱动：安装后批量导入使用长连接会话池
+try:
+    from nebula3.Config import Config as DriverConfig
+    from nebula3.gclient.net import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+ERROR_PATTERN = re.compile(r'\[ERROR \((-?\d+)\)\]:\s*(.*)')
+
+
+class NgqlError(Exception):
+    """
+    nGQL语句执行失败
+    """
+
+    def __init__(self, message, code=None):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+# 原样重试可能成功的错误码：断连、连接失败、RPC失败、leader切换、会话失效或超时
+RETRYABLE_CODES = frozenset([-1, -2, -3, -4, -1002, -1003])
+
+# storaged的分片错误经graphd返回时错误码为通用的执行错误，只能按消息判断
+RETRYABLE_MESSAGES = ('leader changed', 'leader has changed', 'rpc failure', 'timed out', 'timeout',
+                      'session not existed')
+
+
+def is_retryable(error):
+    """
+    判断语句失败是否为瞬时错误
+
+    code为None表示nebula-console进程本身失败（超时被杀或无法连接），也按瞬时错误处理；
+    语法、语义和schema错误重试不会成功。
+
+    Args:
+        error: NgqlError
+
+    Returns:
+        bool: 是否值得对同一语句退避重试
+    """
+    if error.code is None or error.code in RETRYABLE_CODES:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MESSAGES)
+
+
+def parse_console_table(output):
+    """
+    解析nebula-console输出的结果表格
+
+    一次执行多条语句时只返回最后一张表。
+
+    Args:
+        output: nebula-console的标准输出文本
+
+    Returns:
+        list: 每行一个dict，键为表头列名，字符串值已去掉引号
+    """
+    tables = parse_console_tables(output)
+    return tables[-1] if tables else []
+
+
+def parse_console_tables(output):
+    """
+    按出现顺序解析nebula-console输出中的所有结果表格
+
+    Returns:
+        list: 每张表为parse_console_table格式的行列表
+    """
+    tables = []
+    header = None
+    rows = []
+
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('+'):
+            continue
+        if not line.startswith('|'):
+            # 表格之外的内容（提示符、耗时统计）意味着上一张表结束
+            if header is not None:
+                tables.append(rows)
+                header = None
+                rows = []
+            continue
+
+        cells = [_unquote(cell.strip()) for cell in line.strip('|').split('|')]
+        if header is None:
+            header = cells
+        else:
+            rows.append(dict(zip(header, cells)))
+
+    if header is not None:
+        tables.append(rows)
+
+    return tables
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+class ConsoleSession(object):
+    """
+    通过nebula-console执行nGQL的会话
+
+    每次execute都会启动一个nebula-console进程，space不为空时自动在语句前加USE。
+    """
+
+    def __init__(self, console_bin, host, port, user='root', password='nebula',
+                 space=None, timeout=60):
+        self.console_bin = console_bin
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.space = space
+        self.timeout = timeout
+
+    def execute(self, statement):
+        """
+        执行nGQL语句
+
+        Returns:
+            list: parse_console_table解析出的结果行
+
+        Raises:
+            NgqlError: 语句执行失败或超时
+        """
+        return parse_console_table(self._run(statement))
+
+    def execute_all(self, statement):
+        """
+        在同一个nebula-console进程中执行多条语句
+
+        Returns:
+            list: 每条返回结果的语句一张表，见parse_console_tables
+        """
+        return parse_console_tables(self._run(statement))
+
+    def _run(self, statement):
+        if self.space:
+            statement = 'USE {0}; {1}'.format(self.space, statement)
+
+        command = [self.console_bin,
+                   '-addr', self.host,
+                   '-port', str(self.port),
+                   '-u', self.user,
+                   '-p', self.password,
+                   '-e', statement]
+
+        nebula_trace.count('console_processes')
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        timer = threading.Timer(self.timeout, _kill_quietly, [proc])
+        timer.start()
+        try:
+            output = proc.communicate()[0]
+        finally:
+            timer.cancel()
+        nebula_trace.count('bytes_read', len(output))
+
+        if not isinstance(output, str):
+            output = output.decode('utf-8', 'replace')
+
+        match = ERROR_PATTERN.search(output)
+        if match:
+            raise NgqlError(match.group(2).strip(), int(match.group(1)))
+        if proc.returncode != 0:
+            raise NgqlError('nebula-console exited with code {0} on {1}:{2}: {3}'.format(
+                proc.returncode, self.host, self.port, output.strip()[-500:]))
+
+        return output
+
+
+def _kill_quietly(proc):
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+def session_factory(console_bin, hosts, port, user='root', password='nebula',
+                    space=None, timeout=60):
+    """
+    生成按序号轮询graphd主机的会话工厂
+
+    Returns:
+        function: factory(index) -> ConsoleSession
+    """
+    if not hosts:
+        raise ValueError('No graphd hosts are available for nebula-console sessions.')
+
+    def factory(index):
+        host = hosts[index % len(hosts)]
+        return ConsoleSession(console_bin, host, port, user, password, space, timeout)
+
+    return factory
+
+
+class DriverSession(object):
+    """
+    基于nebula3-python连接池的长连接会话
+
+    登录一次后复用，密码不会出现在进程参数中。接口与ConsoleSession一致。
+    """
+
+    def __init__(self, pool, user, password, space=None):
+        self._session = pool.get_session(user, password)
+        if space:
+            self.execute('USE {0}'.format(space))
+
+    def execute(self, statement):
+        result = self._session.execute(statement)
+        if not result.is_succeeded():
+            raise NgqlError(result.error_msg(), result.error_code())
+        if result.is_empty() or not hasattr(result, 'as_primitive'):
+            return []
+        return result.as_primitive()
+
+    def close(self):
+        self._session.release()
+
+
+def driver_session_factory(hosts, port, user='root', password='nebula', space=None, size=8,
+                           timeout=60):
+    """
+    生成基于nebula3-python连接池的会话工厂
+
+    Returns:
+        function: factory(index) -> DriverSession；未安装nebula3-python时返回None
+    """
+    if ConnectionPool is None:
+        return None
+    if not hosts:
+        raise ValueError('No graphd hosts are available for driver sessions.')
+    config = DriverConfig()
+    config.max_connection_pool_size = int(size)
+    config.timeout = int(timeout * 1000)
+    pool = ConnectionPool()
+    if not pool.init([(host, int(port)) for host in hosts], config):
+        raise NgqlError('Unable to connect to graphd hosts: {0}'.format(', '.join(hosts)))
+
+    def factory(index):
+        return DriverSession(pool, user, password, space)
+
+    factory.pool = pool
+    return factory
+
+
+def quote_name(name):
+    """
+    用反引号引用space等标识符，名称中的反引号加反斜杠转义
+    """
+    return '`{0}`'.format(name.replace('`', '\\`'))
+
+
+def parse_distribution(value):
+    """
+    解析SHOW HOSTS中"space:count, ..."格式的分布列
+
+    Returns:
+        dict: space名称到数量，"No valid partition"等文本返回空dict
+    """
+    distribution = {}
+    for item in value.split(','):
+        space, sep, count = item.strip().rpartition(':')
+        if not sep:
+            continue
+        try:
+            distribution[space.strip()] = int(count)
+        except ValueError:
+            continue
+    return distribution
+
+
+def show_hosts(session):
+    """
+    通过SHOW HOSTS读取metad记录的storaged主机信息
+
+    Returns:
+        list: 每台主机一个dict，包含host、port、status、leader_count、
+              leaders（space到leader数）和partitions（space到分片数）
+    """
+    hosts = []
+    for row in session.execute('SHOW HOSTS'):
+        host = row.get('Host')
+        if not host:
+            continue
+        try:
+            leader_count = int(row.get('Leader count', 0))
+        except ValueError:
+            leader_count = 0
+        hosts.append({
+            'host': host,
+            'port': int(row.get('Port', 0) or 0),
+            'status': row.get('Status', '').upper(),
+            'leader_count': leader_count,
+            'leaders': parse_distribution(row.get('Leader distribution', '')),
+            'partitions': parse_distribution(row.get('Partition distribution', ''))
+        })
+    return hosts
+
+
+def show_spaces(session):
+    """
+    Returns:
+        list: metad中所有space的名称
+    """
+    return [row['Name'] for row in session.execute('SHOW SPACES') if row.get('Name')]
+
+
+def show_fleet(session):
+    """
+    在一次nebula-console调用中读取metad登记的graphd和storaged主机
+
+    Returns:
+        dict: {'graphd': [...], 'storaged': [...]}，每台主机一个dict，包含host、port和status
+    """
+    tables = session.execute_all('SHOW HOSTS GRAPH; SHOW HOSTS STORAGE')
+    if len(tables) != 2:
+        raise NgqlError('Expected 2 result tables from SHOW HOSTS GRAPH/STORAGE, got {0}'.format(len(tables)))
+    fleet = {}
+    for role, rows in zip(('graphd', 'storaged'), tables):
+        fleet[role] = [{'host': row['Host'], 'port': int(row.get('Port', 0) or 0),
+                        'status': row.get('Status', '').upper()}
+                       for row in rows if row.get('Host')]
+    return fleet
+
+
+def show_meta_leader(session):
+    """
+    通过SHOW META LEADER读取当前metad leader
+
+    Returns:
+        tuple: (host, port)，没有结果时为None
+    """
+    for row in session.execute('SHOW META LEADER'):
+        address = row.get('Meta Leader', '')
+        host, sep, port = address.rpartition(':')
+        if not sep:
+            continue
+        try:
+            return _unquote(host.strip()), int(port)
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+
+NODE_ROOT = '/sys/devices/system/node'
+PROC_ROOT = '/proc'
+
+_NODE_DIR = re.compile(r'^node(\d+)$')
+
+
+def parse_cpulist(text):
+    """
+    解析"0-3,8,10-11"格式的CPU列表
+
+    Returns:
+        list: 升序的CPU编号
+    """
+    cpus = set()
+    for item in text.strip().split(','):
+        item = item.strip()
+        if not item:
+            continue
+        start, sep, end = item.partition('-')
+        if sep:
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(start))
+    return sorted(cpus)
+
+
+def format_cpulist(cpus):
+    """
+    把CPU编号压缩回"0-3,8"格式
+    """
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(start) if start == end else '{0}-{1}'.format(start, end) for start, end in ranges)
+
+
+def read_topology(node_root=NODE_ROOT):
+    """
+    从/sys/devices/system/node读取NUMA拓扑
+
+    Returns:
+        dict: 节点编号 -> CPU列表；没有NUMA信息时为空dict
+    """
+    topology = {}
+    if not os.path.isdir(node_root):
+        return topology
+    for name in os.listdir(node_root):
+        match = _NODE_DIR.match(name)
+        if not match:
+            continue
+        try:
+            with open(os.path.join(node_root, name, 'cpulist')) as f:
+                cpus = parse_cpulist(f.read())
+        except (IOError, OSError, ValueError):
+            continue
+        if cpus:
+            topology[int(match.group(1))] = cpus
+    return topology
+
+
+def plan_placement(component, topology, co_located, storaged_policy='auto', storaged_node='auto',
+                   graphd_cpu_list=''):
+    """
+    计算守护进程的NUMA/CPU放置
+
+    auto策略：同机部署graphd且有多个NUMA节点时，storaged绑定到一个节点，graphd固定到
+    其余节点的CPU，两者不重叠；否则storaged交错分配内存，graphd不固定。
+
+    Args:
+        component: 'graphd'、'metad'或'storaged'
+        topology: read_topology的结果
+        co_located: 本机部署的组件集合
+        storaged_policy: 'auto'、'bind'、'interleave'或'none'
+        storaged_node: 'auto'或节点编号
+        graphd_cpu_list: 显式指定的graphd CPU列表，为空时自动计算；同机storaged绑定节点时
+                         不能与该节点的CPU重叠
+
+    Returns:
+        dict: policy（none/bind/interleave/cpus）、node、cpus（预期允许的CPU列表）
+    """
+    all_cpus = sorted(cpu for cpus in topology.values() for cpu in cpus)
+    none = {'policy': 'none', 'node': None, 'cpus': all_cpus}
+    if component == 'metad' or not topology:
+        return none
+
+    storaged = _storaged_placement(topology, co_located, storaged_policy, storaged_node)
+    if graphd_cpu_list and storaged and storaged['policy'] == 'bind' and {'graphd', 'storaged'} <= set(co_located):
+        overlap = set(parse_cpulist(graphd_cpu_list)) & set(storaged['cpus'])
+        if overlap:
+            raise ValueError('graphd_cpu_list overlaps NUMA node {0} bound to storaged (CPUs {1})'.format(
+                storaged['node'], format_cpulist(overlap)))
+    if component == 'storaged':
+        return storaged or {'policy': 'none', 'node': None, 'cpus': all_cpus}
+
+    if graphd_cpu_list:
+        cpus = [cpu for cpu in parse_cpulist(graphd_cpu_list) if cpu in all_cpus]
+        return {'policy': 'cpus', 'node': None, 'cpus': cpus} if cpus else none
+    if storaged and storaged['policy'] == 'bind' and 'storaged' in co_located:
+        cpus = [cpu for node, node_cpus in topology.items() if node != storaged['node'] for cpu in node_cpus]
+        if cpus:
+            return {'policy': 'cpus', 'node': None, 'cpus': sorted(cpus)}
+    return none
+
+
+def _storaged_placement(topology, co_located, policy, node):
+    nodes = sorted(topology)
+    if policy == 'none':
+        return None
+    if policy == 'auto':
+        policy = 'bind' if len(nodes) > 1 and 'graphd' in co_located else 'interleave'
+    if policy == 'interleave':
+        if len(nodes) < 2:
+            return None
+        return {'policy': 'interleave', 'node': None, 'cpus': sorted(cpu for cpus in topology.values() for cpu in cpus)}
+    if policy != 'bind':
+        raise ValueError('Unknown storaged NUMA policy: ' + policy)
+    target = nodes[0] if str(node) == 'auto' else int(node)
+    if target not in topology:
+        raise ValueError('NUMA node {0} does not exist on this host (nodes: {1})'.format(
+            target, ', '.join(str(item) for item in nodes)))
+    return {'policy': 'bind', 'node': target, 'cpus': topology[target]}
+
+
+def launch_prefix(placement):
+    """
+    Returns:
+        str: 启动命令前缀，policy为none时为空串
+    """
+    if placement['policy'] == 'bind':
+        return 'numactl --cpunodebind={0} --membind={0} '.format(placement['node'])
+    if placement['policy'] == 'interleave':
+        return 'numactl --interleave=all '
+    if placement['policy'] == 'cpus':
+        return 'taskset -c {0} '.format(format_cpulist(placement['cpus']))
+    return ''
+
+
+def describe(component, placement):
+    if placement['policy'] == 'bind':
+        return '{0}: bound to NUMA node {1} (CPUs {2})'.format(
+            component, placement['node'], format_cpulist(placement['cpus']))
+    if placement['policy'] == 'interleave':
+        return '{0}: memory interleaved across all NUMA nodes'.format(component)
+    if placement['policy'] == 'cpus':
+        return '{0}: pinned to CPUs {1}'.format(component, format_cpulist(placement['cpus']))
+    return '{0}: no NUMA/CPU placement'.format(component)
+
+
+def parse_cpus_allowed(status_text):
+    """
+    从/proc/<pid>/status的Cpus_allowed掩码（逗号分隔的32位十六进制组）解析CPU列表
+    """
+    for line in status_text.splitlines():
+        name, sep, value = line.partition(':')
+        if name.strip() == 'Cpus_allowed' and sep:
+            mask = int(value.strip().replace(',', ''), 16)
+            cpus = []
+            cpu = 0
+            while mask:
+                if mask & 1:
+                    cpus.append(cpu)
+                mask >>= 1
+                cpu += 1
+            return cpus
+    return None
+
+
+def parse_memory_policies(numa_maps_text):
+    """
+    从/proc/<pid>/numa_maps每行的第二列取内存策略，例如"interleave:0-1"、"bind:0"
+
+    未单独mbind的映射显示进程的内存策略。
+
+    Returns:
+        set: 出现过的策略
+    """
+    policies = set()
+    for line in numa_maps_text.splitlines():
+        fields = line.split()
+        if len(fields) > 1:
+            policies.add(fields[1])
+    return policies
+
+
+def _memory_policy_matches(policies, placement):
+    if not policies:
+        return False
+    if placement['policy'] == 'bind':
+        return policies == {'bind:{0}'.format(placement['node'])}
+    return all(policy.startswith('interleave') for policy in policies)
+
+
+def verify_placement(pid, placement, proc_root=PROC_ROOT):
+    """
+    检查进程实际允许的CPU与内存策略是否与放置结果一致
+
+    bind和cpus比较Cpus_allowed；bind和interleave还要求numa_maps中的内存策略
+    分别为bind:<节点>和interleave。
+
+    Returns:
+        tuple: (是否一致, 实际CPU列表)；进程不存在时实际CPU列表为None
+    """
+    try:
+        with open(os.path.join(proc_root, str(pid), 'status')) as f:
+            actual = parse_cpus_allowed(f.read())
+    except (IOError, OSError):
+        return False, None
+    if actual is None:
+        return False, None
+    if placement['policy'] in ('bind', 'cpus') and actual != sorted(placement['cpus']):
+        return False, actual
+    if placement['policy'] in ('bind', 'interleave'):
+        try:
+            with open(os.path.join(proc_root, str(pid), 'numa_maps')) as f:
+                policies = parse_memory_policies(f.read())
+        except (IOError, OSError):
+            policies = set()
+        return _memory_policy_matches(policies, placement), actual
+    return True, actual
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import re
+
+PROC_ROOT = '/proc'
+SYS_ROOT = '/sys'
+THP_FILES = ('kernel/mm/transparent_hugepage/enabled', 'kernel/mm/transparent_hugepage/defrag')
+
+_SELECTED = re.compile(r'\[([^\]]+)\]')
+# /proc/<pid>/limits中的行，例如"Max open files            1048576              1048576              files"
+_LIMIT_LINE = re.compile(r'^Max (open files|processes)\s+(\S+)\s+(\S+)')
+_LIMIT_NAMES = {'open files': 'nofile', 'processes': 'nproc'}
+
+
+def build_profile(nofile=1048576, nproc=65536, swappiness=1, dirty_ratio=10, dirty_background_ratio=5,
+                  somaxconn=4096, transparent_hugepage='never', read_ahead_kb=128, scheduler='none'):
+    """
+    由nebula-env中的设置组成OS配置
+
+    Returns:
+        dict: limits、sysctl、thp和block四部分，值均为字符串
+    """
+    return {
+        'limits': {'nofile': str(nofile), 'nproc': str(nproc)},
+        'sysctl': {
+            'vm.swappiness': str(swappiness),
+            'vm.dirty_ratio': str(dirty_ratio),
+            'vm.dirty_background_ratio': str(dirty_background_ratio),
+            'net.core.somaxconn': str(somaxconn)
+        },
+        'thp': transparent_hugepage,
+        'block': {'read_ahead_kb': str(read_ahead_kb), 'scheduler': scheduler}
+    }
+
+
+def render_limits(user, profile):
+    """
+    生成/etc/security/limits.d片段
+    """
+    lines = []
+    for name in sorted(profile['limits']):
+        for kind in ('soft', 'hard'):
+            lines.append('{0} {1} {2} {3}'.format(user, kind, name, profile['limits'][name]))
+    return '\n'.join(lines) + '\n'
+
+
+def render_sysctl(profile):
+    """
+    生成/etc/sysctl.d片段
+    """
+    return ''.join('{0} = {1}\n'.format(key, profile['sysctl'][key]) for key in sorted(profile['sysctl']))
+
+
+def render_udev_rules(devices, profile):
+    """
+    生成udev规则，使磁盘的预读和调度器在重启或热插拔后保持一致
+    """
+    lines = []
+    for device in sorted(devices):
+        rule = 'ACTION=="add|change", KERNEL=="{0}", ATTR{{queue/read_ahead_kb}}="{1}"'.format(
+            device, profile['block']['read_ahead_kb'])
+        if profile['block']['scheduler']:
+            rule += ', ATTR{{queue/scheduler}}="{0}"'.format(profile['block']['scheduler'])
+        lines.append(rule)
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def _write(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def selected(text):
+    """
+    "always madvise [never]"中被选中的一项；没有方括号时返回原文
+    """
+    match = _SELECTED.search(text)
+    return match.group(1) if match else text.strip()
+
+
+def sysctl_path(key, proc_root=PROC_ROOT):
+    return os.path.join(proc_root, 'sys', *key.split('.'))
+
+
+def block_device_for(path, sys_root=SYS_ROOT):
+    """
+    找到path所在的整块磁盘名，分区会换算为其父设备（sda1 -> sda）
+
+    Returns:
+        str: 设备名，找不到时为None（例如tmpfs、overlay）
+    """
+    try:
+        st_dev = os.stat(path).st_dev
+    except OSError:
+        return None
+    link = os.path.join(sys_root, 'dev', 'block', '{0}:{1}'.format(os.major(st_dev), os.minor(st_dev)))
+    if not os.path.exists(link):
+        return None
+    device_dir = os.path.realpath(link)
+    if os.path.exists(os.path.join(device_dir, 'partition')):
+        device_dir = os.path.dirname(device_dir)
+    name = os.path.basename(device_dir)
+    if not os.path.isdir(os.path.join(sys_root, 'block', name)):
+        return None
+    return name
+
+
+def data_devices(data_path, sys_root=SYS_ROOT):
+    """
+    storaged的data_path（逗号分隔）所在的磁盘
+
+    Returns:
+        list: 去重排序后的设备名，识别不出的路径忽略
+    """
+    devices = set()
+    for path in data_path.split(','):
+        device = block_device_for(path.strip(), sys_root) if path.strip() else None
+        if device:
+            devices.add(device)
+    return sorted(devices)
+
+
+def read_live(profile, devices, proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """
+    读取与profile对应的当前内核取值
+
+    Returns:
+        dict: 设置名 -> 当前值，读不到的设置不出现
+    """
+    live = {}
+    for key in profile['sysctl']:
+        try:
+            live[key] = _read(sysctl_path(key, proc_root))
+        except (IOError, OSError):
+            pass
+    for relative in THP_FILES:
+        try:
+            live['thp.' + relative.split('/')[-1]] = selected(_read(os.path.join(sys_root, relative)))
+        except (IOError, OSError):
+            pass
+    for device in devices:
+        queue = os.path.join(sys_root, 'block', device, 'queue')
+        for name in ('read_ahead_kb', 'scheduler'):
+            try:
+                value = _read(os.path.join(queue, name))
+            except (IOError, OSError):
+                continue
+            live['{0}.{1}'.format(device, name)] = selected(value) if name == 'scheduler' else value
+    return live
+
+
+def expected(profile, devices):
+    """
+    Returns:
+        dict: 设置名 -> 期望值，与read_live的键一致
+    """
+    values = dict(profile['sysctl'])
+    if profile['thp']:
+        values['thp.enabled'] = profile['thp']
+        values['thp.defrag'] = profile['thp']
+    for device in devices:
+        values['{0}.read_ahead_kb'.format(device)] = profile['block']['read_ahead_kb']
+        if profile['block']['scheduler']:
+            values['{0}.scheduler'.format(device)] = profile['block']['scheduler']
+    return values
+
+
+def apply(profile, devices, proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """
+    把profile写入运行中的内核，已经一致的设置不重写
+
+    Returns:
+        dict: changed（写入的设置）和errors（写入失败的设置及原因）
+    """
+    result = {'changed': [], 'errors': []}
+    live = read_live(profile, devices, proc_root, sys_root)
+    targets = {}
+    for key in profile['sysctl']:
+        targets[key] = sysctl_path(key, proc_root)
+    for relative in THP_FILES:
+        targets['thp.' + relative.split('/')[-1]] = os.path.join(sys_root, relative)
+    for device in devices:
+        for name in ('read_ahead_kb', 'scheduler'):
+            targets['{0}.{1}'.format(device, name)] = os.path.join(sys_root, 'block', device, 'queue', name)
+
+    for key, value in sorted(expected(profile, devices).items()):
+        if live.get(key) == value:
+            continue
+        if key not in live:
+            result['errors'].append('{0}: not available on this host'.format(key))
+            continue
+        if key.endswith('.scheduler') or key.startswith('thp.'):
+            options = _read(targets[key]).replace('[', '').replace(']', '').split()
+            if value not in options:
+                result['errors'].append('{0}: {1} is not one of {2}'.format(key, value, ', '.join(options)))
+                continue
+        try:
+            _write(targets[key], value)
+        except (IOError, OSError) as e:
+            result['errors'].append('{0}: {1}'.format(key, e))
+            continue
+        result['changed'].append(key)
+    return result
+
+
+def parse_proc_limits(text):
+    """
+    解析/proc/<pid>/limits中的nofile和nproc
+
+    Returns:
+        dict: {'nofile': (soft, hard), 'nproc': (soft, hard)}
+    """
+    limits = {}
+    for line in text.splitlines():
+        match = _LIMIT_LINE.match(line)
+        if match:
+            limits[_LIMIT_NAMES[match.group(1)]] = (match.group(2), match.group(3))
+    return limits
+
+
+def drift(profile, devices, pids=(), proc_root=PROC_ROOT, sys_root=SYS_ROOT):
+    """
+    比较当前取值与profile
+
+    Args:
+        pids: 运行中的守护进程，用于检查其实际生效的ulimit
+
+    Returns:
+        list: [(设置名, 期望值, 当前值)]，当前值读不到时为None
+    """
+    live = read_live(profile, devices, proc_root, sys_root)
+    result = [(key, value, live.get(key)) for key, value in sorted(expected(profile, devices).items())
+              if live.get(key) != value]
+    for pid in pids:
+        try:
+            limits = parse_proc_limits(_read(os.path.join(proc_root, str(pid), 'limits')))
+        except (IOError, OSError):
+            continue
+        for name, value in sorted(profile['limits'].items()):
+            actual = limits.get(name)
+            if actual is not None and actual != (value, value):
+                result.append(('pid {0} {1}'.format(pid, name), value, '/'.join(actual)))
+    return result
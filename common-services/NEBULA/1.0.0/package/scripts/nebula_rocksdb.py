@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import glob
+import json
+import os
+import re
+import time
+
+try:
+    from urllib2 import urlopen
+    from urllib import quote
+except ImportError:
+    from urllib.request import urlopen
+    from urllib.parse import quote
+
+import nebula_trace
+
+# storaged /rocksdb_property可读的属性 -> 指标名
+PROPERTIES = (
+    ('rocksdb.estimate-pending-compaction-bytes', 'pending_compaction_bytes'),
+    ('rocksdb.num-immutable-mem-table', 'immutable_memtables'),
+    ('rocksdb.compaction-pending', 'compaction_pending'),
+    ('rocksdb.actual-delayed-write-rate', 'delayed_write_rate'),
+)
+
+# RocksDB的默认值，rocksdb_column_family_options中显式设置时以其为准
+DEFAULT_LIMITS = {
+    'level0_slowdown_writes_trigger': 20,
+    'level0_stop_writes_trigger': 36,
+    'soft_pending_compaction_bytes_limit': 64 * 1024 ** 3,
+    'hard_pending_compaction_bytes_limit': 256 * 1024 ** 3,
+    'max_write_buffer_number': 2
+}
+
+# 首次扫描只读LOG末尾的这部分，统计转储是周期性的，最近一次总在末尾
+INITIAL_TAIL_BYTES = 1024 * 1024
+
+_CF_HEADER = re.compile(r'^\*\* Compaction Stats \[(.+)\] \*\*')
+_LEVEL_ROW = re.compile(r'^\s*(L\d+|Sum)\s+(\d+)/(\d+)\s')
+_STALL_COUNT = re.compile(r'^Stalls\(count\):.*interval (\d+) total count')
+_STALL_TIME = re.compile(r'^(Cumulative|Interval) stall: (\d+):(\d+):([\d.]+) H:M:S, ([\d.]+) percent')
+
+
+def log_files(data_paths):
+    """
+    Returns:
+        dict: 引擎（"<data_path>/<space_id>"）-> RocksDB LOG路径
+    """
+    files = {}
+    for data_path in data_paths:
+        for path in sorted(glob.glob(os.path.join(data_path, 'nebula', '*', 'data', 'LOG'))):
+            space_id = os.path.basename(os.path.dirname(os.path.dirname(path)))
+            files['{0}/{1}'.format(data_path.rstrip('/'), space_id)] = path
+    return files
+
+
+def rocksdb_limits(column_family_options):
+    """
+    从storaged的rocksdb_column_family_options（JSON）中取出与写停顿相关的阈值
+    """
+    limits = dict(DEFAULT_LIMITS)
+    try:
+        options = json.loads(column_family_options or '{}')
+    except ValueError:
+        options = {}
+    for name in limits:
+        if name in options:
+            try:
+                limits[name] = int(options[name])
+            except (TypeError, ValueError):
+                pass
+    return limits
+
+
+class LogParser(object):
+    """
+    逐行解析RocksDB LOG中的统计转储，行可以分多次送入
+
+    Attributes:
+        engine: {'cfs': {cf: {l0_files, w_amp, stalls}}, 'stall_micros', 'stall_percent'}
+        state: 跨批次保留的解析位置（当前列族和W-Amp所在列）
+    """
+
+    def __init__(self, engine=None, state=None):
+        self.engine = engine or {'cfs': {}}
+        self.state = state or {'cf': None, 'w_amp_index': None}
+
+    def feed(self, line):
+        match = _CF_HEADER.match(line)
+        if match:
+            self.state['cf'] = match.group(1)
+            return
+        cf = self.state['cf']
+        if cf is not None and line.startswith('Level'):
+            header = line.split()
+            # 数据行中Size占两列（"50.12 MB"）
+            self.state['w_amp_index'] = header.index('W-Amp') + 1 if 'W-Amp' in header else None
+            return
+        match = _LEVEL_ROW.match(line)
+        if match and cf is not None:
+            entry = self.engine['cfs'].setdefault(cf, {})
+            if match.group(1) == 'L0':
+                entry['l0_files'] = int(match.group(2))
+            elif match.group(1) == 'Sum':
+                tokens = line.split()
+                index = self.state['w_amp_index']
+                try:
+                    entry['w_amp'] = float(tokens[index])
+                except (TypeError, IndexError, ValueError):
+                    pass
+            return
+        match = _STALL_COUNT.match(line)
+        if match and cf is not None:
+            self.engine['cfs'].setdefault(cf, {})['stalls'] = int(match.group(1))
+            return
+        match = _STALL_TIME.match(line)
+        if match:
+            hours, minutes, seconds, percent = match.groups()[1:]
+            if match.group(1) == 'Cumulative':
+                self.engine['stall_micros'] = int((int(hours) * 3600 + int(minutes) * 60 + float(seconds)) * 1e6)
+            else:
+                self.engine['stall_percent'] = float(percent)
+
+
+def fetch_properties(host, port, space, prop, timeout=5):
+    """
+    读取storaged /rocksdb_property中一个space的一个属性
+
+    Returns:
+        list: 每个引擎的数值
+    """
+    nebula_trace.count('sockets')
+    url = 'http://{0}:{1}/rocksdb_property?space={2}&property={3}'.format(host, port, quote(space), quote(prop))
+    response = urlopen(url, timeout=timeout)
+    try:
+        data = response.read()
+    finally:
+        response.close()
+    nebula_trace.count('bytes_read', len(data))
+    if not isinstance(data, str):
+        data = data.decode('utf-8', 'replace')
+    return list(_numbers(json.loads(data)))
+
+
+def _numbers(value):
+    # 返回结构随版本不同（[{"Engine 0": "12"}]或{"Engine 0": "12"}），只取其中的数值
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            for number in _numbers(item):
+                yield number
+        return
+    try:
+        yield float(value)
+    except (TypeError, ValueError):
+        return
+
+
+class RocksDbCollector(object):
+    """
+    增量收集本机storaged的RocksDB内部指标
+
+    LOG按inode和偏移增量解析，只读取新增的完整行；HTTP属性按space读取。
+    checkpoint保存解析位置、各引擎最近一次转储的结果和上一次的信号值，
+    供下一次计算增长速度。
+
+    Args:
+        spaces: space名列表，或每次读取属性时返回列表的函数
+    """
+
+    def __init__(self, checkpoint_file, data_paths, host=None, http_port=None, spaces=(),
+                 fetch=fetch_properties, clock=time.time):
+        self.checkpoint_file = checkpoint_file
+        self.data_paths = data_paths
+        self.host = host
+        self.http_port = http_port
+        self.spaces = spaces
+        self._fetch = fetch
+        self._clock = clock
+        self.files = {}
+        self.engines = {}
+        self.previous = {}
+        self._load()
+
+    def _load(self):
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return
+        try:
+            with open(self.checkpoint_file) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return
+        self.files = state.get('files', {})
+        self.engines = state.get('engines', {})
+        self.previous = state.get('previous', {})
+
+    def save(self):
+        tmp_path = self.checkpoint_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.files, 'engines': self.engines, 'previous': self.previous}, f)
+        os.rename(tmp_path, self.checkpoint_file)
+
+    def scan_logs(self):
+        """
+        Returns:
+            int: 本次解析的字节数
+        """
+        processed = 0
+        current = log_files(self.data_paths)
+        for engine in list(self.engines):
+            if engine not in current:
+                del self.engines[engine]
+        for engine, path in sorted(current.items()):
+            processed += self._scan_file(engine, path)
+        for path in list(self.files):
+            if path not in current.values():
+                del self.files[path]
+        return processed
+
+    def _scan_file(self, engine, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        state = self.files.get(path)
+        if state and state.get('inode') == stat.st_ino and state.get('offset', 0) <= stat.st_size:
+            offset, parser_state = state['offset'], state.get('parser')
+        else:
+            # LOG被轮转（inode变化）或首次扫描
+            offset, parser_state = max(0, stat.st_size - INITIAL_TAIL_BYTES), None
+        if stat.st_size <= offset:
+            self.files[path] = {'inode': stat.st_ino, 'offset': offset, 'parser': parser_state}
+            return 0
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+        skip_first = offset > 0 and parser_state is None
+        # 末尾不完整的行留到下次处理
+        end = data.rfind(b'\n') + 1
+        parser = LogParser(self.engines.get(engine), parser_state)
+        lines = data[:end].decode('utf-8', 'replace').split('\n')
+        for line in lines[1:] if skip_first else lines:
+            parser.feed(line)
+        self.engines[engine] = parser.engine
+        self.files[path] = {'inode': stat.st_ino, 'offset': offset + end, 'parser': parser.state}
+        return end
+
+    def read_properties(self):
+        """
+        Returns:
+            dict: space -> {指标名: 各引擎中的最大值}，读取失败的space不出现
+        """
+        result = {}
+        if not self.host or not self.http_port:
+            return result
+        for space in self.spaces() if callable(self.spaces) else self.spaces:
+            values = {}
+            try:
+                for prop, name in PROPERTIES:
+                    numbers = self._fetch(self.host, self.http_port, space, prop)
+                    if numbers:
+                        values[name] = max(numbers)
+            except (IOError, OSError, ValueError):
+                continue
+            result[space] = values
+        return result
+
+    def collect(self):
+        """
+        解析新增的LOG并读取HTTP属性
+
+        Returns:
+            dict: engines（LOG中每个引擎/列族的指标）、properties（每个space的属性）和time
+        """
+        self.scan_logs()
+        return {'engines': self.engines, 'properties': self.read_properties(), 'time': self._clock()}
+
+    def stats(self):
+        """
+        汇总为exporter使用的rocksdb_*统计项，取所有引擎和列族中的最大值
+        """
+        snapshot = self.collect()
+        stats = {}
+
+        def keep_max(name, value):
+            if value is not None:
+                stats[name] = max(stats.get(name, value), value)
+
+        for engine in snapshot['engines'].values():
+            keep_max('rocksdb_stall_micros', engine.get('stall_micros'))
+            keep_max('rocksdb_stall_percent', engine.get('stall_percent'))
+            for cf in engine['cfs'].values():
+                keep_max('rocksdb_l0_files', cf.get('l0_files'))
+                keep_max('rocksdb_write_amplification', cf.get('w_amp'))
+        for values in snapshot['properties'].values():
+            for name, value in values.items():
+                keep_max('rocksdb_' + name, value)
+        try:
+            self.save()
+        except (IOError, OSError):
+            pass
+        return stats
+
+
+def signals(snapshot):
+    """
+    把collect的结果展开为逐项信号
+
+    Returns:
+        list: [(对象, 信号名, 数值)]，对象为"引擎 [列族]"或space名
+    """
+    result = []
+    for engine, entry in sorted(snapshot['engines'].items()):
+        for cf, values in sorted(entry['cfs'].items()):
+            for name in ('l0_files', 'stalls'):
+                if name in values:
+                    result.append(('{0} [{1}]'.format(engine, cf), name, values[name]))
+        if 'stall_percent' in entry:
+            result.append((engine, 'stall_percent', entry['stall_percent']))
+    for space, values in sorted(snapshot['properties'].items()):
+        for name in ('pending_compaction_bytes', 'immutable_memtables', 'delayed_write_rate'):
+            if name in values:
+                result.append((space, name, values[name]))
+    return result
+
+
+def stall_limits(limits):
+    """
+    每个信号开始写减速的阈值
+
+    max_write_buffer_number大于3时，未刷盘的memtable达到max_write_buffer_number - 1
+    就会减速，即immutable memtable达到max_write_buffer_number - 2；不大于3时只在
+    写满时停写，不做提前告警。
+    """
+    result = {
+        'l0_files': limits['level0_slowdown_writes_trigger'],
+        'pending_compaction_bytes': limits['soft_pending_compaction_bytes_limit']
+    }
+    if limits['max_write_buffer_number'] > 3:
+        result['immutable_memtables'] = limits['max_write_buffer_number'] - 2
+    return result
+
+
+def evaluate(items, previous, now, limits, warning_fraction=0.7, horizon_secs=900):
+    """
+    在写停顿开始之前给出告警
+
+    已经发生停顿（delayed_write_rate > 0、本周期的stall计数或stall百分比大于0）或
+    信号达到减速阈值时为CRITICAL；信号超过阈值的warning_fraction，或按与上一次
+    采样之间的增长速度将在horizon_secs内达到阈值时为WARNING。
+
+    Args:
+        items: signals的结果
+        previous: {"对象|信号名": [时间, 数值]}，就地更新为本次的值
+
+    Returns:
+        tuple: (result_code, [问题描述])
+    """
+    thresholds = stall_limits(limits)
+    code = 'OK'
+    problems = []
+    for target, name, value in items:
+        key = '{0}|{1}'.format(target, name)
+        last = previous.get(key)
+        previous[key] = [now, value]
+        if name in ('stalls', 'stall_percent', 'delayed_write_rate'):
+            if value > 0:
+                code = 'CRITICAL'
+                problems.append('{0}: write stall in progress ({1} {2:g})'.format(target, name, value))
+            continue
+        threshold = thresholds.get(name)
+        if not threshold:
+            continue
+        if value >= threshold:
+            code = 'CRITICAL'
+            problems.append('{0}: {1} {2:g} reached the slowdown trigger {3:g}'.format(target, name, value, threshold))
+            continue
+        eta = None
+        if last is not None and now > last[0] and value > last[1]:
+            eta = (threshold - value) / ((value - last[1]) / (now - last[0]))
+        if value >= threshold * warning_fraction or (eta is not None and eta <= horizon_secs):
+            if code == 'OK':
+                code = 'WARNING'
+            text = '{0}: {1} {2:g} of slowdown trigger {3:g}'.format(target, name, value, threshold)
+            if eta is not None:
+                text += ', reached in ~{0:.0f}s at the current rate'.format(eta)
+            problems.append(text)
+    current = set('{0}|{1}'.format(target, name) for target, name, _ in items)
+    for key in list(previous):
+        if key not in current:
+            del previous[key]
+    return code, problems
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import glob
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import re
+
+from nebula_benchmark import LatencyHistogram
+
+# graphd日志中慢查询和失败查询的默认格式
+DEFAULT_PATTERNS = (
+    r'[Ss]low query.*?(?P<latency_us>\d+)\s*us.*?(?:query|stmt)\s*[:=]\s*[`"]?(?P<query>.*?)[`"\']?\s*$',
+    r'Processing query `(?P<query>.*)\' failed'
+)
+# 先用这些字面量在mmap上定位候选行，只对命中的行执行正则
+DEFAULT_MARKERS = (b'low query', b'Processing query `')
+DEFAULT_LOG_GLOB = 'nebula-graphd*.log.INFO.*'
+
+_STRING_LITERAL = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
+_NUMBER_LITERAL = re.compile(r'(?<![\w.$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_VALUE_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_TUPLE_LIST = re.compile(r'\((?:\?|\?\+)\)(?:\s*,\s*\((?:\?|\?\+)\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def required_literal(pattern):
+    """
+    取正则中任何匹配都必须包含的最长字面量，用作mmap预过滤的marker
+
+    只看分组和字符类之外的字符；带?、*或{}量词的字符视为可选。
+
+    Returns:
+        bytes: 长度至少3的字面量；正则有顶层|、忽略大小写或找不到时为None
+    """
+    if re.compile(pattern).flags & re.IGNORECASE:
+        return None
+    runs = []
+    current = ''
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        literal = None
+        if c == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped and not escaped.isalnum():
+                literal = escaped
+            i += 2
+        elif c == '[':
+            # 跳过字符类，"]"紧跟在"["或"[^"之后时是字面量
+            i += 2 if pattern[i + 1:i + 2] == '^' else 1
+            i += 1 if pattern[i:i + 1] == ']' else 0
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif c == '(':
+            depth += 1
+            i += 1
+        elif c == ')':
+            depth -= 1
+            i += 1
+        elif c == '|':
+            if depth == 0:
+                return None
+            i += 1
+        elif c in '.^$':
+            i += 1
+        elif c in '?*{':
+            # 量词使前一个字符可选
+            current = current[:-1]
+            if c == '{':
+                i = pattern.find('}', i) + 1 or len(pattern)
+            else:
+                i += 1
+        elif c == '+':
+            runs.append(current)
+            current = ''
+            i += 1
+        else:
+            literal = c
+            i += 1
+        if literal is not None and depth == 0:
+            current += literal
+        else:
+            runs.append(current)
+            current = '' if literal is None or depth else current
+    runs.append(current)
+    best = max(runs, key=len)
+    return best.encode('utf-8') if len(best) >= 3 else None
+
+
+def fingerprint(statement):
+    """
+    去掉nGQL语句中的字面量得到查询形状
+
+    字符串和数字替换为?，连续的?列表（VID列表、VALUES中的多行）折叠为?+，
+    空白统一为一个空格，其余部分保持原样。
+
+    Returns:
+        tuple: (指纹ID, 归一化后的语句)
+    """
+    normalized = _STRING_LITERAL.sub('?', statement.strip().rstrip(';'))
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _VALUE_LIST.sub('?+', normalized)
+    normalized = _TUPLE_LIST.sub('(?+)+', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:16], normalized
+
+
+class SlowQueryAnalyzer(object):
+    """
+    增量分析graphd日志中的慢查询和失败查询
+
+    checkpoint文件记录每个日志文件的inode和已处理偏移，以及按指纹聚合的
+    次数、失败数和延迟直方图；重复执行只读取新增的字节。
+
+    markers为None时，默认格式使用DEFAULT_MARKERS，自定义格式从正则中推导；
+    任一正则推导不出字面量时不做预过滤，逐行匹配。
+    """
+
+    def __init__(self, checkpoint_file, patterns=None, markers=None,
+                 max_fingerprints=5000, chunk_bytes=64 * 1024 * 1024):
+        self.checkpoint_file = checkpoint_file
+        self.patterns = [re.compile(pattern) for pattern in (patterns or DEFAULT_PATTERNS)]
+        if markers is None:
+            markers = [required_literal(pattern) for pattern in patterns] if patterns else DEFAULT_MARKERS
+            if None in markers:
+                markers = []
+        self.markers = [marker for marker in markers if marker]
+        self.max_fingerprints = max_fingerprints
+        self.chunk_bytes = chunk_bytes
+        self.files = {}
+        self.queries = {}
+        self._load()
+
+    def _load(self):
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return
+        try:
+            with open(self.checkpoint_file) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return
+        self.files = state.get('files', {})
+        for key, entry in state.get('queries', {}).items():
+            histogram = LatencyHistogram()
+            histogram.counts = entry['counts']
+            histogram.total = entry['timed']
+            histogram.sum_us = entry['sum_us']
+            histogram.max_us = entry['max_us']
+            self.queries[key] = {'query': entry['query'], 'count': entry['count'],
+                                 'failed': entry['failed'], 'latency': histogram}
+
+    def save(self):
+        queries = {}
+        for key, entry in self.queries.items():
+            histogram = entry['latency']
+            queries[key] = {'query': entry['query'], 'count': entry['count'], 'failed': entry['failed'],
+                            'counts': histogram.counts, 'timed': histogram.total,
+                            'sum_us': histogram.sum_us, 'max_us': histogram.max_us}
+        tmp_path = self.checkpoint_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': self.files, 'queries': queries}, f)
+        os.rename(tmp_path, self.checkpoint_file)
+
+    def scan_dir(self, log_dir, pattern=DEFAULT_LOG_GLOB):
+        """
+        扫描目录下匹配pattern的日志文件，跳过glog创建的符号链接和日志清理正在写入的临时文件；
+        日志清理压缩出的.gz文件解压读取，见scan_gzip
+
+        Returns:
+            int: 本次处理的字节数
+        """
+        processed = 0
+        for path in sorted(glob.glob(os.path.join(log_dir, pattern))):
+            if os.path.islink(path) or not os.path.isfile(path) or path.endswith('.tmp'):
+                continue
+            if path.endswith('.gz'):
+                processed += self.scan_gzip(path)
+            else:
+                processed += self.scan_file(path)
+        # 已被日志清理删除的文件不再保留偏移
+        for path in list(self.files):
+            if not os.path.exists(path):
+                del self.files[path]
+        return processed
+
+    def scan_file(self, path):
+        stat = os.stat(path)
+        state = self.files.get(path)
+        offset = 0
+        if state and state.get('inode') == stat.st_ino and state.get('offset', 0) <= stat.st_size:
+            offset = state['offset']
+        self.files[path] = {'inode': stat.st_ino, 'offset': offset}
+        if stat.st_size <= offset:
+            return 0
+
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                # 末尾不完整的行留到下次处理
+                end = mapped.rfind(b'\n', offset, stat.st_size) + 1
+                position = offset
+                while position < end:
+                    chunk_end = min(position + self.chunk_bytes, end)
+                    if chunk_end < end:
+                        chunk_end = mapped.rfind(b'\n', position, chunk_end) + 1 or end
+                    self._scan_range(mapped, position, chunk_end)
+                    position = chunk_end
+                    self.files[path] = {'inode': stat.st_ino, 'offset': position}
+            finally:
+                mapped.close()
+        return self.files[path]['offset'] - offset
+
+    def scan_gzip(self, path):
+        """
+        流式解压扫描日志清理压缩后的日志
+
+        压缩文件不再增长，扫描一次后按inode跳过；压缩前原文件已扫描到的偏移
+        （checkpoint中去掉.gz的路径）作为解压后的起点，不会重复或遗漏。
+
+        Returns:
+            int: 本次处理的解压后字节数
+        """
+        stat = os.stat(path)
+        state = self.files.get(path)
+        if state and state.get('inode') == stat.st_ino:
+            return 0
+        offset = self.files.get(path[:-len('.gz')], {}).get('offset', 0)
+        processed = 0
+        pending = b''
+        try:
+            with gzip.open(path, 'rb') as f:
+                f.seek(offset)
+                while True:
+                    block = f.read(self.chunk_bytes)
+                    if not block:
+                        break
+                    processed += len(block)
+                    data = pending + block
+                    end = data.rfind(b'\n') + 1
+                    pending = data[end:]
+                    self._scan_range(data, 0, end)
+        except (IOError, OSError, EOFError) as e:
+            print('Failed to read compressed log {0}: {1}'.format(path, e))
+            return processed
+        if pending:
+            self._scan_range(pending, 0, len(pending))
+        self.files[path] = {'inode': stat.st_ino, 'offset': offset + processed}
+        return processed
+
+    def _scan_range(self, mapped, start, end):
+        if not self.markers:
+            for line in mapped[start:end].splitlines():
+                self.add_line(line.decode('utf-8', 'replace'))
+            return
+        line_starts = set()
+        for marker in self.markers:
+            position = mapped.find(marker, start, end)
+            while position != -1:
+                line_start = mapped.rfind(b'\n', start, position) + 1
+                if line_start == 0:
+                    line_start = start
+                line_end = mapped.find(b'\n', position, end)
+                if line_end == -1:
+                    line_end = end
+                if line_start not in line_starts:
+                    line_starts.add(line_start)
+                    self.add_line(mapped[line_start:line_end].decode('utf-8', 'replace'))
+                position = mapped.find(marker, line_end, end)
+
+    def add_line(self, line):
+        """
+        解析一行日志，返回是否命中慢查询或失败查询
+        """
+        for pattern in self.patterns:
+            match = pattern.search(line)
+            if not match:
+                continue
+            groups = match.groupdict()
+            latency = groups.get('latency_us')
+            self.record(groups['query'], int(latency) if latency else None)
+            return True
+        return False
+
+    def record(self, statement, latency_us=None):
+        key, normalized = fingerprint(statement)
+        entry = self.queries.get(key)
+        if entry is None:
+            if len(self.queries) >= self.max_fingerprints:
+                self._evict()
+            entry = self.queries[key] = {'query': normalized, 'count': 0, 'failed': 0,
+                                         'latency': LatencyHistogram()}
+        entry['count'] += 1
+        if latency_us is None:
+            entry['failed'] += 1
+        else:
+            entry['latency'].record(latency_us)
+
+    def _evict(self):
+        # 指纹数量受限，淘汰总耗时最少的十分之一
+        ranked = sorted(self.queries, key=lambda key: (self.queries[key]['latency'].sum_us,
+                                                       self.queries[key]['count']))
+        for key in ranked[:max(1, len(ranked) // 10)]:
+            del self.queries[key]
+
+    def top(self, limit=20):
+        """
+        Returns:
+            list: 按总耗时降序的指纹统计，总耗时相同时按失败数
+        """
+        rows = []
+        for key, entry in self.queries.items():
+            histogram = entry['latency']
+            rows.append({
+                'fingerprint': key,
+                'query': entry['query'],
+                'count': entry['count'],
+                'failed': entry['failed'],
+                'total_us': histogram.sum_us,
+                'mean_us': histogram.sum_us // histogram.total if histogram.total else 0,
+                'p99_us': histogram.percentile(99),
+                'max_us': histogram.max_us
+            })
+        rows.sort(key=lambda row: (-row['total_us'], -row['failed'], row['fingerprint']))
+        return rows[:limit]
+
+
+def format_top(rows):
+    """
+    把top结果渲染成命令输出中的文本行
+    """
+    lines = ['%-16s %8s %6s %12s %10s %10s  %s' % ('fingerprint', 'count', 'failed', 'total_ms',
+                                                  'mean_ms', 'p99_ms', 'query')]
+    for row in rows:
+        query = row['query'] if len(row['query']) <= 160 else row['query'][:157] + '...'
+        lines.append('%-16s %8d %6d %12.1f %10.1f %10.1f  %s' % (
+            row['fingerprint'], row['count'], row['failed'], row['total_us'] / 1000.0,
+            row['mean_us'] / 1000.0, row['p99_us'] / 1000.0, query))
+    return lines
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+import re
+
+import nebula_trace
+
+# Nebula统计项形如"get_latency_us.p99.60"：指标名.统计方式.时间窗口（秒）
+STAT_SUFFIX = re.compile(r'^(.*)\.(rate|sum|avg|count|p\d+)\.(\d+)$')
+
+# metrics.json中的指标名 -> /stats中的候选统计项，取第一个存在的
+STAT_ALIASES = {
+    'graphd': (
+        ('qps', ('num_queries.rate.60',)),
+        ('query_latency_us', ('query_latency_us.avg.60',)),
+        ('num_active_sessions', ('num_active_sessions', 'num_active_sessions.sum.60')),
+        ('slow_query_count', ('num_slow_queries.sum.60',)),
+        ('error_query_count', ('num_query_errors.sum.60',)),
+    ),
+    'metad': (
+        ('heartbeat_latency_us', ('heartbeat_latency_us.avg.60',)),
+    ),
+    'storaged': (
+        ('get_latency_us', ('kv_get_latency_us.avg.60', 'get_neighbors_latency_us.avg.60')),
+        ('put_latency_us', ('kv_put_latency_us.avg.60', 'add_edges_latency_us.avg.60',
+                            'add_vertices_latency_us.avg.60')),
+    ),
+}
+
+
+def parse_stats(text):
+    """
+    解析Nebula守护进程/stats接口的"name=value"文本
+
+    Returns:
+        dict: 指标名到float值，无法解析为数字的行被忽略
+    """
+    stats = {}
+    for line in text.splitlines():
+        name, sep, value = line.partition('=')
+        if not sep:
+            continue
+        try:
+            stats[name.strip()] = float(value.strip())
+        except ValueError:
+            continue
+    return stats
+
+
+def fetch_stats(host, port, path='/stats', timeout=5):
+    """
+    读取一个守护进程的/stats
+
+    Raises:
+        IOError: 请求失败
+    """
+    nebula_trace.count('sockets')
+    response = urlopen('http://{0}:{1}{2}'.format(host, port, path), timeout=timeout)
+    try:
+        data = response.read()
+    finally:
+        response.close()
+    nebula_trace.count('bytes_read', len(data))
+    if not isinstance(data, str):
+        data = data.decode('utf-8', 'replace')
+    return parse_stats(data)
+
+
+def named_metrics(component, stats):
+    """
+    把一次抓取的统计项转换成metrics.json中nebula.<component>.<name>使用的名称
+
+    STAT_ALIASES中的指标取第一个存在的候选统计项；不带".统计方式.窗口"后缀的统计项
+    （rocksdb_*、集群汇总值、cgroup数值等）原样保留；其余窗口统计项不输出。
+
+    Returns:
+        dict: 名称 -> 值
+    """
+    named = dict((stat, value) for stat, value in stats.items() if not STAT_SUFFIX.match(stat))
+    for name, candidates in STAT_ALIASES.get(component, ()):
+        for stat in candidates:
+            if stat in stats:
+                named[name] = stats[stat]
+                break
+    return named
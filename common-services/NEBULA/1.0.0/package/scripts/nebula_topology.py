@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import array
+import hashlib
+import os
+import struct
+import sys
+import time
+
+from nebula_ngql import NgqlError, show_hosts, show_spaces
+
+MAGIC = b'NTOP'
+VERSION = 1
+
+# 文件头：魔数、版本、主机数、space数、抓取时间、SHOW HOSTS摘要
+_FILE_HEADER = struct.Struct('<4sIIId16s')
+_STRING_LENGTH = struct.Struct('<H')
+_COUNT = struct.Struct('<I')
+
+# leader数组中表示没有leader的主机序号
+NO_HOST = 0xFFFF
+
+
+def hosts_fingerprint(hosts):
+    """
+    SHOW HOSTS结果的摘要，作为metad拓扑版本
+
+    metad根据storaged心跳维护主机表，主机上下线、分片迁移和leader数变化都会
+    改变摘要；数量不变的leader互换不会，由max_age兜底。
+    """
+    digest = hashlib.md5()
+    for host in sorted(hosts, key=lambda item: (item['host'], item['port'])):
+        digest.update('{0}:{1}|{2}|{3}|{4};'.format(
+            host['host'], host['port'], host['status'],
+            ','.join('{0}={1}'.format(k, v) for k, v in sorted(host['leaders'].items())),
+            ','.join('{0}={1}'.format(k, v) for k, v in sorted(host['partitions'].items()))).encode('utf-8'))
+    return digest.digest()
+
+
+def _address(value):
+    # 3.x的SHOW PARTS把主机名放在引号里，例如"storaged0":9779
+    return value.replace('"', '').strip()
+
+
+def _to_bytes(values):
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def _from_bytes(typecode, data):
+    values = array.array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _pack_string(value):
+    data = value.encode('utf-8')
+    return _STRING_LENGTH.pack(len(data)) + data
+
+
+class _Reader(object):
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def string(self):
+        length, = self.unpack(_STRING_LENGTH)
+        value = self.data[self.offset:self.offset + length].decode('utf-8')
+        self.offset += length
+        return value
+
+    def array(self, typecode, count):
+        size = array.array(typecode).itemsize * count
+        data = self.data[self.offset:self.offset + size]
+        if len(data) != size:
+            raise ValueError('Truncated topology cache')
+        values = _from_bytes(typecode, data)
+        self.offset += size
+        return values
+
+
+class _Space(object):
+    """
+    一个space的分片表
+
+    leaders[part]为leader主机序号；part的副本为peers[offsets[part]:offsets[part + 1]]。
+    分片号从1开始，0号槽位留空。
+    """
+
+    def __init__(self, name, leaders, offsets, peers):
+        self.name = name
+        self.leaders = leaders
+        self.offsets = offsets
+        self.peers = peers
+
+    @classmethod
+    def build(cls, name, parts):
+        """
+        Args:
+            parts: {分片号: (leader主机序号, [副本主机序号])}
+        """
+        slots = max(parts) + 1 if parts else 1
+        leaders = array.array('H', [NO_HOST] * slots)
+        offsets = array.array('I', [0])
+        peers = array.array('H')
+        for part in range(slots):
+            leader, replicas = parts.get(part, (NO_HOST, []))
+            leaders[part] = leader
+            peers.extend(replicas)
+            offsets.append(len(peers))
+        return cls(name, leaders, offsets, peers)
+
+    def parts(self):
+        return [part for part in range(1, len(self.leaders))
+                if self.offsets[part + 1] > self.offsets[part] or self.leaders[part] != NO_HOST]
+
+    def replicas(self, part):
+        if part <= 0 or part >= len(self.leaders):
+            return []
+        return self.peers[self.offsets[part]:self.offsets[part + 1]]
+
+
+class TopologyCache(object):
+    """
+    本地缓存的space -> 分片 -> 副本/leader映射和storaged主机表
+
+    refresh先执行一次SHOW HOSTS，摘要与缓存一致且未超过max_age时直接复用缓存，
+    否则逐个space执行SHOW PARTS重建。缓存以二进制文件保存，短生命周期的命令
+    启动时直接加载。
+    """
+
+    def __init__(self, path, max_age=300, clock=time.time):
+        self.path = path
+        self.max_age = max_age
+        self._clock = clock
+        self.fingerprint = None
+        self.fetched_at = 0
+        self.refreshes = 0
+        self._clear()
+
+    def _clear(self):
+        self._hosts = []
+        self._status = []
+        self._host_index = {}
+        self._spaces = {}
+        self._by_host = {}
+
+    def _intern(self, address, status='UNKNOWN'):
+        index = self._host_index.get(address)
+        if index is None:
+            if len(self._hosts) >= NO_HOST:
+                raise ValueError('Too many storaged hosts for the topology cache')
+            index = len(self._hosts)
+            self._host_index[address] = index
+            self._hosts.append(address)
+            self._status.append(status)
+        return index
+
+    def _index_hosts(self):
+        """
+        由分片表生成主机 -> {space: 分片号数组}的反向索引
+        """
+        self._by_host = {}
+        for name, space in self._spaces.items():
+            for part in space.parts():
+                for host in space.replicas(part):
+                    self._by_host.setdefault(host, {}).setdefault(name, array.array('I')).append(part)
+
+    def load(self):
+        """
+        Returns:
+            bool: 文件不存在、版本不符或内容损坏时为False，缓存保持为空
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            reader = _Reader(data)
+            magic, version, host_count, space_count, fetched_at, fingerprint = reader.unpack(_FILE_HEADER)
+            if (magic, version) != (MAGIC, VERSION):
+                return False
+            self._clear()
+            for _ in range(host_count):
+                self._intern(reader.string(), reader.string())
+            for _ in range(space_count):
+                name = reader.string()
+                slots, = reader.unpack(_COUNT)
+                leaders = reader.array('H', slots)
+                offsets = reader.array('I', slots + 1)
+                peers = reader.array('H', offsets[-1])
+                self._spaces[name] = _Space(name, leaders, offsets, peers)
+        except (IOError, OSError, struct.error, ValueError, UnicodeDecodeError):
+            self._clear()
+            return False
+        self.fingerprint = fingerprint
+        self.fetched_at = fetched_at
+        self._index_hosts()
+        return True
+
+    def save(self):
+        """
+        原子替换缓存文件
+        """
+        chunks = [_FILE_HEADER.pack(MAGIC, VERSION, len(self._hosts), len(self._spaces),
+                                    self.fetched_at, self.fingerprint or b'\0' * 16)]
+        for address, status in zip(self._hosts, self._status):
+            chunks.append(_pack_string(address))
+            chunks.append(_pack_string(status))
+        for name in sorted(self._spaces):
+            space = self._spaces[name]
+            chunks.append(_pack_string(name))
+            chunks.append(_COUNT.pack(len(space.leaders)))
+            chunks.extend((_to_bytes(space.leaders), _to_bytes(space.offsets), _to_bytes(space.peers)))
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(chunks))
+        os.rename(tmp_path, self.path)
+
+    def refresh(self, session, force=False):
+        """
+        Returns:
+            bool: 是否重新抓取了分片表
+        """
+        hosts = show_hosts(session)
+        fingerprint = hosts_fingerprint(hosts)
+        now = self._clock()
+        if not force and fingerprint == self.fingerprint and now - self.fetched_at < self.max_age:
+            return False
+
+        self._clear()
+        for host in hosts:
+            self._intern('{0}:{1}'.format(host['host'], host['port']), host['status'])
+        for name in show_spaces(session):
+            parts = {}
+            try:
+                rows = session.execute('USE {0}; SHOW PARTS'.format(name))
+            except NgqlError as e:
+                print('Failed to read partitions of space {0}: {1}'.format(name, e))
+                continue
+            for row in rows:
+                try:
+                    part = int(row.get('Partition ID', ''))
+                except ValueError:
+                    continue
+                leader = _address(row.get('Leader', ''))
+                replicas = [self._intern(_address(peer)) for peer in row.get('Peers', '').split(',') if _address(peer)]
+                parts[part] = (self._intern(leader) if leader else NO_HOST, replicas)
+            self._spaces[name] = _Space.build(name, parts)
+        self.fingerprint = fingerprint
+        self.fetched_at = now
+        self.refreshes += 1
+        self._index_hosts()
+        self.save()
+        return True
+
+    def hosts(self):
+        """
+        Returns:
+            list: [("host:port", status)]，只出现在副本列表中的主机状态为UNKNOWN
+        """
+        return list(zip(self._hosts, self._status))
+
+    def spaces(self):
+        return sorted(self._spaces)
+
+    def leader(self, space, part):
+        """
+        Returns:
+            str: leader的"host:port"，未知时为None
+        """
+        item = self._spaces.get(space)
+        if item is None or part <= 0 or part >= len(item.leaders) or item.leaders[part] == NO_HOST:
+            return None
+        return self._hosts[item.leaders[part]]
+
+    def replicas(self, space, part):
+        item = self._spaces.get(space)
+        return [self._hosts[host] for host in item.replicas(part)] if item else []
+
+    def partitions(self, address, space=None, leaders_only=False):
+        """
+        某台主机持有（或作为leader）的分片
+
+        Returns:
+            dict: space -> [分片号]
+        """
+        index = self._host_index.get(address)
+        result = {}
+        for name, parts in self._by_host.get(index, {}).items():
+            if space is not None and name != space:
+                continue
+            leaders = self._spaces[name].leaders
+            selected = [part for part in parts if not leaders_only or leaders[part] == index]
+            if selected:
+                result[name] = selected
+        return result
+
+
+class SpaceList(object):
+    """
+    按需从metad读取space名
+
+    拓扑缓存只在storaged命令执行时写入，新建的space要等到下一次stop才会出现；
+    这里每max_age秒执行一次SHOW SPACES，metad不可达或没有配置会话时退回拓扑缓存文件。
+
+    Args:
+        session: 执行SHOW SPACES的会话，为None时只读拓扑缓存
+        cache_path: TopologyCache文件路径
+    """
+
+    def __init__(self, session, cache_path, max_age=300, clock=time.time):
+        self.session = session
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self._clock = clock
+        self._names = None
+        self._fetched_at = 0
+
+    def __call__(self):
+        now = self._clock()
+        if self._names is not None and now - self._fetched_at < self.max_age:
+            return self._names
+        if self.session is not None:
+            try:
+                self._names = sorted(show_spaces(self.session))
+                self._fetched_at = now
+                return self._names
+            except (NgqlError, OSError) as e:
+                print('Failed to list spaces from metad, using the topology cache: {0}'.format(e))
+        cache = TopologyCache(self.cache_path)
+        cache.load()
+        return cache.spaces()
+
+
+def format_partitions(partitions):
+    """
+    把partitions的结果渲染为"space[1,2,5]"形式的一行
+    """
+    return ', '.join('{0}[{1}]'.format(name, ','.join(str(part) for part in partitions[name]))
+                     for name in sorted(partitions))
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+# 告警脚本通过这些token判断是否记录trace、trace写到哪里以及保留多少
+TRACE_ENABLED_KEY = '{{nebula-env/trace_enabled}}'
+LOG_DIR_KEY = '{{nebula-env/nebula_log_dir}}'
+KEEP_KEY = '{{nebula-env/trace_keep_per_name}}'
+ALERT_TOKENS = (TRACE_ENABLED_KEY, LOG_DIR_KEY, KEEP_KEY)
+
+DEFAULT_KEEP = 100
+
+_clock = getattr(time, 'monotonic', time.time)
+_config = {'enabled': False, 'trace_dir': None, 'keep': DEFAULT_KEEP}
+_local = threading.local()
+
+
+def configure(enabled, trace_dir=None, keep=DEFAULT_KEEP):
+    """
+    设置进程内的默认开关，命令脚本在导入nebula_utils时根据nebula-env调用
+
+    Args:
+        keep: 每个根区间名称保留的最新trace文件数
+    """
+    _config['enabled'] = bool(enabled)
+    _config['trace_dir'] = trace_dir
+    _config['keep'] = keep
+
+
+def enabled():
+    override = getattr(_local, 'enabled', None)
+    return _config['enabled'] if override is None else override
+
+
+class Span(object):
+    """
+    一段计时区间，counters记录区间内直接发生的计数
+    """
+
+    def __init__(self, name, attrs, parent):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+        self.counters = {}
+        self.wall_start = time.time()
+        self.start = _clock()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else _clock()) - self.start
+
+    def totals(self):
+        """
+        本区间及所有子区间的计数之和
+        """
+        totals = dict(self.counters)
+        for child in self.children:
+            for key, value in child.totals().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def to_dict(self, origin=None):
+        origin = self.start if origin is None else origin
+        result = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3)
+        }
+        if self.attrs:
+            result['attrs'] = self.attrs
+        if self.counters:
+            result['counters'] = self.counters
+        if self.children:
+            result['children'] = [child.to_dict(origin) for child in self.children]
+        return result
+
+
+class _NoopSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanContext(object):
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span = None
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        parent = stack[-1] if stack else None
+        self.span = Span(self.name, self.attrs, parent)
+        if parent is not None:
+            parent.children.append(self.span)
+        stack.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, tb):
+        span = self.span
+        span.end = _clock()
+        if exc_type is not None:
+            span.attrs['error'] = exc_type.__name__
+        _local.stack.pop()
+        if span.parent is None:
+            _finish(span)
+        return False
+
+
+def span(name, **attrs):
+    """
+    with span('name'): ... ；未启用时返回共享的空上下文
+    """
+    if not enabled():
+        return _NOOP
+    return _SpanContext(name, attrs)
+
+
+def annotate(**attrs):
+    """
+    给当前区间附加属性
+    """
+    if not enabled():
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        stack[-1].attrs.update(attrs)
+
+
+def count(name, value=1):
+    """
+    累加当前区间的计数，例如sockets、bytes_read
+    """
+    if not enabled():
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack:
+        counters = stack[-1].counters
+        counters[name] = counters.get(name, 0) + value
+
+
+def traced(name=None):
+    """
+    把函数调用记录为一个区间，未启用时只多一次开关判断
+    """
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with _SpanContext(span_name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_alert(name):
+    """
+    告警execute的装饰器
+
+    告警在agent进程的线程中执行，开关和trace目录取自本次调用的configurations，
+    只对当前线程生效；trace只写文件，不输出汇总行。
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(configurations={}, *args, **kwargs):
+            if not configurations or str(configurations.get(TRACE_ENABLED_KEY, 'false')).lower() != 'true':
+                return func(configurations, *args, **kwargs)
+            _local.enabled = True
+            _local.trace_dir = os.path.join(configurations.get(LOG_DIR_KEY, '/var/log/nebula'), 'trace')
+            _local.keep = int(configurations.get(KEEP_KEY) or DEFAULT_KEEP)
+            _local.quiet = True
+            try:
+                with _SpanContext(name, {}):
+                    return func(configurations, *args, **kwargs)
+            finally:
+                _local.enabled = None
+                _local.trace_dir = None
+                _local.keep = None
+                _local.quiet = False
+
+        return wrapper
+
+    return decorator
+
+
+def summary_line(root, limit=3):
+    """
+    Returns:
+        str: 总耗时、计数和最慢的几个子区间
+    """
+    spans = []
+    pending = list(root.children)
+    while pending:
+        current = pending.pop()
+        spans.append(current)
+        pending.extend(current.children)
+    spans.sort(key=lambda item: -item.duration)
+
+    parts = ['[trace] {0} {1:.3f}s'.format(root.name, root.duration)]
+    totals = root.totals()
+    if totals:
+        parts.append(' '.join('{0}={1}'.format(key, totals[key]) for key in sorted(totals)))
+    if spans:
+        parts.append('slowest: ' + ', '.join('{0} {1:.3f}s'.format(item.name, item.duration)
+                                            for item in spans[:limit]))
+    return '; '.join(parts)
+
+
+def prune(trace_dir, prefix, keep):
+    """
+    只保留trace_dir中以prefix开头的最新keep个trace文件
+
+    告警开启trace后每台主机每个周期都会写一个文件，按名称分别保留可以避免
+    高频告警把组件命令的trace挤掉。
+
+    Returns:
+        int: 删除的文件数
+    """
+    files = []
+    for name in os.listdir(trace_dir):
+        if name.startswith(prefix) and name.endswith('.json'):
+            path = os.path.join(trace_dir, name)
+            try:
+                files.append((os.path.getmtime(path), name, path))
+            except OSError:
+                continue
+    files.sort(reverse=True)
+    removed = 0
+    for _, _, path in files[max(0, keep):]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _finish(root):
+    trace_dir = getattr(_local, 'trace_dir', None) or _config['trace_dir']
+    if trace_dir:
+        try:
+            if not os.path.isdir(trace_dir):
+                os.makedirs(trace_dir)
+            prefix = root.name.replace('/', '_') + '-'
+            path = os.path.join(trace_dir, '{0}{1}-{2}.json'.format(
+                prefix, time.strftime('%Y%m%d-%H%M%S', time.localtime(root.wall_start)), os.getpid()))
+            trace = root.to_dict()
+            trace['wall_start'] = root.wall_start
+            trace['totals'] = root.totals()
+            with open(path, 'w') as f:
+                json.dump(trace, f, indent=2, sort_keys=True)
+            prune(trace_dir, prefix, getattr(_local, 'keep', None) or _config['keep'])
+        except (IOError, OSError) as e:
+            print('Failed to write trace for {0}: {1}'.format(root.name, e))
+    if not getattr(_local, 'quiet', False):
+        print(summary_line(root))
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import binascii
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+MAGIC = b'NTSG'
+VERSION = 1
+
+_FILE_HEADER = struct.Struct('<4sIII')
+# 块头：序号（0表示空槽）、样本数、首个时间戳、最后时间戳、已写入的位数
+_CHUNK_HEADER = struct.Struct('<IIqqI')
+_DOUBLE = struct.Struct('>d')
+_UINT64 = struct.Struct('>Q')
+
+# 追加一个样本最多需要的位数：时间戳5+64位，数值2+5+6+64位
+MAX_SAMPLE_BITS = 146
+
+# delta-of-delta分桶：(前缀, 前缀位数, 数值位数)
+_DOD_BUCKETS = ((0x2, 2, 7), (0x6, 3, 9), (0xE, 4, 12), (0x1E, 5, 32))
+_DOD_WIDTHS = (7, 9, 12, 32, 64)
+
+
+def history_path(base_dir, name):
+    """
+    返回指标历史文件路径，base_dir一般为nebula_pid_dir或agent的tmp目录
+    """
+    safe = ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+    return os.path.join(base_dir, 'nebula-tsdb-{0}.bin'.format(safe))
+
+
+class BitWriter(object):
+    """
+    按高位在前的顺序追加位
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.nbits = 0
+
+    def write(self, value, width):
+        while width > 0:
+            offset = self.nbits & 7
+            if offset == 0:
+                self.data.append(0)
+            take = min(8 - offset, width)
+            width -= take
+            bits = (value >> width) & ((1 << take) - 1)
+            self.data[-1] |= bits << (8 - offset - take)
+            self.nbits += take
+
+
+class BitReader(object):
+    """
+    把整块数据转成一个大整数后按位移读取
+    """
+
+    def __init__(self, data, nbits):
+        self.nbits = nbits
+        self.pos = 0
+        raw = bytes(data[:(nbits + 7) // 8])
+        self._value = int(binascii.hexlify(raw), 16) if raw else 0
+        self._total = len(raw) * 8
+
+    def read(self, width):
+        if self.pos + width > self.nbits:
+            raise EOFError('Read past the end of the chunk')
+        self.pos += width
+        return (self._value >> (self._total - self.pos)) & ((1 << width) - 1)
+
+    def read_bit(self):
+        return self.read(1)
+
+
+def _to_signed(value, width):
+    return value - (1 << width) if value >= 1 << (width - 1) else value
+
+
+def _leading_zeros(value):
+    return 64 - value.bit_length()
+
+
+def _trailing_zeros(value):
+    return (value & -value).bit_length() - 1
+
+
+class ChunkEncoder(object):
+    """
+    Gorilla编码：时间戳按delta-of-delta，数值按与前值XOR后的有效位编码
+
+    时间戳为整数（秒或毫秒均可），数值为float。
+    """
+
+    def __init__(self):
+        self.writer = BitWriter()
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self._delta = 0
+        self._bits = 0
+        self._leading = None
+        self._trailing = 0
+
+    @property
+    def nbits(self):
+        return self.writer.nbits
+
+    def append(self, timestamp, value):
+        timestamp = int(timestamp)
+        bits = _UINT64.unpack(_DOUBLE.pack(float(value)))[0]
+        writer = self.writer
+        if self.count == 0:
+            writer.write(timestamp & 0xFFFFFFFFFFFFFFFF, 64)
+            writer.write(bits, 64)
+            self.first_ts = timestamp
+        else:
+            if timestamp < self.last_ts:
+                raise ValueError('Timestamp {0} is older than the last sample {1}'.format(timestamp, self.last_ts))
+            delta = timestamp - self.last_ts
+            self._write_dod(delta - self._delta)
+            self._delta = delta
+            self._write_xor(bits ^ self._bits)
+        self._bits = bits
+        self.last_ts = timestamp
+        self.count += 1
+
+    def _write_dod(self, dod):
+        writer = self.writer
+        if dod == 0:
+            writer.write(0, 1)
+            return
+        for prefix, prefix_bits, width in _DOD_BUCKETS:
+            if -(1 << (width - 1)) <= dod < (1 << (width - 1)):
+                writer.write(prefix, prefix_bits)
+                writer.write(dod & ((1 << width) - 1), width)
+                return
+        writer.write(0x1F, 5)
+        writer.write(dod & 0xFFFFFFFFFFFFFFFF, 64)
+
+    def _write_xor(self, xor):
+        writer = self.writer
+        if xor == 0:
+            writer.write(0, 1)
+            return
+        leading = min(_leading_zeros(xor), 31)
+        trailing = _trailing_zeros(xor)
+        if self._leading is not None and leading >= self._leading and trailing >= self._trailing:
+            # 有效位落在上一个窗口内，复用窗口
+            writer.write(0x2, 2)
+            width = 64 - self._leading - self._trailing
+            writer.write(xor >> self._trailing, width)
+            return
+        width = 64 - leading - trailing
+        writer.write(0x3, 2)
+        writer.write(leading, 5)
+        writer.write(width & 0x3F, 6)
+        writer.write(xor >> trailing, width)
+        self._leading = leading
+        self._trailing = trailing
+
+
+def decode_chunk(data, nbits, count):
+    """
+    解码一个块
+
+    Returns:
+        list: [(timestamp, value)]
+    """
+    samples = []
+    if count == 0:
+        return samples
+    reader = BitReader(data, nbits)
+    timestamp = _to_signed(reader.read(64), 64)
+    bits = reader.read(64)
+    samples.append((timestamp, _DOUBLE.unpack(_UINT64.pack(bits))[0]))
+
+    delta = 0
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if reader.read_bit() == 0:
+            dod = 0
+        else:
+            # 前缀中连续1的个数决定数值位数：10、110、1110、11110、11111
+            ones = 1
+            while ones < len(_DOD_WIDTHS) and reader.read_bit() == 1:
+                ones += 1
+            width = _DOD_WIDTHS[ones - 1]
+            dod = _to_signed(reader.read(width), width)
+        delta += dod
+        timestamp += delta
+
+        if reader.read_bit() == 1:
+            if reader.read_bit() == 1:
+                leading = reader.read(5)
+                width = reader.read(6) or 64
+                trailing = 64 - leading - width
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        samples.append((timestamp, _DOUBLE.unpack(_UINT64.pack(bits))[0]))
+    return samples
+
+
+class SeriesFile(object):
+    """
+    单个指标的mmap环形块文件
+
+    文件由16字节文件头和max_chunks个chunk_bytes大小的块槽组成，写满后覆盖序号
+    最小的块，文件大小固定为约chunk_bytes * max_chunks。只有当前块在内存中
+    保留编码状态，追加时仅把变化的字节写回映射区。
+    """
+
+    def __init__(self, path, chunk_bytes=4096, max_chunks=8):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.max_chunks = max_chunks
+        self.size = _FILE_HEADER.size + chunk_bytes * max_chunks
+        self._payload_bits = (chunk_bytes - _CHUNK_HEADER.size) * 8
+        self._open()
+
+    def _open(self):
+        fresh = not os.path.exists(self.path) or os.path.getsize(self.path) != self.size
+        if not fresh:
+            with open(self.path, 'rb') as f:
+                magic, version, chunk_bytes, max_chunks = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+            fresh = (magic, version, chunk_bytes, max_chunks) != (MAGIC, VERSION, self.chunk_bytes, self.max_chunks)
+        if fresh:
+            # 布局不同或损坏的文件直接重建
+            with open(self.path, 'wb') as f:
+                f.write(_FILE_HEADER.pack(MAGIC, VERSION, self.chunk_bytes, self.max_chunks))
+                f.truncate(self.size)
+
+        self._file = open(self.path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+        self._encoder = None
+        self._slot = None
+        self._seq = 0
+        headers = self._headers()
+        if headers:
+            seq, slot = max((header[0], slot) for slot, header in headers.items())
+            self._seq = seq
+            self._slot = slot
+            self._encoder = ChunkEncoder()
+            for timestamp, value in self._decode_slot(slot, headers[slot]):
+                self._encoder.append(timestamp, value)
+
+    def _slot_offset(self, slot):
+        return _FILE_HEADER.size + slot * self.chunk_bytes
+
+    def _headers(self):
+        headers = {}
+        for slot in range(self.max_chunks):
+            header = _CHUNK_HEADER.unpack_from(self._map, self._slot_offset(slot))
+            if header[0]:
+                headers[slot] = header
+        return headers
+
+    def _decode_slot(self, slot, header):
+        start = self._slot_offset(slot) + _CHUNK_HEADER.size
+        return decode_chunk(self._map[start:start + (header[4] + 7) // 8], header[4], header[1])
+
+    def append(self, timestamp, value):
+        """
+        追加样本，时间戳不能早于上一个样本
+        """
+        encoder = self._encoder
+        if encoder is not None and encoder.count and int(timestamp) < encoder.last_ts:
+            raise ValueError('Timestamp {0} is older than the last sample {1}'.format(timestamp, encoder.last_ts))
+        if encoder is None or encoder.nbits + MAX_SAMPLE_BITS > self._payload_bits:
+            self._seq += 1
+            self._slot = 0 if self._slot is None else (self._slot + 1) % self.max_chunks
+            encoder = self._encoder = ChunkEncoder()
+            offset = self._slot_offset(self._slot)
+            self._map[offset:offset + self.chunk_bytes] = b'\0' * self.chunk_bytes
+
+        first_byte = encoder.nbits // 8
+        encoder.append(timestamp, value)
+        offset = self._slot_offset(self._slot)
+        data = encoder.writer.data
+        payload = offset + _CHUNK_HEADER.size
+        self._map[payload + first_byte:payload + len(data)] = bytes(data[first_byte:])
+        _CHUNK_HEADER.pack_into(self._map, offset, self._seq, encoder.count,
+                                encoder.first_ts, encoder.last_ts, encoder.nbits)
+
+    def last_timestamp(self):
+        """
+        Returns:
+            int: 最后一个样本的时间戳，文件为空时为None
+        """
+        if self._encoder is None or not self._encoder.count:
+            return None
+        return self._encoder.last_ts
+
+    def scan(self, start=None, end=None):
+        """
+        按时间顺序返回[start, end]内的样本，跳过不相交的块
+        """
+        headers = self._headers()
+        for slot in sorted(headers, key=lambda item: headers[item][0]):
+            seq, count, first_ts, last_ts, nbits = headers[slot]
+            if (start is not None and last_ts < start) or (end is not None and first_ts > end):
+                continue
+            for timestamp, value in self._decode_slot(slot, headers[slot]):
+                if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                    yield timestamp, value
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+def benchmark(samples=10080, metrics=24, seed=42):
+    """
+    用类似监控指标的数据评估编码效果
+
+    默认模拟一周每分钟一个样本：带抖动的时间戳、缓慢变化的gauge和单调递增的计数器。
+
+    Returns:
+        dict: bytes_per_sample、encode/decode每秒样本数
+    """
+    rng = random.Random(seed)
+    series = []
+    for index in range(metrics):
+        timestamp = 1700000000
+        value = 0.0
+        points = []
+        for i in range(samples):
+            timestamp += 60 + (rng.randint(-1, 1) if rng.random() < 0.05 else 0)
+            if index % 3 == 0:
+                value += rng.randint(0, 50)
+            elif index % 3 == 1:
+                value = round(50 + 10 * math.sin(i / 60.0) + rng.random(), 1)
+            else:
+                value = float(rng.choice([0, 0, 0, 1]))
+            points.append((timestamp, value))
+        series.append(points)
+
+    started = time.time()
+    encoders = []
+    for points in series:
+        encoder = ChunkEncoder()
+        for timestamp, value in points:
+            encoder.append(timestamp, value)
+        encoders.append(encoder)
+    encode_secs = time.time() - started
+
+    started = time.time()
+    for encoder in encoders:
+        decode_chunk(encoder.writer.data, encoder.nbits, encoder.count)
+    decode_secs = time.time() - started
+
+    total = samples * metrics
+    total_bytes = sum(len(encoder.writer.data) for encoder in encoders)
+    return {
+        'samples': total,
+        'bytes': total_bytes,
+        'bytes_per_sample': round(float(total_bytes) / total, 3),
+        'encode_samples_per_sec': int(total / max(encode_secs, 1e-9)),
+        'decode_samples_per_sec': int(total / max(decode_secs, 1e-9))
+    }
+
+
+def main(argv):
+    samples = int(argv[1]) if len(argv) > 1 else 10080
+    metrics = int(argv[2]) if len(argv) > 2 else 24
+    result = benchmark(samples, metrics)
+    for key in sorted(result):
+        print('{0}: {1}'.format(key, result[key]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -20,6 +20,8 @@ limitations under the License.
 """
 
 import os
+import sys
+import json
 import time
 import socket
 from resource_management import *
@@ -27,7 +29,16 @@ from resource_management.libraries.functions import format
 from resource_management.libraries.functions.check_process_status import check_process_status
 from resource_management.core.exceptions import ComponentIsNotRunning
 import params
+import nebula_cgroup
+import nebula_endpoints
+import nebula_numa
+import nebula_os_profile
+import nebula_trace
+from nebula_trace import traced
 
+nebula_trace.configure(params.trace_enabled, params.trace_dir, params.trace_keep_per_name)
+
+@traced()
 def nebula_service(action, component_name):
     """
     通用的Nebula服务管理函数
@@ -36,6 +47,7 @@ def nebula_service(action, component_name):
         action: 操作类型 ('start', 'stop', 'status')
         component_name: 组件名称 ('graphd', 'metad', 'storaged')
     """
+    nebula_trace.annotate(action=action, component=component_name)
     if component_name == 'graphd':
         pid_file = params.graphd_pid_file
         binary_path = params.nebula_graphd_bin
@@ -72,8 +84,13 @@ def nebula_service(action, component_name):
                     user=params.nebula_user,
                     ignore_failures=True)
         
-        # 模拟启动服务（用于测试）
-        Execute(format("echo 'Starting {component_name} service...'"),
+        placement = plan_placement(component_name)
+        cgroup = setup_cgroup(component_name)
+        launch_prefix = nebula_numa.launch_prefix(placement)
+
+        # 模拟启动服务（用于测试）。放置前缀要加在真正的守护进程命令前，
+        # 并由守护进程自己写PID文件，verify_placement才能检查到实际放置。
+        Execute(format("{launch_prefix}echo 'Starting {component_name} service...'"),
                 user=params.nebula_user,
                 logoutput=True)
         
@@ -82,6 +99,11 @@ def nebula_service(action, component_name):
                 user=params.nebula_user,
                 ignore_failures=True)
 
+        if cgroup is not None:
+            attach_cgroup(component_name, pid_file, cgroup)
+        if placement['policy'] != 'none':
+            verify_placement(component_name, pid_file, placement)
+
     elif action == 'stop':
         # 停止服务
         if os.path.exists(pid_file):
@@ -93,6 +115,95 @@ def nebula_service(action, component_name):
         # 检查服务状态
         check_process_status(pid_file)
 
+def plan_placement(component_name):
+    """
+    根据nebula-env和本机NUMA拓扑计算组件的放置，并打印选择结果
+
+    Returns:
+        dict: nebula_numa.plan_placement的结果，未启用时policy为none
+    """
+    if not params.numa_placement_enabled:
+        return {'policy': 'none', 'node': None, 'cpus': []}
+    topology = nebula_numa.read_topology()
+    if not topology:
+        print("NUMA topology not available, starting %s without placement" % component_name)
+        return {'policy': 'none', 'node': None, 'cpus': []}
+    try:
+        placement = nebula_numa.plan_placement(component_name, topology, params.co_located_components,
+                                               params.storaged_numa_policy, params.storaged_numa_node,
+                                               params.graphd_cpu_list)
+    except ValueError as e:
+        raise Fail(str(e))
+    print("NUMA nodes: %s" % ', '.join('%d=%s' % (node, nebula_numa.format_cpulist(topology[node]))
+                                       for node in sorted(topology)))
+    print("Placement " + nebula_numa.describe(component_name, placement))
+    nebula_trace.annotate(placement=placement['policy'])
+    return placement
+
+def verify_placement(component_name, pid_file, placement):
+    """
+    启动后读取/proc/<pid>/status的Cpus_allowed，确认放置已生效
+    """
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+    except (IOError, OSError, ValueError):
+        print("Warning: cannot read %s, placement of %s not verified" % (pid_file, component_name))
+        return
+    ok, actual = nebula_numa.verify_placement(pid, placement)
+    if actual is None:
+        print("Warning: %s points to pid %d which is not running; placement of %s not verified" % (
+            pid_file, pid, component_name))
+    elif ok:
+        print("Verified %s (pid %d): %s" % (component_name, pid, nebula_numa.describe(component_name, placement)))
+    else:
+        print("Warning: %s (pid %d) does not match the planned placement (%s); Cpus_allowed is %s" % (
+            component_name, pid, nebula_numa.describe(component_name, placement), nebula_numa.format_cpulist(actual)))
+
+def setup_cgroup(component_name):
+    """
+    创建组件的cgroup v2节点并写入nebula-env中的CPU/内存/IO限制
+
+    Returns:
+        CgroupSlice: 未启用或主机不是cgroup v2时为None
+    """
+    if not params.cgroup_enabled:
+        return None
+    if not nebula_cgroup.available(params.cgroup_root):
+        print("cgroup v2 is not mounted at %s, starting %s without cgroup limits" % (
+            params.cgroup_root, component_name))
+        return None
+    limits = params.cgroup_limits[component_name]
+    try:
+        settings = nebula_cgroup.build_limits(limits['cpu_weight'], limits['memory_high_mb'],
+                                              limits['memory_max_mb'], limits['io_weight'])
+    except ValueError as e:
+        raise Fail(str(e))
+    cgroup = nebula_cgroup.CgroupSlice(component_name, params.cgroup_root, params.cgroup_slice)
+    result = cgroup.ensure(settings)
+    print("cgroup %s: %s" % (cgroup.path, ', '.join('%s=%s' % item for item in settings)))
+    if result['changed']:
+        print("Updated %s" % ', '.join(result['changed']))
+    if result['skipped']:
+        print("Warning: controllers not available for %s" % ', '.join(result['skipped']))
+    return cgroup
+
+def attach_cgroup(component_name, pid_file, cgroup):
+    """
+    把刚启动的进程移入组件的cgroup
+    """
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+    except (IOError, OSError, ValueError):
+        print("Warning: cannot read %s, %s not moved into %s" % (pid_file, component_name, cgroup.path))
+        return
+    if cgroup.attach(pid):
+        print("Moved %s (pid %d) into %s" % (component_name, pid, cgroup.path))
+    else:
+        print("Warning: process %d of %s is not running, not moved into %s" % (pid, component_name, cgroup.path))
+
+@traced()
 def setup_nebula_config():
     """
     配置Nebula服务的通用设置
@@ -127,6 +238,17 @@ def setup_nebula_config():
              group=params.nebula_group,
              mode=0o644)
 
+    # 集群告警结果目录，由ambari-agent写入
+    if params.alert_lease_enabled and not params.alert_lease_dir:
+        print("Warning: alert_lease_enabled is set but alert_lease_dir is empty, every agent probes cluster alerts")
+    elif params.alert_lease_enabled:
+        Directory(params.alert_lease_dir,
+                  mode=0o755,
+                  create_parents=True)
+
+    setup_log_retention()
+
+@traced()
 def generate_graphd_config():
     """
     生成Graphd配置文件
@@ -158,6 +280,7 @@ def generate_graphd_config():
 # Logging configuration
 --log_level={graphd_log_level}
 --log_dir={nebula_log_dir}
+--max_log_size={log_max_file_size_mb}
 
 # Connection limits
 --max_allowed_connections={graphd_max_allowed_connections}
@@ -178,6 +301,7 @@ def generate_graphd_config():
         graphd_meta_server_addrs=getattr(params, 'graphd_meta_server_addrs', 'localhost:9559'),
         graphd_log_level=getattr(params, 'graphd_log_level', 'INFO'),
         nebula_log_dir=getattr(params, 'nebula_log_dir', '/var/log/nebula'),
+        log_max_file_size_mb=getattr(params, 'log_max_file_size_mb', 512),
         graphd_max_allowed_connections=getattr(params, 'graphd_max_allowed_connections', '1000'),
         graphd_local_config=getattr(params, 'graphd_local_config', 'true')
     )
@@ -188,6 +312,7 @@ def generate_graphd_config():
          group=params.nebula_group,
          mode=0o644)
 
+@traced()
 def generate_metad_config():
     """
     生成Metad配置文件
@@ -222,6 +347,7 @@ def generate_metad_config():
 # Logging configuration
 --log_level={metad_log_level}
 --log_dir={nebula_log_dir}
+--max_log_size={log_max_file_size_mb}
 
 # Local configuration
 --local_config=true
@@ -239,7 +365,8 @@ def generate_metad_config():
         metad_default_replica_factor=getattr(params, 'metad_default_replica_factor', '1'),
         metad_cluster_id=getattr(params, 'metad_cluster_id', '1'),
         metad_log_level=getattr(params, 'metad_log_level', 'INFO'),
-        nebula_log_dir=getattr(params, 'nebula_log_dir', '/var/log/nebula')
+        nebula_log_dir=getattr(params, 'nebula_log_dir', '/var/log/nebula'),
+        log_max_file_size_mb=getattr(params, 'log_max_file_size_mb', 512)
     )
     
     File(params.nebula_metad_conf_file,
@@ -248,6 +375,26 @@ def generate_metad_config():
          group=params.nebula_group,
          mode=0o644)
 
+def rocksdb_option_flags():
+    """
+    渲染storaged的RocksDB选项，JSON为空或非法时不输出对应参数
+
+    Returns:
+        str: 每个参数一行，以换行结尾
+    """
+    lines = []
+    for flag, attr in (('rocksdb_db_options', 'storaged_rocksdb_db_options'),
+                       ('rocksdb_column_family_options', 'storaged_rocksdb_column_family_options')):
+        try:
+            options = json.loads(getattr(params, attr, '{}') or '{}')
+        except ValueError:
+            print('Ignoring invalid JSON in {0}'.format(flag))
+            continue
+        if options:
+            lines.append('--{0}={1}\n'.format(flag, json.dumps(options, sort_keys=True, separators=(',', ':'))))
+    return ''.join(lines)
+
+@traced()
 def generate_storaged_config():
     """
     生成Storaged配置文件
@@ -276,13 +423,14 @@ def generate_storaged_config():
 # RocksDB configuration
 --rocksdb_wal_sync={storaged_rocksdb_wal_sync}
 --rocksdb_block_cache={storaged_rocksdb_block_cache}
-
+{storaged_rocksdb_options}
 # Compaction configuration
 --enable_auto_compactions={storaged_enable_auto_compactions}
 
 # Logging configuration
 --log_level={storaged_log_level}
 --log_dir={nebula_log_dir}
+--max_log_size={log_max_file_size_mb}
 
 # Local configuration
 --local_config=true
@@ -297,13 +445,204 @@ def generate_storaged_config():
         storaged_heartbeat_interval_secs=getattr(params, 'storaged_heartbeat_interval_secs', '10'),
         storaged_rocksdb_wal_sync=getattr(params, 'storaged_rocksdb_wal_sync', 'true'),
         storaged_rocksdb_block_cache=getattr(params, 'storaged_rocksdb_block_cache', '1073741824'),
+        storaged_rocksdb_options=rocksdb_option_flags(),
         storaged_enable_auto_compactions=getattr(params, 'storaged_enable_auto_compactions', 'true'),
         storaged_log_level=getattr(params, 'storaged_log_level', 'INFO'),
-        nebula_log_dir=getattr(params, 'nebula_log_dir', '/var/log/nebula')
+        nebula_log_dir=getattr(params, 'nebula_log_dir', '/var/log/nebula'),
+        log_max_file_size_mb=getattr(params, 'log_max_file_size_mb', 512)
     )
     
     File(params.nebula_storaged_conf_file,
          content=storaged_config_content,
          owner=params.nebula_user,
          group=params.nebula_group,
-         mode=0o644)
\ No newline at end of file
+         mode=0o644)
+
+def setup_log_retention():
+    """
+    配置glog文件的压缩和清理
+
+    守护进程按max_log_size自行切分日志；cron每小时以低CPU/IO优先级运行
+    nebula_log_retention.py，压缩已切分的文件并按组件的大小和时间上限清理。
+    """
+    if not params.log_retention_enabled:
+        File(params.log_retention_cron_file, action='delete')
+        return
+
+    File(params.log_retention_config_file,
+         content=json.dumps({
+             'log_dir': params.nebula_log_dir,
+             'max_age_days': params.log_retention_max_age_days,
+             'max_mb': {
+                 'graphd': params.log_retention_graphd_max_mb,
+                 'metad': params.log_retention_metad_max_mb,
+                 'storaged': params.log_retention_storaged_max_mb
+             },
+             'tool_max_mb': params.log_retention_tools_max_mb,
+             'workers': params.log_compression_workers
+         }, indent=2, sort_keys=True),
+         owner=params.nebula_user,
+         group=params.nebula_group,
+         mode=0o644)
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nebula_log_retention.py')
+    File(params.log_retention_cron_file,
+         content="17 * * * * {0} {1} {2} {3} >> {4}/nebula-log-retention.log 2>&1\n".format(
+             params.nebula_user, sys.executable, script, params.log_retention_config_file,
+             params.nebula_log_dir),
+         owner='root',
+         group='root',
+         mode=0o644)
+
+def os_profile():
+    """
+    nebula-env中的OS性能配置
+    """
+    return nebula_os_profile.build_profile(
+        params.os_nofile_limit, params.os_nproc_limit, params.os_vm_swappiness, params.os_vm_dirty_ratio,
+        params.os_vm_dirty_background_ratio, params.os_net_core_somaxconn, params.os_transparent_hugepage,
+        params.os_block_read_ahead_kb, params.os_block_scheduler)
+
+def os_profile_devices():
+    """
+    本机storaged数据盘，未显式配置时按data_path所在设备识别；非storaged主机为空
+    """
+    if params.hostname not in params.storaged_hosts:
+        return []
+    if params.os_block_devices:
+        return params.os_block_devices
+    return nebula_os_profile.data_devices(getattr(params, 'storaged_data_path', ''))
+
+def setup_os_profile():
+    """
+    写入limits.d/sysctl.d片段和磁盘udev规则，并把同样的取值应用到运行中的内核
+
+    同一主机上graphd和storaged生成的内容相同，重复执行不会产生变化。
+    """
+    if not params.os_profile_enabled:
+        return
+    profile = os_profile()
+    devices = os_profile_devices()
+    File(params.os_limits_file,
+         content=nebula_os_profile.render_limits(params.nebula_user, profile),
+         owner='root',
+         group='root',
+         mode=0o644)
+    File(params.os_sysctl_file,
+         content=nebula_os_profile.render_sysctl(profile),
+         owner='root',
+         group='root',
+         mode=0o644)
+    if devices:
+        File(params.os_udev_rules_file,
+             content=nebula_os_profile.render_udev_rules(devices, profile),
+             owner='root',
+             group='root',
+             mode=0o644)
+
+    result = nebula_os_profile.apply(profile, devices)
+    if result['changed']:
+        print("Applied OS profile: %s" % ', '.join(result['changed']))
+    for error in result['errors']:
+        print("Warning: OS profile not applied for %s" % error)
+
+def graphd_capacity():
+    """
+    本机graphd的处理能力：可用核数（NUMA放置指定了graphd_cpu_list时按该列表计）与num_worker_threads中的较小者
+    """
+    if params.numa_placement_enabled and params.graphd_cpu_list:
+        cores = len(nebula_numa.parse_cpulist(params.graphd_cpu_list))
+    elif hasattr(os, 'sched_getaffinity'):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        import multiprocessing
+        cores = multiprocessing.cpu_count()
+    return nebula_endpoints.host_capacity(cores, params.graphd_num_worker_threads)
+
+def update_graphd_endpoints(state=None):
+    """
+    按clusterHostInfo同步graphd endpoint清单，并重新生成HAProxy/Envoy配置片段
+
+    Args:
+        state: 本机的新状态（ACTIVE/DRAINING），None表示保持不变
+
+    Returns:
+        dict: 同步后的清单
+    """
+    hosts = params.graphd_hosts or [params.hostname]
+    manifest = nebula_endpoints.sync_manifest(params.graphd_endpoints_file, hosts, params.graphd_port,
+                                              params.graphd_ws_http_port, params.hostname,
+                                              graphd_capacity(), state,
+                                              nebula_endpoints.parse_host_cores(params.graphd_host_cores),
+                                              params.graphd_num_worker_threads)
+    File(params.graphd_haproxy_file,
+         content=nebula_endpoints.render_haproxy(manifest, params.graphd_port),
+         mode=0o644)
+    File(params.graphd_envoy_file,
+         content=nebula_endpoints.render_envoy(manifest),
+         mode=0o644)
+    print("graphd endpoints: %s" % ', '.join('%s:%s weight=%s %s' % (
+        item['host'], item['port'], item['weight'], item['state']) for item in manifest['graphd']))
+    return manifest
+
+def compaction_scheduler_config():
+    """
+    计划压缩调度器使用的配置，configure时写入compaction_config_file供cron调用
+    """
+    graphd_hosts = params.graphd_hosts or [params.hostname]
+    return {
+        'console_bin': params.nebula_console_bin,
+        'graphd_host': graphd_hosts[0],
+        'graphd_port': params.graphd_port,
+        'user': params.nebula_console_user,
+        'password': params.nebula_console_password,
+        'storaged_hosts': params.storaged_hosts or [params.hostname],
+        'storaged_http_port': params.storaged_ws_http_port,
+        'window': params.compaction_window,
+        'spaces': params.compaction_spaces,
+        'max_concurrent_jobs': params.compaction_max_concurrent_jobs,
+        'latency_metric': params.compaction_latency_metric,
+        'degrade_ratio': params.compaction_latency_degrade_ratio,
+        'latency_floor_us': params.compaction_latency_floor_us,
+        'poll_interval': params.compaction_poll_interval_secs,
+        'max_runtime_secs': params.compaction_max_runtime_secs,
+        'history_file': params.compaction_history_file
+    }
+
+def setup_compaction_schedule():
+    """
+    配置计划压缩
+
+    SUBMIT JOB COMPACT作用于整个集群，因此只在排序后的第一台storaged主机上安装cron任务，
+    在时间窗口开始时启动调度器。
+    """
+    scheduler_host = sorted(params.storaged_hosts)[0] if params.storaged_hosts else params.hostname
+    if not params.compaction_schedule_enabled or scheduler_host != params.hostname:
+        File(params.compaction_cron_file, action='delete')
+        return
+
+    from nebula_compaction import parse_window
+    start, _ = parse_window(params.compaction_window)
+
+    Directory(params.compaction_dir,
+              owner=params.nebula_user,
+              group=params.nebula_group,
+              mode=0o755,
+              create_parents=True)
+
+    # 配置中包含console密码，仅运行用户可读
+    File(params.compaction_config_file,
+         content=json.dumps(compaction_scheduler_config(), indent=2, sort_keys=True),
+         owner=params.nebula_user,
+         group=params.nebula_group,
+         mode=0o600)
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nebula_compaction.py')
+    File(params.compaction_cron_file,
+         content="{0} {1} * * * {2} {3} {4} {5} >> {6}/nebula-compaction.log 2>&1\n".format(
+             start % 60, start // 60, params.nebula_user, sys.executable, script,
+             params.compaction_config_file, params.nebula_log_dir),
+         owner='root',
+         group='root',
+         mode=0o644)
+
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Licensed to the Apache Software Foundation (ASF) under one
+or more contributor license agreements.  See the NOTICE file
+distributed with this work for additional information
+regarding copyright ownership.  The ASF licenses this file
+to you under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance
+with the License.  You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import threading
+import time
+
+from nebula_ngql import NgqlError, show_hosts
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+def list_sst_files(data_paths):
+    """
+    列出各数据目录下的RocksDB SST文件
+
+    Returns:
+        list: [{path, data_path, size, number, recent}]，recent为atime和mtime中较新者
+    """
+    files = []
+    for data_path in data_paths:
+        for directory, _, names in os.walk(data_path):
+            for name in names:
+                if not name.endswith('.sst'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                try:
+                    number = int(name[:-4])
+                except ValueError:
+                    number = 0
+                files.append({'path': path, 'data_path': data_path, 'size': stat.st_size,
+                              'number': number, 'recent': max(stat.st_atime, stat.st_mtime)})
+    return files
+
+
+# select_files支持的顺序，与nebula-storaged-site中warmup_order的取值一致
+WARMUP_ORDERS = ('recent', 'level')
+# warmup_timeout_secs为0（不限时长）时，预热查询等待本机ONLINE的上限
+WARMUP_ONLINE_WAIT_SECS = 120
+
+
+def select_files(files, budget_bytes, order='recent'):
+    """
+    按热度挑选不超过预算的文件，各数据目录轮流入选
+
+    Args:
+        order: recent按最近访问时间；level按文件编号，编号越大越新，
+               通常位于更低的层级，读放大最集中
+
+    Returns:
+        list: 入选的文件，按入选顺序排列
+    """
+    if order == 'recent':
+        key = lambda item: (-item['recent'], -item['number'])
+    elif order == 'level':
+        key = lambda item: (-item['number'], -item['recent'])
+    else:
+        raise ValueError('Unknown warm-up order: ' + order)
+    queues = {}
+    for item in sorted(files, key=key):
+        queues.setdefault(item['data_path'], []).append(item)
+
+    selected = []
+    remaining = budget_bytes
+    paths = sorted(queues)
+    while paths and remaining > 0:
+        for data_path in list(paths):
+            queue = queues[data_path]
+            # 放不下当前文件时看同目录下一个，整个目录都放不下就不再轮到它
+            while queue and queue[0]['size'] > remaining:
+                queue.pop(0)
+            if not queue:
+                paths.remove(data_path)
+                continue
+            item = queue.pop(0)
+            selected.append(item)
+            remaining -= item['size']
+    return selected
+
+
+class PageCacheWarmer(object):
+    """
+    把SST文件预读进page cache
+
+    支持posix_fadvise时按块发起WILLNEED预读，否则按块顺序读取。所有worker共享一个
+    字节速率上限，超过deadline后不再发起新的块。
+    """
+
+    def __init__(self, workers=4, rate_bytes_per_sec=0, chunk_bytes=4 * 1024 * 1024, deadline_secs=0,
+                 progress=None, clock=_clock, sleep=time.sleep, use_fadvise=None):
+        self.workers = max(1, int(workers))
+        self.rate = rate_bytes_per_sec
+        self.chunk_bytes = chunk_bytes
+        self.deadline_secs = deadline_secs
+        self.progress = progress
+        self._clock = clock
+        self._sleep = sleep
+        self.use_fadvise = hasattr(os, 'posix_fadvise') if use_fadvise is None else use_fadvise
+        self._lock = threading.Lock()
+        self._next_slot = 0
+
+    def warm(self, files):
+        """
+        Returns:
+            dict: files、bytes、errors、seconds和timed_out
+        """
+        started = self._clock()
+        self._deadline = started + self.deadline_secs if self.deadline_secs else None
+        self._next_slot = started
+        summary = {'files': 0, 'bytes': 0, 'errors': [], 'seconds': 0, 'timed_out': False}
+        total = len(files)
+        pending = list(files)
+
+        def worker():
+            while True:
+                with self._lock:
+                    if not pending or summary['timed_out']:
+                        return
+                    item = pending.pop(0)
+                try:
+                    warmed, complete = self._warm_file(item['path'])
+                except (IOError, OSError) as e:
+                    with self._lock:
+                        summary['errors'].append('{0}: {1}'.format(item['path'], e))
+                    continue
+                with self._lock:
+                    summary['bytes'] += warmed
+                    if not complete:
+                        summary['timed_out'] = True
+                        return
+                    summary['files'] += 1
+                    if self.progress is not None:
+                        self.progress(summary['files'], total, summary['bytes'])
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.workers, len(files)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        summary['seconds'] = round(self._clock() - started, 3)
+        return summary
+
+    def _warm_file(self, path):
+        warmed = 0
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            offset = 0
+            while offset < size:
+                length = min(self.chunk_bytes, size - offset)
+                if not self._acquire(length):
+                    return warmed, False
+                if self.use_fadvise:
+                    os.posix_fadvise(f.fileno(), offset, length, os.POSIX_FADV_WILLNEED)
+                else:
+                    f.seek(offset)
+                    f.read(length)
+                offset += length
+                warmed += length
+        return warmed, True
+
+    def _acquire(self, length):
+        """
+        按速率上限预约一个时间片，超过deadline时返回False
+        """
+        now = self._clock()
+        if self._deadline is not None and now >= self._deadline:
+            return False
+        if not self.rate:
+            return True
+        with self._lock:
+            start = max(self._next_slot, now)
+            self._next_slot = start + float(length) / self.rate
+        if self._deadline is not None and start >= self._deadline:
+            return False
+        if start > now:
+            self._sleep(start - now)
+        return True
+
+
+def wait_until_online(session, host, port, timeout_secs=120, interval_secs=5, clock=_clock, sleep=time.sleep):
+    """
+    等待metad把本机storaged标记为ONLINE
+
+    Returns:
+        bool: 超时仍未ONLINE时为False
+    """
+    deadline = clock() + timeout_secs
+    while True:
+        try:
+            for item in show_hosts(session):
+                if item['host'] == host and item['port'] == int(port) and item['status'] == 'ONLINE':
+                    return True
+        except NgqlError:
+            pass
+        if clock() >= deadline:
+            return False
+        sleep(interval_secs)
+
+
+def run_warmup_queries(session, statements, clock=_clock):
+    """
+    依次执行预热查询，单条失败不影响后续语句
+
+    Returns:
+        list: [(语句, 耗时秒数, 错误信息或None)]
+    """
+    results = []
+    for statement in statements:
+        started = clock()
+        try:
+            session.execute(statement)
+            error = None
+        except NgqlError as e:
+            error = str(e)
+        results.append((statement, round(clock() - started, 3), error))
+    return results
@@ -19,6 +19,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import os
 from resource_management import *
 from resource_management.libraries.functions import conf_select
 from resource_management.libraries.functions import stack_select
@@ -84,6 +85,16 @@ if 'nebula-graphd-site' in config['configurations']:
     # 添加缺少的配置项
     graphd_meta_server_addrs = config['configurations']['nebula-graphd-site'].get('meta_server_addrs', metad_hosts_with_port)
     graphd_local_config = config['configurations']['nebula-graphd-site'].get('local_config', 'true')
+    # 慢查询分析配置
+    graphd_site_config = config['configurations']['nebula-graphd-site']
+    slow_query_log_glob = graphd_site_config.get('slow_query_log_glob', 'nebula-graphd*.log.INFO.*')
+    slow_query_log_pattern = graphd_site_config.get('slow_query_log_pattern', '') or ''
+    slow_query_top_n = int(graphd_site_config.get('slow_query_top_n', 20))
+    # 停止前排空会话配置
+    graphd_drain_enabled = str(graphd_site_config.get('drain_enabled', 'true')).lower() == 'true'
+    graphd_drain_timeout_secs = int(graphd_site_config.get('drain_timeout_secs', 60))
+    graphd_drain_max_sessions = int(graphd_site_config.get('drain_max_sessions', 0))
+    graphd_drain_max_queries = int(graphd_site_config.get('drain_max_queries', 0))
 
 # Metad specific configurations
 if 'nebula-metad-site' in config['configurations']:
@@ -101,6 +112,14 @@ if 'nebula-metad-site' in config['configurations']:
     # 添加缺少的配置项
     metad_ws_http_port = config['configurations']['nebula-metad-site'].get('ws_http_port', '19559')
     metad_ws_h2_port = config['configurations']['nebula-metad-site'].get('ws_h2_port', '19560')
+    # 均衡作业配置
+    metad_site_config = config['configurations']['nebula-metad-site']
+    balance_spaces = [space.strip() for space in metad_site_config.get('balance_spaces', '').split(',')
+                      if space.strip()]
+    balance_skew_threshold = float(metad_site_config.get('balance_skew_threshold', 0.2))
+    balance_max_poll_interval_secs = int(metad_site_config.get('balance_max_poll_interval_secs', 30))
+    balance_stall_timeout_secs = int(metad_site_config.get('balance_stall_timeout_secs', 600))
+    balance_timeout_secs = int(metad_site_config.get('balance_timeout_secs', 7200))
 
 # Storaged specific configurations
 if 'nebula-storaged-site' in config['configurations']:
@@ -121,6 +140,143 @@ if 'nebula-storaged-site' in config['configurations']:
     storaged_custom_filter_interval_secs = config['configurations']['nebula-storaged-site']['custom_filter_interval_secs']
     # 添加缺少的配置项
     storaged_meta_server_addrs = config['configurations']['nebula-storaged-site'].get('meta_server_addrs', metad_hosts_with_port)
+    # 计划压缩配置
+    storaged_site_config = config['configurations']['nebula-storaged-site']
+    compaction_schedule_enabled = str(storaged_site_config.get('compaction_schedule_enabled', 'false')).lower() == 'true'
+    compaction_window = storaged_site_config.get('compaction_window', '02:00-05:00')
+    compaction_spaces = [space.strip() for space in storaged_site_config.get('compaction_spaces', '').split(',')
+                         if space.strip()]
+    compaction_max_concurrent_jobs = int(storaged_site_config.get('compaction_max_concurrent_jobs', 1))
+    compaction_latency_metric = storaged_site_config.get('compaction_latency_metric', 'get_neighbors_latency_us.p99.60')
+    compaction_latency_degrade_ratio = float(storaged_site_config.get('compaction_latency_degrade_ratio', 2.0))
+    compaction_latency_floor_us = int(storaged_site_config.get('compaction_latency_floor_us', 10000))
+    compaction_poll_interval_secs = int(storaged_site_config.get('compaction_poll_interval_secs', 30))
+    compaction_max_runtime_secs = int(storaged_site_config.get('compaction_max_runtime_secs', 14400))
+    # 启动预热配置
+    warmup_enabled = str(storaged_site_config.get('warmup_enabled', 'false')).lower() == 'true'
+    warmup_budget_mb = int(storaged_site_config.get('warmup_budget_mb', 4096))
+    warmup_order = storaged_site_config.get('warmup_order', 'recent')
+    warmup_workers = int(storaged_site_config.get('warmup_workers', 4))
+    warmup_rate_mb_per_sec = int(storaged_site_config.get('warmup_rate_mb_per_sec', 200))
+    warmup_timeout_secs = int(storaged_site_config.get('warmup_timeout_secs', 300))
+    warmup_queries = [line.strip() for line in (storaged_site_config.get('warmup_queries') or '').splitlines()
+                      if line.strip()]
+    # 停止前迁移leader配置
+    leader_drain_enabled = str(storaged_site_config.get('leader_drain_enabled', 'false')).lower() == 'true'
+    leader_drain_timeout_secs = int(storaged_site_config.get('leader_drain_timeout_secs', 60))
+    leader_drain_statement = storaged_site_config.get('leader_drain_statement') or ''
+
+# Graphd and storaged hosts
+graphd_hosts = default("/clusterHostInfo/nebula_graphd_hosts", [])
+storaged_hosts = default("/clusterHostInfo/nebula_storaged_hosts", [])
+
+# Console credentials
+nebula_console_user = config['configurations']['nebula-env'].get('nebula_console_user', 'root')
+nebula_console_password = config['configurations']['nebula-env'].get('nebula_console_password', 'nebula')
+
+# Benchmark configurations
+nebula_env_config = config['configurations']['nebula-env']
+benchmark_space = nebula_env_config.get('benchmark_space', 'nebula_benchmark')
+benchmark_phases = [phase.strip() for phase in
+                    nebula_env_config.get('benchmark_phases', 'insert_vertex,insert_edge,go,match').split(',')
+                    if phase.strip()]
+benchmark_vertex_count = int(nebula_env_config.get('benchmark_vertex_count', 100000))
+benchmark_edges_per_vertex = int(nebula_env_config.get('benchmark_edges_per_vertex', 5))
+benchmark_batch_size = int(nebula_env_config.get('benchmark_batch_size', 100))
+benchmark_hops = int(nebula_env_config.get('benchmark_hops', 2))
+benchmark_concurrency = int(nebula_env_config.get('benchmark_concurrency', 8))
+benchmark_rate_limit = int(nebula_env_config.get('benchmark_rate_limit', 0))
+benchmark_warmup_secs = int(nebula_env_config.get('benchmark_warmup_secs', 10))
+benchmark_duration_secs = int(nebula_env_config.get('benchmark_duration_secs', 60))
+benchmark_seed = int(nebula_env_config.get('benchmark_seed', 42))
+
+# Bulk load configurations
+bulk_load_space = nebula_env_config.get('bulk_load_space', '')
+bulk_load_jobs = nebula_env_config.get('bulk_load_jobs', '[]')
+bulk_load_batch_bytes = int(nebula_env_config.get('bulk_load_batch_bytes', 65536))
+bulk_load_concurrency = int(nebula_env_config.get('bulk_load_concurrency', 16))
+bulk_load_max_retries = int(nebula_env_config.get('bulk_load_max_retries', 3))
+
+# Prometheus exporter configurations
+exporter_port = int(nebula_env_config.get('exporter_port', 9200))
+exporter_scrape_interval_secs = int(nebula_env_config.get('exporter_scrape_interval_secs', 15))
+cluster_metrics_interval_secs = int(nebula_env_config.get('cluster_metrics_interval_secs', 300))
+exporter_hosts = default("/clusterHostInfo/nebula_exporter_hosts", [])
+
+# Tracing configurations
+trace_enabled = str(nebula_env_config.get('trace_enabled', 'false')).lower() == 'true'
+trace_keep_per_name = int(nebula_env_config.get('trace_keep_per_name', 100))
+
+# Partition/leader topology cache configurations
+topology_cache_file = os.path.join(nebula_pid_dir, 'nebula-topology.bin')
+topology_cache_max_age_secs = int(nebula_env_config.get('topology_cache_max_age_secs', 300))
+
+# Cluster-scoped alert lease configurations
+alert_lease_enabled = str(nebula_env_config.get('alert_lease_enabled', 'false')).lower() == 'true'
+# 必须是所有NEBULA主机共享的目录，未配置时选举不生效
+alert_lease_dir = (nebula_env_config.get('alert_lease_dir') or '').strip()
+
+# Client-facing graphd endpoint manifest
+graphd_endpoints_file = nebula_env_config.get('graphd_endpoints_file') or '/etc/nebula/graphd-endpoints.json'
+# 各graphd主机的核数（host:cores,...），由service advisor按Ambari的主机信息填写
+graphd_host_cores = nebula_env_config.get('graphd_host_cores') or ''
+graphd_haproxy_file = os.path.join(os.path.dirname(graphd_endpoints_file), 'graphd-haproxy.cfg')
+graphd_envoy_file = os.path.join(os.path.dirname(graphd_endpoints_file), 'graphd-envoy.json')
+
+# NUMA/CPU placement configurations
+numa_placement_enabled = str(nebula_env_config.get('numa_placement_enabled', 'false')).lower() == 'true'
+storaged_numa_policy = nebula_env_config.get('storaged_numa_policy', 'auto')
+storaged_numa_node = str(nebula_env_config.get('storaged_numa_node', 'auto')).strip() or 'auto'
+graphd_cpu_list = (nebula_env_config.get('graphd_cpu_list') or '').strip()
+# 本机部署的组件，用于避免同机守护进程的CPU重叠
+co_located_components = set(name for name, hosts in (('graphd', graphd_hosts), ('metad', metad_hosts),
+                                                     ('storaged', storaged_hosts)) if hostname in hosts)
+
+# OS performance profile configurations
+os_profile_enabled = str(nebula_env_config.get('os_profile_enabled', 'false')).lower() == 'true'
+os_nofile_limit = int(nebula_env_config.get('os_nofile_limit', 1048576))
+os_nproc_limit = int(nebula_env_config.get('os_nproc_limit', 65536))
+os_vm_swappiness = int(nebula_env_config.get('os_vm_swappiness', 1))
+os_vm_dirty_ratio = int(nebula_env_config.get('os_vm_dirty_ratio', 10))
+os_vm_dirty_background_ratio = int(nebula_env_config.get('os_vm_dirty_background_ratio', 5))
+os_net_core_somaxconn = int(nebula_env_config.get('os_net_core_somaxconn', 4096))
+os_transparent_hugepage = nebula_env_config.get('os_transparent_hugepage', 'never')
+os_block_read_ahead_kb = int(nebula_env_config.get('os_block_read_ahead_kb', 128))
+os_block_scheduler = (nebula_env_config.get('os_block_scheduler') or '').strip()
+os_block_devices = [device.strip() for device in (nebula_env_config.get('os_block_devices') or '').split(',')
+                    if device.strip()]
+
+# cgroup v2 configurations
+cgroup_enabled = str(nebula_env_config.get('cgroup_enabled', 'false')).lower() == 'true'
+cgroup_root = '/sys/fs/cgroup'
+cgroup_slice = 'nebula.slice'
+cgroup_limits = {}
+for _component, _cpu_weight, _io_weight in (('graphd', 100, 100), ('metad', 200, 200), ('storaged', 300, 500)):
+    cgroup_limits[_component] = {
+        'cpu_weight': int(nebula_env_config.get('cgroup_%s_cpu_weight' % _component, _cpu_weight)),
+        'memory_high_mb': int(nebula_env_config.get('cgroup_%s_memory_high_mb' % _component, 0)),
+        'memory_max_mb': int(nebula_env_config.get('cgroup_%s_memory_max_mb' % _component, 0)),
+        'io_weight': int(nebula_env_config.get('cgroup_%s_io_weight' % _component, _io_weight))
+    }
+
+# Log retention configurations
+log_retention_enabled = str(nebula_env_config.get('log_retention_enabled', 'true')).lower() == 'true'
+log_max_file_size_mb = int(nebula_env_config.get('log_max_file_size_mb', 512))
+log_retention_max_age_days = int(nebula_env_config.get('log_retention_max_age_days', 7))
+log_retention_graphd_max_mb = int(nebula_env_config.get('log_retention_graphd_max_mb', 4096))
+log_retention_metad_max_mb = int(nebula_env_config.get('log_retention_metad_max_mb', 2048))
+log_retention_storaged_max_mb = int(nebula_env_config.get('log_retention_storaged_max_mb', 8192))
+log_retention_tools_max_mb = int(nebula_env_config.get('log_retention_tools_max_mb', 256))
+log_compression_workers = int(nebula_env_config.get('log_compression_workers', 2))
+
+# Ambari Metrics sink configurations
+ams_sink_enabled = str(nebula_env_config.get('ams_sink_enabled', 'false')).lower() == 'true'
+ams_sink_flush_interval_secs = int(nebula_env_config.get('ams_sink_flush_interval_secs', 60))
+ams_sink_max_points = int(nebula_env_config.get('ams_sink_max_points', 100000))
+ams_sink_batch_size = int(nebula_env_config.get('ams_sink_batch_size', 500))
+ams_sink_compress = str(nebula_env_config.get('ams_sink_compress', 'true')).lower() == 'true'
+metrics_collector_hosts = default("/clusterHostInfo/metrics_collector_hosts", [])
+metrics_collector_port = default("/configurations/ams-site/timeline.metrics.service.webapp.address", "0.0.0.0:6188").split(':')[-1]
 
 # Log4j configurations
 if 'nebula-log4j' in config['configurations']:
@@ -132,11 +288,13 @@ nebula_metad_conf_file = nebula_install_dir + '/etc/nebula-metad.conf'
 nebula_storaged_conf_file = nebula_install_dir + '/etc/nebula-storaged.conf'
 nebula_env_sh_file = nebula_install_dir + '/etc/nebula-env.sh'
 nebula_log4j_file = nebula_install_dir + '/etc/log4j.properties'
+exporter_config_file = nebula_install_dir + '/etc/nebula-exporter.json'
 
 # PID files
 graphd_pid_file = nebula_pid_dir + '/nebula-graphd.pid'
 metad_pid_file = nebula_pid_dir + '/nebula-metad.pid'
 storaged_pid_file = nebula_pid_dir + '/nebula-storaged.pid'
+exporter_pid_file = nebula_pid_dir + '/nebula-exporter.pid'
 
 # Binary executables
 nebula_graphd_bin = nebula_install_dir + '/bin/nebula-graphd'
@@ -144,6 +302,34 @@ nebula_metad_bin = nebula_install_dir + '/bin/nebula-metad'
 nebula_storaged_bin = nebula_install_dir + '/bin/nebula-storaged'
 nebula_console_bin = nebula_install_dir + '/bin/nebula-console'
 
+# Benchmark result files
+benchmark_result_dir = nebula_log_dir + '/benchmark'
+
+# Bulk load checkpoints
+bulk_load_checkpoint_dir = nebula_data_dir + '/bulk_load'
+
+# Trace files
+trace_dir = nebula_log_dir + '/trace'
+
+# Log retention files
+log_retention_config_file = nebula_install_dir + '/etc/nebula-log-retention.json'
+log_retention_cron_file = '/etc/cron.d/nebula-log-retention'
+
+# OS profile files
+os_limits_file = '/etc/security/limits.d/90-nebula.conf'
+os_sysctl_file = '/etc/sysctl.d/90-nebula.conf'
+os_udev_rules_file = '/etc/udev/rules.d/90-nebula-block.rules'
+
+# Slow query analyzer checkpoint
+slow_query_dir = nebula_data_dir + '/slow_query'
+slow_query_checkpoint_file = slow_query_dir + '/checkpoint.json'
+
+# Compaction scheduler files
+compaction_dir = nebula_data_dir + '/compaction'
+compaction_config_file = nebula_install_dir + '/etc/nebula-compaction.json'
+compaction_history_file = compaction_dir + '/history.jsonl'
+compaction_cron_file = '/etc/cron.d/nebula-compaction'
+
 # Import all the properties
 import functools
 try:
@@ -22,9 +22,158 @@ Nebula Graph Service Advisor for Ambari
 提供Nebula Graph服务的配置推荐和验证
 """
 
+import json
 import os
 import traceback
 
+MB = 1024 * 1024
+
+# workload_profile的预设：线程数按核数缩放，block cache按storaged主机内存的比例计算，
+# 其余为固定值。custom表示不做推荐也不做校验。
+WORKLOAD_PROFILES = {
+    'oltp_read': {
+        'graphd_workers_per_core': 1,
+        'graphd_netio_per_core': 0.5,
+        'storaged_workers_per_core': 2,
+        'storaged_io_per_core': 1,
+        'block_cache_ratio': 0.4,
+        'rocksdb_wal_sync': 'true',
+        'enable_auto_compactions': 'true',
+        'write_buffer_mb': 64,
+        'max_write_buffer_number': 4,
+        'idle_timeout_secs': 3600,
+    },
+    'bulk_ingest': {
+        'graphd_workers_per_core': 1,
+        'graphd_netio_per_core': 0.25,
+        'storaged_workers_per_core': 1,
+        'storaged_io_per_core': 2,
+        'block_cache_ratio': 0.1,
+        'rocksdb_wal_sync': 'false',
+        'enable_auto_compactions': 'false',
+        'write_buffer_mb': 256,
+        'max_write_buffer_number': 6,
+        'idle_timeout_secs': 28800,
+    },
+    'analytic': {
+        'graphd_workers_per_core': 2,
+        'graphd_netio_per_core': 0.25,
+        'storaged_workers_per_core': 2,
+        'storaged_io_per_core': 1,
+        'block_cache_ratio': 0.3,
+        'rocksdb_wal_sync': 'true',
+        'enable_auto_compactions': 'true',
+        'write_buffer_mb': 64,
+        'max_write_buffer_number': 4,
+        'idle_timeout_secs': 86400,
+    },
+}
+
+# 与配置文件中value-attributes一致的上下限
+PROFILE_LIMITS = {
+    ('nebula-graphd-site', 'num_worker_threads'): (1, 32),
+    ('nebula-graphd-site', 'num_netio_threads'): (1, 32),
+    ('nebula-graphd-site', 'client_idle_timeout_secs'): (60, 86400),
+    ('nebula-graphd-site', 'session_idle_timeout_secs'): (60, 86400),
+    ('nebula-storaged-site', 'num_worker_threads'): (1, 128),
+    ('nebula-storaged-site', 'num_io_threads'): (1, 128),
+    ('nebula-storaged-site', 'rocksdb_block_cache'): (64 * MB, 64 * 1024 * MB),
+}
+
+# 与nebula_warmup.WARMUP_ORDERS一致；advisor在Ambari server上单独加载，不导入package下的模块
+WARMUP_ORDERS = ('recent', 'level')
+
+# 随硬件缩放的数值允许在推荐值的1/2到2倍之间手工调整，超出即视为与profile冲突
+PROFILE_TOLERANCE = 2.0
+SCALED_PROPERTIES = ('num_worker_threads', 'num_netio_threads', 'num_io_threads', 'rocksdb_block_cache',
+                     'write_buffer_size')
+
+
+def _clamp(config_type, name, value):
+    low, high = PROFILE_LIMITS.get((config_type, name), (1, None))
+    value = max(low, int(value))
+    return min(high, value) if high else value
+
+
+def workload_profile_configs(profile, cpu_count, memory_mb):
+    """
+    计算workload profile对应的graphd/storaged参数
+
+    Args:
+        profile: WORKLOAD_PROFILES中的名称
+        cpu_count: 主机核数
+        memory_mb: storaged可用内存（MB）
+
+    Returns:
+        dict: config_type -> {property: value}，值均为字符串；未知profile返回{}。
+        写缓冲区参数以rocksdb_column_family_options中的键给出。
+    """
+    preset = WORKLOAD_PROFILES.get(profile)
+    if preset is None:
+        return {}
+    cores = max(1, int(cpu_count))
+    graphd = {
+        'num_worker_threads': cores * preset['graphd_workers_per_core'],
+        'num_netio_threads': cores * preset['graphd_netio_per_core'],
+        'client_idle_timeout_secs': preset['idle_timeout_secs'],
+        'session_idle_timeout_secs': preset['idle_timeout_secs'],
+    }
+    storaged = {
+        'num_worker_threads': cores * preset['storaged_workers_per_core'],
+        'num_io_threads': cores * preset['storaged_io_per_core'],
+        'rocksdb_block_cache': int(memory_mb * preset['block_cache_ratio']) * MB,
+    }
+    result = {
+        'nebula-graphd-site': dict((name, str(_clamp('nebula-graphd-site', name, value)))
+                                   for name, value in graphd.items()),
+        'nebula-storaged-site': dict((name, str(_clamp('nebula-storaged-site', name, value)))
+                                     for name, value in storaged.items()),
+    }
+    result['nebula-storaged-site'].update({
+        'rocksdb_wal_sync': preset['rocksdb_wal_sync'],
+        'enable_auto_compactions': preset['enable_auto_compactions'],
+        'write_buffer_size': str(preset['write_buffer_mb'] * MB),
+        'max_write_buffer_number': str(preset['max_write_buffer_number']),
+    })
+    return result
+
+
+def profile_conflicts(profile, recommended, current):
+    """
+    找出与workload profile冲突的手工配置
+
+    Args:
+        recommended: workload_profile_configs中某个config_type的推荐值
+        current: 该config_type的当前配置
+
+    Returns:
+        list: (property, message)，写缓冲区参数以rocksdb_column_family_options报告
+    """
+    try:
+        cf_options = json.loads(current.get('rocksdb_column_family_options') or '{}')
+    except ValueError:
+        cf_options = {}
+    conflicts = []
+    for name in sorted(recommended):
+        in_cf_options = name in ('write_buffer_size', 'max_write_buffer_number')
+        value = (cf_options if in_cf_options else current).get(name)
+        if value is None or value == '':
+            continue
+        expected = recommended[name]
+        if name in SCALED_PROPERTIES:
+            try:
+                ratio = float(value) / float(expected)
+            except (TypeError, ValueError, ZeroDivisionError):
+                continue
+            if 1.0 / PROFILE_TOLERANCE <= ratio <= PROFILE_TOLERANCE:
+                continue
+        elif str(value).lower() == str(expected).lower():
+            continue
+        conflicts.append(('rocksdb_column_family_options' if in_cf_options else name,
+                          'workload_profile {0} recommends {1}={2}, but it is set to {3}'.format(
+                              profile, name, expected, value)))
+    return conflicts
+
 
 class NebulaServiceAdvisor(object):
     """
@@ -89,6 +238,15 @@ class NebulaServiceAdvisor(object):
         
         # 推荐基于集群拓扑的配置
         self._recommend_cluster_topology_configs(configurations, cluster_data, hosts, services)
+
+        # 推荐同机部署时的cgroup内存上限
+        self._recommend_cgroup_configs(configurations, hosts)
+
+        # 按workload_profile推荐线程、缓存、WAL和超时参数
+        self._recommend_workload_profile_configs(configurations, hosts)
+
+        # 记录各graphd主机的核数，供endpoint清单计权
+        self._recommend_graphd_host_cores(configurations, hosts)
     
     def _recommend_cluster_topology_configs(self, configurations, cluster_data, hosts, services):
         """
@@ -119,6 +277,166 @@ class NebulaServiceAdvisor(object):
         except Exception as e:
             print("Error in _recommend_cluster_topology_configs: %s" % str(e))
     
+    def _recommend_cgroup_configs(self, configurations, hosts):
+        """
+        graphd与storaged同机部署且启用cgroup时，按同机主机的最小内存推荐内存上限：
+        storaged的memory.max为50%，graphd为30%，memory.high为memory.max的90%
+        """
+        try:
+            nebula_env = self._get_configuration(configurations, 'nebula-env', {})
+            if str(nebula_env.get('cgroup_enabled', 'false')).lower() != 'true':
+                return
+            shared = set(self.component_hosts_map.get('NEBULA_GRAPHD', [])) & \
+                set(self.component_hosts_map.get('NEBULA_STORAGED', []))
+            memory_kb = [item['Hosts']['total_mem'] for item in (hosts or {}).get('items', [])
+                         if item['Hosts']['host_name'] in shared and item['Hosts'].get('total_mem')]
+            if not memory_kb:
+                return
+            total_mb = min(memory_kb) // 1024
+            for component, share in (('storaged', 0.5), ('graphd', 0.3)):
+                max_key = 'cgroup_%s_memory_max_mb' % component
+                high_key = 'cgroup_%s_memory_high_mb' % component
+                if int(nebula_env.get(max_key, 0) or 0) == 0:
+                    nebula_env[max_key] = str(int(total_mb * share))
+                    if int(nebula_env.get(high_key, 0) or 0) == 0:
+                        nebula_env[high_key] = str(int(total_mb * share * 0.9))
+            self._put_configuration(configurations, 'nebula-env', nebula_env)
+        except Exception as e:
+            print("Error in _recommend_cgroup_configs: %s" % str(e))
+
+    def _recommend_graphd_host_cores(self, configurations, hosts):
+        """
+        按Ambari上报的cpu_count生成graphd_host_cores（host:cores,...）
+        """
+        try:
+            graphd_hosts = set(self.component_hosts_map.get('NEBULA_GRAPHD', []))
+            cores = sorted((item['Hosts']['host_name'], item['Hosts']['cpu_count'])
+                           for item in (hosts or {}).get('items', [])
+                           if item['Hosts']['host_name'] in graphd_hosts and item['Hosts'].get('cpu_count'))
+            if not cores:
+                return
+            self._put_configuration(configurations, 'nebula-env', {
+                'graphd_host_cores': ','.join('%s:%d' % (host, int(count)) for host, count in cores)})
+        except Exception as e:
+            print("Error in _recommend_graphd_host_cores: %s" % str(e))
+
+    def _component_hosts(self, services):
+        """
+        从services['services'][*]['components'][*]['StackServiceComponents']['hostnames']
+        构造组件到主机的映射
+
+        校验时Ambari使用新的建议器实例，不会先调用推荐接口，因此不能依赖component_hosts_map。
+        """
+        component_hosts = {}
+        if not isinstance(services, dict):
+            return component_hosts
+        for service in services.get('services', []):
+            for component in service.get('components', []):
+                info = component.get('StackServiceComponents', {})
+                if info.get('component_name'):
+                    component_hosts[info['component_name']] = info.get('hostnames') or []
+        return component_hosts
+
+    def _profile_hardware(self, configurations, hosts, component_hosts=None):
+        """
+        取graphd和storaged主机中的最小核数，以及storaged主机的最小内存（MB）
+
+        启用cgroup时storaged的内存以cgroup_storaged_memory_max_mb为准。
+
+        Args:
+            component_hosts: 组件到主机的映射，为None时使用推荐时记录的component_hosts_map
+        """
+        if component_hosts is None:
+            component_hosts = self.component_hosts_map
+        nebula_hosts = set(component_hosts.get('NEBULA_GRAPHD', [])) | \
+            set(component_hosts.get('NEBULA_STORAGED', []))
+        storaged_hosts = set(component_hosts.get('NEBULA_STORAGED', []))
+        items = [item['Hosts'] for item in (hosts or {}).get('items', [])]
+        cores = [item['cpu_count'] for item in items
+                 if item['host_name'] in nebula_hosts and item.get('cpu_count')]
+        memory_kb = [item['total_mem'] for item in items
+                     if item['host_name'] in storaged_hosts and item.get('total_mem')]
+        if not cores or not memory_kb:
+            return None
+        memory_mb = min(memory_kb) // 1024
+        nebula_env = self._get_configuration(configurations, 'nebula-env', {})
+        if str(nebula_env.get('cgroup_enabled', 'false')).lower() == 'true':
+            cgroup_mb = int(nebula_env.get('cgroup_storaged_memory_max_mb', 0) or 0)
+            if cgroup_mb:
+                memory_mb = min(memory_mb, cgroup_mb)
+        return min(cores), memory_mb
+
+    def _profile_configs(self, configurations, hosts, component_hosts=None):
+        """
+        当前workload_profile对应的推荐值，未选择profile或缺少主机信息时为{}
+        """
+        nebula_env = self._get_configuration(configurations, 'nebula-env', {})
+        profile = nebula_env.get('workload_profile', 'custom')
+        hardware = self._profile_hardware(configurations, hosts, component_hosts)
+        if profile not in WORKLOAD_PROFILES or hardware is None:
+            return profile, {}
+        return profile, workload_profile_configs(profile, hardware[0], hardware[1])
+
+    def _recommend_workload_profile_configs(self, configurations, hosts):
+        """
+        按workload_profile一次性推荐graphd和storaged的整组参数
+        """
+        try:
+            profile, recommended = self._profile_configs(configurations, hosts)
+            if not recommended:
+                return
+            for config_type in ('nebula-graphd-site', 'nebula-storaged-site'):
+                site = dict(recommended[config_type])
+                if config_type == 'nebula-storaged-site':
+                    current = self._get_configuration(configurations, config_type, {})
+                    try:
+                        cf_options = json.loads(current.get('rocksdb_column_family_options') or '{}')
+                    except ValueError:
+                        cf_options = {}
+                    for name in ('write_buffer_size', 'max_write_buffer_number'):
+                        cf_options[name] = site.pop(name)
+                    site['rocksdb_column_family_options'] = json.dumps(cf_options, sort_keys=True)
+                self._put_configuration(configurations, config_type, site)
+            print("Applied workload profile %s recommendations" % profile)
+        except Exception as e:
+            print("Error in _recommend_workload_profile_configs: %s" % str(e))
+
+    def _validate_profile_site(self, config_type, properties, configurations, services, hosts):
+        """
+        校验某个site中与workload_profile冲突的手工配置，冲突项给出WARN
+        """
+        profile, recommended = self._profile_configs(configurations, hosts, self._component_hosts(services))
+        if not recommended:
+            return []
+        return [{'type': 'configuration',
+                 'level': 'WARN',
+                 'message': message,
+                 'config-type': config_type,
+                 'config-name': name}
+                for name, message in profile_conflicts(profile, recommended[config_type], properties)]
+
+    def validate_graphd_site(self, properties, recommended_defaults, configurations, services, hosts):
+        return self._validate_profile_site('nebula-graphd-site', properties, configurations, services, hosts)
+
+    def validate_storaged_site(self, properties, recommended_defaults, configurations, services, hosts):
+        items = self._validate_profile_site('nebula-storaged-site', properties, configurations, services,
+                                            hosts)
+        order = properties.get('warmup_order')
+        if order and order not in WARMUP_ORDERS:
+            items.append({'type': 'configuration',
+                          'level': 'ERROR',
+                          'message': 'warmup_order must be one of {0}'.format(', '.join(WARMUP_ORDERS)),
+                          'config-type': 'nebula-storaged-site',
+                          'config-name': 'warmup_order'})
+        if str(properties.get('leader_drain_enabled', 'false')).lower() == 'true' and \
+                '{host}' not in (properties.get('leader_drain_statement') or ''):
+            items.append({'type': 'configuration',
+                          'level': 'ERROR',
+                          'message': 'leader_drain_statement must move leaders off the stopping host with {host}',
+                          'config-type': 'nebula-storaged-site',
+                          'config-name': 'leader_drain_statement'})
+        return items
+
     def _get_configuration(self, configurations, config_type, default_value=None):
         """
         获取配置
@@ -140,8 +458,13 @@ class NebulaServiceAdvisor(object):
     def get_service_configuration_validators(self):
         """
         获取配置验证器
+
+        Returns:
+            list: (config_type, 校验函数)，校验函数的参数为
+                (properties, recommended_defaults, configurations, services, hosts)
         """
-        return []
+        return [('nebula-graphd-site', self.validate_graphd_site),
+                ('nebula-storaged-site', self.validate_storaged_site)]
     
     def get_service_component_layout_validations(self, services, hosts):
         """
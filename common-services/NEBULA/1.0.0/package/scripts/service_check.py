@@ -43,6 +43,9 @@ class NebulaServiceCheck(Script):
         
         # 检查配置文件是否存在
         self.check_config_files()
+
+        # 报告主机OS配置与nebula-env的偏差
+        self.check_os_profile()
         
         print("Nebula service check completed successfully!")
 
@@ -87,5 +90,38 @@ class NebulaServiceCheck(Script):
         
         print("Configuration file check completed")
 
+    def check_os_profile(self):
+        """
+        比较本机内核取值和运行中守护进程的ulimit与OS性能配置，只报告不失败
+
+        服务检查只在一台主机上执行，各graphd/storaged主机的持续检查由
+        nebula_graphd_os_profile_drift和nebula_storaged_os_profile_drift告警完成。
+        """
+        import params
+        import nebula_os_profile
+        from nebula_utils import os_profile, os_profile_devices
+
+        if not params.os_profile_enabled:
+            return
+        if params.hostname not in params.graphd_hosts and params.hostname not in params.storaged_hosts:
+            print("No graphd or storaged on this host, OS profile check skipped; "
+                  "drift on daemon hosts is reported by the nebula_*_os_profile_drift alerts")
+            return
+
+        print("Checking OS performance profile...")
+        pids = []
+        for pid_file in (params.graphd_pid_file, params.storaged_pid_file):
+            try:
+                with open(pid_file) as f:
+                    pids.append(int(f.read().strip()))
+            except (IOError, OSError, ValueError):
+                continue
+        drift = nebula_os_profile.drift(os_profile(), os_profile_devices(), pids)
+        for setting, expected, actual in drift:
+            print("Warning: OS profile drift on %s: %s is %s, expected %s" % (
+                params.hostname, setting, 'unavailable' if actual is None else actual, expected))
+        if not drift:
+            print("OS profile matches nebula-env")
+
 if __name__ == "__main__":
     NebulaServiceCheck().execute()
\ No newline at end of file
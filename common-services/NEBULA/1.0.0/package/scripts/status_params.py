@@ -38,6 +38,7 @@ nebula_user = config['configurations']['nebula-env']['nebula_user']
 graphd_pid_file = format("{nebula_pid_dir}/nebula-graphd.pid")
 metad_pid_file = format("{nebula_pid_dir}/nebula-metad.pid")
 storaged_pid_file = format("{nebula_pid_dir}/nebula-storaged.pid")
+exporter_pid_file = format("{nebula_pid_dir}/nebula-exporter.pid")
 
 # Log directory
 nebula_log_dir = config['configurations']['nebula-env']['nebula_log_dir']
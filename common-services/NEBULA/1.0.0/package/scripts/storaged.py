@@ -20,6 +20,7 @@ limitations under the License.
 """
 
 import sys
+import time
 from resource_management import *
 from resource_management.libraries.script.script import Script
 from resource_management.libraries.functions import conf_select
@@ -28,7 +29,9 @@ from resource_management.core.resources.system import Execute, File, Directory
 from resource_management.core.source import InlineTemplate
 from resource_management.libraries.functions.check_process_status import check_process_status
 
-from nebula_utils import nebula_service, setup_nebula_config, generate_storaged_config
+from nebula_utils import nebula_service, setup_nebula_config, generate_storaged_config, setup_os_profile
+from nebula_utils import setup_compaction_schedule, compaction_scheduler_config
+from nebula_trace import traced
 import params
 
 class StoragedServer(Script):
@@ -55,6 +58,7 @@ class StoragedServer(Script):
         Execute(format('usermod -a -G {nebula_group} {nebula_user}'),
                 ignore_failures=True)
 
+    @traced('storaged.configure')
     def configure(self, env):
         """
         配置Storaged组件
@@ -69,6 +73,9 @@ class StoragedServer(Script):
         
         # 生成Storaged特定配置
         generate_storaged_config()
+
+        # 应用主机OS性能配置
+        setup_os_profile()
         
         # 创建Storaged数据目录
         Directory(params.storaged_data_path,
@@ -86,6 +93,10 @@ class StoragedServer(Script):
                   create_parents=True,
                   recursive_ownership=True)
 
+        # 计划压缩
+        setup_compaction_schedule()
+
+    @traced('storaged.start')
     def start(self, env, upgrade_type=None):
         """
         启动Storaged服务
@@ -101,6 +112,14 @@ class StoragedServer(Script):
         # 启动服务
         nebula_service('start', 'storaged')
 
+        # 预热page cache后再报告启动完成；守护进程已经启动，预热失败不影响START
+        if params.warmup_enabled:
+            try:
+                self._warm_up()
+            except Exception as e:
+                print("Warning: warm-up aborted, storaged is running without it: %s" % e)
+
+    @traced('storaged.stop')
     def stop(self, env, upgrade_type=None):
         """
         停止Storaged服务
@@ -109,10 +128,63 @@ class StoragedServer(Script):
         env.set_params(params)
         
         print("Stopping Nebula Storaged...")
+
+        # 先迁走本机leader，避免写入等待选举超时；迁移失败不阻止停止
+        if params.leader_drain_enabled:
+            try:
+                self._drain_leaders()
+            except Exception as e:
+                print("Warning: leader drain aborted, stopping anyway: %s" % e)
         
         # 停止服务
         nebula_service('stop', 'storaged')
 
+    @traced('storaged.force_stop')
+    def force_stop(self, env):
+        """
+        紧急停止，跳过leader迁移
+        """
+        import params
+        env.set_params(params)
+
+        print("Force stopping Nebula Storaged without draining leaders...")
+        nebula_service('stop', 'storaged')
+
+    @traced('storaged.drain_leaders')
+    def _drain_leaders(self):
+        """
+        请求metad迁走本机leader并等待其降为0或超时
+        """
+        import params
+        from nebula_balance import LeaderDrain, format_drain
+        from nebula_ngql import NgqlError, session_factory
+        from nebula_topology import TopologyCache, format_partitions
+
+        if not params.graphd_hosts:
+            print("No graphd hosts, leader drain skipped")
+            return
+        session = session_factory(params.nebula_console_bin, params.graphd_hosts, params.graphd_port,
+                                  params.nebula_console_user, params.nebula_console_password, timeout=30)(0)
+        # 拓扑只用于输出本机担任leader的分片，graphd不可用等失败不影响迁移和停止
+        try:
+            cache = TopologyCache(params.topology_cache_file, params.topology_cache_max_age_secs)
+            cache.load()
+            cache.refresh(session)
+            leading = cache.partitions('{0}:{1}'.format(params.hostname, params.storaged_port), leaders_only=True)
+            print("Leader of partitions: %s" % (format_partitions(leading) or 'none'))
+        except (NgqlError, OSError, IOError, ValueError) as e:
+            print("Warning: partition topology not available: %s" % e)
+        try:
+            report = LeaderDrain(session, params.hostname, params.storaged_port,
+                                 statement=params.leader_drain_statement,
+                                 timeout=params.leader_drain_timeout_secs).drain()
+        except (NgqlError, OSError) as e:
+            # nebula-console或graphd不可用时照常停止
+            print("Warning: leader drain skipped: %s" % e)
+            return
+        for line in format_drain(report):
+            print(line)
+
     def status(self, env):
         """
         检查Storaged服务状态
@@ -131,6 +203,89 @@ class StoragedServer(Script):
         self.stop(env)
         self.start(env)
 
+    def compact(self, env):
+        """
+        立即执行一轮压缩调度，忽略时间窗口但仍按延迟暂停
+        """
+        import params
+        env.set_params(params)
+
+        from nebula_compaction import lock_history, scheduler_from_config
+
+        Directory(params.compaction_dir,
+                  owner=params.nebula_user,
+                  group=params.nebula_group,
+                  mode=0o755,
+                  create_parents=True)
+
+        lock = lock_history(params.compaction_history_file)
+        if lock is None:
+            raise Fail("Another compaction run is in progress; wait for it to finish before running COMPACT.")
+        try:
+            print("Running compaction for %s..." % (', '.join(params.compaction_spaces) or 'all spaces'))
+            for record in scheduler_from_config(compaction_scheduler_config()).run(force=True):
+                print("Space %s job %s: %s in %ss, paused %ss" % (
+                    record['space'], record['job_id'], record['status'],
+                    record['duration_secs'], record['paused_secs']))
+        finally:
+            lock.close()
+
+    @traced('storaged.warm_up')
+    def _warm_up(self):
+        """
+        把最热的SST文件预读进page cache，等本机ONLINE后执行预热查询
+        """
+        import params
+        from nebula_ngql import session_factory
+        from nebula_warmup import (WARMUP_ONLINE_WAIT_SECS, WARMUP_ORDERS, PageCacheWarmer, list_sst_files,
+                                   run_warmup_queries, select_files, wait_until_online)
+
+        started = time.time()
+        order = params.warmup_order
+        if order not in WARMUP_ORDERS:
+            print("Warning: unknown warmup_order %s, using recent" % order)
+            order = 'recent'
+        data_paths = [path.strip() for path in params.storaged_data_path.split(',') if path.strip()]
+        files = select_files(list_sst_files(data_paths), params.warmup_budget_mb * 1024 * 1024, order)
+        print("Warming %d SST files (%.1f MB) from %s..." % (
+            len(files), sum(item['size'] for item in files) / 1048576.0, ', '.join(data_paths)))
+
+        def progress(done, total, warmed_bytes):
+            if done == total or done % max(1, total // 10) == 0:
+                print("Warmed %d/%d files, %.1f MB" % (done, total, warmed_bytes / 1048576.0))
+
+        warmer = PageCacheWarmer(workers=params.warmup_workers,
+                                 rate_bytes_per_sec=params.warmup_rate_mb_per_sec * 1024 * 1024,
+                                 deadline_secs=params.warmup_timeout_secs,
+                                 progress=progress)
+        summary = warmer.warm(files)
+        print("Page cache warm-up: %d files, %.1f MB in %.1fs%s" % (
+            summary['files'], summary['bytes'] / 1048576.0, summary['seconds'],
+            ' (stopped at timeout)' if summary['timed_out'] else ''))
+        for error in summary['errors']:
+            print("Warning: warm-up failed for %s" % error)
+
+        if not params.warmup_queries or not params.graphd_hosts:
+            return
+        if params.warmup_timeout_secs > 0:
+            remaining = params.warmup_timeout_secs - (time.time() - started)
+            if remaining <= 0:
+                print("Warning: warm-up timeout of %ds reached, warm-up queries skipped" % params.warmup_timeout_secs)
+                return
+        else:
+            # 不限时长时预热查询最多等待ONLINE的默认时间
+            remaining = WARMUP_ONLINE_WAIT_SECS
+        session = session_factory(params.nebula_console_bin, params.graphd_hosts, params.graphd_port,
+                                  params.nebula_console_user, params.nebula_console_password)(0)
+        if not wait_until_online(session, params.hostname, params.storaged_port, timeout_secs=remaining):
+            print("Warning: storaged on %s is not ONLINE yet, warm-up queries skipped" % params.hostname)
+            return
+        for statement, seconds, error in run_warmup_queries(session, params.warmup_queries):
+            if error:
+                print("Warning: warm-up query failed after %.3fs: %s: %s" % (seconds, statement, error))
+            else:
+                print("Warm-up query %.3fs: %s" % (seconds, statement))
+
     def get_log_folder(self):
         """
         获取日志目录
@@ -136,6 +136,2238 @@ class TestAlertScripts(unittest.TestCase):
         except ImportError:
             self.skipTest("alert_graphd_process module not available")
 
+class TestLeaderSkewAlert(unittest.TestCase):
+    """测试leader偏斜告警"""
+
+    def test_coefficient_of_variation(self):
+        from alert_leader_skew import coefficient_of_variation
+
+        self.assertEqual(coefficient_of_variation([5, 5, 5]), 0.0)
+        self.assertAlmostEqual(coefficient_of_variation([0, 10]), 1.0)
+        self.assertEqual(coefficient_of_variation([]), 0.0)
+
+    def test_evaluate_flags_hot_hosts(self):
+        from alert_leader_skew import evaluate
+
+        code, labels = evaluate({'s1': 10, 's2': 10, 's3': 10}, {'s1': 100.0, 's2': 90.0, 's3': 110.0}, 30, 60)
+        self.assertEqual(code, 'OK')
+
+        code, labels = evaluate({'s1': 14, 's2': 8, 's3': 8}, {}, 30, 60)
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('s1 leaders 14 (+40%)', labels[0])
+
+        code, labels = evaluate({'s1': 20, 's2': 5, 's3': 5}, {}, 30, 60)
+        self.assertEqual(code, 'CRITICAL')
+
+        code, labels = evaluate({'s1': 10, 's2': 10}, {'s1': 500.0, 's2': 100.0}, 30, 60)
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('s1 requests 500/s', labels[0])
+
+    def test_execute_without_graphd_hosts(self):
+        import alert_leader_skew
+
+        code, labels = alert_leader_skew.execute({})
+        self.assertEqual(code, 'UNKNOWN')
+
+    def test_only_the_metad_leader_probes(self):
+        import alert_leader_skew as alert
+
+        statements = []
+
+        class Session(object):
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def execute(self, statement):
+                statements.append(statement)
+                if statement == 'SHOW META LEADER':
+                    return [{'Meta Leader': '"m1":9559'}]
+                return [_host_row('s1', 5)]
+
+        configurations = {alert.GRAPHD_HOSTS_KEY: ['g1'], alert.GRAPHD_PORT_KEY: '9669',
+                          alert.STORAGED_HTTP_PORT_KEY: '19779'}
+        with patch.object(alert, 'ConsoleSession', Session):
+            code, labels = alert.execute(configurations, {}, 'm2')
+            self.assertEqual((code, statements), ('OK', ['SHOW META LEADER']))
+            code, labels = alert.execute(configurations, {}, 'm1')
+        self.assertEqual(statements[1:], ['SHOW META LEADER', 'SHOW HOSTS'])
+        self.assertIn('leader skew does not apply', labels[0])
+
+
+class TestFleetLivenessAlert(unittest.TestCase):
+    """测试基于metad的全集群存活告警"""
+
+    def test_show_fleet_reads_both_tables(self):
+        from nebula_ngql import parse_console_tables, show_fleet
+
+        output = '\n'.join([
+            '+----------+------+----------+',
+            '| Host     | Port | Status   |',
+            '+----------+------+----------+',
+            '| "g1"     | 9669 | "ONLINE" |',
+            '+----------+------+----------+',
+            'Got 1 rows (time spent 1.2ms/2.1ms)',
+            '+----------+------+-----------+',
+            '| Host     | Port | Status    |',
+            '+----------+------+-----------+',
+            '| "s1"     | 9779 | "ONLINE"  |',
+            '| "s2"     | 9779 | "OFFLINE" |',
+            '+----------+------+-----------+',
+            'Got 2 rows (time spent 1.0ms/1.9ms)'])
+        tables = parse_console_tables(output)
+        self.assertEqual(len(tables), 2)
+
+        class Session(object):
+            statements = []
+
+            def execute_all(self, statement):
+                self.statements.append(statement)
+                return tables
+
+        session = Session()
+        fleet = show_fleet(session)
+        self.assertEqual(session.statements, ['SHOW HOSTS GRAPH; SHOW HOSTS STORAGE'])
+        self.assertEqual(fleet['graphd'], [{'host': 'g1', 'port': 9669, 'status': 'ONLINE'}])
+        self.assertEqual([host['status'] for host in fleet['storaged']], ['ONLINE', 'OFFLINE'])
+
+    def test_evaluate_tracks_offline_age(self):
+        from alert_fleet_liveness import evaluate
+
+        def fleet(down=()):
+            return {'graphd': [{'host': 'g1', 'port': 9669, 'status': 'ONLINE'}],
+                    'storaged': [{'host': 's{0}'.format(i), 'port': 9779,
+                                  'status': 'OFFLINE' if i in down else 'ONLINE'} for i in range(1, 5)]}
+
+        expected = {'graphd': ['g1'], 'storaged': ['s1', 's2', 's3', 's4']}
+        state = {}
+        code, labels = evaluate(fleet(), expected, state, 1000.0, 300, 50)
+        self.assertEqual(code, 'OK')
+        self.assertEqual(state['storaged s2:9779'], 1000.0)
+
+        code, labels = evaluate(fleet(down=(2,)), expected, state, 1060.0, 300, 50)
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('Offline: storaged s2:9779 for 60s', labels[0])
+
+        code, labels = evaluate(fleet(down=(2,)), expected, state, 1400.0, 300, 50)
+        self.assertEqual(code, 'CRITICAL')
+        self.assertIn('storaged s2:9779 for 400s', labels[0])
+
+        # 半数storaged同时离线
+        code, labels = evaluate(fleet(down=(3, 4)), expected, {}, 1400.0, 300, 50)
+        self.assertEqual(code, 'CRITICAL')
+
+        expected['storaged'].append('s5')
+        code, labels = evaluate(fleet(), expected, state, 1460.0, 300, 50)
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('Not registered: storaged s5', labels[0])
+
+    def test_only_the_metad_leader_lists_hosts(self):
+        import shutil
+        import tempfile
+        import alert_fleet_liveness as alert
+
+        pid_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pid_dir)
+        statements = []
+
+        class Session(object):
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def execute(self, statement):
+                statements.append(statement)
+                return [{'Meta Leader': '"m1":9559', 'secs from last heart beat': '1'}]
+
+            def execute_all(self, statement):
+                statements.append(statement)
+                return [[{'Host': 'g1', 'Port': '9669', 'Status': 'ONLINE'}],
+                        [{'Host': 's1', 'Port': '9779', 'Status': 'ONLINE'}]]
+
+        configurations = {alert.GRAPHD_HOSTS_KEY: ['g1'], alert.STORAGED_HOSTS_KEY: ['s1'],
+                          alert.GRAPHD_PORT_KEY: '9669', alert.PID_DIR_KEY: pid_dir}
+        with patch.object(alert, 'ConsoleSession', Session):
+            code, labels = alert.execute(configurations, {}, 'm2')
+            self.assertEqual((code, statements), ('OK', ['SHOW META LEADER']))
+            self.assertIn('metad leader m1', labels[0])
+            code, labels = alert.execute(configurations, {}, 'm1')
+        self.assertEqual(code, 'OK')
+        self.assertEqual(statements[1:], ['SHOW META LEADER', 'SHOW HOSTS GRAPH; SHOW HOSTS STORAGE'])
+        self.assertTrue(os.path.exists(os.path.join(pid_dir, alert.STATE_FILE)))
+
+
+class TestDiskForecastAlert(unittest.TestCase):
+    """测试磁盘写满预测告警"""
+
+    def test_history_persists_in_series_file(self):
+        from alert_storaged_disk_forecast import DiskHistory
+        import nebula_tsdb
+
+        path = os.path.join(tempfile.mkdtemp(), 'history.bin')
+        history = DiskHistory(path, capacity=4)
+        for hour in range(6):
+            self.assertTrue(history.record(hour * 3600.0, hour * 10.0, min_interval=3600))
+        # 同一采样间隔内的样本和回拨的时钟都被跳过
+        self.assertFalse(history.record(5 * 3600.0 + 60, 55.0, min_interval=3600))
+        self.assertFalse(history.record(3600.0, 5.0, min_interval=3600))
+        history.save()
+
+        loaded = DiskHistory(path, capacity=4)
+        self.assertEqual(loaded.samples(), [(7200, 20.0), (10800, 30.0), (14400, 40.0), (18000, 50.0)])
+        self.assertEqual(loaded.last_timestamp(), 18000)
+        loaded.save()
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(4), nebula_tsdb.MAGIC)
+        self.assertEqual(os.path.getsize(path), loaded.series.size)
+
+    def test_history_two_weeks_fit_in_series_file(self):
+        from alert_storaged_disk_forecast import DiskHistory, HISTORY_CAPACITY
+
+        gib = 1024.0 ** 3
+        path = os.path.join(tempfile.mkdtemp(), 'history.bin')
+        history = DiskHistory(path)
+        for hour in range(HISTORY_CAPACITY + 24):
+            history.record(1700000000 + hour * 3600 + hour % 7, 100 * gib + hour * 37 * 1024 ** 2, 3000)
+        samples = history.samples()
+        history.save()
+        self.assertEqual(len(samples), HISTORY_CAPACITY)
+        self.assertEqual(samples[-1][0], 1700000000 + (HISTORY_CAPACITY + 23) * 3600 + (HISTORY_CAPACITY + 23) % 7)
+        self.assertLess(os.path.getsize(path), HISTORY_CAPACITY * 16)
+
+    def test_legacy_history_is_imported(self):
+        from alert_storaged_disk_forecast import (DiskHistory, HISTORY_CAPACITY, _LEGACY_HEADER,
+                                                  history_file, legacy_history_file)
+        import array
+
+        history_dir = tempfile.mkdtemp()
+        legacy = legacy_history_file(history_dir, '/data/storage')
+        values = array.array('d', [0.0]) * (HISTORY_CAPACITY * 2)
+        for i in range(3):
+            values[i * 2], values[i * 2 + 1] = i * 3600.0, i * 10.0
+        with open(legacy, 'wb') as f:
+            f.write(_LEGACY_HEADER.pack(3, 3))
+            values.tofile(f)
+
+        history = DiskHistory(history_file(history_dir, '/data/storage'))
+        self.assertEqual(history.import_legacy(legacy), 3)
+        self.assertEqual(history.samples(), [(0, 0.0), (3600, 10.0), (7200, 20.0)])
+        history.save()
+        self.assertFalse(os.path.exists(legacy))
+        self.assertTrue(os.path.basename(history_file(history_dir, '/data/storage')).startswith('nebula-tsdb-'))
+
+    def test_execute_records_history(self):
+        import alert_storaged_disk_forecast as alert
+
+        history_dir = tempfile.mkdtemp()
+        configurations = {alert.STORAGED_DATA_PATH_KEY: history_dir}
+        parameters = {alert.HISTORY_DIR_PARAM: history_dir}
+        for _ in range(2):
+            code, labels = alert.execute(configurations, parameters, 'storaged1')
+            self.assertEqual(code, 'OK')
+        self.assertIn('not enough history', labels[0])
+        history = alert.DiskHistory(alert.history_file(history_dir, history_dir))
+        self.assertEqual(len(history.samples()), 1)
+        history.save()
+
+    def test_trend_ignores_compaction_spikes(self):
+        from alert_storaged_disk_forecast import days_to_full
+
+        gib = 1024.0 ** 3
+        samples = []
+        for hour in range(48):
+            used = 100 * gib + hour * gib
+            # 每6小时一次压缩把用量临时推高20GiB
+            if hour % 6 == 3:
+                used += 20 * gib
+            samples.append((hour * 3600.0, used))
+        days = days_to_full(samples, 240 * gib)
+        self.assertAlmostEqual(days, 10.0, delta=0.5)
+        self.assertIsNone(days_to_full(samples[:6], 240 * gib))
+        self.assertIsNone(days_to_full([(t, 100.0) for t, _ in samples], 240 * gib))
+
+    def test_classify(self):
+        from alert_storaged_disk_forecast import classify
+
+        self.assertEqual(classify(None, 14, 3), 'OK')
+        self.assertEqual(classify(20, 14, 3), 'OK')
+        self.assertEqual(classify(10, 14, 3), 'WARNING')
+        self.assertEqual(classify(1, 14, 3), 'CRITICAL')
+
+
+class LoopbackSession(object):
+    """记录语句的nebula-console替身"""
+
+    def __init__(self, statements, fail_on=None):
+        self.statements = statements
+        self.fail_on = fail_on
+
+    def execute(self, statement):
+        from nebula_ngql import NgqlError
+        self.statements.append(statement)
+        if self.fail_on and self.fail_on in statement:
+            raise NgqlError('SemanticError: injected', -1009)
+        return []
+
+
+class TestBenchmark(unittest.TestCase):
+    """测试压测负载生成器"""
+
+    def test_write_phase_covers_all_vertices(self):
+        from nebula_benchmark import WorkloadGenerator, run_phase
+
+        statements = []
+        generator = WorkloadGenerator(vertex_count=250, batch_size=100)
+        result = run_phase('insert_vertex', generator,
+                           lambda slot: LoopbackSession(statements), concurrency=3)
+
+        self.assertEqual(result['operations'], 3)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(len(statements), 3)
+        inserted = sum(statement.count(':("v') for statement in statements)
+        self.assertEqual(inserted, 250)
+
+    def test_read_phase_excludes_warmup_and_counts_errors(self):
+        from nebula_benchmark import WorkloadGenerator, run_phase
+
+        statements = []
+        generator = WorkloadGenerator(vertex_count=10, hops=3)
+        result = run_phase('go', generator,
+                           lambda slot: LoopbackSession(statements, fail_on='FROM 0 '),
+                           concurrency=2, rate=200, warmup_secs=0.05, duration_secs=0.1)
+
+        self.assertTrue(statements[0].startswith('GO 3 STEPS FROM'))
+        # 预热期间执行的语句不计入结果
+        self.assertLess(result['operations'] + result['errors'], len(statements))
+        self.assertGreater(result['operations'], 0)
+        self.assertEqual(result['warmup_secs'], 0.05)
+
+    def test_console_failures_count_as_errors(self):
+        from nebula_benchmark import WorkloadGenerator, run_phase
+
+        class BrokenConsole(object):
+            def execute(self, statement):
+                raise OSError(2, 'No such file or directory')
+
+        def factory(slot):
+            if slot == 1:
+                raise RuntimeError('authentication failed')
+            return BrokenConsole()
+
+        generator = WorkloadGenerator(vertex_count=250, batch_size=100)
+        result = run_phase('insert_vertex', generator, factory, concurrency=2)
+        # 3个批次的OSError加上1个会话创建失败
+        self.assertEqual((result['operations'], result['errors']), (0, 4))
+        self.assertIn('authentication failed', result['last_error'])
+
+    def test_statements_are_deterministic(self):
+        from nebula_benchmark import WorkloadGenerator
+
+        first = WorkloadGenerator(vertex_count=1000, seed=7)
+        second = WorkloadGenerator(vertex_count=1000, seed=7)
+        for phase in ('insert_edge', 'go', 'match'):
+            self.assertEqual(first.statement(phase, 5), second.statement(phase, 5))
+
+    def test_histogram_percentiles(self):
+        from nebula_benchmark import LatencyHistogram
+
+        histogram = LatencyHistogram()
+        for latency in range(1, 101):
+            histogram.record(latency * 100)
+        summary = histogram.to_dict()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['max_us'], 10000)
+        self.assertLessEqual(summary['p50_us'], 8192)
+        self.assertEqual(summary['p99_us'], 10000)
+
+
+class TestBulkLoad(unittest.TestCase):
+    """测试CSV批量导入"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.tmp_dir, 'person.csv')
+        with open(self.csv_file, 'w') as f:
+            f.write('id,name,age\n')
+            for index in range(200):
+                f.write('p{0},"name {0}",{1}\n'.format(index, index % 90))
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp_dir)
+
+    def _formatter(self):
+        from nebula_bulk_load import RowFormatter
+        return RowFormatter('vertex', 'person', [':vid', 'name:string', 'age:int'])
+
+    def test_format_vertex_and_edge_rows(self):
+        from nebula_bulk_load import RowFormatter
+
+        self.assertEqual(self._formatter().format(['p1', 'say "hi"', '']),
+                         '"p1":("say \\"hi\\"", NULL)')
+        edge = RowFormatter('edge', 'follow', [':src', ':dst', ':rank', 'degree:double'], vid_type='int64')
+        self.assertEqual(edge.header(), 'INSERT EDGE follow(degree) VALUES ')
+        self.assertEqual(edge.format(['1', '2', '3', '0.5']), '1->2@3:(0.5)')
+
+    def test_load_splits_failed_batches_and_checkpoints(self):
+        from nebula_bulk_load import BulkLoader, Checkpoint, read_rows, iter_batches
+
+        statements = []
+
+        class OversizeRejectingSession(LoopbackSession):
+            def execute(self, statement):
+                from nebula_ngql import NgqlError
+                if statement.count('"p') > 8:
+                    raise NgqlError('SemanticError: statement exceeds the max allowed size', -1009)
+                return LoopbackSession.execute(self, statement)
+
+        formatter = self._formatter()
+        checkpoint_file = os.path.join(self.tmp_dir, 'checkpoint.json')
+        checkpoint = Checkpoint(checkpoint_file, self.csv_file)
+        loader = BulkLoader(lambda slot: OversizeRejectingSession(statements), concurrency=3)
+        batches = iter_batches(read_rows(self.csv_file, header=True), formatter, max_bytes=1024)
+        stats = loader.load(formatter, batches, checkpoint)
+
+        self.assertEqual(stats['rows'], 200)
+        self.assertEqual(stats['rejected'], 0)
+        self.assertGreater(stats['splits'], 0)
+        self.assertTrue(all(len(statement) <= 1024 for statement in statements))
+
+        resumed = Checkpoint(checkpoint_file, self.csv_file)
+        self.assertEqual(resumed.offset, os.path.getsize(self.csv_file))
+        self.assertEqual(list(read_rows(self.csv_file, start_offset=resumed.offset)), [])
+
+    def test_rejects_row_after_retries(self):
+        from nebula_bulk_load import BulkLoader, RejectFile, read_rows, iter_batches
+
+        formatter = self._formatter()
+        rejects = RejectFile(os.path.join(self.tmp_dir, 'person.rejects'))
+        loader = BulkLoader(lambda slot: LoopbackSession([], fail_on='"p7"'),
+                            concurrency=2, max_retries=2, sleep=lambda secs: None)
+        stats = loader.load(formatter, iter_batches(read_rows(self.csv_file, header=True), formatter),
+                            rejects=rejects)
+
+        self.assertEqual(stats['rows'], 199)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertIn('"p7"', stats['errors'][0])
+        self.assertEqual([fields for _, fields in read_rows(rejects.path)], [['p7', 'name 7', '7']])
+
+    def test_transient_errors_retry_the_whole_batch(self):
+        from nebula_bulk_load import BulkLoader, read_rows, iter_batches
+        from nebula_ngql import NgqlError
+
+        statements = []
+        sleeps = []
+
+        class FlakySession(LoopbackSession):
+            failures = [NgqlError('Storage Error: The leader has changed. Try again later', -1005),
+                        NgqlError('nebula-console exited with code -9')]
+
+            def execute(self, statement):
+                if self.failures:
+                    raise self.failures.pop(0)
+                return LoopbackSession.execute(self, statement)
+
+        formatter = self._formatter()
+        loader = BulkLoader(lambda slot: FlakySession(statements), concurrency=1, max_retries=3,
+                            retry_backoff=0.5, sleep=sleeps.append)
+        stats = loader.load(formatter, iter_batches(read_rows(self.csv_file, header=True), formatter))
+        self.assertEqual((stats['rows'], stats['retries'], stats['splits'], stats['rejected']), (200, 2, 0, 0))
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+        class DownSession(LoopbackSession):
+            def execute(self, statement):
+                raise NgqlError('Storage Error: RPC failure', -3)
+
+        loader = BulkLoader(lambda slot: DownSession([]), concurrency=2, max_retries=1, sleep=lambda secs: None)
+        self.assertRaises(NgqlError, loader.load, formatter,
+                          iter_batches(read_rows(self.csv_file, header=True), formatter, max_bytes=256))
+        self.assertEqual(loader.stats['rejected'], 0)
+
+    def test_failed_session_factory_does_not_hang(self):
+        from nebula_bulk_load import BulkLoader, Checkpoint, read_rows, iter_batches
+        from nebula_ngql import NgqlError
+
+        def factory(slot):
+            raise NgqlError('Unable to connect to graphd hosts: g1')
+
+        formatter = self._formatter()
+        checkpoint = Checkpoint(os.path.join(self.tmp_dir, 'checkpoint.json'), self.csv_file)
+        loader = BulkLoader(factory, concurrency=2)
+        # 每批一行，远多于队列容量
+        batches = iter_batches(read_rows(self.csv_file, header=True), formatter, max_bytes=60)
+        self.assertRaises(NgqlError, loader.load, formatter, batches, checkpoint)
+        self.assertEqual(checkpoint.offset, 0)
+
+    def test_malformed_rows_are_rejected(self):
+        from nebula_bulk_load import BulkLoader, RejectFile, read_rows, iter_batches
+
+        path = os.path.join(self.tmp_dir, 'bad.csv')
+        with open(path, 'w') as f:
+            f.write('p1,alice,30\np2,bob\np3,carol,old\np4,dave,40\n')
+        formatter = self._formatter()
+        statements = []
+        rejects = RejectFile(os.path.join(self.tmp_dir, 'bad.rejects'))
+        loader = BulkLoader(lambda slot: LoopbackSession(statements), concurrency=1)
+        stats = loader.load(formatter, iter_batches(read_rows(path), formatter, rejected=loader.reject),
+                            rejects=rejects)
+        self.assertEqual((stats['rows'], stats['rejected']), (2, 2))
+        self.assertEqual([fields for _, fields in read_rows(rejects.path)],
+                         [['p2', 'bob'], ['p3', 'carol', 'old']])
+        self.assertNotIn('old', statements[0])
+
+    def test_quoted_fields_with_newlines(self):
+        from nebula_bulk_load import read_rows
+
+        path = os.path.join(self.tmp_dir, 'multiline.csv')
+        with open(path, 'wb') as f:
+            f.write(b'p1,"line one\nline two",3\np2,"\xe5\xbc\xa0",4\n')
+        rows = list(read_rows(path))
+        self.assertEqual([fields for _, fields in rows],
+                         [['p1', 'line one\nline two', '3'], ['p2', u'\u5f20', '4']])
+        # 从第一条记录结束处恢复时不会拆开引号内的换行
+        self.assertEqual([fields for _, fields in read_rows(path, start_offset=rows[0][0])],
+                         [['p2', u'\u5f20', '4']])
+        self.assertEqual(rows[-1][0], os.path.getsize(path))
+
+
+class FakeJobSession(object):
+    """模拟graphd作业语句的会话"""
+
+    def __init__(self, polls_until_finished=2):
+        self.statements = []
+        self.polls_until_finished = polls_until_finished
+        self.polls = {}
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if 'SUBMIT JOB COMPACT' in statement:
+            return [{'New Job Id': str(len(self.polls) + 1)}]
+        if 'SHOW JOB' in statement:
+            job_id = statement.split()[-1]
+            self.polls[job_id] = self.polls.get(job_id, 0) + 1
+            finished = self.polls[job_id] >= self.polls_until_finished
+            return [{'Status': 'FINISHED' if finished else 'RUNNING'}]
+        return []
+
+
+class TestCompactionScheduler(unittest.TestCase):
+    """测试计划压缩调度"""
+
+    def test_window_wraps_midnight(self):
+        import datetime
+        from nebula_compaction import in_window
+
+        self.assertTrue(in_window('23:00-02:00', datetime.datetime(2024, 1, 1, 23, 30)))
+        self.assertTrue(in_window('23:00-02:00', datetime.datetime(2024, 1, 1, 1, 59)))
+        self.assertFalse(in_window('23:00-02:00', datetime.datetime(2024, 1, 1, 2, 0)))
+        self.assertFalse(in_window('02:00-05:00', datetime.datetime(2024, 1, 1, 12, 0)))
+        self.assertRaises(ValueError, in_window, '2am-5am', datetime.datetime(2024, 1, 1))
+
+    def test_pauses_on_latency_and_records_history(self):
+        from nebula_compaction import CompactionScheduler
+
+        latencies = iter([1000, 1000, 5000, 1000, 1000, 1000, 1000, 1000])
+
+        def fetch(host, port):
+            return {'get_neighbors_latency_us.p99.60': next(latencies, 1000),
+                    'rocksdb_compaction_pending': 3}
+
+        session = FakeJobSession()
+        history_file = os.path.join(tempfile.mkdtemp(), 'history.jsonl')
+        scheduler = CompactionScheduler(session, [('storaged1', 19779)], '02:00-05:00',
+                                        spaces=['s1', 's2'], latency_floor_us=2000,
+                                        history_file=history_file, fetch=fetch,
+                                        sleep=lambda secs: None)
+        history = scheduler.run(force=True)
+
+        self.assertEqual([record['space'] for record in history], ['s1', 's2'])
+        self.assertTrue(all(record['status'] == 'FINISHED' for record in history))
+        self.assertIn('USE `s1`; STOP JOB 1', session.statements)
+        self.assertIn('USE `s1`; RECOVER JOB 1', session.statements)
+        self.assertEqual(len(history[0]['pauses']), 1)
+        # 同时只运行一个作业
+        self.assertLess(session.statements.index('USE `s1`; SHOW JOB 1'),
+                        session.statements.index('USE `s2`; SUBMIT JOB COMPACT'))
+        with open(history_file) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_forced_run_stops_at_deadline_and_keeps_paused_time(self):
+        from nebula_compaction import CompactionScheduler, lock_history
+
+        clock = [0.0]
+
+        def sleep(secs):
+            clock[0] += secs
+
+        # 延迟一直高于阈值，作业暂停后不会恢复
+        latencies = iter([1000, 1000])
+
+        def fetch(host, port):
+            return {'get_neighbors_latency_us.p99.60': next(latencies, 50000)}
+
+        session = FakeJobSession(polls_until_finished=1000)
+        scheduler = CompactionScheduler(session, [('storaged1', 19779)], '02:00-05:00', spaces=['s1'],
+                                        latency_floor_us=2000, poll_interval=30, max_runtime_secs=300,
+                                        fetch=fetch, sleep=sleep, clock=lambda: clock[0])
+        history = scheduler.run(force=True)
+
+        self.assertEqual(history[0]['status'], 'DEADLINE_EXCEEDED')
+        self.assertGreater(history[0]['paused_secs'], 0)
+        self.assertGreaterEqual(clock[0], 300)
+        # 已暂停的作业不会再次STOP
+        self.assertEqual(session.statements.count('USE `s1`; STOP JOB 1'), 1)
+
+        history_file = os.path.join(tempfile.mkdtemp(), 'history.jsonl')
+        lock = lock_history(history_file)
+        self.assertIsNotNone(lock)
+        self.assertIsNone(lock_history(history_file))
+        lock.close()
+
+    def test_stopped_and_unknown_job_states_are_final(self):
+        from nebula_compaction import CompactionScheduler, job_finished
+
+        class StoppedJobSession(FakeJobSession):
+            def execute(self, statement):
+                if 'SHOW JOB' in statement:
+                    self.statements.append(statement)
+                    return [{'Status': 'STOPPED'}]
+                return FakeJobSession.execute(self, statement)
+
+        clock = [0.0]
+
+        def sleep(secs):
+            clock[0] += secs
+
+        session = StoppedJobSession()
+        scheduler = CompactionScheduler(session, [], '02:00-05:00', spaces=['s1'], poll_interval=30,
+                                        max_runtime_secs=3600, fetch=None, sleep=sleep, clock=lambda: clock[0])
+        history = scheduler.run(force=True)
+        self.assertEqual(history[0]['status'], 'STOPPED')
+        self.assertEqual(clock[0], 0)
+        self.assertTrue(job_finished('REMOVED'))
+        self.assertFalse(job_finished('QUEUE'))
+
+    def test_skips_outside_window(self):
+        import datetime
+        from nebula_compaction import CompactionScheduler
+
+        session = FakeJobSession()
+        scheduler = CompactionScheduler(session, [], '02:00-05:00', spaces=['s1'],
+                                        now=lambda: datetime.datetime(2024, 1, 1, 12, 0))
+        self.assertEqual(scheduler.run(), [])
+        self.assertEqual(session.statements, [])
+
+
+class FakeBalanceSession(object):
+    """按SHOW HOSTS/SHOW JOB脚本化返回结果的会话"""
+
+    def __init__(self, hosts_before, hosts_after, job_polls):
+        self.hosts = [hosts_before, hosts_after]
+        self.job_polls = list(job_polls)
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if statement == 'SHOW HOSTS':
+            return self.hosts.pop(0)
+        if 'SUBMIT JOB BALANCE' in statement:
+            return [{'New Job Id': '12'}]
+        if 'SHOW JOB' in statement:
+            return self.job_polls.pop(0) if len(self.job_polls) > 1 else self.job_polls[0]
+        return []
+
+
+def _host_row(host, leaders):
+    return {'Host': host, 'Port': '9779', 'Status': 'ONLINE', 'Leader count': str(leaders),
+            'Leader distribution': 'g1:{0}'.format(leaders), 'Partition distribution': 'g1:10'}
+
+
+class TestBalanceOrchestrator(unittest.TestCase):
+    """测试leader均衡编排"""
+
+    def _job(self, status, task_states):
+        rows = [{'Job Id(spaceId:partId)': '12', 'Status': status}]
+        rows.extend({'Job Id(spaceId:partId)': '12, 1:{0}'.format(i), 'Status': state}
+                    for i, state in enumerate(task_states))
+        rows.append({'Job Id(spaceId:partId)': 'Total:{0}'.format(len(task_states)),
+                     'Command(src->dst)': 'Succeeded:0', 'Status': 'Failed:0'})
+        return rows
+
+    def test_balance_reports_before_and_after(self):
+        from nebula_balance import BalanceOrchestrator, format_report
+
+        session = FakeBalanceSession(
+            [_host_row('s1', 10), _host_row('s2', 0)],
+            [_host_row('s1', 5), _host_row('s2', 5)],
+            [self._job('RUNNING', ['IN PROGRESS', 'SUCCEEDED']), self._job('FINISHED', ['SUCCEEDED', 'SUCCEEDED'])])
+        report = BalanceOrchestrator(session, sleep=lambda secs: None).balance('LEADER')
+
+        self.assertEqual(report['g1']['skew_before'], 2.0)
+        self.assertEqual(report['g1']['skew_after'], 0.0)
+        self.assertEqual(report['g1']['job']['status'], 'FINISHED')
+        self.assertIn('USE `g1`; SUBMIT JOB BALANCE LEADER', session.statements)
+        self.assertIn('  s2:9779: 0 -> 5', format_report(report))
+
+    def test_balance_skips_even_spaces(self):
+        from nebula_balance import BalanceOrchestrator
+
+        even = [_host_row('s1', 5), _host_row('s2', 5)]
+        session = FakeBalanceSession(even, even, [])
+        report = BalanceOrchestrator(session).balance('LEADER')
+        self.assertEqual(report['g1']['job'], 'skipped')
+
+    def test_stalled_job_is_stopped(self):
+        from nebula_balance import BalanceOrchestrator, failed_spaces, format_report
+
+        ticks = iter(range(0, 10000, 100))
+        before = [_host_row('s1', 10), _host_row('s2', 0)]
+        for row in before:
+            row['Leader distribution'] += ', g2:{0}'.format(row['Leader count'])
+        session = FakeBalanceSession(
+            before, [_host_row('s1', 8), _host_row('s2', 2)],
+            [self._job('RUNNING', ['IN PROGRESS', 'SUCCEEDED'])])
+        orchestrator = BalanceOrchestrator(session, stall_timeout=300, clock=lambda: next(ticks),
+                                           sleep=lambda secs: None)
+
+        report = orchestrator.balance('LEADER')
+        # g1停滞后仍继续处理g2，并输出两个space的before/after
+        self.assertIn('USE `g1`; STOP JOB 12', session.statements)
+        self.assertIn('USE `g2`; SUBMIT JOB BALANCE LEADER', session.statements)
+        self.assertEqual(failed_spaces(report), ['g1', 'g2'])
+        lines = format_report(report)
+        self.assertIn('  s2:9779: 0 -> 2', lines)
+        self.assertTrue(any('stalled' in line for line in lines))
+
+    def test_leader_drain_polls_until_empty(self):
+        from nebula_balance import LeaderDrain, format_drain
+
+        class Session(object):
+            def __init__(self, counts):
+                self.counts = counts
+                self.statements = []
+
+            def execute(self, statement):
+                self.statements.append(statement)
+                if statement == 'SHOW HOSTS':
+                    count = self.counts[0] if len(self.counts) == 1 else self.counts.pop(0)
+                    row = _host_row('s1', count)
+                    row['Leader distribution'] = 'g1:{0}, g2:0'.format(count)
+                    return [row, _host_row('s2', 10 - count)]
+                return []
+
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        statement = 'SUBMIT JOB BALANCE DATA REMOVE "{host}":{port}'
+        session = Session([6, 4, 1, 0])
+        report = LeaderDrain(session, 's1', 9779, statement, clock=lambda: now[0], sleep=sleep).drain()
+        self.assertEqual(session.statements[1], 'USE `g1`; SUBMIT JOB BALANCE DATA REMOVE "s1":9779')
+        self.assertEqual((report['initial'], report['remaining']), (6, 0))
+        self.assertEqual([count for _, count in report['timeline']], [6, 4, 1, 0])
+        self.assertEqual(format_drain(report)[0], 'Leader drain: 6 -> 0 leaders in 6.0s')
+
+        now[0] = 0.0
+        report = LeaderDrain(Session([3]), 's1', 9779, statement, timeout=5, clock=lambda: now[0],
+                             sleep=sleep).drain()
+        self.assertEqual(report['remaining'], 3)
+        self.assertEqual(report['seconds'], 5)
+        self.assertIn('3 leaders still on this host', format_drain(report)[-1])
+
+        report = LeaderDrain(Session([0]), 's1', 9779, statement, clock=lambda: now[0], sleep=sleep).drain()
+        self.assertEqual(report['timeline'], [(0.0, 0)])
+
+        # 不排除本机的BALANCE LEADER只会在全集群重新均衡，不执行
+        session = Session([6])
+        report = LeaderDrain(session, 's1', 9779, 'SUBMIT JOB BALANCE LEADER').drain()
+        self.assertEqual(session.statements, [])
+        self.assertIn('{host}', format_drain(report)[0])
+        self.assertIn('not registered', LeaderDrain(Session([3]), 's9', 9779, statement).drain()['skipped'])
+
+        # 占位符按字面替换，其他花括号原样保留
+        now[0] = 0.0
+        session = Session([1, 0])
+        LeaderDrain(session, 's1', 9779, 'CALL drain({host}, {"port": {port}})', clock=lambda: now[0],
+                    sleep=sleep).drain()
+        self.assertEqual(session.statements[1], 'USE `g1`; CALL drain(s1, {"port": 9779})')
+
+    def test_advisor_requires_host_scoped_drain_statement(self):
+        from service_advisor import NebulaServiceAdvisor
+
+        validate = dict(NebulaServiceAdvisor().get_service_configuration_validators())['nebula-storaged-site']
+        self.assertEqual(validate({'leader_drain_enabled': 'false'}, {}, {}, [], {}), [])
+        problems = validate({'leader_drain_enabled': 'true', 'leader_drain_statement': 'SUBMIT JOB BALANCE LEADER'},
+                            {}, {}, [], {})
+        self.assertEqual([item['config-name'] for item in problems], ['leader_drain_statement'])
+
+
+class TestPrometheusExporter(unittest.TestCase):
+    """测试Prometheus指标导出"""
+
+    def test_metric_names_follow_metrics_json(self):
+        from nebula_exporter import metric_name
+
+        self.assertEqual(metric_name('graphd', 'qps'), ('nebula_graphd_qps', {}))
+        self.assertEqual(metric_name('storaged', 'get_latency_us.p99.60'),
+                         ('nebula_storaged_get_latency_us', {'stat': 'p99', 'window': '60'}))
+
+    def test_render_groups_families(self):
+        from nebula_exporter import render
+
+        text = render({'graphd': {'num_queries.rate.60': 12.0, 'query_latency_us.p99.60': 900.0},
+                       'storaged': None, 'graphd_cgroup': {'memory.current': 1.0}},
+                      scraped=['graphd', 'storaged'])
+        # 真实的/stats统计项同时以metrics.json中的名称输出
+        self.assertIn('# TYPE nebula_graphd_qps gauge\nnebula_graphd_qps 12\n', text)
+        self.assertIn('nebula_graphd_num_queries{stat="rate",window="60"} 12', text)
+        self.assertIn('nebula_graphd_query_latency_us{stat="p99",window="60"} 900', text)
+        self.assertIn('nebula_up{component="storaged"} 0', text)
+        self.assertNotIn('nebula_up{component="graphd_cgroup"}', text)
+
+    def test_render_non_finite_values(self):
+        from nebula_exporter import render
+
+        text = render({'graphd': {'num_queries.rate.60': float('nan'), 'query_latency_us.p99.60': float('inf'),
+                                  'query_latency_us.p95.60': float('-inf')}}, scraped=['graphd'])
+        self.assertIn('nebula_graphd_qps NaN\n', text)
+        self.assertIn('nebula_graphd_query_latency_us{stat="p99",window="60"} +Inf', text)
+        self.assertIn('nebula_graphd_query_latency_us{stat="p95",window="60"} -Inf', text)
+        self.assertIn('nebula_up{component="graphd"} 1', text)
+
+    def test_refresh_failures_do_not_stop_the_scraper(self):
+        from nebula_exporter import MetricsCache
+
+        class BrokenRocksDb(object):
+            def stats(self):
+                raise OSError('SST file vanished')
+
+        cache = MetricsCache([('storaged', 'localhost', 19779)], interval=0,
+                             fetch=lambda host, port: {'kv_get_latency_us.avg.60': 80.0}, rocksdb=BrokenRocksDb())
+        cache.refresh()
+        text = cache.body(False)[0].decode('utf-8')
+        self.assertIn('nebula_storaged_get_latency_us 80', text)
+        self.assertIn('nebula_up{component="storaged"} 1', text)
+
+        def fail():
+            cache.stop()
+            raise RuntimeError('boom')
+
+        cache.refresh = fail
+        cache.run()
+        self.assertIn('nebula_up{component="storaged"} 0', cache.body(False)[0].decode('utf-8'))
+
+    def test_scrapes_are_served_from_cache(self):
+        import gzip
+        import threading
+        from urllib.request import Request, urlopen
+        from nebula_exporter import MetricsCache, make_server
+
+        calls = []
+
+        def fetch(host, port):
+            calls.append(host)
+            return {'num_active_sessions': 3.0}
+
+        cache = MetricsCache([('graphd', 'localhost', 19669)], fetch=fetch)
+        cache.refresh()
+        server = make_server(cache, 0, '127.0.0.1')
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{0}/metrics'.format(server.server_address[1])
+            for _ in range(3):
+                response = urlopen(Request(url, headers={'Accept-Encoding': 'gzip'}))
+                self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+                body = gzip.decompress(response.read()).decode('utf-8')
+                self.assertIn('nebula_graphd_num_active_sessions 3', body)
+            plain = urlopen(url).read().decode('utf-8')
+            self.assertIn('nebula_up{component="graphd"} 1', plain)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(len(calls), 1)
+
+
+class TestAmsSink(unittest.TestCase):
+    """测试批量推送到Ambari Metrics Collector"""
+
+    def _collector(self, status):
+        import gzip
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                if status[0] == 200:
+                    received.append((self.path, json.loads(body.decode('utf-8'))))
+                self.send_response(status[0])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_address[1], received
+
+    def test_flush_posts_compressed_batches(self):
+        from nebula_metrics_sink import AmsSink
+
+        port, received = self._collector([200])
+        sink = AmsSink(['127.0.0.1'], port, 'host1', batch_size=2)
+        # /stats的真实统计项形状
+        sink.add('graphd', {'num_queries.rate.60': 5.0, 'num_queries.sum.60': 300.0,
+                            'num_active_sessions': 2.0}, 1000)
+        sink.add('graphd', {'num_queries.rate.60': 7.0}, 1060)
+        sink.add('storaged', {'kv_get_latency_us.avg.60': 900.0, 'rocksdb_l0_files': 4.0}, 1060)
+        sink.add('cluster', {'total_vertices': 10.0}, 1060)
+
+        self.assertTrue(sink.flush())
+        self.assertEqual([path for path, _ in received], ['/ws/v1/timeline/metrics'] * 3)
+        metrics = dict((metric['metricname'], metric) for _, payload in received for metric in payload['metrics'])
+        self.assertEqual(sorted(metrics), ['nebula.cluster.total_vertices', 'nebula.graphd.num_active_sessions',
+                                           'nebula.graphd.qps', 'nebula.storaged.get_latency_us',
+                                           'nebula.storaged.rocksdb_l0_files'])
+        self.assertEqual(metrics['nebula.graphd.qps']['metrics'], {'1000000': 5.0, '1060000': 7.0})
+        self.assertEqual(metrics['nebula.graphd.qps']['starttime'], 1000000)
+        self.assertEqual(metrics['nebula.graphd.qps']['appid'], 'nebula_graphd')
+        self.assertEqual(metrics['nebula.storaged.get_latency_us']['hostname'], 'host1')
+        self.assertEqual(metrics['nebula.storaged.get_latency_us']['appid'], 'nebula_storaged')
+        self.assertEqual(metrics['nebula.cluster.total_vertices']['appid'], 'nebula_metad')
+        self.assertEqual((sink.sent, sink.pending()), (6, 0))
+
+    def test_pushed_names_are_declared_in_metrics_json(self):
+        from nebula_exporter import known_metrics
+        from nebula_stats import STAT_ALIASES
+
+        metrics_file = os.path.join(scripts_path, '..', '..', 'metrics.json')
+        with open(metrics_file) as f:
+            definitions = json.load(f)
+        known = known_metrics(metrics_file)
+        for component, aliases in STAT_ALIASES.items():
+            for name, _ in aliases:
+                self.assertIn('nebula_{0}_{1}'.format(component, name), known)
+        # 每个组件的指标在其timelineAppid下查询
+        self.assertEqual(sorted(definitions), ['NEBULA_GRAPHD', 'NEBULA_METAD', 'NEBULA_STORAGED'])
+        with open(os.path.join(scripts_path, '..', '..', 'metainfo.xml')) as f:
+            metainfo = f.read()
+        for component in ('graphd', 'metad', 'storaged'):
+            self.assertIn('<timelineAppid>nebula_{0}</timelineAppid>'.format(component), metainfo)
+
+    def test_outage_keeps_newest_points(self):
+        from nebula_metrics_sink import AmsSink
+
+        status = [503]
+        port, received = self._collector(status)
+        sink = AmsSink(['127.0.0.1'], port, 'host1', max_points=3)
+        for ts in range(5):
+            sink.add('graphd', {'num_queries.rate.60': float(ts)}, ts)
+            self.assertFalse(sink.flush())
+        self.assertEqual((sink.pending(), sink.dropped), (3, 2))
+
+        status[0] = 200
+        self.assertTrue(sink.flush())
+        self.assertEqual(received[0][1]['metrics'][0]['metrics'], {'2000': 2.0, '3000': 3.0, '4000': 4.0})
+
+
+class FakeMetaSession(object):
+    """保存可变集群状态的metad会话替身"""
+
+    def __init__(self):
+        self.statements = []
+        self.hosts = [_host_row('s1', 5), _host_row('s2', 5)]
+        self.peers = {'1': 's1:9779, s2:9779'}
+        self.stats = {'g1': (100, 400)}
+
+    def execute(self, statement):
+        from nebula_ngql import NgqlError
+        self.statements.append(statement)
+        if statement == 'SHOW HOSTS':
+            return self.hosts
+        if statement == 'SHOW SPACES':
+            return [{'Name': 'g1'}]
+        if 'SHOW TAGS' in statement:
+            return [{'Name': 'player'}]
+        if 'SHOW EDGES' in statement:
+            return [{'Name': 'follow'}]
+        if 'SHOW PARTS' in statement:
+            return [{'Partition ID': part, 'Leader': 's1:9779', 'Peers': peers} for part, peers in self.peers.items()]
+        if 'SHOW STATS' in statement:
+            if 'g1' not in self.stats:
+                raise NgqlError('There is no any stats info to show', -1005)
+            vertices, edges = self.stats['g1']
+            return [{'Type': 'Space', 'Name': 'vertices', 'Count': str(vertices)},
+                    {'Type': 'Space', 'Name': 'edges', 'Count': str(edges)}]
+        if 'SUBMIT JOB STATS' in statement:
+            return [{'New Job Id': '7'}]
+        if 'SHOW JOB' in statement:
+            return [{'Status': 'FINISHED'}]
+        return []
+
+
+class TestClusterMetrics(unittest.TestCase):
+    """测试nebula.cluster.*增量汇总"""
+
+    def test_aggregator_applies_deltas(self):
+        from nebula_cluster_metrics import ClusterAggregator
+
+        aggregator = ClusterAggregator()
+        aggregator.update_host('s1', True)
+        aggregator.update_host('s2', True)
+        aggregator.update_host('s2', False)
+        aggregator.update_space('g1', 10, 20)
+        aggregator.update_space('g1', 15, 20)
+        aggregator.update_space('g2', 1, 1)
+        aggregator.remove_space('g2')
+        self.assertEqual(aggregator.totals(), {'total_vertices': 15.0, 'total_edges': 20.0,
+                                               'healthy_hosts': 1.0, 'total_hosts': 2.0})
+
+    def test_stats_job_only_on_topology_change(self):
+        from nebula_cluster_metrics import ClusterStatsCollector
+
+        session = FakeMetaSession()
+        collector = ClusterStatsCollector(session)
+        self.assertIsNone(collector.totals())
+        collector.collect()
+        collector.collect()
+        self.assertEqual(collector.submitted, 0)
+        self.assertEqual(collector.totals()['total_edges'], 400.0)
+
+        # leader变化不触发统计作业，副本迁移会触发
+        session.hosts[1]['Status'] = 'OFFLINE'
+        collector.collect()
+        self.assertEqual((collector.submitted, collector.totals()['healthy_hosts']), (0, 1.0))
+        session.peers['1'] = 's1:9779, s3:9779'
+        session.hosts[1]['Partition distribution'] = 'g1:9'
+        collector.collect()
+        self.assertEqual(collector.submitted, 1)
+        self.assertIn('USE `g1`; SUBMIT JOB STATS', session.statements)
+
+    def test_space_list_and_fingerprints_are_cached(self):
+        from nebula_cluster_metrics import ClusterStatsCollector
+
+        session = FakeMetaSession()
+        now = [1000.0]
+        collector = ClusterStatsCollector(session, refresh_secs=600, clock=lambda: now[0])
+        collector.collect()
+        del session.statements[:]
+        # 分片分布不变时每个周期只执行SHOW HOSTS和每个space一次SHOW STATS
+        now[0] += 300
+        collector.collect()
+        self.assertEqual(session.statements, ['SHOW HOSTS', 'USE `g1`; SHOW STATS'])
+        self.assertEqual(collector.refreshes, 1)
+
+        now[0] += 300
+        collector.collect()
+        self.assertIn('SHOW SPACES', session.statements)
+        self.assertEqual(collector.refreshes, 2)
+
+
+class TestTimeSeriesEncoding(unittest.TestCase):
+    """测试Gorilla压缩时间序列"""
+
+    def test_round_trip_irregular_samples(self):
+        from nebula_tsdb import ChunkEncoder, decode_chunk
+
+        samples = [(1000, 1.5), (1060, 1.5), (1120, 2.25), (1121, -7.0), (1121, 0.0),
+                   (5000000000, float('inf')), (5000000060, 1e-300), (5000000120, 123456789.125)]
+        encoder = ChunkEncoder()
+        for timestamp, value in samples:
+            encoder.append(timestamp, value)
+        self.assertEqual(decode_chunk(encoder.writer.data, encoder.nbits, encoder.count), samples)
+        self.assertRaises(ValueError, encoder.append, 10, 1.0)
+
+    def test_series_file_reopens_and_rotates(self):
+        import shutil
+        import tempfile
+        from nebula_tsdb import SeriesFile, history_path
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = history_path(tmp_dir, 'storaged/get_latency_us.p99.60')
+        samples = [(1700000000 + i * 60, float(i % 7) * 1.5) for i in range(400)]
+
+        series = SeriesFile(path, chunk_bytes=256, max_chunks=4)
+        for timestamp, value in samples[:100]:
+            series.append(timestamp, value)
+        series.close()
+        series = SeriesFile(path, chunk_bytes=256, max_chunks=4)
+        for timestamp, value in samples[100:]:
+            series.append(timestamp, value)
+
+        kept = list(series.scan())
+        self.assertEqual(kept, samples[-len(kept):])
+        self.assertGreater(len(kept), 100)
+        self.assertEqual(list(series.scan(samples[390][0], samples[392][0])), samples[390:393])
+        series.close()
+        self.assertEqual(os.path.getsize(path), 16 + 256 * 4)
+
+    def test_benchmark_reports_compression(self):
+        from nebula_tsdb import benchmark
+
+        result = benchmark(samples=1440, metrics=3)
+        self.assertEqual(result['samples'], 4320)
+        self.assertLess(result['bytes_per_sample'], 4.0)
+
+
+class TestSlowQueryAnalyzer(unittest.TestCase):
+    """测试graphd慢查询日志分析"""
+
+    def test_fingerprint_strips_literals(self):
+        from nebula_slow_query import fingerprint
+
+        first = fingerprint('GO FROM "player100", "player101" OVER follow WHERE $$.player.age > 30')
+        second = fingerprint('GO  FROM "p9", "p7", "p8" OVER follow WHERE $$.player.age > 41;')
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 'GO FROM ?+ OVER follow WHERE $$.player.age > ?')
+        self.assertEqual(fingerprint('INSERT VERTEX t(a) VALUES "a":(1), "b":(2)')[1],
+                         'INSERT VERTEX t(a) VALUES ?:(?), ?:(?)')
+
+    def test_rerun_reads_only_new_bytes(self):
+        import shutil
+        import tempfile
+        from nebula_slow_query import SlowQueryAnalyzer
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        log_file = os.path.join(tmp_dir, 'nebula-graphd.host.nebula.log.INFO.20260101-000000.42')
+        checkpoint = os.path.join(tmp_dir, 'checkpoint.json')
+        with open(log_file, 'w') as f:
+            f.write('I20260101 00:00:01.000 42 QueryInstance.cpp:99] Slow query: duration: 1500 us, '
+                    'query: GO FROM "a" OVER e\n')
+            f.write('I20260101 00:00:01.100 42 Foo.cpp:1] unrelated line\n')
+            f.write("E20260101 00:00:02.000 42 QueryInstance.cpp:120] Processing query "
+                    "`MATCH (v) WHERE id(v) == \"b\" RETURN v' failed: SemanticError\n")
+            partial = 'I20260101 00:00:03.000 42 QueryInstance.cpp:99] Slow query: dur'
+            f.write(partial)
+
+        analyzer = SlowQueryAnalyzer(checkpoint)
+        analyzer.scan_dir(tmp_dir)
+        analyzer.save()
+        rest = 'ation: 4000 us, query: GO FROM "z" OVER e\n'
+        with open(log_file, 'a') as f:
+            f.write(rest)
+
+        analyzer = SlowQueryAnalyzer(checkpoint)
+        processed = analyzer.scan_dir(tmp_dir)
+        top = analyzer.top(5)
+        self.assertEqual(processed, len(partial) + len(rest))
+        self.assertEqual((top[0]['query'], top[0]['count'], top[0]['total_us']), ('GO FROM ? OVER e', 2, 5500))
+        self.assertEqual((top[1]['failed'], top[1]['query']), (1, 'MATCH (v) WHERE id(v) == ? RETURN v'))
+
+    def test_reads_logs_compressed_by_retention(self):
+        import shutil
+        import tempfile
+        from nebula_log_retention import gzip_file
+        from nebula_slow_query import SlowQueryAnalyzer
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        slow = ('I20260101 00:00:0{0}.000 42 QueryInstance.cpp:99] Slow query: duration: {1} us, '
+                'query: GO FROM "{0}" OVER e\n')
+        first = os.path.join(tmp_dir, 'nebula-graphd.host.nebula.log.INFO.20260101-000000.42')
+        second = os.path.join(tmp_dir, 'nebula-graphd.host.nebula.log.INFO.20260102-000000.42')
+        with open(first, 'w') as f:
+            f.write(slow.format(1, 1000))
+        checkpoint = os.path.join(tmp_dir, 'checkpoint.json')
+        analyzer = SlowQueryAnalyzer(checkpoint)
+        analyzer.scan_dir(tmp_dir)
+        analyzer.save()
+
+        # 第一个日志在上次扫描后追加并被压缩，第二个日志从未扫描就被压缩
+        with open(first, 'a') as f:
+            f.write(slow.format(2, 2000))
+        with open(second, 'w') as f:
+            f.write(slow.format(3, 4000))
+        gzip_file(first)
+        gzip_file(second)
+        analyzer = SlowQueryAnalyzer(checkpoint)
+        analyzer.scan_dir(tmp_dir)
+        self.assertEqual(analyzer.top(1)[0]['total_us'], 7000)
+        self.assertEqual(analyzer.top(1)[0]['count'], 3)
+        self.assertEqual(sorted(analyzer.files), [first + '.gz', second + '.gz'])
+        self.assertEqual(analyzer.scan_dir(tmp_dir), 0)
+
+    def test_custom_pattern_is_not_filtered_by_default_markers(self):
+        import shutil
+        import tempfile
+        from nebula_slow_query import SlowQueryAnalyzer, required_literal
+
+        self.assertEqual(required_literal(r'Query took (?P<latency_us>\d+)us: (?P<query>.*)'), b'Query took ')
+        self.assertEqual(required_literal(r'(?:took|spent) (?P<latency_us>\d+)us: (?P<query>.*)'), b'us: ')
+        self.assertIsNone(required_literal(r'(?:took|spent) (?P<latency_us>\d+) (?P<query>.*)'))
+        self.assertIsNone(required_literal(r'slow|Slow'))
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        log_file = os.path.join(tmp_dir, 'nebula-graphd.log.INFO.1')
+        with open(log_file, 'w') as f:
+            f.write('I0101 Query took 5000us: GO FROM 1 OVER e\nI0101 other\n')
+        checkpoint = os.path.join(tmp_dir, 'checkpoint.json')
+        for pattern in (r'Query took (?P<latency_us>\d+)us: (?P<query>.*)',
+                        r'(?:Query|Stmt) took (?P<latency_us>\d+)us: (?P<query>.*)'):
+            analyzer = SlowQueryAnalyzer(None, [pattern])
+            analyzer.scan_dir(tmp_dir, 'nebula-graphd.log.*')
+            self.assertEqual([row['total_us'] for row in analyzer.top()], [5000])
+
+        analyzer = SlowQueryAnalyzer(checkpoint)
+        analyzer.scan_dir(tmp_dir, 'nebula-graphd.log.*')
+        self.assertIn(log_file, analyzer.files)
+        os.remove(log_file)
+        analyzer.scan_dir(tmp_dir, 'nebula-graphd.log.*')
+        self.assertEqual(analyzer.files, {})
+
+
+class TestLogRetention(unittest.TestCase):
+    """测试glog文件压缩和清理"""
+
+    def _log(self, log_dir, name, size, age_days, now):
+        path = os.path.join(log_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (now - age_days * 86400, now - age_days * 86400))
+        return path
+
+    def test_compresses_rotated_and_enforces_caps(self):
+        import shutil
+        import tempfile
+        from nebula_log_retention import LogRetention
+
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        now = 1800000000
+        prefix = 'nebula-storaged.host.nebula.log.INFO.'
+        old = self._log(log_dir, prefix + '20260101-000000.1', 4000, 10, now)
+        rotated = self._log(log_dir, prefix + '20260108-000000.1', 4000, 2, now)
+        current = self._log(log_dir, prefix + '20260110-000000.1', 4000, 0, now)
+        os.symlink(os.path.basename(current), os.path.join(log_dir, 'nebula-storaged.INFO'))
+        graphd_old = self._log(log_dir, 'nebula-graphd.host.nebula.log.WARNING.20260101-000000.2', 3000, 3, now)
+        graphd_new = self._log(log_dir, 'nebula-graphd.host.nebula.log.WARNING.20260102-000000.2', 3000, 1, now)
+
+        summary = LogRetention(log_dir, {'graphd': 100}, max_age_days=7, workers=2, clock=lambda: now).run()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(rotated + '.gz'))
+        self.assertTrue(os.path.exists(current))
+        self.assertFalse(os.path.exists(graphd_old + '.gz'))
+        self.assertTrue(os.path.exists(graphd_new))
+        self.assertEqual((summary['compressed'], summary['deleted'], summary['errors']), (2, 2, []))
+
+    def test_rotates_and_caps_tool_logs(self):
+        import shutil
+        import tempfile
+        from nebula_log_retention import LogRetention
+
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        now = 1800000000
+        live = self._log(log_dir, 'nebula-exporter.log', 5000, 0, now)
+        old = self._log(log_dir, 'nebula-exporter.log.20260101-000000.gz', 3990, 2, now)
+        quiet = self._log(log_dir, 'nebula-compaction.log', 100, 0, now)
+
+        summary = LogRetention(log_dir, max_age_days=7, clock=lambda: now,
+                               tool_max_bytes=4000, tool_rotate_bytes=1000).run()
+
+        rotated = [name for name in os.listdir(log_dir) if name.startswith('nebula-exporter.log.')
+                   and name != os.path.basename(old)]
+        self.assertEqual(os.path.getsize(live), 0)
+        self.assertEqual(len(rotated), 1)
+        self.assertTrue(rotated[0].endswith('.gz'))
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(os.path.getsize(quiet), 100)
+        self.assertEqual((summary['compressed'], summary['deleted'], summary['errors']), (1, 1, []))
+
+
+class TestTracing(unittest.TestCase):
+    """测试命令和告警的分段计时"""
+
+    def tearDown(self):
+        import nebula_trace
+        nebula_trace.configure(False)
+
+    def test_disabled_tracing_is_transparent(self):
+        import nebula_trace
+
+        @nebula_trace.traced()
+        def work(value):
+            nebula_trace.count('sockets')
+            return value * 2
+
+        nebula_trace.configure(False)
+        self.assertIs(nebula_trace.span('anything'), nebula_trace.span('other'))
+        self.assertEqual(work(21), 42)
+
+    def test_nested_spans_write_trace(self):
+        import shutil
+        import tempfile
+        import nebula_trace
+
+        trace_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, trace_dir)
+        nebula_trace.configure(True, trace_dir)
+
+        @nebula_trace.traced('child')
+        def child():
+            nebula_trace.count('sockets')
+            nebula_trace.count('bytes_read', 100)
+
+        @nebula_trace.traced('graphd.start')
+        def start():
+            with nebula_trace.span('configure', step=1):
+                child()
+            child()
+
+        with patch('sys.stdout') as stdout:
+            start()
+        files = os.listdir(trace_dir)
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(trace_dir, files[0])) as f:
+            trace = json.load(f)
+        self.assertEqual(trace['name'], 'graphd.start')
+        self.assertEqual(trace['totals'], {'sockets': 2, 'bytes_read': 200})
+        self.assertEqual([child['name'] for child in trace['children']], ['configure', 'child'])
+        self.assertEqual(trace['children'][0]['attrs'], {'step': 1})
+        printed = ''.join(call[0][0] for call in stdout.write.call_args_list)
+        self.assertIn('[trace] graphd.start', printed)
+        self.assertIn('bytes_read=200 sockets=2', printed)
+
+    def test_alert_tracing_follows_configuration(self):
+        import shutil
+        import tempfile
+        import nebula_trace
+
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+
+        @nebula_trace.traced_alert('nebula_test_alert')
+        def execute(configurations={}, parameters={}, host_name=None):
+            nebula_trace.count('sockets')
+            return ('OK', ['fine'])
+
+        self.assertEqual(execute({nebula_trace.TRACE_ENABLED_KEY: 'false'}), ('OK', ['fine']))
+        self.assertFalse(os.path.exists(os.path.join(log_dir, 'trace')))
+        execute({nebula_trace.TRACE_ENABLED_KEY: 'true', nebula_trace.LOG_DIR_KEY: log_dir}, {})
+        self.assertEqual(len(os.listdir(os.path.join(log_dir, 'trace'))), 1)
+        self.assertFalse(nebula_trace.enabled())
+
+    def test_prune_keeps_newest_traces_per_name(self):
+        import shutil
+        import tempfile
+        import nebula_trace
+
+        trace_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, trace_dir)
+        for index in range(5):
+            for name in ('nebula_graphd_process', 'graphd.start'):
+                path = os.path.join(trace_dir, '{0}-20260101-00000{1}-1.json'.format(name, index))
+                with open(path, 'w') as f:
+                    f.write('{}')
+                os.utime(path, (1800000000 + index, 1800000000 + index))
+
+        self.assertEqual(nebula_trace.prune(trace_dir, 'nebula_graphd_process-', 2), 3)
+        remaining = sorted(os.listdir(trace_dir))
+        self.assertEqual([name for name in remaining if name.startswith('nebula_graphd_process-')],
+                         ['nebula_graphd_process-20260101-000003-1.json',
+                          'nebula_graphd_process-20260101-000004-1.json'])
+        self.assertEqual(len([name for name in remaining if name.startswith('graphd.start-')]), 5)
+
+
+class TestNumaPlacement(unittest.TestCase):
+    """测试NUMA/CPU放置"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def make_topology(self, cpulists):
+        node_root = os.path.join(self.root, 'node')
+        for node, cpulist in enumerate(cpulists):
+            os.makedirs(os.path.join(node_root, 'node%d' % node))
+            with open(os.path.join(node_root, 'node%d' % node, 'cpulist'), 'w') as f:
+                f.write(cpulist + '\n')
+        with open(os.path.join(node_root, 'possible'), 'w') as f:
+            f.write('0-%d\n' % (len(cpulists) - 1))
+        return node_root
+
+    def test_cpulist_round_trip(self):
+        import nebula_numa
+
+        self.assertEqual(nebula_numa.parse_cpulist('0-3,8,10-11'), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(nebula_numa.format_cpulist([11, 0, 1, 2, 3, 8, 10]), '0-3,8,10-11')
+
+    def test_co_located_daemons_do_not_overlap(self):
+        import nebula_numa
+
+        topology = nebula_numa.read_topology(self.make_topology(['0-7,16-23', '8-15,24-31']))
+        self.assertEqual(sorted(topology), [0, 1])
+        co_located = {'graphd', 'storaged'}
+        storaged = nebula_numa.plan_placement('storaged', topology, co_located)
+        graphd = nebula_numa.plan_placement('graphd', topology, co_located)
+        self.assertEqual(storaged['policy'], 'bind')
+        self.assertEqual(nebula_numa.launch_prefix(storaged), 'numactl --cpunodebind=0 --membind=0 ')
+        self.assertEqual(graphd['policy'], 'cpus')
+        self.assertEqual(nebula_numa.launch_prefix(graphd), 'taskset -c 8-15,24-31 ')
+        self.assertFalse(set(storaged['cpus']) & set(graphd['cpus']))
+        self.assertEqual(nebula_numa.plan_placement('metad', topology, co_located)['policy'], 'none')
+
+    def test_policies_without_graphd(self):
+        import nebula_numa
+
+        topology = nebula_numa.read_topology(self.make_topology(['0-3', '4-7']))
+        storaged = nebula_numa.plan_placement('storaged', topology, {'storaged'})
+        self.assertEqual(nebula_numa.launch_prefix(storaged), 'numactl --interleave=all ')
+        bound = nebula_numa.plan_placement('storaged', topology, {'storaged'}, 'bind', '1')
+        self.assertEqual(bound['cpus'], [4, 5, 6, 7])
+        self.assertRaises(ValueError, nebula_numa.plan_placement, 'storaged', topology, {'storaged'}, 'bind', '2')
+        graphd = nebula_numa.plan_placement('graphd', topology, {'graphd'}, graphd_cpu_list='2-5,40')
+        self.assertEqual(graphd['cpus'], [2, 3, 4, 5])
+        self.assertEqual(nebula_numa.read_topology(os.path.join(self.root, 'missing')), {})
+
+    def test_verify_reads_cpus_allowed(self):
+        import nebula_numa
+
+        proc_root = os.path.join(self.root, 'proc')
+        os.makedirs(os.path.join(proc_root, '4242'))
+        with open(os.path.join(proc_root, '4242', 'status'), 'w') as f:
+            f.write('Name:\tnebula-graphd\nCpus_allowed:\t00000000,ff00ff00\nCpus_allowed_list:\t8-15,24-31\n')
+        placement = {'policy': 'cpus', 'node': None, 'cpus': list(range(8, 16)) + list(range(24, 32))}
+        self.assertEqual(nebula_numa.verify_placement(4242, placement, proc_root),
+                         (True, placement['cpus']))
+        ok, actual = nebula_numa.verify_placement(4242, {'policy': 'cpus', 'cpus': [0, 1]}, proc_root)
+        self.assertFalse(ok)
+        self.assertEqual(nebula_numa.verify_placement(1, placement, proc_root), (False, None))
+
+    def test_verify_checks_memory_policy(self):
+        import nebula_numa
+
+        proc_root = os.path.join(self.root, 'proc')
+        os.makedirs(os.path.join(proc_root, '4242'))
+        with open(os.path.join(proc_root, '4242', 'status'), 'w') as f:
+            f.write('Cpus_allowed:\tff\n')
+        interleave = {'policy': 'interleave', 'node': None, 'cpus': list(range(8))}
+        self.assertFalse(nebula_numa.verify_placement(4242, interleave, proc_root)[0])
+        with open(os.path.join(proc_root, '4242', 'numa_maps'), 'w') as f:
+            f.write('00400000 default file=/usr/bin/nebula-storaged mapped=10\n')
+        self.assertFalse(nebula_numa.verify_placement(4242, interleave, proc_root)[0])
+        with open(os.path.join(proc_root, '4242', 'numa_maps'), 'w') as f:
+            f.write('00400000 interleave:0-1 file=/usr/bin/nebula-storaged mapped=10\n'
+                    '7f0000000000 interleave:0-1 anon=512 dirty=512\n')
+        self.assertTrue(nebula_numa.verify_placement(4242, interleave, proc_root)[0])
+        bound = {'policy': 'bind', 'node': 0, 'cpus': list(range(8))}
+        self.assertFalse(nebula_numa.verify_placement(4242, bound, proc_root)[0])
+
+    def test_explicit_graphd_cpus_must_not_overlap_bound_storaged(self):
+        import nebula_numa
+
+        topology = nebula_numa.read_topology(self.make_topology(['0-3', '4-7']))
+        co_located = {'graphd', 'storaged'}
+        self.assertRaises(ValueError, nebula_numa.plan_placement, 'graphd', topology, co_located,
+                          graphd_cpu_list='2-5')
+        self.assertRaises(ValueError, nebula_numa.plan_placement, 'storaged', topology, co_located,
+                          graphd_cpu_list='2-5')
+        graphd = nebula_numa.plan_placement('graphd', topology, co_located, graphd_cpu_list='5-7')
+        self.assertEqual(graphd['cpus'], [5, 6, 7])
+
+
+class TestCgroupIsolation(unittest.TestCase):
+    """测试cgroup v2隔离"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        with open(os.path.join(self.root, 'cgroup.controllers'), 'w') as f:
+            f.write('cpuset cpu io memory pids\n')
+        with open(os.path.join(self.root, 'cgroup.subtree_control'), 'w') as f:
+            f.write('')
+
+    def fake_kernel_files(self, path, controllers):
+        # 真实的cgroupfs在mkdir时自动创建接口文件，这里手工模拟
+        with open(os.path.join(path, 'cgroup.controllers'), 'w') as f:
+            f.write(controllers)
+        for name, value in (('cgroup.subtree_control', ''), ('cgroup.procs', ''), ('cpu.weight', '100'),
+                            ('memory.high', 'max'), ('memory.max', 'max'), ('io.weight', 'default 100')):
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(value + '\n')
+
+    def test_limits_are_validated(self):
+        import nebula_cgroup
+
+        limits = dict(nebula_cgroup.build_limits(300, 3072, 4096, 500))
+        self.assertEqual(limits['memory.high'], str(3072 * 1024 * 1024))
+        self.assertEqual(limits['io.weight'], 'default 500')
+        self.assertEqual(dict(nebula_cgroup.build_limits())['memory.max'], 'max')
+        self.assertRaises(ValueError, nebula_cgroup.build_limits, 0)
+        self.assertRaises(ValueError, nebula_cgroup.build_limits, 100, 8192, 4096)
+
+    def test_ensure_is_idempotent(self):
+        import nebula_cgroup
+
+        cgroup = nebula_cgroup.CgroupSlice('storaged', self.root)
+        os.makedirs(cgroup.path)
+        self.fake_kernel_files(cgroup.parent, 'cpu io memory')
+        self.fake_kernel_files(cgroup.path, 'cpu io memory')
+        limits = nebula_cgroup.build_limits(300, 0, 4096, 500)
+
+        result = cgroup.ensure(limits)
+        self.assertEqual(result['changed'], ['cpu.weight', 'memory.max', 'io.weight'])
+        with open(os.path.join(self.root, 'cgroup.subtree_control')) as f:
+            self.assertEqual(f.read(), '+cpu +memory +io')
+        with open(os.path.join(cgroup.path, 'memory.max')) as f:
+            self.assertEqual(f.read(), str(4096 * 1024 * 1024))
+        self.assertEqual(cgroup.ensure(limits)['changed'], [])
+
+        os.remove(os.path.join(cgroup.path, 'io.weight'))
+        self.assertEqual(cgroup.ensure(limits)['skipped'], ['io.weight'])
+        self.assertTrue(cgroup.attach(4242))
+        self.assertEqual(cgroup.pids(), [4242])
+
+    def test_pressure_is_exported(self):
+        import nebula_cgroup
+        from nebula_exporter import MetricsCache
+
+        cgroup = nebula_cgroup.CgroupSlice('graphd', self.root)
+        os.makedirs(cgroup.path)
+        with open(os.path.join(cgroup.path, 'cpu.pressure'), 'w') as f:
+            f.write('some avg10=12.50 avg60=3.00 avg300=0.75 total=987654\n'
+                    'full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n')
+        with open(os.path.join(cgroup.path, 'memory.current'), 'w') as f:
+            f.write('1048576\n')
+
+        stats = cgroup.stats()
+        self.assertEqual(stats['cpu.pressure.some.avg10'], 12.5)
+        self.assertEqual(stats['cpu.pressure.some.total'], 987654)
+        self.assertNotIn('io.pressure.some.avg10', stats)
+        self.assertIsNone(nebula_cgroup.CgroupSlice('metad', self.root).stats())
+
+        cache = MetricsCache([], fetch=None, cgroups=[cgroup, nebula_cgroup.CgroupSlice('metad', self.root)])
+        cache.refresh()
+        text = cache.body(False)[0].decode('utf-8')
+        self.assertIn('nebula_graphd_cgroup_cpu_pressure_some_avg10 12.5', text)
+        self.assertIn('nebula_graphd_cgroup_memory_current 1048576', text)
+        self.assertNotIn('metad_cgroup', text)
+
+    def test_advisor_recommends_memory_for_co_located_hosts(self):
+        from service_advisor import NebulaServiceAdvisor
+
+        advisor = NebulaServiceAdvisor()
+        configurations = {'nebula-env': {'properties': {'cgroup_enabled': 'true',
+                                                        'cgroup_graphd_memory_max_mb': '0',
+                                                        'cgroup_storaged_memory_max_mb': '0'}}}
+        cluster_data = {'componentHostsMap': {'NEBULA_GRAPHD': ['host1', 'host2'],
+                                              'NEBULA_STORAGED': ['host2', 'host3']}}
+        hosts = {'items': [{'Hosts': {'host_name': 'host1', 'total_mem': 16 * 1024 * 1024}},
+                           {'Hosts': {'host_name': 'host2', 'total_mem': 64 * 1024 * 1024}}]}
+        advisor.get_service_configuration_recommendations(configurations, cluster_data, hosts, [])
+        env = configurations['nebula-env']['properties']
+        self.assertEqual(env['cgroup_storaged_memory_max_mb'], str(32 * 1024))
+        self.assertEqual(env['cgroup_graphd_memory_max_mb'], str(int(64 * 1024 * 0.3)))
+        self.assertEqual(env['cgroup_storaged_memory_high_mb'], str(int(32 * 1024 * 0.9)))
+
+    def test_advisor_records_graphd_host_cores(self):
+        from service_advisor import NebulaServiceAdvisor
+
+        configurations = {}
+        cluster_data = {'componentHostsMap': {'NEBULA_GRAPHD': ['host2', 'host1'], 'NEBULA_STORAGED': ['host3']}}
+        hosts = {'items': [{'Hosts': {'host_name': 'host1', 'cpu_count': 16}},
+                           {'Hosts': {'host_name': 'host2', 'cpu_count': 8}},
+                           {'Hosts': {'host_name': 'host3', 'cpu_count': 64}}]}
+        NebulaServiceAdvisor().get_service_configuration_recommendations(configurations, cluster_data, hosts, [])
+        self.assertEqual(configurations['nebula-env']['properties']['graphd_host_cores'], 'host1:16,host2:8')
+
+    def test_advisor_workload_profile(self):
+        import json
+        from service_advisor import NebulaServiceAdvisor
+
+        advisor = NebulaServiceAdvisor()
+        configurations = {'nebula-env': {'properties': {'workload_profile': 'bulk_ingest'}},
+                          'nebula-storaged-site': {'properties': {
+                              'rocksdb_column_family_options': '{"level0_stop_writes_trigger": "64"}'}}}
+        cluster_data = {'componentHostsMap': {'NEBULA_GRAPHD': ['host1'], 'NEBULA_STORAGED': ['host2']}}
+        hosts = {'items': [{'Hosts': {'host_name': 'host1', 'cpu_count': 16, 'total_mem': 32 * 1024 * 1024}},
+                           {'Hosts': {'host_name': 'host2', 'cpu_count': 8, 'total_mem': 64 * 1024 * 1024}}]}
+        advisor.get_service_configuration_recommendations(configurations, cluster_data, hosts, [])
+        graphd = configurations['nebula-graphd-site']['properties']
+        storaged = configurations['nebula-storaged-site']['properties']
+        self.assertEqual(graphd['num_worker_threads'], '8')
+        self.assertEqual(storaged['num_io_threads'], '16')
+        self.assertEqual(storaged['rocksdb_block_cache'], str(int(64 * 1024 * 0.1) * 1024 * 1024))
+        self.assertEqual(storaged['rocksdb_wal_sync'], 'false')
+        self.assertEqual(storaged['enable_auto_compactions'], 'false')
+        cf_options = json.loads(storaged['rocksdb_column_family_options'])
+        self.assertEqual(cf_options['write_buffer_size'], str(256 * 1024 * 1024))
+        self.assertEqual(cf_options['level0_stop_writes_trigger'], '64')
+
+        # Ambari用新的实例做校验，组件主机只能从services中取得
+        services = {'services': [{'StackServices': {'service_name': 'NEBULA'}, 'components': [
+            {'StackServiceComponents': {'component_name': 'NEBULA_GRAPHD', 'hostnames': ['host1']}},
+            {'StackServiceComponents': {'component_name': 'NEBULA_STORAGED', 'hostnames': ['host2']}}]}]}
+        validators = dict(NebulaServiceAdvisor().get_service_configuration_validators())
+        self.assertEqual(validators['nebula-storaged-site'](storaged, {}, configurations, services, hosts), [])
+        # 缩放值在2倍以内不算冲突，布尔值和写缓冲区必须一致
+        overrides = dict(storaged, num_io_threads='24', rocksdb_wal_sync='true',
+                         rocksdb_column_family_options=json.dumps(dict(cf_options, write_buffer_size='8388608')))
+        problems = validators['nebula-storaged-site'](overrides, {}, configurations, services, hosts)
+        self.assertEqual(sorted(item['config-name'] for item in problems),
+                         ['rocksdb_column_family_options', 'rocksdb_wal_sync'])
+        self.assertEqual(problems[0]['level'], 'WARN')
+        self.assertEqual(validators['nebula-storaged-site'](overrides, {}, configurations, [], hosts), [])
+
+        configurations['nebula-env']['properties']['workload_profile'] = 'custom'
+        self.assertEqual(validators['nebula-storaged-site'](overrides, {}, configurations, services, hosts), [])
+
+
+class TestOsProfile(unittest.TestCase):
+    """测试主机OS性能配置"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.proc_root = os.path.join(self.root, 'proc')
+        self.sys_root = os.path.join(self.root, 'sys')
+        for path, value in (('proc/sys/vm/swappiness', '60'), ('proc/sys/vm/dirty_ratio', '20'),
+                            ('proc/sys/vm/dirty_background_ratio', '10'), ('proc/sys/net/core/somaxconn', '4096'),
+                            ('sys/kernel/mm/transparent_hugepage/enabled', 'always madvise [never]'),
+                            ('sys/kernel/mm/transparent_hugepage/defrag', '[always] defer defer+madvise madvise never'),
+                            ('sys/block/sdb/queue/read_ahead_kb', '4096'),
+                            ('sys/block/sdb/queue/scheduler', '[mq-deadline] kyber bfq none')):
+            self.write(path, value + '\n')
+
+    def write(self, relative, value):
+        path = os.path.join(self.root, relative)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(value)
+
+    def test_render_snippets(self):
+        import nebula_os_profile
+
+        profile = nebula_os_profile.build_profile(nofile=65536, nproc=4096)
+        self.assertEqual(nebula_os_profile.render_limits('nebula', profile),
+                         'nebula soft nofile 65536\nnebula hard nofile 65536\n'
+                         'nebula soft nproc 4096\nnebula hard nproc 4096\n')
+        self.assertIn('vm.swappiness = 1\n', nebula_os_profile.render_sysctl(profile))
+        self.assertEqual(nebula_os_profile.render_udev_rules(['sdb'], profile),
+                         'ACTION=="add|change", KERNEL=="sdb", ATTR{queue/read_ahead_kb}="128", '
+                         'ATTR{queue/scheduler}="none"\n')
+
+    def test_apply_is_idempotent_and_clears_drift(self):
+        import nebula_os_profile
+
+        profile = nebula_os_profile.build_profile()
+        before = nebula_os_profile.drift(profile, ['sdb'], proc_root=self.proc_root, sys_root=self.sys_root)
+        self.assertIn(('vm.swappiness', '1', '60'), before)
+        self.assertIn(('thp.defrag', 'never', 'always'), before)
+        self.assertIn(('sdb.scheduler', 'none', 'mq-deadline'), before)
+        self.assertNotIn('net.core.somaxconn', [item[0] for item in before])
+
+        result = nebula_os_profile.apply(profile, ['sdb'], self.proc_root, self.sys_root)
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(sorted(result['changed']), ['sdb.read_ahead_kb', 'sdb.scheduler', 'thp.defrag',
+                                                     'vm.dirty_background_ratio', 'vm.dirty_ratio',
+                                                     'vm.swappiness'])
+        # 真实sysfs写入后回读为带方括号的选项列表
+        self.write('sys/block/sdb/queue/scheduler', 'mq-deadline kyber bfq [none]\n')
+        self.write('sys/kernel/mm/transparent_hugepage/defrag', 'always defer defer+madvise madvise [never]\n')
+        self.assertEqual(nebula_os_profile.apply(profile, ['sdb'], self.proc_root, self.sys_root)['changed'], [])
+        self.assertEqual(nebula_os_profile.drift(profile, ['sdb'], proc_root=self.proc_root,
+                                                 sys_root=self.sys_root), [])
+
+    def test_unsupported_values_are_reported(self):
+        import nebula_os_profile
+
+        profile = nebula_os_profile.build_profile(scheduler='deadline')
+        result = nebula_os_profile.apply(profile, ['sdb', 'sdz'], self.proc_root, self.sys_root)
+        self.assertIn('sdb.scheduler: deadline is not one of mq-deadline, kyber, bfq, none', result['errors'])
+        self.assertIn('sdz.read_ahead_kb: not available on this host', result['errors'])
+
+    def test_daemon_limits_drift(self):
+        import nebula_os_profile
+
+        self.write('proc/4242/limits', 'Limit                     Soft Limit           Hard Limit           Units\n'
+                                       'Max processes             65536                65536                processes\n'
+                                       'Max open files            1024                 1048576              files\n')
+        profile = nebula_os_profile.build_profile()
+        drift = nebula_os_profile.drift(profile, [], pids=[4242, 4343], proc_root=self.proc_root,
+                                        sys_root=self.sys_root)
+        self.assertIn(('pid 4242 nofile', '1048576', '1024/1048576'), drift)
+        self.assertNotIn('pid 4242 nproc', [item[0] for item in drift])
+
+    def test_block_device_for_partition(self):
+        import nebula_os_profile
+
+        data_dir = os.path.join(self.root, 'data')
+        os.makedirs(data_dir)
+        st_dev = os.stat(data_dir).st_dev
+        partition = os.path.join(self.sys_root, 'devices', 'pci0000:00', 'block', 'sdb', 'sdb1')
+        os.makedirs(partition)
+        self.write(os.path.join(partition, 'partition'), '1\n')
+        os.makedirs(os.path.join(self.sys_root, 'dev', 'block'))
+        os.symlink(partition, os.path.join(self.sys_root, 'dev', 'block',
+                                           '%d:%d' % (os.major(st_dev), os.minor(st_dev))))
+        self.assertEqual(nebula_os_profile.block_device_for(data_dir, self.sys_root), 'sdb')
+        self.assertIsNone(nebula_os_profile.block_device_for(os.path.join(self.root, 'missing'), self.sys_root))
+
+    def test_host_alert_reports_drift_for_its_daemon(self):
+        import alert_os_profile_drift as alert
+
+        pid_dir = os.path.join(self.root, 'run')
+        self.write('run/nebula-storaged.pid', '4242\n')
+        configurations = {alert.OS_PROFILE_ENABLED_KEY: 'true', alert.PID_DIR_KEY: pid_dir,
+                          alert.BLOCK_DEVICES_KEY: 'sdb', '{{nebula-env/os_vm_swappiness}}': '0'}
+        self.assertEqual(alert.profile_from(configurations)['sysctl']['vm.swappiness'], '0')
+        self.assertEqual(alert.profile_from(configurations)['limits']['nofile'], '1048576')
+
+        drift = [('vm.swappiness', '0', '60'), ('sdb.read_ahead_kb', '128', None)]
+        with patch('nebula_os_profile.drift', return_value=drift) as check:
+            code, labels = alert.execute(configurations, {'component': 'storaged'}, 'host1')
+        self.assertEqual(check.call_args[0][1:], (['sdb'], [4242]))
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('vm.swappiness is 60, expected 0', labels[0])
+        self.assertIn('sdb.read_ahead_kb is unavailable', labels[0])
+
+        with patch('nebula_os_profile.drift', return_value=[]) as check:
+            self.assertEqual(alert.execute(configurations, {'component': 'graphd'}, 'host1')[0], 'OK')
+        self.assertEqual(check.call_args[0][1:], ([], []))
+        self.assertEqual(alert.execute({alert.OS_PROFILE_ENABLED_KEY: 'false'}, {}, 'host1')[0], 'OK')
+
+
+class TestStoragedWarmup(unittest.TestCase):
+    """测试storaged启动预热"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def make_sst(self, data_path, number, size, recent):
+        directory = os.path.join(self.root, data_path, 'nebula', '1', 'data')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, '%06d.sst' % number)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (recent, recent))
+        return path
+
+    def test_selection_respects_budget_and_order(self):
+        from nebula_warmup import list_sst_files, select_files
+
+        self.make_sst('d1', 10, 400, 1000)
+        self.make_sst('d1', 11, 300, 3000)
+        self.make_sst('d1', 12, 900, 2000)
+        self.make_sst('d2', 20, 200, 500)
+        with open(os.path.join(self.root, 'd1', 'nebula', '1', 'data', 'MANIFEST-000001'), 'w') as f:
+            f.write('not an sst')
+        files = list_sst_files([os.path.join(self.root, 'd1'), os.path.join(self.root, 'd2')])
+        self.assertEqual(len(files), 4)
+
+        def numbers(selected):
+            return [item['number'] for item in selected]
+
+        # 两个目录轮流入选，放不下900字节的文件时跳到下一个
+        self.assertEqual(numbers(select_files(files, 1000, 'recent')), [11, 20, 10])
+        self.assertEqual(numbers(select_files(files, 1200, 'level')), [12, 20])
+        self.assertEqual(select_files(files, 0), [])
+        self.assertRaises(ValueError, select_files, files, 100, 'size')
+
+
+    def test_advisor_rejects_unknown_warmup_order(self):
+        from service_advisor import NebulaServiceAdvisor
+
+        validators = dict(NebulaServiceAdvisor().get_service_configuration_validators())
+        validate = validators['nebula-storaged-site']
+        self.assertEqual(validate({'warmup_order': 'level'}, {}, {}, [], {}), [])
+        problems = validate({'warmup_order': 'size'}, {}, {}, [], {})
+        self.assertEqual([(item['level'], item['config-name']) for item in problems], [('ERROR', 'warmup_order')])
+
+    def test_warmer_rate_limit_and_deadline(self):
+        from nebula_warmup import PageCacheWarmer
+
+        paths = [self.make_sst('d1', number, 1024, 1000) for number in range(4)]
+        files = [{'path': path} for path in paths]
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        progress = []
+        warmer = PageCacheWarmer(workers=1, rate_bytes_per_sec=1024, chunk_bytes=512, clock=lambda: now[0],
+                                 sleep=sleep, progress=lambda *args: progress.append(args), use_fadvise=False)
+        summary = warmer.warm(files)
+        self.assertEqual((summary['files'], summary['bytes'], summary['timed_out']), (4, 4096, False))
+        self.assertAlmostEqual(sum(slept), 3.5)
+        self.assertEqual(progress[-1], (4, 4, 4096))
+
+        now[0] = 0.0
+        warmer = PageCacheWarmer(workers=1, rate_bytes_per_sec=1024, chunk_bytes=512, deadline_secs=1.2,
+                                 clock=lambda: now[0], sleep=sleep, use_fadvise=hasattr(os, 'posix_fadvise'))
+        summary = warmer.warm(files)
+        self.assertTrue(summary['timed_out'])
+        self.assertEqual(summary['files'], 1)
+        self.assertEqual(summary['bytes'], 1536)
+
+    def test_queries_wait_for_online(self):
+        from nebula_ngql import NgqlError
+        from nebula_warmup import run_warmup_queries, wait_until_online
+
+        class Session(object):
+            def __init__(self):
+                self.polls = 0
+
+            def execute(self, statement):
+                if statement == 'SHOW HOSTS':
+                    self.polls += 1
+                    row = _host_row('s1', 0)
+                    row['Status'] = 'ONLINE' if self.polls >= 3 else 'OFFLINE'
+                    return [row]
+                if 'bad' in statement:
+                    raise NgqlError('SyntaxError: syntax error near `bad\'', -1004)
+                return []
+
+        session = Session()
+        self.assertTrue(wait_until_online(session, 's1', 9779, timeout_secs=60, sleep=lambda secs: None))
+        self.assertEqual(session.polls, 3)
+        self.assertFalse(wait_until_online(Session(), 's2', 9779, timeout_secs=0, sleep=lambda secs: None))
+        results = run_warmup_queries(session, ['GO FROM "p1" OVER follow', 'bad'])
+        self.assertIsNone(results[0][2])
+        self.assertIn('syntax error', results[1][2])
+
+
+class TestGraphdDrain(unittest.TestCase):
+    """测试graphd停止前的会话排空"""
+
+    def test_manifest_state_changes(self):
+        import shutil
+        import tempfile
+        from nebula_endpoints import ACTIVE, DRAINING, active_endpoints, load_manifest, sync_manifest
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'etc', 'graphd-endpoints.json')
+        self.assertEqual(load_manifest(path), {'graphd': []})
+        sync_manifest(path, ['g2', 'g1'], 9669, 19669, 'g2', state=ACTIVE)
+        sync_manifest(path, ['g2', 'g1'], '9669', 19669, 'g1', state=ACTIVE)
+        manifest = sync_manifest(path, ['g2', 'g1'], 9669, 19669, 'g2', state=DRAINING)
+        self.assertEqual(active_endpoints(manifest), ['g1:9669'])
+        self.assertEqual([item['host'] for item in load_manifest(path)['graphd']], ['g1', 'g2'])
+        sync_manifest(path, ['g2', 'g1'], 9669, 19669, 'g2', state=ACTIVE)
+        self.assertEqual(active_endpoints(load_manifest(path)), ['g1:9669', 'g2:9669'])
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))),
+                         ['graphd-endpoints.json', 'graphd-endpoints.json.lock'])
+
+    def test_weighted_manifest_and_lb_fragments(self):
+        import json
+        import shutil
+        import tempfile
+        from nebula_endpoints import (DRAINING, host_capacity, parse_host_cores, render_envoy, render_haproxy,
+                                      sync_manifest)
+
+        self.assertEqual(host_capacity(16), 16)
+        self.assertEqual(host_capacity(16, 8), 8)
+        self.assertEqual(host_capacity(4, 32), 4)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'graphd-endpoints.json')
+        sync_manifest(path, ['g1', 'g2', 'g3'], 9669, 19669, 'g1', capacity=16)
+        manifest = sync_manifest(path, ['g1', 'g2', 'g3'], 9669, 19669, 'g2', capacity=8)
+        # g3尚未上报capacity，按已知主机的平均值计权
+        self.assertEqual([(item['host'], item['weight']) for item in manifest['graphd']],
+                         [('g1', 16), ('g2', 8), ('g3', 12)])
+        # Ambari记录的核数优先于平均值，本机上报的capacity优先于Ambari
+        manifest = sync_manifest(path, ['g1', 'g2', 'g3'], 9669, 19669, 'g2', capacity=8,
+                                 host_cores=parse_host_cores('g1:32,g3:4,bad'), num_worker_threads=24)
+        self.assertEqual([(item['host'], item['weight']) for item in manifest['graphd']],
+                         [('g1', 16), ('g2', 8), ('g3', 4)])
+
+        # g3被移出拓扑，g2开始排空
+        manifest = sync_manifest(path, ['g1', 'g2'], 9669, 19669, 'g2', state=DRAINING)
+        self.assertEqual([item['host'] for item in manifest['graphd']], ['g1', 'g2'])
+
+        haproxy = render_haproxy(manifest, 9669)
+        self.assertIn('    bind *:9669', haproxy)
+        self.assertIn('    option httpchk GET /status', haproxy)
+        self.assertIn('    server g1 g1:9669 weight 16 check port 19669', haproxy)
+        self.assertIn('    server g2 g2:9669 weight 0 check port 19669', haproxy)
+
+        cluster = json.loads(render_envoy(manifest))['clusters'][0]
+        self.assertEqual(cluster['type'], 'STRICT_DNS')
+        endpoints = cluster['load_assignment']['endpoints'][0]['lb_endpoints']
+        self.assertEqual([item['load_balancing_weight'] for item in endpoints], [16, 8])
+        self.assertEqual(endpoints[1]['health_status'], 'DRAINING')
+        self.assertNotIn('health_status', endpoints[0])
+        self.assertEqual(endpoints[0]['endpoint']['health_check_config']['port_value'], 19669)
+        self.assertEqual(cluster['health_checks'][0]['http_health_check']['path'], '/status')
+
+    def test_drain_waits_for_thresholds(self):
+        from nebula_endpoints import SessionDrain, format_drain
+
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        samples = [{'num_active_sessions': 12, 'num_active_queries.sum.5': 3},
+                   {'num_active_sessions': 5, 'num_active_queries.sum.5': 1},
+                   {'num_active_sessions': 2, 'num_active_queries.sum.5': 0}]
+        report = SessionDrain(lambda: samples.pop(0), max_sessions=2, clock=lambda: now[0], sleep=sleep).drain()
+        self.assertEqual(report['reason'], 'drained')
+        self.assertEqual(report['timeline'], [(0.0, 12, 3), (2.0, 5, 1), (4.0, 2, 0)])
+        self.assertEqual(format_drain(report)[0], 'Session drain drained after 4.0s')
+
+        now[0] = 0.0
+        report = SessionDrain(lambda: {'num_active_sessions': 40}, timeout=5, clock=lambda: now[0],
+                              sleep=sleep).drain()
+        self.assertEqual((report['reason'], report['seconds']), ('deadline', 5))
+
+        def unreachable():
+            raise IOError('connection refused')
+
+        self.assertEqual(SessionDrain(unreachable).drain()['reason'], 'unreachable')
+
+
+class TestAlertLease(unittest.TestCase):
+    """测试集群范围告警的执行者选举"""
+
+    def test_rank_is_deterministic_and_spreads_alerts(self):
+        from nebula_alert_lease import rank_hosts
+
+        hosts = ['h{0}'.format(i) for i in range(8)]
+        ranked = rank_hosts('nebula_cluster_health', hosts + ['h3'])
+        self.assertEqual(sorted(ranked), hosts)
+        self.assertEqual(ranked, rank_hosts('nebula_cluster_health', list(reversed(hosts))))
+        # 移除非执行者不改变执行者
+        self.assertEqual(rank_hosts('nebula_cluster_health', [h for h in hosts if h != ranked[-1]])[0],
+                         ranked[0])
+        runners = set(rank_hosts('alert_{0}'.format(i), hosts)[0] for i in range(20))
+        self.assertGreater(len(runners), 1)
+
+    def test_one_probe_per_interval_with_fallback(self):
+        import shutil
+        import tempfile
+        from nebula_alert_lease import LEASE_DIR_KEY, LEASE_ENABLED_KEY, cluster_scoped, rank_hosts
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        probes = []
+
+        @cluster_scoped('nebula_test_lease')
+        def execute(configurations={}, parameters={}, host_name=None):
+            probes.append(host_name)
+            return ('OK', ['Metad cluster has a healthy leader on m1.'])
+
+        hosts = ['h1', 'h2', 'h3', 'h4']
+        configurations = {'{{clusterHostInfo/nebula_metad_hosts}}': hosts[:3],
+                          '{{clusterHostInfo/nebula_storaged_hosts}}': hosts,
+                          LEASE_ENABLED_KEY: 'true', LEASE_DIR_KEY: directory}
+        ranked = rank_hosts('nebula_test_lease', hosts)
+        now = [1000.0]
+
+        def run_round(order):
+            labels = {}
+            for host in order:
+                code, labels[host] = execute(configurations, {}, host, clock=lambda: now[0])
+                self.assertEqual(code, 'OK')
+            now[0] += 60
+            return labels
+
+        # 第一轮各主机还不知道告警周期，都会探测
+        run_round(ranked)
+        self.assertEqual(sorted(probes), sorted(hosts))
+        del probes[:]
+        for order in (ranked, list(reversed(ranked)), list(reversed(ranked))):
+            labels = run_round(order)
+        self.assertEqual(probes, [ranked[0]] * 3)
+        self.assertIn('(probed by {0})'.format(ranked[0]), labels[ranked[1]][0])
+
+        # 执行者停止发布后，第一后备在1.5个周期后接管并持续探测，其他主机继续读取
+        del probes[:]
+        for _ in range(3):
+            run_round(ranked[1:])
+        self.assertEqual(probes, [ranked[1]] * 2)
+
+        # 目录不共享时每台主机只能读到自己发布的结果，照常探测而不是冻结
+        del probes[:]
+        private = dict(configurations)
+        private[LEASE_DIR_KEY] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, private[LEASE_DIR_KEY])
+        for _ in range(2):
+            execute(private, {}, ranked[3], clock=lambda: now[0])
+            now[0] += 60
+        self.assertEqual(probes, [ranked[3]] * 2)
+
+        # 未启用或未配置共享目录时每次都探测
+        del probes[:]
+        execute(dict(configurations, **{LEASE_DIR_KEY: ''}), {}, ranked[2])
+        configurations[LEASE_ENABLED_KEY] = 'false'
+        execute(configurations, {}, ranked[3])
+        self.assertEqual(probes, [ranked[2], ranked[3]])
+
+
+class FakeTopologySession(object):
+    """按SHOW HOSTS/SHOW SPACES/SHOW PARTS返回固定拓扑的会话"""
+
+    def __init__(self):
+        self.hosts = [_host_row('s1', 2), _host_row('s2', 1)]
+        self.parts = {'g1': [
+            {'Partition ID': '1', 'Leader': '"s1":9779', 'Peers': '"s1":9779, "s2":9779', 'Losts': ''},
+            {'Partition ID': '2', 'Leader': '"s2":9779', 'Peers': '"s1":9779, "s2":9779', 'Losts': ''},
+            {'Partition ID': '3', 'Leader': '"s1":9779', 'Peers': '"s1":9779, "s3":9779', 'Losts': ''}]}
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if statement == 'SHOW HOSTS':
+            return self.hosts
+        if statement == 'SHOW SPACES':
+            return [{'Name': name} for name in sorted(self.parts)]
+        if statement.endswith('SHOW PARTS'):
+            return self.parts[statement.split()[1].rstrip(';')]
+        return []
+
+
+class TestTopologyCache(unittest.TestCase):
+    """测试分片/leader拓扑缓存"""
+
+    def test_lookups_and_version_invalidation(self):
+        import shutil
+        import tempfile
+        from nebula_topology import TopologyCache, format_partitions
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'nebula-topology.bin')
+        now = [1000.0]
+        session = FakeTopologySession()
+        cache = TopologyCache(path, max_age=300, clock=lambda: now[0])
+        self.assertTrue(cache.refresh(session))
+        self.assertEqual(cache.leader('g1', 2), 's2:9779')
+        self.assertEqual(cache.replicas('g1', 3), ['s1:9779', 's3:9779'])
+        self.assertIsNone(cache.leader('g1', 9))
+        self.assertEqual(cache.partitions('s1:9779'), {'g1': [1, 2, 3]})
+        self.assertEqual(format_partitions(cache.partitions('s1:9779', leaders_only=True)), 'g1[1,3]')
+        self.assertEqual(dict(cache.hosts())['s3:9779'], 'UNKNOWN')
+
+        # SHOW HOSTS未变化时只执行一次查询
+        del session.statements[:]
+        now[0] += 60
+        self.assertFalse(cache.refresh(session))
+        self.assertEqual(session.statements, ['SHOW HOSTS'])
+
+        # leader数变化使摘要失效
+        session.hosts = [_host_row('s1', 1), _host_row('s2', 2)]
+        session.parts['g1'][0]['Leader'] = '"s2":9779'
+        self.assertTrue(cache.refresh(session))
+        self.assertEqual(cache.leader('g1', 1), 's2:9779')
+
+        # 超过max_age时即使摘要相同也重建
+        now[0] += 301
+        self.assertTrue(cache.refresh(session))
+        self.assertEqual(cache.refreshes, 3)
+
+    def test_binary_file_starts_warm(self):
+        import shutil
+        import tempfile
+        from nebula_topology import TopologyCache
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'nebula-topology.bin')
+        session = FakeTopologySession()
+        TopologyCache(path, clock=lambda: 1000.0).refresh(session)
+
+        cache = TopologyCache(path, clock=lambda: 1010.0)
+        self.assertTrue(cache.load())
+        self.assertEqual(cache.spaces(), ['g1'])
+        self.assertEqual(cache.partitions('s2:9779', leaders_only=True), {'g1': [2]})
+        del session.statements[:]
+        self.assertFalse(cache.refresh(session))
+        self.assertEqual(session.statements, ['SHOW HOSTS'])
+
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 3)
+        self.assertFalse(TopologyCache(path).load())
+        self.assertFalse(TopologyCache(os.path.join(directory, 'missing.bin')).load())
+
+    def test_space_list_reads_metad_and_falls_back_to_the_cache(self):
+        import shutil
+        import tempfile
+        from nebula_ngql import NgqlError
+        from nebula_topology import SpaceList, TopologyCache
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'nebula-topology.bin')
+        session = FakeTopologySession()
+        TopologyCache(path, clock=lambda: 1000.0).refresh(session)
+
+        # 缓存写入之后新建的space直接从metad读到
+        session.parts['g2'] = []
+        del session.statements[:]
+        now = [1000.0]
+        spaces = SpaceList(session, path, max_age=300, clock=lambda: now[0])
+        self.assertEqual(spaces(), ['g1', 'g2'])
+        now[0] += 60
+        self.assertEqual(spaces(), ['g1', 'g2'])
+        self.assertEqual(session.statements, ['SHOW SPACES'])
+
+        def fail(statement):
+            raise NgqlError('connection refused')
+
+        session.execute = fail
+        now[0] += 300
+        self.assertEqual(spaces(), ['g1'])
+        self.assertEqual(SpaceList(None, path)(), ['g1'])
+
+
+ROCKSDB_STATS_DUMP = """2026/10/19-10:00:00.000000 7f ------- DUMPING STATS -------
+** DB Stats **
+Uptime(secs): 600.0 total, 600.0 interval
+Cumulative stall: 00:00:1.500 H:M:S, 0.3 percent
+Interval stall: 00:00:0.000 H:M:S, 0.0 percent
+
+** Compaction Stats [default] **
+Level    Files   Size     Score Read(GB)  Rn(GB) Rnp1(GB) Write(GB) Wnew(GB) Moved(GB) W-Amp Rd(MB/s) Wr(MB/s)
+--------------------------------------------------------------------------------------------------------------
+  L0     {l0}/0   50.12 MB   0.5      0.0     0.0      0.0       0.1      0.1       0.0   1.0      0.0     40.2
+  L1      4/0   200.00 MB   0.8      0.3     0.1      0.2       0.3      0.1       0.0   2.5     30.0     35.0
+ Sum     {sum}/0   250.12 MB   0.0      0.3     0.1      0.2       0.4      0.2       0.0   {wamp}     30.0     36.0
+Stalls(count): 0 level0_slowdown, 0 level0_numfiles, interval {stalls} total count
+"""
+
+
+class TestRocksDbCollector(unittest.TestCase):
+    """测试RocksDB内部指标收集和写停顿预警"""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.data_path = os.path.join(self.root, 'data')
+        os.makedirs(os.path.join(self.data_path, 'nebula', '1', 'data'))
+        self.log = os.path.join(self.data_path, 'nebula', '1', 'data', 'LOG')
+
+    def _append(self, text):
+        with open(self.log, 'a') as f:
+            f.write(text)
+
+    def test_incremental_log_parsing(self):
+        from nebula_rocksdb import RocksDbCollector
+
+        checkpoint = os.path.join(self.root, 'rocksdb.json')
+        dump = ROCKSDB_STATS_DUMP.format(l0=3, sum=7, wamp=4.2, stalls=0)
+        self._append(dump)
+        collector = RocksDbCollector(checkpoint, [self.data_path])
+        self.assertEqual(collector.scan_logs(), len(dump))
+        engine = collector.engines[self.data_path + '/1']
+        self.assertEqual(engine['cfs']['default'], {'l0_files': 3, 'w_amp': 4.2, 'stalls': 0})
+        self.assertEqual(engine['stall_micros'], 1500000)
+        collector.save()
+
+        # 第二次转储分两次写入，第一次停在半行
+        dump = ROCKSDB_STATS_DUMP.format(l0=9, sum=13, wamp=5.0, stalls=2)
+        split = dump.index(' Sum') + 5
+        self._append(dump[:split])
+        collector = RocksDbCollector(checkpoint, [self.data_path])
+        collector.scan_logs()
+        self.assertEqual(collector.engines[self.data_path + '/1']['cfs']['default']['l0_files'], 9)
+        collector.save()
+        self._append(dump[split:])
+        collector = RocksDbCollector(checkpoint, [self.data_path])
+        self.assertLess(collector.scan_logs(), len(dump))
+        self.assertEqual(collector.engines[self.data_path + '/1']['cfs']['default'],
+                         {'l0_files': 9, 'w_amp': 5.0, 'stalls': 2})
+
+    def test_properties_and_exporter_stats(self):
+        from nebula_rocksdb import RocksDbCollector
+
+        self._append(ROCKSDB_STATS_DUMP.format(l0=3, sum=7, wamp=4.2, stalls=0))
+        values = {'rocksdb.estimate-pending-compaction-bytes': [1024.0, 4096.0],
+                  'rocksdb.num-immutable-mem-table': [1.0, 0.0],
+                  'rocksdb.compaction-pending': [1.0],
+                  'rocksdb.actual-delayed-write-rate': [0.0]}
+        calls = []
+
+        def fetch(host, port, space, prop):
+            calls.append((host, space, prop))
+            return values[prop]
+
+        collector = RocksDbCollector(os.path.join(self.root, 'rocksdb.json'), [self.data_path], 's1', 19779,
+                                     lambda: ['g1'], fetch=fetch)
+        stats = collector.stats()
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(stats['rocksdb_l0_files'], 3)
+        self.assertEqual(stats['rocksdb_pending_compaction_bytes'], 4096.0)
+        self.assertEqual(stats['rocksdb_compaction_pending'], 1.0)
+        self.assertEqual(stats['rocksdb_write_amplification'], 4.2)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'rocksdb.json')))
+
+    def test_evaluate_warns_before_stall(self):
+        from nebula_rocksdb import evaluate, rocksdb_limits
+
+        limits = rocksdb_limits('{"level0_slowdown_writes_trigger": "20", "max_write_buffer_number": 6}')
+        self.assertEqual(limits['level0_slowdown_writes_trigger'], 20)
+        previous = {}
+        engine = '/data/1 [default]'
+        code, problems = evaluate([(engine, 'l0_files', 6), ('g1', 'immutable_memtables', 1)], previous, 0, limits)
+        self.assertEqual((code, problems), ('OK', []))
+
+        # 低于70%但按当前速度300秒内达到阈值
+        code, problems = evaluate([(engine, 'l0_files', 12)], previous, 60, limits)
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('reached in ~80s', problems[0])
+        self.assertNotIn('g1|immutable_memtables', previous)
+
+        code, problems = evaluate([(engine, 'l0_files', 12), ('g1', 'immutable_memtables', 3)], previous, 120,
+                                  limits)
+        self.assertEqual(code, 'WARNING')
+        self.assertIn('g1: immutable_memtables 3 of slowdown trigger 4', problems[0])
+
+        code, problems = evaluate([(engine, 'l0_files', 21)], previous, 180, limits)
+        self.assertEqual(code, 'CRITICAL')
+        code, problems = evaluate([(engine, 'stalls', 2)], previous, 240, limits)
+        self.assertEqual(code, 'CRITICAL')
+        self.assertIn('write stall in progress', problems[0])
+
+    def test_alert_reports_unwritable_checkpoint_dir(self):
+        import shutil
+        import tempfile
+        import alert_storaged_write_stall as alert
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        blocker = os.path.join(directory, 'file')
+        open(blocker, 'w').close()
+        code, labels = alert.execute({alert.STORAGED_DATA_PATH_KEY: directory},
+                                     {alert.CHECKPOINT_DIR_PARAM: os.path.join(blocker, 'tmp')}, 's1')
+        self.assertEqual(code, 'UNKNOWN')
+        self.assertIn('checkpoint directory', labels[0])
+
+
 class TestConfigurationFiles(unittest.TestCase):
     """测试配置文件"""
     
@@ -182,9 +2414,10 @@ class TestConfigurationFiles(unittest.TestCase):
         with open(metrics_file, 'r') as f:
             try:
                 metrics_data = json.load(f)
-                self.assertIn('NEBULA', metrics_data)
-                self.assertIn('Component', metrics_data['NEBULA'])
-                self.assertIn('HostComponent', metrics_data['NEBULA'])
+                for component in ('NEBULA_GRAPHD', 'NEBULA_METAD', 'NEBULA_STORAGED'):
+                    self.assertIn(component, metrics_data)
+                    self.assertIn('Component', metrics_data[component])
+                    self.assertIn('HostComponent', metrics_data[component])
             except json.JSONDecodeError as e:
                 self.fail(f"metrics.json contains invalid JSON: {e}")
     
@@ -243,6 +2476,7 @@ class TestScriptFiles(unittest.TestCase):
             'metad.py',
             'storaged.py',
             'console.py',
+            'exporter.py',
             'service_check.py'
         ]
         
@@ -279,6 +2513,28 @@ def run_tests():
     test_classes = [
         TestNebulaUtils,
         TestAlertScripts,
+        TestLeaderSkewAlert,
+        TestFleetLivenessAlert,
+        TestDiskForecastAlert,
+        TestBenchmark,
+        TestBulkLoad,
+        TestCompactionScheduler,
+        TestBalanceOrchestrator,
+        TestPrometheusExporter,
+        TestAmsSink,
+        TestClusterMetrics,
+        TestTimeSeriesEncoding,
+        TestSlowQueryAnalyzer,
+        TestLogRetention,
+        TestTracing,
+        TestNumaPlacement,
+        TestCgroupIsolation,
+        TestOsProfile,
+        TestStoragedWarmup,
+        TestGraphdDrain,
+        TestAlertLease,
+        TestTopologyCache,
+        TestRocksDbCollector,
         TestConfigurationFiles,
         TestScriptFiles
     ]